@@ -0,0 +1,88 @@
+"""
+Compares folding list_objects_v2 pages into BucketInfo object by object
+(BucketInfo.add_file, as explore_bucket used to) against the batched,
+page at a time path (access.add_page), on synthetic 1000 object pages.
+
+Run from the app directory:
+    S3X_PATH=$PWD PYTHONPATH=src python3 benchmarks/bench_aggregation.py
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from access import add_page, CONTENTS, KEY, SIZE, LAST_MODIFIED
+from results import BucketInfo
+
+DEFAULT_PAGES = 200
+PAGE_SIZE = 1000
+
+
+def make_pages(n_pages, seed=0):
+    """
+    :return: Response pages shaped like botocore's parsed list_objects_v2 output.
+    :rtype: list of dict
+    """
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    pages = []
+    for page in range(n_pages):
+        contents = []
+        for n in range(PAGE_SIZE):
+            contents.append({
+                KEY: 'prefix_{}/file_{}'.format(page, n),
+                SIZE: int(rng.lognormvariate(10, 2)),
+                LAST_MODIFIED: start + timedelta(seconds=rng.randrange(10**8)),
+            })
+        pages.append({CONTENTS: contents})
+    return pages
+
+
+def per_object(my_info, pages):
+    for resp in pages:
+        for obj in resp[CONTENTS]:
+            if not obj[KEY].endswith('/'):
+                my_info.add_file(obj[SIZE], obj[LAST_MODIFIED])
+
+
+def batched(my_info, pages):
+    for resp in pages:
+        add_page(my_info, resp)
+
+
+def time_method(method, pages, repeat):
+    """
+    :return: Best wall time over the repeats, and the resulting BucketInfo.
+    :rtype: tuple(float, BucketInfo)
+    """
+    best = None
+    for _ in range(repeat):
+        my_info = BucketInfo('bench', datetime(2020, 1, 1))
+        start = time.perf_counter()
+        method(my_info, pages)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, my_info
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-p', '--pages', type=int, default=DEFAULT_PAGES)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    pages = make_pages(args.pages)
+    n_objects = args.pages * PAGE_SIZE
+    results = {}
+    for method in (per_object, batched):
+        elapsed, my_info = time_method(method, pages, args.repeat)
+        results[method.__name__] = my_info
+        print('{:<12} {:8.1f} ms  {:12,.0f} objects/s'.format(
+            method.__name__, 1e3 * elapsed, n_objects / elapsed))
+
+    totals = {(x.file_count, x.cumulative_size, x.most_recent_mod) for x in results.values()}
+    assert len(totals) == 1, 'Batched totals differ from per object totals'
+
+
+if __name__ == '__main__':
+    main()
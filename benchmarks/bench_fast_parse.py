@@ -0,0 +1,140 @@
+"""
+Measures list_objects_v2 throughput with botocore's full response parsing
+against the fast parse mode (fastparse.enable_fast_parse), on a bucket
+served by a local moto server. Two numbers are reported for each:
+
+- end to end: a full explore_bucket against the moto server,
+- client side: the same pages replayed from memory, so only the
+  client's own work (mostly parsing) is timed.
+
+Run from the app directory:
+    S3X_PATH=$PWD PYTHONPATH=src python3 benchmarks/bench_fast_parse.py
+"""
+import argparse
+import logging
+import socket
+import time
+import boto3
+from botocore.awsrequest import AWSResponse
+from moto.core import DEFAULT_ACCOUNT_ID
+from moto.s3.models import s3_backends
+from moto.server import ThreadedMotoServer
+from datetime import datetime
+from access import explore_bucket
+from fastparse import enable_fast_parse
+from results import BucketInfo
+
+BUCKET_NAME = 'bench-fast-parse'
+DEFAULT_OBJECTS = 20000
+
+
+class _RawResponse:
+    """
+    Just enough of a urllib3 response for botocore to read a replayed body.
+    """
+    def __init__(self, body):
+        self._body = body
+
+    def stream(self, *args, **kwargs):
+        yield self._body
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def fill_bucket(n_objects):
+    # Going straight to the moto backend is far quicker than put_object calls
+    backend = s3_backends[DEFAULT_ACCOUNT_ID]['global']
+    backend.create_bucket(BUCKET_NAME, 'us-east-1')
+    for n in range(n_objects):
+        backend.put_object(BUCKET_NAME, 'prefix_{}/file_{:08d}.dat'.format(n % 50, n), b'x' * (n % 997))
+
+
+def make_client(endpoint_url):
+    return boto3.Session(aws_access_key_id='bench', aws_secret_access_key='bench').client(
+        's3', endpoint_url=endpoint_url, region_name='us-east-1')
+
+
+def record_pages(s3_client):
+    """
+    :return: Raw responses of every page of the bucket, in order.
+    :rtype: list of tuple(int, dict, bytes)
+    """
+    recorded = []
+
+    def record(response_dict, **kwargs):
+        recorded.append((response_dict['status_code'], dict(response_dict['headers']), response_dict['body']))
+    s3_client.meta.events.register('before-parse.s3.ListObjectsV2', record)
+    explore_bucket(BucketInfo(BUCKET_NAME, datetime.now()), s3_client)
+    s3_client.meta.events.unregister('before-parse.s3.ListObjectsV2', record)
+    return recorded
+
+
+def replay_client(endpoint_url, recorded):
+    s3_client = make_client(endpoint_url)
+    pages = iter([])
+
+    def replay(request, **kwargs):
+        status_code, headers, body = next(pages)
+        return AWSResponse(request.url, status_code, headers, _RawResponse(body))
+    s3_client.meta.events.register('before-send.s3.ListObjectsV2', replay)
+
+    def reset():
+        nonlocal pages
+        pages = iter(recorded)
+    return s3_client, reset
+
+
+def time_explore(s3_client, repeat, before_each=None):
+    best, my_info = None, None
+    for _ in range(repeat):
+        if before_each is not None:
+            before_each()
+        my_info = BucketInfo(BUCKET_NAME, datetime.now())
+        start = time.perf_counter()
+        explore_bucket(my_info, s3_client)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, my_info
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--objects', type=int, default=DEFAULT_OBJECTS)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    port = free_port()
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+    server.start()
+    try:
+        endpoint_url = 'http://127.0.0.1:{}'.format(port)
+        fill_bucket(args.objects)
+        recorded = record_pages(make_client(endpoint_url))
+
+        totals = set()
+        print('{:<8} {:>14} {:>16}'.format('mode', 'end to end', 'client side'))
+        for mode in ('boto', 'fast'):
+            live_client = make_client(endpoint_url)
+            replayed_client, reset = replay_client(endpoint_url, recorded)
+            if mode == 'fast':
+                enable_fast_parse(live_client)
+                enable_fast_parse(replayed_client)
+            live_time, live_info = time_explore(live_client, args.repeat)
+            replay_time, replay_info = time_explore(replayed_client, args.repeat, reset)
+            for my_info in (live_info, replay_info):
+                totals.add((my_info.file_count, my_info.cumulative_size, my_info.most_recent_mod))
+            print('{:<8} {:>10,.0f} o/s {:>12,.0f} o/s'.format(
+                mode, args.objects / live_time, args.objects / replay_time))
+        assert len(totals) == 1, 'Fast parse totals differ from botocore totals'
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
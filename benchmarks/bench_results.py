@@ -0,0 +1,82 @@
+"""
+Compares the cost of logging each bucket's result as the number of buckets grows:
+the old approach (rewriting the whole CSV with pandas after every bucket) against
+the streaming, append only writers. Streaming should stay flat per bucket.
+
+Run from the app directory:
+    S3X_PATH=$PWD PYTHONPATH=src python3 benchmarks/bench_results.py
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from results import BucketInfo
+from writers import RESULT_WRITERS, RESULT_FIELDS, FsyncPolicy
+
+DEFAULT_BUCKET_COUNTS = (100, 500, 2000)
+
+
+def _bucket_infos(n_buckets):
+    created = datetime(2020, 9, 25)
+    infos = []
+    for n in range(n_buckets):
+        info = BucketInfo('bucket-{:05d}'.format(n), created)
+        info.add_file(n * 1024, created + timedelta(hours=n))
+        infos.append(info)
+    return infos
+
+
+def bench_pandas_rewrite(infos, path):
+    """
+    What ResultHandler used to do: rebuild and rewrite the whole table per bucket.
+    """
+    import pandas as pd
+    results = []
+    start = time.perf_counter()
+    for info in infos:
+        results.append({field: getattr(info, field) for field in RESULT_FIELDS})
+        pd.DataFrame(results).set_index('name').to_csv(path)
+    return time.perf_counter() - start
+
+
+def bench_streaming(infos, path, output_format, fsync_policy):
+    start = time.perf_counter()
+    writer = RESULT_WRITERS[output_format](path, fsync_policy)
+    for info in infos:
+        writer.write(info)
+    writer.close()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--bucket_counts', type=int, nargs='+', default=DEFAULT_BUCKET_COUNTS)
+    parser.add_argument('--fsync', type=str, default=FsyncPolicy.CLOSE.value,
+                        choices=[x.value for x in FsyncPolicy])
+    args = parser.parse_args()
+
+    try:
+        import pandas  # noqa: F401
+        methods = ['pandas_rewrite']
+    except ImportError:
+        methods = []
+    methods += list(RESULT_WRITERS.keys())
+
+    print('{:>8}  {:>15}  {:>12}  {:>14}'.format('buckets', 'method', 'total (s)', 'per bucket (us)'))
+    for n_buckets in args.bucket_counts:
+        infos = _bucket_infos(n_buckets)
+        for method in methods:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                path = os.path.join(temp_dir, 'results')
+                if method == 'pandas_rewrite':
+                    elapsed = bench_pandas_rewrite(infos, path)
+                else:
+                    elapsed = bench_streaming(infos, path, method, FsyncPolicy(args.fsync))
+            print('{:>8}  {:>15}  {:>12.4f}  {:>14.1f}'.format(
+                n_buckets, method, elapsed, 1e6 * elapsed / n_buckets))
+
+
+if __name__ == '__main__':
+    main()
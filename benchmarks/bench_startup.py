@@ -0,0 +1,154 @@
+"""
+Tracks how quickly the command line tool gets going:
+
+- import time of each of the app's modules (from python's -X importtime),
+- wall time of "s3explore.py --help",
+- time to first request: from launching a real run until the first request
+  reaches S3 (here, a stand in local HTTP endpoint answering list_buckets).
+
+Run from the app directory:
+    S3X_PATH=$PWD PYTHONPATH=src python3 benchmarks/bench_startup.py
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+APP_HOME = os.environ['S3X_PATH']
+SRC_PATH = os.path.join(APP_HOME, 'src')
+SCRIPT_PATH = os.path.join(SRC_PATH, 's3explore.py')
+EXAMPLE_CREDS_FILE = os.path.join(APP_HOME, 'installation_support', 'cred_EXAMPLE.json')
+APP_MODULES = ('s3explore', 'access', 'results', 'writers', 'checkpoint', 'shards')
+DEFAULT_REPEAT = 5
+
+EMPTY_BUCKET_LIST = (b'<?xml version="1.0" encoding="UTF-8"?>'
+                     b'<ListAllMyBucketsResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                     b'<Owner><ID>bench</ID></Owner><Buckets></Buckets></ListAllMyBucketsResult>')
+
+
+class _FirstRequestHandler(BaseHTTPRequestHandler):
+    """
+    Notes when each request arrives, and answers with an empty bucket list.
+    """
+    def do_GET(self):
+        self.server.request_times.append(time.perf_counter())
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(EMPTY_BUCKET_LIST)))
+        self.end_headers()
+        self.wfile.write(EMPTY_BUCKET_LIST)
+
+    def log_message(self, *args):
+        pass
+
+
+def _env(app_home):
+    env = dict(os.environ, S3X_PATH=app_home,
+               PYTHONPATH=os.pathsep.join(x for x in (SRC_PATH, os.environ.get('PYTHONPATH')) if x))
+    env.pop('AWS_PROFILE', None)
+    return env
+
+
+def bench_imports(repeat):
+    """
+    :return: Median cumulative import time (seconds) of each app module.
+    :rtype: dict
+    """
+    timings = {x: [] for x in APP_MODULES}
+    for _ in range(repeat):
+        for module in APP_MODULES:
+            proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                                  env=_env(APP_HOME), cwd=SRC_PATH,
+                                  stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, check=True)
+            for line in proc.stderr.decode().splitlines():
+                match = re.match(r'import time:\s+\d+ \|\s+(\d+) \| (\S+)$', line)
+                if match and match.group(2) == module:
+                    timings[module].append(int(match.group(1)) / 1e6)
+    return {x: statistics.median(y) for x, y in timings.items()}
+
+
+def bench_help(repeat):
+    """
+    :return: Median wall time (seconds) of running the script with --help.
+    :rtype: float
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, SCRIPT_PATH, '--help'], env=_env(APP_HOME),
+                       stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def bench_first_request(repeat):
+    """
+    :return: Median time (seconds) from launching a run to its first request,
+    and median wall time of the whole (empty) run.
+    :rtype: tuple(float, float)
+    """
+    server = HTTPServer(('127.0.0.1', 0), _FirstRequestHandler)
+    server.request_times = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    first_request, total = [], []
+    with tempfile.TemporaryDirectory() as app_home:
+        os.makedirs(os.path.join(app_home, 'data'))
+        shutil.copy(EXAMPLE_CREDS_FILE, os.path.join(app_home, 'data', '.cred.json'))
+        env = _env(app_home)
+        env.update(AWS_ENDPOINT_URL_S3='http://127.0.0.1:{}'.format(server.server_port),
+                   AWS_DEFAULT_REGION='us-east-1')
+        for _ in range(repeat):
+            del server.request_times[:]
+            start = time.perf_counter()
+            subprocess.run([sys.executable, SCRIPT_PATH], env=env, stdout=subprocess.DEVNULL, check=True)
+            total.append(time.perf_counter() - start)
+            first_request.append(server.request_times[0] - start)
+    server.shutdown()
+    return statistics.median(first_request), statistics.median(total)
+
+
+def run(repeat=DEFAULT_REPEAT):
+    """
+    :return: All startup timings, in seconds.
+    :rtype: dict
+    """
+    first_request, total = bench_first_request(repeat)
+    return dict(
+        import_time=bench_imports(repeat),
+        help_time=bench_help(repeat),
+        first_request_time=first_request,
+        empty_run_time=total,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-r', '--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='Runs of each measurement; the median is reported.')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='Also write the timings to this JSON file.')
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    for module, seconds in results['import_time'].items():
+        print('import {:<12} {:8.1f} ms'.format(module, 1e3 * seconds))
+    print('--help              {:8.1f} ms'.format(1e3 * results['help_time']))
+    print('first request       {:8.1f} ms'.format(1e3 * results['first_request_time']))
+    print('empty run           {:8.1f} ms'.format(1e3 * results['empty_run_time']))
+    if args.output is not None:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+
+
+if __name__ == '__main__':
+    main()
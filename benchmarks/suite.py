@@ -0,0 +1,311 @@
+"""
+The benchmark suite: runs each scenario against a synthetic bucket served
+by a local moto server, and writes the numbers to a JSON file, so that two
+runs (say, before and after a change) can be compared.
+
+Scenarios:
+- explore: explore_bucket with botocore's full response parsing,
+- explore_fast: explore_bucket with --fast_parse,
+- explore_async: the asyncio engine (--engine async),
+- results: ResultHandler displaying and logging one record per bucket,
+- startup: wall time of "s3explore.py --help".
+
+Each scenario runs in a process of its own, so its peak RSS is its own
+(the moto server and its data live in the parent). Wall time is the best
+of --repeat runs; objects/s and requests/s are worked out from it.
+
+Run from the app directory:
+    S3X_PATH=$PWD PYTHONPATH=src python3 benchmarks/suite.py run -n 100000 -o before.json
+    S3X_PATH=$PWD PYTHONPATH=src python3 benchmarks/suite.py compare before.json after.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Scenarios run with a scratch S3X_PATH, so find the script from here
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 's3explore.py')
+BUCKET_NAME = 'bench-suite'
+SCENARIOS = ('explore', 'explore_fast', 'explore_async', 'results', 'startup')
+DEFAULT_OBJECTS = 10000
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.10
+
+# Which way is better, for each metric
+HIGHER_IS_BETTER = ('objects_per_s', 'requests_per_s')
+LOWER_IS_BETTER = ('wall_time_s', 'peak_rss_mb')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in KB on Linux, but in bytes on macOS
+    scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(who).ru_maxrss / scale
+
+
+def _client(endpoint_url):
+    import boto3
+    return boto3.Session(aws_access_key_id='bench', aws_secret_access_key='bench').client(
+        's3', endpoint_url=endpoint_url, region_name='us-east-1')
+
+
+def _best_of(repeat, run):
+    """
+    :return: Best wall time of 'repeat' calls to run, and what the last call returned.
+    :rtype: tuple(float, object)
+    """
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def scenario_explore(endpoint_url, repeat, fast_parse=False):
+    from access import explore_bucket
+    from fastparse import enable_fast_parse
+    from results import BucketInfo
+
+    s3_client = _client(endpoint_url)
+    if fast_parse:
+        enable_fast_parse(s3_client)
+    requests = []
+    s3_client.meta.events.register('before-send.s3.ListObjectsV2', lambda **kwargs: requests.append(1))
+
+    def run():
+        requests.clear()
+        return explore_bucket(BucketInfo(BUCKET_NAME, datetime.now()), s3_client)
+    wall_time, my_info = _best_of(repeat, run)
+    return wall_time, my_info.file_count, len(requests)
+
+
+def scenario_explore_async(endpoint_url, repeat):
+    from asyncscan import AsyncScanner, explore_buckets_async
+    from botocore.credentials import Credentials
+    from results import BucketInfo
+
+    def run():
+        scanner = AsyncScanner(Credentials('bench', 'bench'), 'us-east-1', endpoint_url)
+        my_info, = explore_buckets_async([BucketInfo(BUCKET_NAME, datetime.now())], scanner)
+        return my_info
+    wall_time, my_info = _best_of(repeat, run)
+    return wall_time, my_info.file_count, my_info.throttle.requests
+
+
+def scenario_results(n_records, repeat):
+    from results import BucketInfo, ResultHandler, SizeFormat
+
+    bucket_infos = []
+    for n in range(n_records):
+        my_info = BucketInfo('bucket-{:08d}'.format(n), datetime(2020, 1, 1))
+        my_info.add_file(n, datetime(2020, 9, 1))
+        bucket_infos.append(my_info)
+
+    def run():
+        handler = ResultHandler('%Y_%m_%d', SizeFormat.MB, 'bench_{}'.format(time.monotonic_ns()))
+        for my_info in bucket_infos:
+            handler.update_results(my_info)
+        handler.close()
+
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            wall_time, _ = _best_of(repeat, run)
+        finally:
+            sys.stdout = stdout
+    return wall_time, n_records, 0
+
+
+def scenario_startup(repeat):
+    wall_time, _ = _best_of(repeat, lambda: subprocess.run(
+        [sys.executable, SCRIPT_PATH, '--help'], stdout=subprocess.DEVNULL, check=True))
+    return wall_time, 0, 0
+
+
+def run_scenario(name, endpoint_url, objects, repeat):
+    """
+    Runs a single scenario in this process.
+
+    :return: The scenario's metrics.
+    :rtype: dict
+    """
+    if name == 'explore':
+        wall_time, n_objects, n_requests = scenario_explore(endpoint_url, repeat)
+    elif name == 'explore_fast':
+        wall_time, n_objects, n_requests = scenario_explore(endpoint_url, repeat, fast_parse=True)
+    elif name == 'explore_async':
+        wall_time, n_objects, n_requests = scenario_explore_async(endpoint_url, repeat)
+    elif name == 'results':
+        wall_time, n_objects, n_requests = scenario_results(objects, repeat)
+    else:
+        wall_time, n_objects, n_requests = scenario_startup(repeat)
+
+    metrics = dict(wall_time_s=wall_time, objects=n_objects, requests=n_requests)
+    if n_objects:
+        metrics['objects_per_s'] = n_objects / wall_time
+    if n_requests:
+        metrics['requests_per_s'] = n_requests / wall_time
+    who = resource.RUSAGE_CHILDREN if name == 'startup' else resource.RUSAGE_SELF
+    metrics['peak_rss_mb'] = peak_rss_mb(who)
+    return metrics
+
+
+def run_suite(args):
+    from synthetic import fill_moto_bucket
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    port = free_port()
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+    server.start()
+    endpoint_url = 'http://127.0.0.1:{}'.format(port)
+    scenarios = args.scenarios.split(',')
+    report = dict(
+        created=datetime.now().isoformat(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        objects=args.objects,
+        seed=args.seed,
+        scenarios=dict(),
+    )
+    try:
+        start = time.perf_counter()
+        expected_count, _ = fill_moto_bucket(BUCKET_NAME, args.objects, args.seed)
+        print('Filled "{}" with {:,} objects in {:.1f}s'.format(
+            BUCKET_NAME, args.objects, time.perf_counter() - start), file=sys.stderr)
+
+        # Results are logged under a scratch app directory, not the real one
+        with tempfile.TemporaryDirectory() as app_home:
+            env = dict(os.environ, S3X_PATH=app_home)
+            for name in scenarios:
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), 'scenario', name,
+                     '--endpoint', endpoint_url, '-n', str(args.objects), '-r', str(args.repeat)],
+                    env=env, stdout=subprocess.PIPE, check=True).stdout
+                metrics = json.loads(output)
+                if name.startswith('explore') and (metrics['objects'] != expected_count):
+                    raise AssertionError('Scenario "{}" counted {} objects, expected {}.'.format(
+                        name, metrics['objects'], expected_count))
+                report['scenarios'][name] = metrics
+                print(_format_metrics(name, metrics), file=sys.stderr)
+    finally:
+        server.stop()
+
+    with open(args.output, 'w') as fp:
+        json.dump(report, fp, indent=2)
+    print('Written to {}'.format(args.output), file=sys.stderr)
+
+
+def _format_metrics(name, metrics):
+    return '{:<14} {:>9.3f}s {:>14} {:>14} {:>9.1f} MB'.format(
+        name, metrics['wall_time_s'],
+        '{:,.0f} o/s'.format(metrics['objects_per_s']) if 'objects_per_s' in metrics else '-',
+        '{:,.0f} r/s'.format(metrics['requests_per_s']) if 'requests_per_s' in metrics else '-',
+        metrics['peak_rss_mb'])
+
+
+def compare_reports(base, new, tolerance=DEFAULT_TOLERANCE):
+    """
+    :param base: Report of the earlier run.
+    :type base: dict
+    :param new: Report of the later run.
+    :type new: dict
+    :param tolerance: Relative change allowed in the wrong direction before it counts.
+    :type tolerance: float
+    :return: (scenario, metric, base value, new value, relative change, regressed)
+    for every metric both runs have.
+    :rtype: list of tuple
+    """
+    rows = []
+    for name, base_metrics in base['scenarios'].items():
+        new_metrics = new['scenarios'].get(name)
+        if new_metrics is None:
+            continue
+        for metric in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+            if (metric not in base_metrics) or (metric not in new_metrics) or not base_metrics[metric]:
+                continue
+            change = (new_metrics[metric] - base_metrics[metric]) / base_metrics[metric]
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            rows.append((name, metric, base_metrics[metric], new_metrics[metric], change, worse > tolerance))
+    return rows
+
+
+def compare(args):
+    with open(args.base) as fp:
+        base = json.load(fp)
+    with open(args.new) as fp:
+        new = json.load(fp)
+    if base['objects'] != new['objects']:
+        print('Warning: runs used different bucket sizes ({} vs {} objects).'.format(
+            base['objects'], new['objects']), file=sys.stderr)
+
+    rows = compare_reports(base, new, args.tolerance)
+    print('{:<14} {:<15} {:>14} {:>14} {:>8}'.format('scenario', 'metric', 'base', 'new', 'change'))
+    for name, metric, base_value, new_value, change, regressed in rows:
+        print('{:<14} {:<15} {:>14,.3f} {:>14,.3f} {:>+7.1%}{}'.format(
+            name, metric, base_value, new_value, change, '  REGRESSION' if regressed else ''))
+    regressions = sum(1 for row in rows if row[-1])
+    if regressions:
+        print('{} regression(s) beyond {:.0%}.'.format(regressions, args.tolerance))
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the suite and write a report.')
+    run_parser.add_argument('-n', '--objects', type=int, default=DEFAULT_OBJECTS,
+                            help='Synthetic objects in the bucket (default {}).'.format(DEFAULT_OBJECTS))
+    run_parser.add_argument('-r', '--repeat', type=int, default=DEFAULT_REPEAT)
+    run_parser.add_argument('-s', '--scenarios', type=str, default=','.join(SCENARIOS),
+                            help='Comma separated scenarios to run (default all).')
+    run_parser.add_argument('--seed', type=int, default=None)
+    run_parser.add_argument('-o', '--output', type=str, default='benchmark.json')
+
+    compare_parser = commands.add_parser('compare', help='Compare two reports, flagging regressions.')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('-t', '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                                help='Relative change counted as a regression (default {}).'.format(
+                                    DEFAULT_TOLERANCE))
+
+    scenario_parser = commands.add_parser('scenario', help='Run a single scenario (used by "run").')
+    scenario_parser.add_argument('name', choices=SCENARIOS)
+    scenario_parser.add_argument('--endpoint', type=str, default=None)
+    scenario_parser.add_argument('-n', '--objects', type=int, default=DEFAULT_OBJECTS)
+    scenario_parser.add_argument('-r', '--repeat', type=int, default=DEFAULT_REPEAT)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        from synthetic import DEFAULT_SEED
+        if args.seed is None:
+            args.seed = DEFAULT_SEED
+        unknown = set(args.scenarios.split(',')) - set(SCENARIOS)
+        if unknown:
+            parser.error('Unknown scenario(s): {}'.format(', '.join(sorted(unknown))))
+        run_suite(args)
+    elif args.command == 'compare':
+        compare(args)
+    else:
+        print(json.dumps(run_scenario(args.name, args.endpoint, args.objects, args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
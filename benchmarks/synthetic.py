@@ -0,0 +1,99 @@
+"""
+Generates synthetic bucket contents that look like a real, well used bucket,
+and loads them straight into moto's in memory backend.
+
+Keys are spread over a handful of top level areas of very different
+popularity (logs, data exports, images, backups, ...), mostly date
+partitioned underneath. Sizes follow a log-normal distribution, with a
+sprinkling of empty files and "directory" placeholders, and modification
+times are spread over the last few years, skewed towards the recent.
+Everything is driven by a seeded random generator, so the same seed
+always gives the same bucket.
+
+Only the object metadata is real: moto is handed empty bodies and then
+told the synthetic size, so millions of objects do not need gigabytes of
+memory (moto still keeps a few KB of bookkeeping per object).
+"""
+import math
+import random
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_SEED = 20201001
+
+# Top level areas: (prefix, relative popularity, file extension, median size, sigma of log size)
+AREAS = (
+    ('logs/', 40, 'log.gz', 64 * 1024, 1.5),
+    ('data/exports/', 25, 'parquet', 8 * 1024 ** 2, 1.2),
+    ('images/', 20, 'jpg', 350 * 1024, 0.8),
+    ('backups/', 5, 'tar.gz', 512 * 1024 ** 2, 1.0),
+    ('tmp/', 7, 'tmp', 4 * 1024, 2.5),
+    ('', 3, 'txt', 2 * 1024, 1.5),
+)
+# Share of placeholders (keys ending in '/') and of empty files
+PLACEHOLDER_RATE = 0.002
+EMPTY_RATE = 0.01
+MAX_SIZE = 5 * 1024 ** 4
+HISTORY_DAYS = 3 * 365
+NOW = datetime(2020, 10, 1, tzinfo=timezone.utc)
+
+
+def synthetic_objects(n_objects, seed=DEFAULT_SEED):
+    """
+    :param n_objects: How many objects to generate.
+    :type n_objects: int
+    :param seed: Seed for the random generator.
+    :type seed: int
+    :return: Yields (key, size, last_modified) for each object, in no particular order.
+    :rtype: generator of tuple(str, int, datetime)
+    """
+    rng = random.Random(seed)
+    weights = [x[1] for x in AREAS]
+    for n in range(n_objects):
+        prefix, _, extension, median, sigma = rng.choices(AREAS, weights)[0]
+        # Recent days are busier: an exponential spread, cut off at the history length
+        age = min(rng.expovariate(1 / (HISTORY_DAYS / 4)), HISTORY_DAYS)
+        last_modified = NOW - timedelta(days=age)
+        if prefix in ('logs/', 'data/exports/'):
+            prefix = '{}year={:%Y}/month={:%m}/day={:%d}/'.format(prefix, last_modified, last_modified, last_modified)
+        elif prefix == 'images/':
+            prefix = '{}{:02x}/'.format(prefix, rng.randrange(256))
+
+        roll = rng.random()
+        if roll < PLACEHOLDER_RATE:
+            yield prefix or 'folder_{}/'.format(n), 0, last_modified
+            continue
+        size = 0 if roll < PLACEHOLDER_RATE + EMPTY_RATE else \
+            min(MAX_SIZE, int(rng.lognormvariate(math.log(median), sigma)))
+        yield '{}{:016x}_{:09d}.{}'.format(prefix, rng.getrandbits(64), n, extension), size, last_modified
+
+
+def fill_moto_bucket(bucket_name, n_objects, seed=DEFAULT_SEED, region='us-east-1'):
+    """
+    Creates a bucket in moto's backend and fills it with synthetic objects.
+
+    :param bucket_name: Bucket to create.
+    :type bucket_name: str
+    :param n_objects: How many objects to put in it.
+    :type n_objects: int
+    :param seed: Seed for the random generator.
+    :type seed: int
+    :param region: Region to create the bucket in.
+    :type region: str
+    :return: Expected totals: file count (placeholders excluded), cumulative size.
+    :rtype: tuple(int, int)
+    """
+    from moto.core import DEFAULT_ACCOUNT_ID
+    from moto.s3.models import s3_backends
+
+    backend = s3_backends[DEFAULT_ACCOUNT_ID]['global']
+    backend.create_bucket(bucket_name, region)
+    file_count, cumulative_size = 0, 0
+    for key, size, last_modified in synthetic_objects(n_objects, seed):
+        fake_key = backend.put_object(bucket_name, key, b'')
+        # Listings only report the metadata, so there is no need for a real body
+        fake_key.contentsize = size
+        fake_key.last_modified = last_modified.replace(tzinfo=None)
+        if not key.endswith('/'):
+            file_count += 1
+            cumulative_size += size
+    return file_count, cumulative_size
@@ -5,7 +5,21 @@ DATA_DIR=$S3X_PATH/data
 CRED_FILE=$DATA_DIR/.cred.json
 CRED_EXAMPLE=$S3X_PATH/installation_support/cred_EXAMPLE.json
 
-python3 -m venv env/env_s3explore
+RED='\033[0;31m'  # ANSI Red for printing critical WARNING
+GREEN='\033[0;32m'  # ANSI Green for printing Important reminder
+NC='\033[0m'  # ANSI No Color for ending highlighted output
+
+# The packages in requirements.txt need Python 3.10 or later; set PYTHON to use
+# an interpreter other than python3 (for example PYTHON=python3.10)
+PYTHON=${PYTHON:-python3}
+if ! "$PYTHON" -c 'import sys; sys.exit(sys.version_info < (3, 10))' 2>/dev/null; then
+  printf "${RED}\nERROR:\nS3Explore needs Python 3.10 or later, and '%s' is %s.\n" \
+    "$PYTHON" "$("$PYTHON" --version 2>&1)"
+  printf "Install a newer Python, and run setup.sh again with PYTHON set to it.\n${NC}"
+  exit 1
+fi
+
+"$PYTHON" -m venv env/env_s3explore
 source env/env_s3explore/bin/activate
 
 export S3X_PATH=${PWD}
@@ -18,10 +32,6 @@ if ! test -d "$DATA_DIR"; then
   echo "Created $DATA_DIR"
 fi
 
-RED='\033[0;31m'  # ANSI Red for printing critical WARNING
-GREEN='\033[0;32m'  # ANSI Green for printing Important reminder
-NC='\033[0m'  # ANSI No Color for ending highlighted output
-
 if test -f "$CRED_FILE"; then
     echo "Credential file '$CRED_FILE' already exists."
 else
@@ -1,6 +1,9 @@
-import boto3
 import json
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fastparse import FAST_PAGE
+from operator import itemgetter
 
 APP_HOME = os.environ['S3X_PATH']
 
@@ -10,47 +13,221 @@ SIZE = 'Size'
 LAST_MODIFIED = 'LastModified'
 IS_TRUNCATED = 'IsTruncated'
 NEXT_CONTINUATION_TOKEN = 'NextContinuationToken'
+BUCKETS = 'Buckets'
 
+_logger = logging.getLogger(__name__)
 
-def explore_bucket(my_info, s3_client):
+_get_key = itemgetter(KEY)
+_get_size = itemgetter(SIZE)
+_get_last_modified = itemgetter(LAST_MODIFIED)
+
+# botocore's own default; we only ever grow the pool past this
+DEFAULT_POOL_CONNECTIONS = 10
+
+
+def iter_pages(s3_client, cont_token=None, **search_params):
     """
-    This is the 'star of the show', which does one of the two main jobs,
-    in this case traversing the bucket and gathering desired information.
+    Follows the continuation token chain of list_objects_v2, handing
+    back each response page as it arrives.
 
-    :param my_info: An initiated BucketInfo object not yet containing detailed file info.
-    :type my_info: BucketInfo
     :param s3_client: The client that will be used to gain access to AWS.
     :type s3_client: boto3.s3.client
-    :return: Returns the BucketInfo data structure now filled in with results
-    :rtype: BucketInfo
+    :param cont_token: Pick up a previous listing from this continuation token.
+    :type cont_token: str or None
+    :param search_params: Parameters passed straight through to list_objects_v2,
+    at the very least Bucket.
+    :return: Yields each response page.
+    :rtype: generator of dict
     """
-
     keep_fetching = True
-    cont_token = None
-    search_params = dict(Bucket=my_info.name)
     while keep_fetching:
         keep_fetching = False
         if cont_token is not None:
             search_params.update(dict(ContinuationToken=cont_token))
 
         resp = s3_client.list_objects_v2(**search_params)
+        yield resp
 
-        if CONTENTS in resp:
-            for obj in resp[CONTENTS]:
-                if not obj[KEY].endswith('/'):
-                    my_info.add_file(obj[SIZE], obj[LAST_MODIFIED])
         if IS_TRUNCATED in resp:
             keep_fetching = resp[IS_TRUNCATED]
         if keep_fetching:
             cont_token = resp[NEXT_CONTINUATION_TOKEN]
+
+
+def iter_marked_pages(list_method, markers, **search_params):
+    """
+    The same as iter_pages, for the listings that page with markers
+    rather than a continuation token (list_object_versions,
+    list_multipart_uploads and list_parts).
+
+    :param list_method: The client method to call, for example s3_client.list_object_versions.
+    :type list_method: function
+    :param markers: Pairs of (response field, request parameter) carrying
+    each page's position on to the next, for example ('NextKeyMarker', 'KeyMarker').
+    :type markers: tuple of tuple(str, str)
+    :param search_params: Parameters passed straight through to list_method,
+    at the very least Bucket.
+    :return: Yields each response page.
+    :rtype: generator of dict
+    """
+    while True:
+        resp = list_method(**search_params)
+        yield resp
+        if not resp.get(IS_TRUNCATED):
+            return
+        for next_marker, marker in markers:
+            if resp.get(next_marker) is not None:
+                search_params[marker] = resp[next_marker]
+
+
+def add_page(my_info, resp):
+    """
+    Tallies the files found in a single list_objects_v2 response page.
+    "Directory" placeholder keys (ending in '/') are not counted as files.
+
+    The whole page is folded into the running totals in one go; sum() and
+    max() over the page do the per object work in C, rather than updating
+    BucketInfo attributes once per object. Only a breakdown or top objects,
+    if they are being gathered, go through the page object by object.
+
+    :param my_info: BucketInfo collecting the running totals.
+    :type my_info: BucketInfo
+    :param resp: A list_objects_v2 response page.
+    :type resp: dict
+    """
+    if FAST_PAGE in resp:
+        page = resp[FAST_PAGE]
+        my_info.add_totals(page.file_count, page.cumulative_size, page.most_recent_mod)
+    elif CONTENTS in resp:
+        files = resp[CONTENTS]
+        # Placeholders are rare, so check for them all at once (a key ending
+        # in '/' always shows up as '/\n' once joined) before filtering.
+        if '/\n' in '\n'.join(map(_get_key, files)) + '\n':
+            files = [obj for obj in files if not obj[KEY].endswith('/')]
+        if files:
+            my_info.add_totals(len(files),
+                               sum(map(_get_size, files)),
+                               max(map(_get_last_modified, files)))
+            if my_info.breakdown is not None:
+                my_info.breakdown.add_files(files)
+            if my_info.top_objects is not None:
+                my_info.top_objects.add_files(files)
+
+
+def page_last_key(resp):
+    """
+    :param resp: A list_objects_v2 response page.
+    :type resp: dict
+    :return: The last key listed on the page, or None if it listed none.
+    :rtype: str or None
+    """
+    if FAST_PAGE in resp:
+        return resp[FAST_PAGE].last_key
+    if resp.get(CONTENTS):
+        return resp[CONTENTS][-1][KEY]
+    return None
+
+
+def explore_bucket(my_info, s3_client, checkpointer=None, scope=None):
+    """
+    This is the 'star of the show', which does one of the two main jobs,
+    in this case traversing the bucket and gathering desired information.
+
+    :param my_info: An initiated BucketInfo object not yet containing detailed file info.
+    :type my_info: BucketInfo
+    :param s3_client: The client that will be used to gain access to AWS.
+    :type s3_client: boto3.s3.client
+    :param checkpointer: If supplied, progress is saved as we go (and picked
+    back up, if the checkpointer is resuming a previous run).
+    :type checkpointer: Checkpointer or None
+    :param scope: If supplied, only the keys in scope are listed (and counted).
+    Checkpoints are not kept of scoped listings.
+    :type scope: KeyScope or None
+    :return: Returns the BucketInfo data structure now filled in with results
+    :rtype: BucketInfo
+    """
+    if scope is not None:
+        for resp in scope.iter_pages(s3_client, my_info.name):
+            add_page(my_info, scope.filter_page(resp))
+        return my_info
+
+    if checkpointer is None:
+        for resp in iter_pages(s3_client, Bucket=my_info.name):
+            add_page(my_info, resp)
+        return my_info
+
+    checkpoint = checkpointer.start(my_info)
+    if checkpoint.complete:
+        return my_info
+    try:
+        for resp in iter_pages(s3_client, checkpoint.cont_token, Bucket=my_info.name):
+            add_page(my_info, resp)
+            checkpoint.page_done(my_info, resp.get(NEXT_CONTINUATION_TOKEN))
+    except BaseException:
+        # Expired credentials, Ctrl-C, etc.: keep what we have so far
+        try:
+            checkpoint.save()
+        except Exception:
+            # A full disk, say; what went wrong in the first place is what gets raised
+            _logger.exception('Saving the checkpoint of %s failed', my_info.name)
+        raise
+    checkpoint.finish(my_info)
     return my_info
 
 
+def explore_buckets(bucket_infos, s3_client, workers=1, sorted_output=False,
+                    explore=explore_bucket):
+    """
+    Runs explore_bucket over many buckets, optionally in a bounded thread pool.
+    The boto3 client is thread safe, so all workers share it (and its connection
+    pool, which should be sized to at least the number of workers). Results are
+    yielded back to the calling thread, so whatever consumes them (ResultHandler)
+    never has to deal with concurrent updates.
+
+    :param bucket_infos: Initiated BucketInfo objects, one per bucket to explore.
+    :type bucket_infos: iterable of BucketInfo
+    :param s3_client: The client that will be used to gain access to AWS.
+    :type s3_client: boto3.s3.client
+    :param workers: How many buckets to explore at the same time. Default: 1 (serial).
+    :type workers: int
+    :param sorted_output: Yield results sorted by bucket name rather than in
+    the order they finish. Default: False.
+    :type sorted_output: bool
+    :param explore: Function used to explore each bucket, called the same way
+    as explore_bucket. Default: explore_bucket.
+    :type explore: function
+    :return: Yields each BucketInfo once it has been filled in.
+    :rtype: generator of BucketInfo
+    """
+    if sorted_output:
+        bucket_infos = sorted(bucket_infos, key=lambda x: x.name)
+
+    if workers <= 1:
+        for my_info in bucket_infos:
+            yield explore(my_info, s3_client)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(explore, my_info, s3_client)
+                   for my_info in bucket_infos]
+        if sorted_output:
+            # Waiting on each in turn still streams results out as soon
+            # as every bucket ahead of it (by name) has finished.
+            for future in futures:
+                yield future.result()
+        else:
+            for future in as_completed(futures):
+                yield future.result()
+
+
 class AccessHandler:
     """
     This encapsulates the initiation of an s3 client, depending on
     whether the user has AWS CLI installed and will use pre-exisitng
     credentials, or they will edit the app-specific .cred.json
+
+    boto3 is only imported once a handler is actually created, so code paths
+    that never talk to AWS (--help, for one) do not pay for loading it.
     """
     CREDENTIALS_PATH = 'data/.cred.json'
     AWS_PROFILES = 'aws_profiles'
@@ -59,8 +236,12 @@ class AccessHandler:
             self,
             profile_name,
             use_aws_cli_profiles=False,
-            cred_path=CREDENTIALS_PATH
+            cred_path=CREDENTIALS_PATH,
+            max_pool_connections=DEFAULT_POOL_CONNECTIONS
     ):
+        import boto3
+        from botocore.config import Config
+
         if use_aws_cli_profiles:
             # This simply preps a parameter that boto3 will ingest
             creds = dict(profile_name=profile_name)
@@ -70,8 +251,91 @@ class AccessHandler:
             creds = self._fetch_creds(profile_name,
                                       os.path.join(APP_HOME, cred_path))
         self._session = boto3.Session(**creds)
-        self.s3_client = self._session.client('s3')
-        self.s3_resource = self._session.resource('s3')
+        # When exploring buckets concurrently, each worker holds a connection
+        # while its request is in flight, so the pool needs to be at least as big
+        # as the number of workers or requests will queue up waiting for one.
+        self._client_config = Config(
+            max_pool_connections=max(max_pool_connections, DEFAULT_POOL_CONNECTIONS)
+        )
+        self.s3_client = self._session.client('s3', config=self._client_config)
+        self._s3_resource = None
+
+    @property
+    def s3_resource(self):
+        """
+        The higher level boto3 resource is fairly expensive to build and
+        the main program no longer needs it, so it is only created on request.
+
+        :return: boto3 s3 resource sharing this handler's session.
+        :rtype: boto3.resources.factory.s3.ServiceResource
+        """
+        if self._s3_resource is None:
+            self._s3_resource = self._session.resource('s3')
+        return self._s3_resource
+
+    def client(self, service_name, region_name=None):
+        """
+        :param service_name: Any AWS service, for example 'cloudwatch'.
+        :type service_name: str
+        :param region_name: Region for the client, if not the session's own.
+        :type region_name: str or None
+        :return: boto3 client sharing this handler's session (and so its credentials).
+        :rtype: botocore.client.BaseClient
+        """
+        return self._session.client(service_name, region_name=region_name)
+
+    def regional_s3_client(self, region_name):
+        """
+        :param region_name: Region for the client.
+        :type region_name: str
+        :return: boto3 s3 client in the given region, with a connection pool
+        sized the same as the handler's own client.
+        :rtype: boto3.s3.client
+        """
+        return self._session.client('s3', region_name=region_name, config=self._client_config)
+
+    def get_credentials(self):
+        """
+        :return: The session's credentials, for signing requests made outside boto3.
+        :rtype: botocore.credentials.Credentials
+        """
+        return self._session.get_credentials()
+
+    def get_ca_bundle(self):
+        """
+        :return: Certificates boto3 verifies TLS connections with (from AWS_CA_BUNDLE
+        or the profile's ca_bundle), for connections made outside boto3, or None for the system's.
+        :rtype: str or None
+        """
+        return self._session._session.get_config_variable('ca_bundle')
+
+    def list_buckets(self):
+        """
+        Enumerates buckets with a single call on the plain client.
+
+        :return: The 'Buckets' entries of list_buckets, each with a Name and CreationDate.
+        :rtype: list of dict
+        """
+        return self.s3_client.list_buckets()[BUCKETS]
+
+    @classmethod
+    def list_profiles(cls, use_aws_cli_profiles=False, cred_path=CREDENTIALS_PATH):
+        """
+        :param use_aws_cli_profiles: List the AWS CLI's profiles, rather than the app's own.
+        :type use_aws_cli_profiles: bool
+        :param cred_path: The app's credential file, relative to the app's home.
+        :type cred_path: str
+        :return: Every profile that could be explored, in the order they are set up.
+        :rtype: list of str
+        """
+        if use_aws_cli_profiles:
+            import boto3
+            return list(boto3.Session().available_profiles)
+        with open(os.path.join(APP_HOME, cred_path), 'r') as fp:
+            data_load = json.load(fp)
+        if (not isinstance(data_load, dict)) or (cls.AWS_PROFILES not in data_load):
+            raise ValueError('File "{}" is not in the correct format for credential storage.'.format(cred_path))
+        return list(data_load[cls.AWS_PROFILES])
 
     @staticmethod
     def _fetch_creds(
@@ -0,0 +1,323 @@
+import asyncio
+import queue
+import random
+import re
+import threading
+import time
+from aiobotocore.credentials import AioCredentials
+from access import add_page
+from defaults import DEFAULT_MAX_IN_FLIGHT, DEFAULT_PER_BUCKET_IN_FLIGHT
+from fastparse import enable_fast_parse
+from shards import Shard, next_shards, DEFAULT_MAX_DEPTH, DEFAULT_SPLIT_AFTER_PAGES
+from throttle import AimdController, AdaptiveGate
+
+DEFAULT_MAX_RETRIES = 5
+# The same as botocore's own defaults, in seconds
+DEFAULT_CONNECT_TIMEOUT = 60
+DEFAULT_READ_TIMEOUT = 60
+RETRY_BASE_DELAY = 0.1
+
+# S3 asking us to slow down: retried, and the bucket's limit is cut back
+THROTTLE_STATUS = (503,)
+THROTTLE_CODES = ('SlowDown', 'ServiceUnavailable')
+# Server side hiccups, worth another try but no reason to slow down
+RETRYABLE_STATUS = (500, 502, 504)
+RETRYABLE_CODES = ('InternalError', 'RequestTimeout')
+REGION_HEADER = 'x-amz-bucket-region'
+# AWS' own endpoints are left for botocore to work out, bucket by bucket
+_AWS_ENDPOINT_PATTERN = re.compile(r'^https://s3(\.[a-z0-9-]+)?\.amazonaws\.com/?$')
+
+
+class AsyncScanError(Exception):
+    """
+    A listing request S3 turned down (after any retries).
+    """
+    def __init__(self, bucket_name, status, code):
+        super().__init__('Listing bucket "{}" failed with {} {}.'.format(bucket_name, status, code))
+        self.bucket_name = bucket_name
+        self.status = status
+        self.code = code
+
+
+class _SharedCredentials(AioCredentials):
+    """
+    Lets an aiobotocore client sign with boto3's own credentials, so
+    temporary ones are refreshed just as they are for the threads engine.
+    """
+    def __init__(self, credentials):
+        frozen = credentials.get_frozen_credentials()
+        super().__init__(frozen.access_key, frozen.secret_key, frozen.token, account_id=frozen.account_id)
+        self._credentials = credentials
+
+    async def get_frozen_credentials(self):
+        return self._credentials.get_frozen_credentials()
+
+
+class AsyncScanner:
+    """
+    Explores many buckets (and the shards within them) on a single event loop.
+    Listing requests go through one aiobotocore client, and are read with the
+    fast parser, so thousands of requests can be in flight without a thread
+    (or a full botocore parse) for each.
+
+    Two limits keep things in check: a global cap on requests in flight,
+    and a per bucket cap, so one huge bucket's shards cannot crowd out every
+    other bucket waiting its turn. Within its cap, each bucket's limit is
+    adjusted as the scan goes (see AimdController): raised while requests
+    come back quickly, cut back whenever S3 starts throttling.
+    """
+    def __init__(self,
+                 credentials,
+                 region: str,
+                 endpoint_url: str,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 per_bucket_in_flight: int = DEFAULT_PER_BUCKET_IN_FLIGHT,
+                 max_depth: int = DEFAULT_MAX_DEPTH,
+                 split_after_pages: int = DEFAULT_SPLIT_AFTER_PAGES,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 page_size: int = None,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 ca_bundle: str = None,
+                 metrics=None):
+        """
+        :param credentials: botocore credentials used to sign requests.
+        :type credentials: botocore.credentials.Credentials
+        :param region: Region of the client (buckets elsewhere are redirected).
+        :type region: str
+        :param endpoint_url: S3 endpoint, for example that of an existing boto3 client.
+        :type endpoint_url: str
+        :param max_in_flight: Most listing requests in flight at once, overall.
+        :type max_in_flight: int
+        :param per_bucket_in_flight: Most listing requests in flight at once for any one bucket;
+        the adaptive limit for each bucket never goes above this.
+        :type per_bucket_in_flight: int
+        :param max_depth: How many prefix levels deep to split each bucket's key space.
+        :type max_depth: int
+        :param split_after_pages: Pages a shard lists before the rest of it is split up.
+        :type split_after_pages: int
+        :param max_retries: Attempts at a request that failed in a retryable way.
+        :type max_retries: int
+        :param page_size: Keys per listing page, S3's own default (1000) if None.
+        :type page_size: int or None
+        :param connect_timeout: Seconds to wait for a connection to S3, before trying again.
+        :type connect_timeout: float
+        :param read_timeout: Seconds to wait for each read of a response, before trying again.
+        :type read_timeout: float
+        :param ca_bundle: Certificates to verify S3's with, rather than the system's.
+        :type ca_bundle: str or None
+        :param metrics: Records request and bucket timings, if given.
+        :type metrics: ScanMetrics or None
+        """
+        self._credentials = credentials
+        self._region = region
+        self._endpoint_url = None if _AWS_ENDPOINT_PATTERN.match(endpoint_url or '') else endpoint_url
+        self._max_in_flight = max_in_flight
+        self._per_bucket_in_flight = per_bucket_in_flight
+        self._max_depth = max_depth
+        self._split_after_pages = split_after_pages
+        self._max_retries = max_retries
+        self._page_size = page_size
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._ca_bundle = ca_bundle
+        self._metrics = metrics
+        self._gate = None
+        self._client = None
+
+    @classmethod
+    def from_access_handler(cls, access_handler, **kwargs):
+        """
+        :param access_handler: Supplies the credentials, region, endpoint, timeouts and certificates to use.
+        :type access_handler: AccessHandler
+        :return: A scanner talking to S3 the same way the handler's client does.
+        :rtype: AsyncScanner
+        """
+        meta = access_handler.s3_client.meta
+        kwargs.setdefault('connect_timeout', meta.config.connect_timeout)
+        kwargs.setdefault('read_timeout', meta.config.read_timeout)
+        kwargs.setdefault('ca_bundle', access_handler.get_ca_bundle())
+        return cls(access_handler.get_credentials(), meta.region_name, meta.endpoint_url, **kwargs)
+
+    async def scan(self, bucket_infos, on_result):
+        """
+        Explores all buckets concurrently, within the in flight limits.
+
+        :param bucket_infos: Initiated BucketInfo objects, one per bucket to explore.
+        :type bucket_infos: iterable of BucketInfo
+        :param on_result: Called with each BucketInfo once it has been filled in.
+        :type on_result: function
+        """
+        from aiobotocore.config import AioConfig
+        from aiobotocore.session import get_session
+
+        session = get_session()
+        # Signing goes through the session's credentials, which botocore would otherwise look up afresh
+        session._credentials = _SharedCredentials(self._credentials)
+        config = AioConfig(max_pool_connections=self._max_in_flight,
+                           connect_timeout=self._connect_timeout,
+                           read_timeout=self._read_timeout,
+                           # Retries are made here, so each bucket's controller hears about every attempt
+                           retries=dict(total_max_attempts=1))
+        self._gate = asyncio.Semaphore(self._max_in_flight)
+        async with session.create_client('s3', region_name=self._region, endpoint_url=self._endpoint_url,
+                                         verify=self._ca_bundle, config=config) as self._client:
+            enable_fast_parse(self._client)
+            tasks = [asyncio.ensure_future(self.scan_bucket(x)) for x in bucket_infos]
+            try:
+                for task in asyncio.as_completed(tasks):
+                    on_result(await task)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    async def scan_bucket(self, my_info):
+        """
+        The asyncio counterpart of explore_bucket_sharded.
+
+        :param my_info: An initiated BucketInfo object not yet containing detailed file info.
+        :type my_info: BucketInfo
+        :return: Returns the BucketInfo data structure now filled in with results
+        :rtype: BucketInfo
+        """
+        started = time.perf_counter()
+        my_info.throttle = AimdController(max_limit=self._per_bucket_in_flight)
+        bucket_gate = AdaptiveGate(my_info.throttle)
+        pending = {asyncio.ensure_future(self._scan_shard(my_info, Shard(), bucket_gate))}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    partial, children = task.result()
+                    my_info.merge(partial)
+                    for shard in children:
+                        pending.add(asyncio.ensure_future(self._scan_shard(my_info, shard, bucket_gate)))
+        finally:
+            for task in pending:
+                task.cancel()
+        if self._metrics is not None:
+            self._metrics.record_bucket(my_info, time.perf_counter() - started)
+        return my_info
+
+    async def _scan_shard(self, my_info, shard, bucket_gate):
+        partial = my_info.empty_copy()
+        children = []
+        search_params = shard.search_params(my_info.name)
+        if self._page_size is not None:
+            search_params['MaxKeys'] = self._page_size
+        pages = 0
+        while True:
+            resp = await self._list_page(search_params, bucket_gate)
+            add_page(partial, resp)
+            pages += 1
+            new_shards, stop = next_shards(shard, resp, pages, self._max_depth, self._split_after_pages)
+            children.extend(new_shards)
+            if stop or not resp['IsTruncated']:
+                return partial, children
+            search_params['ContinuationToken'] = resp['NextContinuationToken']
+
+    async def _list_page(self, search_params, bucket_gate):
+        """
+        Lists one page, retrying as needed, and lets the bucket's
+        controller know how each attempt went.
+
+        :param search_params: list_objects_v2 parameters (Bucket, Prefix, etc.).
+        :type search_params: dict
+        :param bucket_gate: Limits the requests in flight for this bucket.
+        :type bucket_gate: AdaptiveGate
+        :return: A response page, as from a fast parsing boto3 client.
+        :rtype: dict
+        """
+        from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+        bucket_name = search_params['Bucket']
+        page_started = time.monotonic()
+        attempt = 0
+        while True:
+            status = code = None
+            # Take the bucket's own slot first, so waiting on it never holds up a global one.
+            # Slots are given back before any retry back off, so others can go ahead.
+            async with bucket_gate:
+                async with self._gate:
+                    started = time.monotonic()
+                    try:
+                        resp = await self._send(search_params)
+                    except ClientError as error:
+                        resp = error.response
+                        status = resp.get('ResponseMetadata', {}).get('HTTPStatusCode')
+                        code = resp.get('Error', {}).get('Code')
+                    except (ConnectionError, HTTPClientError):
+                        # Dropped or timed out connections say nothing about how busy the bucket is
+                        resp = {}
+                    latency = time.monotonic() - started
+            region = resp.get('ResponseMetadata', {}).get('HTTPHeaders', {}).get(REGION_HEADER, self._region)
+
+            if resp and (code is None):
+                await bucket_gate.on_success(latency)
+                self._record_request(bucket_name, page_started, attempt, region=region)
+                return resp
+
+            attempt += 1
+            throttled = (status in THROTTLE_STATUS) or (code in THROTTLE_CODES)
+            if throttled:
+                await bucket_gate.on_throttle()
+            retryable = throttled or (not resp) or (status in RETRYABLE_STATUS) or (code in RETRYABLE_CODES)
+            if (not retryable) or (attempt > self._max_retries):
+                self._record_request(bucket_name, page_started, attempt - 1, error=True, region=region)
+                raise AsyncScanError(bucket_name, status, code)
+            await asyncio.sleep(random.uniform(0, RETRY_BASE_DELAY * 2 ** attempt))
+
+    def _record_request(self, bucket_name, started, retries, error=False, region=None):
+        if self._metrics is not None:
+            self._metrics.record_request('ListObjectsV2', bucket_name, time.monotonic() - started,
+                                         retries=retries, error=error, region=region)
+
+    async def _send(self, search_params):
+        return await self._client.list_objects_v2(**search_params)
+
+
+def explore_buckets_async(bucket_infos, scanner, sorted_output=False):
+    """
+    Runs an AsyncScanner on its own thread, handing results back to the calling
+    thread as they complete; a drop in replacement for explore_buckets.
+
+    :param bucket_infos: Initiated BucketInfo objects, one per bucket to explore.
+    :type bucket_infos: iterable of BucketInfo
+    :param scanner: The scanner to explore them with.
+    :type scanner: AsyncScanner
+    :param sorted_output: Yield results sorted by bucket name rather than in
+    the order they finish. Default: False.
+    :type sorted_output: bool
+    :return: Yields each BucketInfo once it has been filled in.
+    :rtype: generator of BucketInfo
+    """
+    bucket_infos = list(bucket_infos)
+    results = queue.Queue()
+    done = object()
+
+    def run():
+        try:
+            asyncio.run(scanner.scan(bucket_infos, results.put))
+        except BaseException as error:
+            results.put(error)
+        results.put(done)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+    names = sorted(x.name for x in bucket_infos)
+    finished = {}
+    while True:
+        result = results.get()
+        if result is done:
+            break
+        if isinstance(result, BaseException):
+            raise result
+        if not sorted_output:
+            yield result
+            continue
+        # Hold results back until every bucket ahead of them (by name) is done
+        finished[result.name] = result
+        while names and (names[0] in finished):
+            yield finished.pop(names.pop(0))
+    thread.join()
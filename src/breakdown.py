@@ -0,0 +1,197 @@
+KEY = 'Key'
+SIZE = 'Size'
+STORAGE_CLASS = 'StorageClass'
+DELIMITER = '/'
+
+DEFAULT_BREAKDOWN_DEPTH = 2
+DEFAULT_MAX_PREFIXES = 1000
+# Where files go once no more prefixes can be tracked
+OTHER = '(other)'
+# Listings leave the storage class out for some S3 compatible stores
+DEFAULT_STORAGE_CLASS = 'STANDARD'
+
+
+class Breakdown:
+    """
+    Where a bucket's files are: totals per prefix (down to a set depth), per
+    storage class, and per size range (each range twice as wide as the one
+    before), all gathered in the same pass as the bucket totals.
+
+    Memory stays bounded however big the bucket: once max_prefixes prefixes
+    are tracked, files under any new top level prefix are added to a single
+    "(other)" entry instead, and new prefixes further down are simply left
+    out (their files still count towards the prefix above them). Storage
+    classes and size ranges are few by nature.
+
+    Each entry is a [file count, total size] pair. Breakdowns of different
+    parts of a bucket can be merged; while under the prefix cap, the result
+    is exactly that of a single pass.
+    """
+    __slots__ = ('depth', 'max_prefixes', 'prefixes', 'storage_classes', 'sizes')
+
+    def __init__(self, depth: int = DEFAULT_BREAKDOWN_DEPTH, max_prefixes: int = DEFAULT_MAX_PREFIXES):
+        """
+        :param depth: How many levels of '/' delimited prefixes to keep totals for.
+        :type depth: int
+        :param max_prefixes: Most prefixes to keep totals for.
+        :type max_prefixes: int
+        """
+        self.depth = depth
+        self.max_prefixes = max_prefixes
+        # Prefix (ending in '/', or OTHER) -> [file count, total size]
+        self.prefixes = dict()
+        # Storage class -> [file count, total size]
+        self.storage_classes = dict()
+        # Size range n, holding sizes under 2 ** n (and at least 2 ** (n - 1)) -> [file count, total size]
+        self.sizes = dict()
+
+    def empty_copy(self):
+        """
+        :return: A Breakdown set up the same way, with nothing in it yet.
+        :rtype: Breakdown
+        """
+        return Breakdown(self.depth, self.max_prefixes)
+
+    def add_file(self, key: str, size: int, storage_class: str = None):
+        """
+        :param key: The file's key.
+        :type key: str
+        :param size: The file's size.
+        :type size: int
+        :param storage_class: The file's storage class, if known.
+        :type storage_class: str or None
+        """
+        prefixes = self.prefixes
+        parts = key.split(DELIMITER, self.depth)
+        end = 0
+        for level in range(len(parts) - 1):
+            end += len(parts[level]) + 1
+            prefix = key[:end]
+            totals = prefixes.get(prefix)
+            if totals is None:
+                if len(prefixes) < self.max_prefixes:
+                    totals = prefixes[prefix] = [0, 0]
+                elif level == 0:
+                    totals = prefixes.setdefault(OTHER, [0, 0])
+                else:
+                    # A new prefix further down: its files count towards the prefix above
+                    break
+            totals[0] += 1
+            totals[1] += size
+
+        storage_class = storage_class or DEFAULT_STORAGE_CLASS
+        totals = self.storage_classes.get(storage_class)
+        if totals is None:
+            totals = self.storage_classes[storage_class] = [0, 0]
+        totals[0] += 1
+        totals[1] += size
+
+        size_range = size.bit_length()
+        totals = self.sizes.get(size_range)
+        if totals is None:
+            totals = self.sizes[size_range] = [0, 0]
+        totals[0] += 1
+        totals[1] += size
+
+    def add_files(self, files):
+        """
+        :param files: 'Contents' entries of a list_objects_v2 page, placeholders already left out.
+        :type files: list of dict
+        """
+        add_file = self.add_file
+        for obj in files:
+            add_file(obj[KEY], obj[SIZE], obj.get(STORAGE_CLASS))
+
+    def merge(self, other):
+        """
+        Folds in the totals of another Breakdown, for example
+        of a single shard of the same bucket.
+
+        :param other: Partial breakdown to fold into this one.
+        :type other: Breakdown
+        """
+        prefixes = self.prefixes
+        # Every prefix is added after the one above it, so parents come first
+        for prefix, (file_count, cumulative_size) in other.prefixes.items():
+            totals = prefixes.get(prefix)
+            if totals is None:
+                parent = prefix[:prefix.rfind(DELIMITER, 0, -1) + 1]
+                if (len(prefixes) < self.max_prefixes) and ((not parent) or (parent in prefixes)):
+                    totals = prefixes[prefix] = [0, 0]
+                elif not parent:
+                    totals = prefixes.setdefault(OTHER, [0, 0])
+                else:
+                    continue
+            totals[0] += file_count
+            totals[1] += cumulative_size
+        for mine, theirs in ((self.storage_classes, other.storage_classes), (self.sizes, other.sizes)):
+            for name, (file_count, cumulative_size) in theirs.items():
+                totals = mine.setdefault(name, [0, 0])
+                totals[0] += file_count
+                totals[1] += cumulative_size
+
+    def top_prefixes(self, limit: int):
+        """
+        :param limit: Most prefixes to list by name.
+        :type limit: int
+        :return: The top level prefixes holding the most bytes, biggest first, with the
+        rest (and OTHER) added together as OTHER at the end.
+        :rtype: list of tuple(str, int, int)
+        """
+        top_level = [(prefix, file_count, cumulative_size)
+                     for prefix, (file_count, cumulative_size) in self.prefixes.items()
+                     if (prefix != OTHER) and (prefix.find(DELIMITER) == len(prefix) - 1)]
+        top_level.sort(key=lambda x: (-x[2], x[0]))
+        rest = top_level[limit:]
+        if OTHER in self.prefixes:
+            rest.append((OTHER,) + tuple(self.prefixes[OTHER]))
+        top_level = top_level[:limit]
+        if rest:
+            top_level.append((OTHER, sum(x[1] for x in rest), sum(x[2] for x in rest)))
+        return top_level
+
+    def as_dict(self):
+        """
+        :return: The breakdown as plain values, for logging. Size ranges are
+        keyed by the smallest size they hold.
+        :rtype: dict
+        """
+        return dict(
+            prefixes={x: list(y) for x, y in sorted(self.prefixes.items())},
+            storage_classes={x: list(y) for x, y in sorted(self.storage_classes.items())},
+            sizes={str(size_range_start(x)): list(y) for x, y in sorted(self.sizes.items())},
+        )
+
+    def as_state(self):
+        """
+        :return: Everything needed to carry on with the breakdown, as plain values ready for JSON.
+        :rtype: dict
+        """
+        return dict(depth=self.depth, max_prefixes=self.max_prefixes,
+                    prefixes={x: list(y) for x, y in self.prefixes.items()},
+                    storage_classes={x: list(y) for x, y in self.storage_classes.items()},
+                    sizes=[[x] + y for x, y in self.sizes.items()])
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        :param state: As returned by as_state.
+        :type state: dict
+        :return: The breakdown as it was.
+        :rtype: Breakdown
+        """
+        breakdown = cls(state['depth'], state['max_prefixes'])
+        breakdown.prefixes = {x: list(y) for x, y in state['prefixes'].items()}
+        breakdown.storage_classes = {x: list(y) for x, y in state['storage_classes'].items()}
+        breakdown.sizes = {x[0]: list(x[1:]) for x in state['sizes']}
+        return breakdown
+
+
+def size_range_start(size_range: int):
+    """
+    :param size_range: A Breakdown size range.
+    :type size_range: int
+    :return: Smallest size the range holds.
+    :rtype: int
+    """
+    return 0 if size_range == 0 else 2 ** (size_range - 1)
@@ -0,0 +1,183 @@
+import json
+import logging
+import os
+import time
+from defaults import DEFAULT_CHECKPOINT_INTERVAL
+from results import BucketInfo
+
+APP_HOME = os.environ['S3X_PATH']
+CHECKPOINT_EXTENSION = '.json'
+
+_logger = logging.getLogger(__name__)
+
+
+class BucketCheckpoint:
+    """
+    Checkpoint state for a single bucket. This is updated after every page,
+    so it only keeps a snapshot of the running totals in memory, and leaves
+    it to the clock to decide when the snapshot is worth writing to disk.
+    """
+    def __init__(self, path: str, bucket_name: str, interval: float):
+        """
+        :param path: Where the state file for this bucket lives.
+        :type path: str
+        :param bucket_name: The bucket being explored.
+        :type bucket_name: str
+        :param interval: Minimum seconds between writes while exploring.
+        :type interval: float
+        """
+        self._path = path
+        self._bucket_name = bucket_name
+        self._interval = interval
+        self._last_saved = time.monotonic()
+
+        self.cont_token = None
+        self.complete = False
+        self._totals = (0, 0, None)
+
+    def restore(self, my_info):
+        """
+        Loads a previously saved state (if there is one) into the BucketInfo.
+
+        :param my_info: BucketInfo not yet containing detailed file info.
+        :type my_info: BucketInfo
+        """
+        if not os.path.exists(self._path):
+            return
+        with open(self._path, 'r') as fp:
+            state = json.load(fp)
+        saved = BucketInfo.from_state(state)
+        if saved.name != self._bucket_name:
+            raise ValueError('Checkpoint "{}" belongs to bucket "{}", not "{}".'.format(
+                self._path, saved.name, self._bucket_name))
+
+        my_info.file_count = saved.file_count
+        my_info.cumulative_size = saved.cumulative_size
+        my_info.most_recent_mod = saved.most_recent_mod
+        self.cont_token = state['cont_token']
+        self.complete = state['complete']
+        self._totals = (my_info.file_count, my_info.cumulative_size, my_info.most_recent_mod)
+
+    def page_done(self, my_info, cont_token):
+        """
+        Called once each page has been tallied. Cheap enough for the page loop:
+        a tuple and a clock read, with a write only every 'interval' seconds.
+
+        :param my_info: BucketInfo with totals up to and including this page.
+        :type my_info: BucketInfo
+        :param cont_token: Continuation token for the next page.
+        :type cont_token: str or None
+        """
+        self.cont_token = cont_token
+        self._totals = (my_info.file_count, my_info.cumulative_size, my_info.most_recent_mod)
+        if time.monotonic() - self._last_saved >= self._interval:
+            self.save()
+
+    def finish(self, my_info):
+        """
+        Marks the bucket as done, so a resumed run can skip it entirely.
+
+        :param my_info: The completed BucketInfo.
+        :type my_info: BucketInfo
+        """
+        self.cont_token = None
+        self.complete = True
+        self._totals = (my_info.file_count, my_info.cumulative_size, my_info.most_recent_mod)
+        self.save()
+
+    def save(self):
+        """
+        Writes the last consistent snapshot to disk. The file is written
+        alongside and then renamed over the old one, so a crash mid-write
+        never leaves a corrupt checkpoint behind.
+        """
+        snapshot = BucketInfo(self._bucket_name, None)
+        snapshot.add_totals(*self._totals)
+        state = snapshot.as_state()
+        state.update(cont_token=self.cont_token, complete=self.complete)
+        temp_path = '{}.tmp'.format(self._path)
+        with open(temp_path, 'w') as fp:
+            json.dump(state, fp)
+        os.replace(temp_path, self._path)
+        self._last_saved = time.monotonic()
+
+
+class Checkpointer:
+    """
+    Keeps a state file per bucket under the 'data' directory, so an
+    interrupted run can pick up where it left off instead of starting over.
+
+    A bucket's checkpoint is only ever removed once the bucket is done, so
+    a run without resume starts its buckets over, but leaves the progress
+    of an interrupted run in place until each bucket is listed again.
+    """
+    CHECKPOINT_LOCATION = 'data/checkpoints'
+
+    def __init__(self,
+                 profile_name: str,
+                 resume: bool = False,
+                 interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+                 location: str = CHECKPOINT_LOCATION):
+        """
+        :param profile_name: Checkpoints are kept separately for each profile.
+        :type profile_name: str
+        :param resume: Pick up from existing checkpoints, rather than starting fresh.
+        :type resume: bool
+        :param interval: Minimum seconds between checkpoints of a bucket.
+        :type interval: float
+        :param location: Directory for checkpoints, relative to the app directory.
+        :type location: str
+        """
+        self._directory = os.path.join(APP_HOME, location, profile_name)
+        self._interval = interval
+        self._resume = resume
+        if not os.path.exists(self._directory):
+            os.makedirs(self._directory)
+        interrupted = self.interrupted()
+        if interrupted and not resume:
+            _logger.warning('Not resuming, so %d interrupted bucket(s) (%s) will be listed from the start, '
+                            'and their saved progress replaced; rerun with --resume to carry on from it.',
+                            len(interrupted), ', '.join(interrupted))
+
+    def start(self, my_info):
+        """
+        Sets up checkpointing for a bucket, restoring any saved progress into my_info
+        when resuming.
+
+        :param my_info: BucketInfo not yet containing detailed file info.
+        :type my_info: BucketInfo
+        :return: Checkpoint handle to update as the bucket is explored.
+        :rtype: BucketCheckpoint
+        """
+        checkpoint = BucketCheckpoint(
+            os.path.join(self._directory, '{}{}'.format(my_info.name, CHECKPOINT_EXTENSION)),
+            my_info.name,
+            self._interval
+        )
+        if self._resume:
+            checkpoint.restore(my_info)
+        return checkpoint
+
+    def interrupted(self):
+        """
+        :return: Names of the buckets with progress saved part way through.
+        :rtype: list of str
+        """
+        return sorted(name for name, complete in self._saved() if not complete)
+
+    def clear(self):
+        """
+        Removes the checkpoints of finished buckets, for example once a run has
+        completed. Those of buckets still part way through are left for --resume.
+        """
+        for name, complete in self._saved():
+            if complete:
+                os.remove(os.path.join(self._directory, '{}{}'.format(name, CHECKPOINT_EXTENSION)))
+
+    def _saved(self):
+        for file_name in sorted(os.listdir(self._directory)):
+            if not file_name.endswith(CHECKPOINT_EXTENSION):
+                continue
+            with open(os.path.join(self._directory, file_name), 'r') as fp:
+                state = json.load(fp)
+            yield state['bucket'], state['complete']
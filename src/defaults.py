@@ -0,0 +1,36 @@
+# Defaults of command line options whose modules are only imported once they
+# are used. They live here, rather than in those modules, so that s3explore
+# can show them in --help without importing anything heavy, while each module
+# still defaults to the very same value.
+
+# checkpoint
+DEFAULT_CHECKPOINT_INTERVAL = 30
+
+# inventory
+DEFAULT_INVENTORY_WORKERS = 4
+
+# regions
+DEFAULT_REGION_CACHE_DAYS = 7
+
+# fanout
+DEFAULT_PROFILE_WORKERS = 4
+
+# asyncscan
+DEFAULT_MAX_IN_FLIGHT = 64
+DEFAULT_PER_BUCKET_IN_FLIGHT = 8
+
+# sampling
+DEFAULT_SAMPLE_ERROR = 0.02
+DEFAULT_SAMPLE_SECONDS = 300.0
+
+# watch
+DEFAULT_WATCH_HOST = '127.0.0.1'
+DEFAULT_WATCH_PORT = 8321
+DEFAULT_WATCH_MIN_INTERVAL = 5 * 60
+DEFAULT_WATCH_MAX_INTERVAL = 24 * 60 * 60
+
+# progress
+DEFAULT_PROGRESS_PAGES = 10
+
+# workqueue
+DEFAULT_LEASE_SECONDS = 60.0
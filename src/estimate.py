@@ -0,0 +1,192 @@
+from datetime import datetime, timedelta, timezone
+
+NAMESPACE = 'AWS/S3'
+SIZE_METRIC = 'BucketSizeBytes'
+COUNT_METRIC = 'NumberOfObjects'
+BUCKET_NAME = 'BucketName'
+STORAGE_TYPE = 'StorageType'
+ALL_STORAGE_TYPES = 'AllStorageTypes'
+
+# S3 publishes its storage metrics once a day, and a little behind
+METRIC_PERIOD = 24 * 60 * 60
+LOOKBACK_DAYS = 3
+# Most queries a single GetMetricData call takes
+MAX_QUERIES = 500
+
+CLOUDWATCH = 'cloudwatch'
+
+
+class Estimate:
+    """
+    Marks a BucketInfo's numbers as an estimate rather than a count,
+    and says where they came from (and, if known, how far off they may be).
+    """
+    __slots__ = ('method', 'as_of', 'confidence', 'file_count_range', 'size_range', 'samples')
+
+    def __init__(self, method: str, as_of: datetime = None, confidence: float = None,
+                 file_count_range: tuple = None, size_range: tuple = None, samples: int = None):
+        """
+        :param method: How the numbers were arrived at, for example 'cloudwatch'.
+        :type method: str
+        :param as_of: When the numbers were true, if not at the time of the run.
+        :type as_of: datetime or None
+        :param confidence: Confidence level of the ranges, for example 0.95.
+        :type confidence: float or None
+        :param file_count_range: Lowest and highest likely file count.
+        :type file_count_range: tuple(int, int) or None
+        :param size_range: Lowest and highest likely total size.
+        :type size_range: tuple(int, int) or None
+        :param samples: How many samples the estimate was made from.
+        :type samples: int or None
+        """
+        self.method = method
+        self.as_of = as_of
+        self.confidence = confidence
+        self.file_count_range = file_count_range
+        self.size_range = size_range
+        self.samples = samples
+
+    def describe(self, date_display_format: str):
+        """
+        :param date_display_format: Format for the as of date.
+        :type date_display_format: str
+        :return: For display, for example "from CloudWatch storage metrics as of 09/30/2020".
+        :rtype: str
+        """
+        if self.method == CLOUDWATCH:
+            description = 'from CloudWatch storage metrics'
+        elif self.samples is not None:
+            description = 'by {} from {} samples'.format(self.method, self.samples)
+        else:
+            description = 'by {}'.format(self.method)
+        if self.as_of is not None:
+            description = '{} as of {}'.format(description, self.as_of.strftime(date_display_format))
+        return description
+
+    def as_dict(self):
+        """
+        :return: The estimate as plain values, for logging.
+        :rtype: dict
+        """
+        record = {name: getattr(self, name) for name in self.__slots__}
+        if self.as_of is not None:
+            record['as_of'] = self.as_of.isoformat()
+        return record
+
+
+def _list_bucket_metrics(cloudwatch_client, bucket_names):
+    """
+    :return: Every S3 storage metric CloudWatch has for the given buckets.
+    :rtype: list of dict
+    """
+    metrics = dict()
+    paginator = cloudwatch_client.get_paginator('list_metrics')
+    for metric_name in (SIZE_METRIC, COUNT_METRIC):
+        for page in paginator.paginate(Namespace=NAMESPACE, MetricName=metric_name):
+            for metric in page['Metrics']:
+                dimensions = {x['Name']: x['Value'] for x in metric['Dimensions']}
+                if dimensions.get(BUCKET_NAME) not in bucket_names:
+                    continue
+                # Object counts are only worth having over all storage types together
+                if (metric_name == COUNT_METRIC) and (dimensions.get(STORAGE_TYPE) != ALL_STORAGE_TYPES):
+                    continue
+                # A metric may be listed more than once, and would then be added up twice
+                metrics[(metric_name, tuple(sorted(dimensions.items())))] = metric
+    return list(metrics.values())
+
+
+def estimate_buckets(bucket_infos, cloudwatch_client, now=None):
+    """
+    Fills in file counts and total sizes from the daily storage metrics S3
+    sends to CloudWatch, rather than listing each bucket. The metrics are
+    found with ListMetrics, and fetched for all buckets together in as few
+    GetMetricData calls as possible (up to 500 metrics each), so the run
+    takes seconds however many buckets there are.
+
+    The numbers are at most a couple of days old, and count the way S3 bills
+    (every version of every object, across all storage classes), so each
+    bucket filled in is marked with an Estimate. The most recent
+    modification is not known this way, and is left empty.
+
+    :param bucket_infos: Initiated BucketInfo objects, not yet containing detailed file info.
+    :type bucket_infos: list of BucketInfo
+    :param cloudwatch_client: CloudWatch client, in the buckets' region.
+    :type cloudwatch_client: boto3.cloudwatch.client
+    :param now: End of the time window to look for metrics in (default: now).
+    :type now: datetime or None
+    :return: The buckets CloudWatch had no metrics for, still to be explored.
+    :rtype: list of BucketInfo
+    """
+    by_name = {x.name: x for x in bucket_infos}
+    now = now or datetime.now(timezone.utc)
+    metrics = _list_bucket_metrics(cloudwatch_client, by_name)
+
+    queries = dict()
+    for n, metric in enumerate(metrics):
+        queries['m{}'.format(n)] = metric
+
+    # Bucket name -> [total size, object count, latest timestamp]
+    found = dict()
+    paginator = cloudwatch_client.get_paginator('get_metric_data')
+    query_ids = list(queries)
+    for start in range(0, len(query_ids), MAX_QUERIES):
+        batch = [dict(Id=query_id,
+                      MetricStat=dict(Metric=queries[query_id], Period=METRIC_PERIOD, Stat='Average'),
+                      ReturnData=True)
+                 for query_id in query_ids[start:start + MAX_QUERIES]]
+        pages = paginator.paginate(MetricDataQueries=batch,
+                                   StartTime=now - timedelta(days=LOOKBACK_DAYS),
+                                   EndTime=now,
+                                   ScanBy='TimestampDescending')
+        for page in pages:
+            for result in page['MetricDataResults']:
+                if not result['Values']:
+                    continue
+                metric = queries[result['Id']]
+                bucket_name = next(x['Value'] for x in metric['Dimensions'] if x['Name'] == BUCKET_NAME)
+                totals = found.setdefault(bucket_name, [0, None, None])
+                # Newest first, so the first value is the latest
+                value, timestamp = result['Values'][0], result['Timestamps'][0]
+                if metric['MetricName'] == SIZE_METRIC:
+                    totals[0] += int(value)
+                else:
+                    totals[1] = int(value)
+                if (totals[2] is None) or (timestamp > totals[2]):
+                    totals[2] = timestamp
+
+    missing = []
+    for my_info in bucket_infos:
+        totals = found.get(my_info.name)
+        # Without an object count there is no estimate worth giving
+        if (totals is None) or (totals[1] is None):
+            missing.append(my_info)
+            continue
+        my_info.cumulative_size, my_info.file_count = totals[0], totals[1]
+        my_info.estimate = Estimate(CLOUDWATCH, as_of=totals[2])
+    return missing
+
+
+def estimate_buckets_by_region(bucket_infos, region_of, cloudwatch_client, now=None):
+    """
+    estimate_buckets for buckets spread over several regions. S3 publishes
+    each bucket's storage metrics in the bucket's own region, so buckets are
+    grouped by region, and each group looked up in CloudWatch there.
+
+    :param bucket_infos: Initiated BucketInfo objects, not yet containing detailed file info.
+    :type bucket_infos: list of BucketInfo
+    :param region_of: Finds a bucket's region from its name (None if it cannot be found).
+    :type region_of: function
+    :param cloudwatch_client: Makes a CloudWatch client for a region (None for the default region).
+    :type cloudwatch_client: function
+    :param now: End of the time window to look for metrics in (default: now).
+    :type now: datetime or None
+    :return: The buckets CloudWatch had no metrics for, still to be explored, in the order given.
+    :rtype: list of BucketInfo
+    """
+    by_region = dict()
+    for my_info in bucket_infos:
+        by_region.setdefault(region_of(my_info.name), []).append(my_info)
+    missing = set()
+    for region, regional_infos in by_region.items():
+        missing.update(x.name for x in estimate_buckets(regional_infos, cloudwatch_client(region), now=now))
+    return [x for x in bucket_infos if x.name in missing]
@@ -0,0 +1,94 @@
+import multiprocessing
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from defaults import DEFAULT_PROFILE_WORKERS
+
+# Seconds to wait for a result before checking on the workers
+POLL_INTERVAL = 1.0
+
+# Set in each worker process: where to send results back to
+_results = None
+
+
+class ProfileScanError(Exception):
+    """
+    One or more profiles could not be explored. Every other
+    profile's results were still handed back before this was raised.
+    """
+    def __init__(self, failures):
+        """
+        :param failures: The exception each failed profile raised, by profile name.
+        :type failures: dict
+        """
+        self.failures = failures
+        super().__init__('Exploring failed for profile(s) {}'.format(
+            ', '.join('"{}" ({})'.format(x, y) for x, y in failures.items())))
+
+
+def _start_worker(results):
+    global _results
+    _results = results
+
+
+def _scan_in_worker(scan, profile_name):
+    """
+    Runs in a worker process: explores one profile, sending each
+    bucket back as soon as it is done, and a None once there are no more.
+    """
+    try:
+        scan(profile_name, lambda bucket_info: _results.put((profile_name, bucket_info)))
+    finally:
+        _results.put((profile_name, None))
+
+
+def explore_profiles(profiles, scan, workers=DEFAULT_PROFILE_WORKERS):
+    """
+    Explores several profiles (that is, usually, several AWS accounts) at
+    the same time, each in a worker process of its own, with its own
+    session and clients. A pool of 'workers' processes is started once and
+    takes on profiles as it gets through them, so interpreter start up and
+    imports are paid per worker rather than per profile.
+
+    Buckets are sent back to this process as each one is done, and handed
+    out in the order they arrive, so results stream in from every profile
+    at once. A profile that fails does not hold up the rest: once they are
+    all done, a ProfileScanError says which failed and why.
+
+    :param profiles: Names of the profiles to explore.
+    :type profiles: list of str
+    :param scan: Explores a single profile, called (in the worker process) as
+    scan(profile_name, report), where report is to be called with each completed
+    BucketInfo. It has to be picklable, for example a module level function.
+    :type scan: function
+    :param workers: How many profiles to explore at the same time.
+    :type workers: int
+    :return: Yields a (profile name, BucketInfo) pair for each bucket explored.
+    :rtype: generator of tuple(str, BucketInfo)
+    """
+    context = multiprocessing.get_context()
+    results = context.Queue()
+    failures = dict()
+    with ProcessPoolExecutor(max_workers=min(workers, len(profiles)), mp_context=context,
+                             initializer=_start_worker, initargs=(results,)) as executor:
+        futures = {x: executor.submit(_scan_in_worker, scan, x) for x in profiles}
+        remaining = set(profiles)
+        while remaining:
+            try:
+                profile_name, bucket_info = results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                # A worker that died outright never gets to say it is done
+                for profile_name in list(remaining):
+                    future = futures[profile_name]
+                    if future.done() and (future.exception() is not None):
+                        failures[profile_name] = future.exception()
+                        remaining.discard(profile_name)
+                continue
+            if bucket_info is not None:
+                yield profile_name, bucket_info
+            elif profile_name in remaining:
+                remaining.discard(profile_name)
+                exception = futures[profile_name].exception()
+                if exception is not None:
+                    failures[profile_name] = exception
+    if failures:
+        raise ProfileScanError(failures)
@@ -0,0 +1,158 @@
+import re
+from html import unescape
+from urllib.parse import unquote_plus
+
+# Key under which a fast parsed page shows up in the list_objects_v2 response
+FAST_PAGE = 'FastPage'
+IS_TRUNCATED = 'IsTruncated'
+NEXT_CONTINUATION_TOKEN = 'NextContinuationToken'
+KEY_COUNT = 'KeyCount'
+COMMON_PREFIXES = 'CommonPrefixes'
+PREFIX = 'Prefix'
+
+# What botocore gets to parse in place of the real body
+EMPTY_RESULT = b'<?xml version="1.0" encoding="UTF-8"?><ListBucketResult/>'
+
+# Key, LastModified and Size only ever appear inside <Contents>, so each
+# can be pulled out of the whole body in one pass, in document order.
+_KEY_PATTERN = re.compile(rb'<Key>([^<]*)</Key>')
+_LAST_MODIFIED_PATTERN = re.compile(rb'<LastModified>([^<]*)</LastModified>')
+_SIZE_PATTERN = re.compile(rb'<Size>(\d+)</Size>')
+_COMMON_PREFIX_PATTERN = re.compile(rb'<CommonPrefixes><Prefix>([^<]*)</Prefix></CommonPrefixes>')
+_IS_TRUNCATED_PATTERN = re.compile(rb'<IsTruncated>(true|false)</IsTruncated>')
+_NEXT_TOKEN_PATTERN = re.compile(rb'<NextContinuationToken>([^<]*)</NextContinuationToken>')
+_URL_ENCODED = b'<EncodingType>url</EncodingType>'
+
+
+def _timestamp_parser():
+    # The parser botocore itself uses, so dates come out identical
+    from botocore.parsers import DEFAULT_TIMESTAMP_PARSER
+    return DEFAULT_TIMESTAMP_PARSER
+
+
+class FastPage:
+    """
+    The totals of a single list_objects_v2 page, read straight from the
+    response body. Only the fields the totals need are pulled out, and
+    timestamps stay as text: S3 writes them all in the same fixed width
+    UTC format, so the newest is simply the largest string, and only that
+    one ever gets converted to a datetime.
+    """
+    __slots__ = ('file_count', 'cumulative_size', 'last_key', '_newest', '_most_recent_mod')
+
+    def __init__(self, file_count, cumulative_size, newest, last_key):
+        """
+        :param file_count: Number of files on the page.
+        :type file_count: int
+        :param cumulative_size: Total size of the files on the page.
+        :type cumulative_size: int
+        :param newest: Most recent LastModified on the page, as text (None if no files).
+        :type newest: str or None
+        :param last_key: Last key listed on the page, placeholders included (None if empty).
+        :type last_key: str or None
+        """
+        self.file_count = file_count
+        self.cumulative_size = cumulative_size
+        self.last_key = last_key
+        self._newest = newest
+        self._most_recent_mod = None
+
+    @property
+    def most_recent_mod(self):
+        """
+        :return: Most recent modification on the page (None if no files).
+        :rtype: datetime or None
+        """
+        if (self._most_recent_mod is None) and (self._newest is not None):
+            self._most_recent_mod = _timestamp_parser()(self._newest)
+        return self._most_recent_mod
+
+
+def _decode(raw, url_encoded):
+    # Handles the numeric character references XML allows, as well as &amp; etc.
+    value = unescape(raw.decode('utf-8'))
+    if url_encoded:
+        value = unquote_plus(value)
+    return value
+
+
+def _newest(timestamps):
+    if len({len(x) for x in timestamps}) == 1:
+        return max(timestamps)
+    # Not all in the same format after all, so compare them properly
+    parse = _timestamp_parser()
+    return max(timestamps, key=parse)
+
+
+def parse_list_objects(body):
+    """
+    Reads the fields needed for the running totals out of a raw
+    list_objects_v2 response body.
+
+    :param body: Raw XML response body.
+    :type body: bytes
+    :return: The page totals, and the paging / prefix fields of the response.
+    :rtype: tuple(FastPage, dict)
+    """
+    url_encoded = _URL_ENCODED in body
+    keys = _KEY_PATTERN.findall(body)
+    timestamps = _LAST_MODIFIED_PATTERN.findall(body)
+    sizes = _SIZE_PATTERN.findall(body)
+    if not (len(keys) == len(timestamps) == len(sizes)):
+        raise ValueError('Unexpected list_objects_v2 response layout.')
+
+    last_key = _decode(keys[-1], url_encoded) if keys else None
+
+    # Placeholders ("directories") are rare, so check for them all at once
+    # (a key ending in '/' always shows up as '/\n' once joined)
+    joined = b'\n'.join(keys) + b'\n'
+    if (b'/\n' in joined) or (url_encoded and (b'%2F\n' in joined)):
+        files = [n for n, key in enumerate(keys) if not _decode(key, url_encoded).endswith('/')]
+        sizes = [sizes[n] for n in files]
+        timestamps = [timestamps[n] for n in files]
+
+    page = FastPage(
+        file_count=len(sizes),
+        cumulative_size=sum(map(int, sizes)),
+        newest=_newest([x.decode('ascii') for x in timestamps]) if timestamps else None,
+        last_key=last_key,
+    )
+
+    fields = {
+        KEY_COUNT: len(keys),
+        COMMON_PREFIXES: [{PREFIX: _decode(x, url_encoded)}
+                          for x in _COMMON_PREFIX_PATTERN.findall(body)],
+    }
+    is_truncated = _IS_TRUNCATED_PATTERN.search(body)
+    fields[IS_TRUNCATED] = (is_truncated is not None) and (is_truncated.group(1) == b'true')
+    next_token = _NEXT_TOKEN_PATTERN.search(body)
+    if next_token is not None:
+        fields[NEXT_CONTINUATION_TOKEN] = _decode(next_token.group(1), False)
+    return page, fields
+
+
+def _before_parse(response_dict, customized_response_dict, **kwargs):
+    """
+    botocore event handler: parses successful list_objects_v2 bodies here,
+    and leaves botocore only a near empty document of its own to parse.
+    """
+    if response_dict['status_code'] != 200:
+        return
+    page, fields = parse_list_objects(response_dict['body'])
+    customized_response_dict.update(fields)
+    customized_response_dict[FAST_PAGE] = page
+    response_dict['body'] = EMPTY_RESULT
+
+
+def enable_fast_parse(s3_client):
+    """
+    Switches a client over to fast parsing of list_objects_v2 responses.
+    Pages then carry a FastPage (under 'FastPage') in place of 'Contents',
+    along with the IsTruncated, NextContinuationToken, KeyCount and
+    CommonPrefixes fields; everything else botocore would have parsed is skipped.
+
+    :param s3_client: The client to switch over.
+    :type s3_client: boto3.s3.client
+    """
+    s3_client.meta.events.register('before-parse.s3.ListObjectsV2', _before_parse,
+                                   unique_id='s3explore-fast-parse')
@@ -0,0 +1,233 @@
+import fcntl
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+APP_HOME = os.environ['S3X_PATH']
+
+# Every column holds one value per result, as fixed width little endian
+# integers of the given array type code, in a file of its own
+COLUMNS = dict(
+    time='q',             # When the result came in, seconds since the epoch
+    bucket='i',           # Line of the bucket's name in buckets.txt
+    file_count='q',
+    cumulative_size='q',
+    most_recent_mod='q',  # Seconds since the epoch, or NO_DATE
+    estimated='b',        # 1 if the numbers are an estimate rather than a count
+)
+NO_DATE = -2 ** 63
+PARTITION_FORMAT = '%Y-%m'
+COLUMN_EXTENSION = 'col'
+BUCKETS_FILE = 'buckets.txt'
+LOCK_FILE = '.lock'
+_SWAP_BYTES = sys.byteorder != 'little'
+
+
+def _to_seconds(when):
+    return NO_DATE if when is None else int(when.timestamp())
+
+
+class HistoryStore:
+    """
+    Every result a profile ever had, kept column by column so that trends
+    over thousands of runs can be worked out without reading them all back.
+
+    Results are partitioned by month, under "data/history/<profile>/<YYYY-MM>",
+    and each partition holds one file per column (see COLUMNS). Questions
+    over a period only open the partitions that overlap it, only read the
+    columns they need, and, as results are appended in time order, only
+    from the first result in the period on. Bucket names are kept once,
+    in "buckets.txt", and referred to by line number.
+
+    Columns are appended to one after the other, so a process killed in
+    between can leave some a result longer than others; the extra values
+    are dropped when the partition is next appended to, and never read.
+
+    Several processes may append to the same history at once (a --watch
+    daemon and a scheduled run, say): each append holds an exclusive lock
+    on the profile's history, and picks up any buckets and results the
+    others added first. Reading needs no lock, as only complete results
+    are ever read.
+    """
+    HISTORY_LOCATION = 'data/history'
+
+    def __init__(self, profile_name: str, clock=None, location: str = HISTORY_LOCATION):
+        """
+        :param profile_name: Each profile (account) gets a history of its own.
+        :type profile_name: str
+        :param clock: Source of the current time as a datetime, for tests.
+        :type clock: function or None
+        :param location: Directory for histories, relative to the app directory.
+        :type location: str
+        """
+        self._path = os.path.join(APP_HOME, location, profile_name)
+        self._clock = clock or (lambda: datetime.now(timezone.utc))
+        self._bucket_ids = dict()
+        self._bucket_names = []
+        # How much of the bucket names file has been read
+        self._names_read = 0
+
+    def bucket_names(self):
+        """
+        :return: Every bucket ever recorded, in the order they were first seen
+        (so a bucket's position is its id in the "bucket" column).
+        :rtype: list of str
+        """
+        # Only names added since last time (by any process) are read
+        path = os.path.join(self._path, BUCKETS_FILE)
+        if os.path.exists(path):
+            with open(path, 'rb') as fp:
+                fp.seek(self._names_read)
+                added = fp.read()
+            # A name cut short by a crash never got any results written
+            added = added[:added.rfind(b'\n') + 1]
+            for name in added.decode('utf-8').split('\n')[:-1]:
+                self._bucket_ids[name] = len(self._bucket_names)
+                self._bucket_names.append(name)
+            self._names_read += len(added)
+        return self._bucket_names
+
+    def append(self, bucket_info):
+        """
+        Adds a result to the history, as of now.
+
+        :param bucket_info: Completed bucket analysis.
+        :type bucket_info: BucketInfo
+        """
+        now = self._clock()
+        path = os.path.join(self._path, now.strftime(PARTITION_FORMAT))
+        os.makedirs(path, exist_ok=True)
+        with self._locked():
+            bucket_id = self._bucket_id(bucket_info.name)
+            rows = self._row_count(path)
+            # Kept in order, even if the clock steps back (or another process's
+            # clock is ahead), so periods can be found by bisection
+            seconds = int(now.timestamp())
+            if rows:
+                seconds = max(seconds, self._read_column(path, 'time', rows - 1, rows)[0])
+            values = dict(time=seconds,
+                          bucket=bucket_id,
+                          file_count=bucket_info.file_count,
+                          cumulative_size=bucket_info.cumulative_size,
+                          most_recent_mod=_to_seconds(bucket_info.most_recent_mod),
+                          estimated=int(bucket_info.estimate is not None))
+            for column, typecode in COLUMNS.items():
+                value = array(typecode, [values[column]])
+                if _SWAP_BYTES:
+                    value.byteswap()
+                with open(self._column_path(path, column), 'ab') as fp:
+                    # Drop anything past the last complete result
+                    fp.truncate(rows * value.itemsize)
+                    fp.write(value.tobytes())
+
+    def read(self, columns, since=None, until=None):
+        """
+        :param columns: Names of the columns wanted (see COLUMNS).
+        :type columns: list of str
+        :param since: Only results from this time on, if given.
+        :type since: datetime or None
+        :param until: Only results before this time, if given.
+        :type until: datetime or None
+        :return: The values of each column asked for, plus "time", one per result.
+        :rtype: dict of str to array
+        """
+        columns = list(dict.fromkeys(['time'] + list(columns)))
+        result = {x: array(COLUMNS[x]) for x in columns}
+        first = None if since is None else since.strftime(PARTITION_FORMAT)
+        last = None if until is None else until.strftime(PARTITION_FORMAT)
+        for partition in self.partitions():
+            if ((first is not None) and (partition < first)) or ((last is not None) and (partition > last)):
+                continue
+            path = os.path.join(self._path, partition)
+            rows = self._row_count(path)
+            times = self._read_column(path, 'time', 0, rows)
+            start = 0 if since is None else bisect_left(times, _to_seconds(since))
+            stop = rows if until is None else bisect_left(times, _to_seconds(until), start)
+            if start >= stop:
+                continue
+            for column in columns:
+                if column == 'time':
+                    result[column].extend(times[start:stop])
+                else:
+                    result[column].extend(self._read_column(path, column, start, stop))
+        return result
+
+    def latest(self, column: str, since=None):
+        """
+        :param column: Name of the column wanted (see COLUMNS).
+        :type column: str
+        :param since: Only look at results from this time on, if given.
+        :type since: datetime or None
+        :return: Each bucket's most recent value of the column, by name.
+        :rtype: dict
+        """
+        columns = self.read(['bucket', column], since=since)
+        names = self.bucket_names()
+        return {names[x]: y for x, y in zip(columns['bucket'], columns[column])}
+
+    def partitions(self):
+        """
+        :return: Names of the partitions there are, oldest first.
+        :rtype: list of str
+        """
+        if not os.path.isdir(self._path):
+            return []
+        return sorted(x for x in os.listdir(self._path) if os.path.isdir(os.path.join(self._path, x)))
+
+    def close(self):
+        """
+        Nothing is kept open between appends; here so that a store is closed like the result writers.
+        """
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self._path, LOCK_FILE), 'a') as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+
+    def _bucket_id(self, name: str):
+        # Only called with the lock held, so no other process is adding names meanwhile
+        self.bucket_names()
+        bucket_id = self._bucket_ids.get(name)
+        if bucket_id is None:
+            added = '{}\n'.format(name).encode('utf-8')
+            with open(os.path.join(self._path, BUCKETS_FILE), 'ab') as fp:
+                # Drop any name cut short by a crash
+                fp.truncate(self._names_read)
+                fp.write(added)
+            self._names_read += len(added)
+            bucket_id = self._bucket_ids[name] = len(self._bucket_names)
+            self._bucket_names.append(name)
+        return bucket_id
+
+    def _row_count(self, path: str):
+        """
+        :return: Number of complete results in a partition.
+        :rtype: int
+        """
+        rows = None
+        for column, typecode in COLUMNS.items():
+            column_path = self._column_path(path, column)
+            size = os.path.getsize(column_path) if os.path.exists(column_path) else 0
+            count = size // array(typecode).itemsize
+            rows = count if rows is None else min(rows, count)
+        return rows
+
+    def _read_column(self, path: str, column: str, start: int, stop: int):
+        values = array(COLUMNS[column])
+        with open(self._column_path(path, column), 'rb') as fp:
+            fp.seek(start * values.itemsize)
+            values.fromfile(fp, stop - start)
+        if _SWAP_BYTES:
+            values.byteswap()
+        return values
+
+    @staticmethod
+    def _column_path(path: str, column: str):
+        return os.path.join(path, '{}.{}'.format(column, COLUMN_EXTENSION))
@@ -0,0 +1,300 @@
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+APP_HOME = os.environ['S3X_PATH']
+
+CONTENTS = 'Contents'
+KEY = 'Key'
+SIZE = 'Size'
+LAST_MODIFIED = 'LastModified'
+
+# Pages waiting to be written; past this, listing waits for the writer to catch up
+DEFAULT_QUEUE_DEPTH = 256
+
+# Top level prefix of a key (everything up to and including the first '/'), in SQL
+_PREFIX_SQL = "CASE WHEN instr(key, '/') > 0 THEN substr(key, 1, instr(key, '/')) ELSE '' END"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    key TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS prefixes (
+    prefix TEXT PRIMARY KEY, file_count INTEGER NOT NULL,
+    cumulative_size INTEGER NOT NULL, most_recent_mod TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY, finished TEXT NOT NULL,
+    file_count INTEGER NOT NULL, cumulative_size INTEGER NOT NULL
+);
+"""
+
+
+class IndexDiff:
+    """
+    What changed in a bucket since it was last indexed.
+    """
+    __slots__ = ('first_run', 'added', 'added_bytes', 'deleted', 'deleted_bytes',
+                 'changed', 'size_growth', 'changed_prefixes', 'reused_prefixes')
+
+    def __init__(self, first_run=False):
+        """
+        :param first_run: True if there was no previous index to compare against.
+        :type first_run: bool
+        """
+        self.first_run = first_run
+        self.added = 0
+        self.added_bytes = 0
+        self.deleted = 0
+        self.deleted_bytes = 0
+        self.changed = 0
+        # Net change in the bucket's total size
+        self.size_growth = 0
+        self.changed_prefixes = 0
+        self.reused_prefixes = 0
+
+    def as_dict(self):
+        """
+        :return: The diff as plain values, for logging.
+        :rtype: dict
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __str__(self):
+        if self.first_run:
+            return 'first indexed run, nothing to compare against'
+        return '{} new ({} bytes), {} deleted ({} bytes), {} changed, size {:+d} bytes'.format(
+            self.added, self.added_bytes, self.deleted, self.deleted_bytes, self.changed, self.size_growth)
+
+
+class ObjectIndex:
+    """
+    An on disk (SQLite) index of every file in one bucket, as of the last
+    completed run. A run lists the bucket into a table of its own, and only
+    once the listing is complete is that compared with the index and then
+    swapped in, so an interrupted run never leaves a half updated index.
+
+    Totals are also kept for each top level prefix. Only prefixes with
+    changes in them are added up again; the rest are carried over as they were.
+    """
+    def __init__(self, path: str):
+        """
+        :param path: The index's database file (created if need be).
+        :type path: str
+        """
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(_SCHEMA)
+        self._listing = False
+
+    def begin_run(self):
+        """
+        Starts listing afresh, dropping what any unfinished earlier run left behind.
+        """
+        self._db.executescript("""
+            DROP TABLE IF EXISTS listing;
+            CREATE TABLE listing (key TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime TEXT NOT NULL) WITHOUT ROWID;
+        """)
+        self._listing = True
+
+    def add_files(self, rows):
+        """
+        :param rows: (key, size, last modified in ISO format) for each file listed.
+        :type rows: list of tuple(str, int, str)
+        """
+        with self._transaction():
+            self._db.executemany('INSERT OR REPLACE INTO listing VALUES (?, ?, ?)', rows)
+
+    def finish_run(self):
+        """
+        Compares the completed listing with the index, then makes it the new index.
+
+        :return: What changed since the last completed run.
+        :rtype: IndexDiff
+        """
+        if not self._listing:
+            self.begin_run()
+        db = self._db
+        first_run = db.execute('SELECT count(*) FROM runs').fetchone()[0] == 0
+        diff = IndexDiff(first_run)
+
+        diff.added, diff.added_bytes = db.execute("""
+            SELECT count(*), coalesce(sum(l.size), 0) FROM listing l
+            WHERE NOT EXISTS (SELECT 1 FROM objects o WHERE o.key = l.key)""").fetchone()
+        diff.deleted, diff.deleted_bytes = db.execute("""
+            SELECT count(*), coalesce(sum(o.size), 0) FROM objects o
+            WHERE NOT EXISTS (SELECT 1 FROM listing l WHERE l.key = o.key)""").fetchone()
+        diff.changed, changed_bytes = db.execute("""
+            SELECT count(*), coalesce(sum(l.size - o.size), 0) FROM listing l JOIN objects o ON o.key = l.key
+            WHERE l.size != o.size OR l.mtime != o.mtime""").fetchone()
+        diff.size_growth = diff.added_bytes - diff.deleted_bytes + changed_bytes
+
+        with self._transaction():
+            # Only prefixes something happened in need adding up again
+            db.execute('CREATE TEMP TABLE dirty (prefix TEXT PRIMARY KEY) WITHOUT ROWID')
+            db.execute("""
+                INSERT OR IGNORE INTO dirty
+                SELECT {prefix} FROM (
+                    SELECT key FROM listing l WHERE NOT EXISTS (
+                        SELECT 1 FROM objects o WHERE o.key = l.key AND o.size = l.size AND o.mtime = l.mtime)
+                    UNION ALL
+                    SELECT key FROM objects o WHERE NOT EXISTS (SELECT 1 FROM listing l WHERE l.key = o.key)
+                )""".format(prefix=_PREFIX_SQL))
+            diff.changed_prefixes = db.execute('SELECT count(*) FROM dirty').fetchone()[0]
+            diff.reused_prefixes = db.execute(
+                'SELECT count(*) FROM prefixes WHERE prefix NOT IN (SELECT prefix FROM dirty)').fetchone()[0]
+            db.execute('DELETE FROM prefixes WHERE prefix IN (SELECT prefix FROM dirty)')
+            db.execute("""
+                INSERT INTO prefixes
+                SELECT {prefix} AS p, count(*), sum(size), max(mtime) FROM listing
+                WHERE {prefix} IN (SELECT prefix FROM dirty) GROUP BY p""".format(prefix=_PREFIX_SQL))
+            db.execute('DROP TABLE dirty')
+
+            db.execute('DROP TABLE objects')
+            db.execute('ALTER TABLE listing RENAME TO objects')
+            db.execute("""
+                INSERT INTO runs (finished, file_count, cumulative_size)
+                SELECT datetime('now'), coalesce(sum(file_count), 0), coalesce(sum(cumulative_size), 0)
+                FROM prefixes""")
+        self._listing = False
+        return diff
+
+    def prefix_totals(self):
+        """
+        :return: File count, total size and most recent modification (ISO format)
+        of each top level prefix, as of the last completed run.
+        :rtype: dict of str to tuple(int, int, str)
+        """
+        return {row[0]: row[1:] for row in self._db.execute('SELECT * FROM prefixes ORDER BY prefix')}
+
+    def close(self):
+        self._db.close()
+
+    @contextmanager
+    def _transaction(self):
+        # The connection is in autocommit mode, so group statements explicitly
+        self._db.execute('BEGIN')
+        try:
+            yield
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+
+
+class IndexWriter:
+    """
+    Keeps the object index of every bucket explored, without slowing the
+    listing down: listing threads only hand each page's contents over to a
+    queue, and a single background thread does all the SQLite work.
+
+    Pages are picked up from the client's own responses (by way of a
+    botocore event), so any way of exploring a bucket with the client is
+    indexed, as long as the responses carry their Contents (not --fast_parse).
+    """
+    INDEX_LOCATION = 'data/index'
+
+    def __init__(self,
+                 profile_name: str,
+                 location: str = INDEX_LOCATION,
+                 queue_depth: int = DEFAULT_QUEUE_DEPTH):
+        """
+        :param profile_name: Indexes are kept separately for each profile.
+        :type profile_name: str
+        :param location: Directory for indexes, relative to the app directory.
+        :type location: str
+        :param queue_depth: Most pages waiting to be written at any one time.
+        :type queue_depth: int
+        """
+        self._directory = os.path.join(APP_HOME, location, profile_name)
+        if not os.path.exists(self._directory):
+            os.makedirs(self._directory)
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._indexes = dict()
+        self._thread = threading.Thread(target=self._run, name='index-writer', daemon=True)
+        self._thread.start()
+
+    def attach(self, s3_client):
+        """
+        Indexes every list_objects_v2 page the client receives from now on.
+
+        :param s3_client: The client used to explore buckets.
+        :type s3_client: boto3.s3.client
+        """
+        def on_page(http_response, parsed, model, context, **kwargs):
+            if (http_response.status_code == 200) and ('s3explore_index_bucket' in context):
+                self._queue.put((context['s3explore_index_bucket'], parsed.get(CONTENTS), None))
+
+        def note_bucket(params, context, **kwargs):
+            context['s3explore_index_bucket'] = params['Bucket']
+
+        events = s3_client.meta.events
+        events.register('provide-client-params.s3.ListObjectsV2', note_bucket,
+                        unique_id='s3explore-index-bucket')
+        events.register('after-call.s3.ListObjectsV2', on_page, unique_id='s3explore-index-page')
+
+    def finish(self, my_info):
+        """
+        Waits for all of a bucket's pages to be written, then updates its index.
+
+        :param my_info: The fully explored bucket.
+        :type my_info: BucketInfo
+        :return: What changed since the bucket was last indexed.
+        :rtype: IndexDiff
+        """
+        done = Future()
+        self._queue.put((my_info.name, None, done))
+        return done.result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def index_path(self, bucket_name):
+        """
+        :param bucket_name: The bucket.
+        :type bucket_name: str
+        :return: Where the bucket's index lives.
+        :rtype: str
+        """
+        return os.path.join(self._directory, '{}.sqlite'.format(bucket_name))
+
+    def _run(self):
+        # Buckets whose index could not be written, kept until the bucket is finished
+        errors = dict()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            bucket_name, contents, done = item
+            try:
+                if bucket_name in errors:
+                    if done is not None:
+                        done.set_exception(errors.pop(bucket_name))
+                    continue
+                index = self._indexes.get(bucket_name)
+                if index is None:
+                    index = self._indexes[bucket_name] = ObjectIndex(self.index_path(bucket_name))
+                    index.begin_run()
+                if done is None:
+                    if contents:
+                        index.add_files([(x[KEY], x[SIZE], x[LAST_MODIFIED].isoformat())
+                                         for x in contents if not x[KEY].endswith('/')])
+                    continue
+                diff = index.finish_run()
+                self._indexes.pop(bucket_name).close()
+                done.set_result(diff)
+            except Exception as error:
+                index = self._indexes.pop(bucket_name, None)
+                if index is not None:
+                    index.close()
+                if done is not None:
+                    done.set_exception(error)
+                else:
+                    errors[bucket_name] = error
+        for index in self._indexes.values():
+            index.close()
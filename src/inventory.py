@@ -0,0 +1,247 @@
+import csv
+import glob
+import gzip
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from defaults import DEFAULT_INVENTORY_WORKERS
+from urllib.parse import unquote
+
+MANIFEST_NAME = 'manifest.json'
+S3_SCHEME = 's3://'
+
+# Manifest fields, and the inventory columns we need
+SOURCE_BUCKET = 'sourceBucket'
+DESTINATION_BUCKET = 'destinationBucket'
+FILE_FORMAT = 'fileFormat'
+FILE_SCHEMA = 'fileSchema'
+FILES = 'files'
+FILE_KEY = 'key'
+KEY_COLUMN = 'Key'
+SIZE_COLUMN = 'Size'
+LAST_MODIFIED_COLUMN = 'LastModifiedDate'
+IS_LATEST_COLUMN = 'IsLatest'
+IS_DELETE_MARKER_COLUMN = 'IsDeleteMarker'
+STORAGE_CLASS_COLUMN = 'StorageClass'
+
+
+class InventoryError(Exception):
+    """
+    An inventory report that cannot be read, or not in a format we can read.
+    """
+
+
+def _timestamp_parser():
+    from botocore.parsers import DEFAULT_TIMESTAMP_PARSER
+    return DEFAULT_TIMESTAMP_PARSER
+
+
+class InventoryLocation:
+    """
+    Where S3 Inventory reports are delivered: either an S3 location
+    ("s3://destination-bucket/prefix") or a local copy of one. Reports for a
+    bucket are found where S3 puts them, under
+    "<prefix>/<source bucket>/<configuration>/<timestamp>/manifest.json",
+    and the newest is used. The location may also point straight at a single
+    manifest.json, which is then used for the bucket it reports on.
+    """
+    def __init__(self, location: str):
+        """
+        :param location: "s3://bucket/prefix", a local directory, or a manifest.json.
+        :type location: str
+        """
+        self.location = location
+        self.is_s3 = location.startswith(S3_SCHEME)
+        if self.is_s3:
+            bucket, _, prefix = location[len(S3_SCHEME):].partition('/')
+            self._bucket = bucket
+            self._prefix = prefix.strip('/')
+
+    def find_manifest(self, bucket_name, s3_client):
+        """
+        :param bucket_name: The source bucket.
+        :type bucket_name: str
+        :param s3_client: Used to look for (and later read) reports kept in S3.
+        :type s3_client: boto3.s3.client
+        :return: Where the bucket's newest manifest is, or None if it has no reports here.
+        :rtype: str or None
+        """
+        if self.location.endswith(MANIFEST_NAME):
+            manifest = self.read_manifest(self.location, s3_client)
+            return self.location if manifest.get(SOURCE_BUCKET) == bucket_name else None
+
+        if not self.is_s3:
+            pattern = os.path.join(glob.escape(self.location), glob.escape(bucket_name), '*', '*', MANIFEST_NAME)
+            # Report directories are named by timestamp, so the newest sorts last
+            found = sorted(glob.glob(pattern), key=lambda x: os.path.basename(os.path.dirname(x)))
+            return found[-1] if found else None
+
+        prefix = '/'.join(x for x in (self._prefix, bucket_name) if x) + '/'
+        found = []
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self._bucket, Prefix=prefix):
+            found.extend(x['Key'] for x in page.get('Contents', []) if x['Key'].endswith('/' + MANIFEST_NAME))
+        if not found:
+            return None
+        newest = max(found, key=lambda x: x.split('/')[-2])
+        return '{}{}/{}'.format(S3_SCHEME, self._bucket, newest)
+
+    def read_manifest(self, manifest_path, s3_client):
+        """
+        :return: The parsed manifest.json.
+        :rtype: dict
+        """
+        with self._open(manifest_path, s3_client) as fp:
+            return json.load(fp)
+
+    def data_file_path(self, manifest_path, manifest, key):
+        """
+        :param manifest_path: Where the manifest was found.
+        :type manifest_path: str
+        :param manifest: The parsed manifest.
+        :type manifest: dict
+        :param key: A data file's key in the destination bucket, as listed in the manifest.
+        :type key: str
+        :return: Where to read the data file from.
+        :rtype: str
+        """
+        if self.is_s3:
+            destination = manifest.get(DESTINATION_BUCKET, '').split(':')[-1] or self._bucket
+            return '{}{}/{}'.format(S3_SCHEME, destination, key)
+
+        # A local copy may hold the whole destination bucket, or only part
+        # of it, so drop leading parts of the key until the file turns up.
+        # Given a manifest directly, look around the report it belongs to
+        # (data files sit next to the timestamped manifest directories).
+        if os.path.isdir(self.location):
+            roots = [self.location]
+        else:
+            roots = [os.path.dirname(manifest_path)]
+            for _ in range(3):
+                roots.append(os.path.dirname(roots[-1]))
+        parts = key.split('/')
+        for root in roots:
+            for start in range(len(parts)):
+                path = os.path.join(root, *parts[start:])
+                if os.path.isfile(path):
+                    return path
+        raise InventoryError('Inventory data file "{}" not found near "{}".'.format(key, self.location))
+
+    def open_data_file(self, path, s3_client):
+        """
+        :return: The data file's decompressed contents, read as they are needed.
+        :rtype: file object (binary)
+        """
+        if not path.startswith(S3_SCHEME):
+            return gzip.open(path, 'rb')
+        return gzip.GzipFile(fileobj=self._open(path, s3_client, binary=True), mode='rb')
+
+    def _open(self, path, s3_client, binary=False):
+        if not path.startswith(S3_SCHEME):
+            return open(path, 'rb' if binary else 'r')
+        bucket, _, key = path[len(S3_SCHEME):].partition('/')
+        body = s3_client.get_object(Bucket=bucket, Key=key)['Body']
+        return body if binary else io.TextIOWrapper(body, encoding='utf-8')
+
+
+def _columns(manifest):
+    if manifest.get(FILE_FORMAT, 'CSV').upper() != 'CSV':
+        raise InventoryError('Only CSV inventory reports can be read, not {}.'.format(manifest[FILE_FORMAT]))
+    schema = [x.strip() for x in manifest[FILE_SCHEMA].split(',')]
+    missing = {KEY_COLUMN, SIZE_COLUMN, LAST_MODIFIED_COLUMN} - set(schema)
+    if missing:
+        raise InventoryError('Inventory report lacks the {} field(s).'.format(', '.join(sorted(missing))))
+    return {x: schema.index(x) if x in schema else None
+            for x in (KEY_COLUMN, SIZE_COLUMN, LAST_MODIFIED_COLUMN, IS_LATEST_COLUMN, IS_DELETE_MARKER_COLUMN,
+                      STORAGE_CLASS_COLUMN)}
+
+
+def tally_data_file(my_info, stream, columns):
+    """
+    Adds up one (decompressed) inventory CSV file, a row at a time, so memory
+    use does not depend on the size of the file. As in a listing, only the
+    current version of each object counts, and placeholders do not. Rows
+    also go into the bucket's breakdown and top objects, if it is gathering them.
+
+    :param my_info: BucketInfo to add the file's totals to.
+    :type my_info: BucketInfo
+    :param stream: The decompressed CSV data.
+    :type stream: file object (binary)
+    :param columns: Position of each field we need in a row (None if absent).
+    :type columns: dict
+    """
+    key_col = columns[KEY_COLUMN]
+    size_col = columns[SIZE_COLUMN]
+    modified_col = columns[LAST_MODIFIED_COLUMN]
+    latest_col = columns[IS_LATEST_COLUMN]
+    marker_col = columns[IS_DELETE_MARKER_COLUMN]
+    storage_class_col = columns[STORAGE_CLASS_COLUMN]
+    breakdown = my_info.breakdown
+    top_objects = my_info.top_objects
+
+    file_count, cumulative_size, newest = 0, 0, ''
+    for row in csv.reader(io.TextIOWrapper(stream, encoding='utf-8', newline='')):
+        if (latest_col is not None) and (row[latest_col] != 'true'):
+            continue
+        if (marker_col is not None) and (row[marker_col] == 'true'):
+            continue
+        # Keys are URL encoded in CSV reports
+        key = row[key_col]
+        if key.endswith('/') or (('%' in key) and unquote(key).endswith('/')):
+            continue
+        size = int(row[size_col] or 0)
+        file_count += 1
+        cumulative_size += size
+        if breakdown is not None:
+            breakdown.add_file(unquote(key), size,
+                               None if storage_class_col is None else row[storage_class_col])
+        # Inventory dates all share one fixed width UTC format, so the newest is simply the largest
+        if row[modified_col] > newest:
+            newest = row[modified_col]
+        if top_objects is not None:
+            top_objects.add_file(unquote(key), size, _timestamp_parser()(row[modified_col]))
+    my_info.add_totals(file_count, cumulative_size, _timestamp_parser()(newest) if newest else None)
+
+
+def explore_bucket_inventory(my_info, s3_client, location, workers=DEFAULT_INVENTORY_WORKERS,
+                             fallback=None):
+    """
+    A drop in replacement for explore_bucket, which reads the bucket's newest
+    S3 Inventory report instead of listing it. The report's data files are
+    streamed and decompressed in parallel, and their totals merged.
+
+    :param my_info: An initiated BucketInfo object not yet containing detailed file info.
+    :type my_info: BucketInfo
+    :param s3_client: The client used for any reports kept in S3.
+    :type s3_client: boto3.s3.client
+    :param location: Where the inventory reports are.
+    :type location: InventoryLocation
+    :param workers: How many data files to read at the same time.
+    :type workers: int
+    :param fallback: Function to explore buckets without a report with
+    (called the same way as explore_bucket); if None, such buckets are an error.
+    :type fallback: function or None
+    :return: Returns the BucketInfo data structure now filled in with results
+    :rtype: BucketInfo
+    """
+    manifest_path = location.find_manifest(my_info.name, s3_client)
+    if manifest_path is None:
+        if fallback is None:
+            raise InventoryError('No inventory report found for bucket "{}".'.format(my_info.name))
+        return fallback(my_info, s3_client)
+
+    manifest = location.read_manifest(manifest_path, s3_client)
+    columns = _columns(manifest)
+    paths = [location.data_file_path(manifest_path, manifest, x[FILE_KEY]) for x in manifest[FILES]]
+
+    def tally(path):
+        partial = my_info.empty_copy()
+        with location.open_data_file(path, s3_client) as stream:
+            tally_data_file(partial, stream, columns)
+        return partial
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for partial in executor.map(tally, paths):
+            my_info.merge(partial)
+    return my_info
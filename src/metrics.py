@@ -0,0 +1,353 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds of the latency histogram buckets, in seconds: 1ms doubling up to about 65s
+LATENCY_BOUNDS = tuple(0.001 * 2 ** n for n in range(17))
+PERCENTILES = (50, 90, 99)
+METRIC_PREFIX = 's3explore'
+NO_BUCKET = ''
+
+
+class Histogram:
+    """
+    Counts observations into fixed buckets, the way Prometheus histograms do.
+    Recording a value is a binary search and two additions, however many
+    values came before it, so it is cheap enough to do for every request.
+    Percentiles are estimated from the bucket counts.
+    """
+    __slots__ = ('bounds', 'counts', 'count', 'total')
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        """
+        :param bounds: Upper bound of each bucket, in increasing order;
+        values above the last bound go in a final, open ended, bucket.
+        :type bounds: tuple of float
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def merge(self, other):
+        """
+        :param other: Histogram with the same bounds to fold into this one.
+        :type other: Histogram
+        """
+        self.counts = [x + y for x, y in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, percent: float):
+        """
+        :param percent: Which percentile, for example 99.
+        :type percent: float
+        :return: Estimated value, interpolating within the bucket it falls in
+        (None if nothing was observed).
+        :rtype: float or None
+        """
+        if self.count == 0:
+            return None
+        rank = self.count * percent / 100
+        seen = 0
+        for n, count in enumerate(self.counts):
+            if count and (seen + count >= rank):
+                lower = self.bounds[n - 1] if n > 0 else 0.0
+                upper = self.bounds[n] if n < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def summary(self):
+        """
+        :return: Count, mean and percentiles, for the JSON summary.
+        :rtype: dict
+        """
+        summary = dict(count=self.count, mean=self.total / self.count if self.count else None)
+        summary.update(('p{}'.format(x), self.percentile(x)) for x in PERCENTILES)
+        return summary
+
+
+class BucketMetrics:
+    """
+    Counters and timings for a single bucket.
+    """
+    __slots__ = ('requests', 'retries', 'errors', 'latency', 'scan_seconds', 'objects', 'bytes')
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.scan_seconds = None
+        self.objects = None
+        self.bytes = None
+
+
+class ScanMetrics:
+    """
+    Collects timings and counters over a run: every S3 request (by operation,
+    bucket and region), how long each bucket took to explore, and how long each
+    result took to display / log. At the end of the run these can be written
+    out as a JSON summary, and / or as a file for the Prometheus node
+    exporter's textfile collector.
+
+    Updates may come from several threads at once, so they are made under a
+    lock; each is only a handful of additions.
+    """
+    def __init__(self, clock=time.perf_counter):
+        """
+        :param clock: Source of time in seconds, for tests.
+        :type clock: function
+        """
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._started = clock()
+        self._finished = None
+        self.buckets = dict()
+        self.operations = dict()
+        self.regions = dict()
+        self.output = Histogram()
+
+    def record_request(self, operation: str, bucket_name: str, latency: float,
+                       retries: int = 0, error: bool = False, region: str = None):
+        """
+        :param operation: S3 operation, for example 'ListObjectsV2'.
+        :type operation: str
+        :param bucket_name: Bucket the request was about ('' for none).
+        :type bucket_name: str
+        :param latency: Seconds from making the call to having the parsed response, retries included.
+        :type latency: float
+        :param retries: How many times the request was retried.
+        :type retries: int
+        :param error: Whether the request failed in the end.
+        :type error: bool
+        :param region: Region the request was sent to, if known.
+        :type region: str or None
+        """
+        with self._lock:
+            histogram = self.operations.get(operation)
+            if histogram is None:
+                histogram = self.operations[operation] = Histogram()
+            histogram.observe(latency)
+            if region is not None:
+                histogram = self.regions.get(region)
+                if histogram is None:
+                    histogram = self.regions[region] = Histogram()
+                histogram.observe(latency)
+            bucket = self._bucket(bucket_name)
+            bucket.requests += 1
+            bucket.retries += retries
+            bucket.errors += error
+            bucket.latency.observe(latency)
+
+    def record_bucket(self, bucket_info, seconds: float):
+        """
+        :param bucket_info: A fully explored bucket.
+        :type bucket_info: BucketInfo
+        :param seconds: How long exploring it took.
+        :type seconds: float
+        """
+        with self._lock:
+            bucket = self._bucket(bucket_info.name)
+            bucket.scan_seconds = seconds
+            bucket.objects = bucket_info.file_count
+            bucket.bytes = bucket_info.cumulative_size
+
+    def record_output(self, seconds: float):
+        """
+        :param seconds: How long displaying / logging a single result took.
+        :type seconds: float
+        """
+        with self._lock:
+            self.output.observe(seconds)
+
+    def instrument_client(self, s3_client):
+        """
+        Times every call the client makes, by way of botocore's events.
+        Clients in different regions can all be instrumented, and their
+        latencies are then also kept by region.
+
+        :param s3_client: The client to instrument.
+        :type s3_client: boto3.s3.client
+        """
+        clock = self._clock
+        region = s3_client.meta.region_name
+
+        def start(params, context, model, **kwargs):
+            context['s3explore_started'] = clock()
+            context['s3explore_operation'] = model.name
+            context['s3explore_bucket'] = params.get('Bucket', NO_BUCKET)
+
+        def finish(http_response, parsed, model, context, **kwargs):
+            if 's3explore_started' not in context:
+                return
+            self.record_request(model.name, context['s3explore_bucket'],
+                                clock() - context['s3explore_started'],
+                                retries=parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0),
+                                error=http_response.status_code >= 300, region=region)
+
+        def fail(context, **kwargs):
+            if 's3explore_started' not in context:
+                return
+            self.record_request(context['s3explore_operation'], context['s3explore_bucket'],
+                                clock() - context['s3explore_started'], error=True, region=region)
+
+        events = s3_client.meta.events
+        events.register('provide-client-params.s3', start, unique_id='s3explore-metrics-start')
+        events.register('after-call.s3', finish, unique_id='s3explore-metrics-finish')
+        events.register('after-call-error.s3', fail, unique_id='s3explore-metrics-fail')
+
+    def timed_explore(self, explore):
+        """
+        :param explore: Function exploring a single bucket, for example explore_bucket.
+        :type explore: function
+        :return: The same function, recording how long each bucket took.
+        :rtype: function
+        """
+        def timed(my_info, s3_client):
+            started = self._clock()
+            result = explore(my_info, s3_client)
+            self.record_bucket(result, self._clock() - started)
+            return result
+        return timed
+
+    def finish(self):
+        """
+        Marks the end of the run, for the run wide rates.
+        """
+        self._finished = self._clock()
+
+    def summary(self):
+        """
+        :return: Everything recorded, with latencies summarized as percentiles.
+        :rtype: dict
+        """
+        with self._lock:
+            run_seconds = (self._finished or self._clock()) - self._started
+            objects = sum(x.objects or 0 for x in self.buckets.values())
+            requests = sum(x.requests for x in self.buckets.values())
+            return dict(
+                run_seconds=run_seconds,
+                buckets=len([x for x in self.buckets.values() if x.objects is not None]),
+                objects=objects,
+                objects_per_second=objects / run_seconds if run_seconds else None,
+                requests=requests,
+                retries=sum(x.retries for x in self.buckets.values()),
+                errors=sum(x.errors for x in self.buckets.values()),
+                request_latency={op: x.summary() for op, x in sorted(self.operations.items())},
+                request_latency_by_region={region: x.summary() for region, x in sorted(self.regions.items())},
+                output_latency=self.output.summary(),
+                by_bucket={name: dict(requests=x.requests, retries=x.retries, errors=x.errors,
+                                      objects=x.objects, bytes=x.bytes, scan_seconds=x.scan_seconds,
+                                      request_latency=x.latency.summary())
+                           for name, x in sorted(self.buckets.items()) if name != NO_BUCKET},
+            )
+
+    def write_json(self, path: str):
+        """
+        :param path: Where to write the JSON summary.
+        :type path: str
+        """
+        _write_atomic(path, json.dumps(self.summary(), indent=2))
+
+    def write_textfile(self, path: str):
+        """
+        Writes the metrics in Prometheus' text format. The file is written
+        alongside and renamed into place, as the textfile collector expects,
+        so it never picks up a half written file.
+
+        :param path: Where to write, conventionally a '.prom' file in the collector's directory.
+        :type path: str
+        """
+        _write_atomic(path, self.textfile())
+
+    def textfile(self):
+        """
+        :return: The metrics in Prometheus' text exposition format.
+        :rtype: str
+        """
+        summary = self.summary()
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            name = '{}_{}'.format(METRIC_PREFIX, name)
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            for suffix, labels, value in samples:
+                lines.append('{}{}{} {}'.format(name, suffix, _labels(labels), _number(value)))
+
+        with self._lock:
+            buckets = sorted((name, x) for name, x in self.buckets.items() if name != NO_BUCKET)
+            metric('requests_total', 'counter', 'S3 requests made, by bucket.',
+                   [('', dict(bucket=name), x.requests) for name, x in buckets])
+            metric('request_retries_total', 'counter', 'S3 request retries, by bucket.',
+                   [('', dict(bucket=name), x.retries) for name, x in buckets])
+            metric('request_errors_total', 'counter', 'S3 requests that failed, by bucket.',
+                   [('', dict(bucket=name), x.errors) for name, x in buckets])
+            explored = [(name, x) for name, x in buckets if x.objects is not None]
+            metric('bucket_objects', 'gauge', 'Objects found in the bucket.',
+                   [('', dict(bucket=name), x.objects) for name, x in explored])
+            metric('bucket_bytes', 'gauge', 'Total size of the objects found in the bucket.',
+                   [('', dict(bucket=name), x.bytes) for name, x in explored])
+            metric('bucket_scan_seconds', 'gauge', 'Time taken to explore the bucket.',
+                   [('', dict(bucket=name), x.scan_seconds) for name, x in explored])
+            metric('request_duration_seconds', 'histogram', 'S3 request latency, by operation.',
+                   [sample for op, x in sorted(self.operations.items())
+                    for sample in _histogram_samples(x, dict(operation=op))])
+            metric('region_request_duration_seconds', 'histogram', 'S3 request latency, by region.',
+                   [sample for region, x in sorted(self.regions.items())
+                    for sample in _histogram_samples(x, dict(region=region))])
+            metric('output_duration_seconds', 'histogram', 'Time taken to display / log each result.',
+                   _histogram_samples(self.output, dict()))
+        metric('run_seconds', 'gauge', 'Duration of the run.', [('', dict(), summary['run_seconds'])])
+        metric('objects_per_second', 'gauge', 'Objects explored per second over the run.',
+               [('', dict(), summary['objects_per_second'] or 0)])
+        metric('last_run_timestamp_seconds', 'gauge', 'When the run finished.', [('', dict(), time.time())])
+        return '\n'.join(lines) + '\n'
+
+    def _bucket(self, bucket_name):
+        bucket = self.buckets.get(bucket_name)
+        if bucket is None:
+            bucket = self.buckets[bucket_name] = BucketMetrics()
+        return bucket
+
+
+def _histogram_samples(histogram, labels):
+    samples = []
+    cumulative = 0
+    for bound, count in zip(histogram.bounds + (float('inf'),), histogram.counts):
+        cumulative += count
+        samples.append(('_bucket', dict(labels, le='+Inf' if bound == float('inf') else _number(bound)), cumulative))
+    samples.append(('_sum', labels, histogram.total))
+    samples.append(('_count', labels, histogram.count))
+    return samples
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{{{}}}'.format(','.join('{}="{}"'.format(name, value) for name, value in zip(labels, escaped)))
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    temp_path = '{}.tmp'.format(path)
+    with open(temp_path, 'w') as fp:
+        fp.write(text)
+    os.replace(temp_path, path)
@@ -0,0 +1,257 @@
+import json
+import shutil
+import sys
+import threading
+import time
+from defaults import DEFAULT_PROGRESS_PAGES
+from fastparse import FAST_PAGE
+from operator import itemgetter
+from results import SizeFormat, display_file_size
+
+CONTENTS = 'Contents'
+VERSIONS = 'Versions'
+SIZE = 'Size'
+# Listings whose pages are counted, and where their objects are on the page
+LISTINGS = dict(ListObjectsV2=CONTENTS, ListObjectVersions=VERSIONS)
+
+# TTY control sequence: erase from the cursor to the end of the line
+_CLEAR_TO_END = '\x1b[K'
+
+_get_size = itemgetter(SIZE)
+
+
+class BucketProgress:
+    """
+    How far the listing of a bucket has got.
+    """
+    __slots__ = ('name', 'started', 'pages', 'file_count', 'cumulative_size', 'expected')
+
+    def __init__(self, name: str, started: float, expected=None):
+        """
+        :param name: The bucket's name.
+        :type name: str
+        :param started: When its first page was asked for.
+        :type started: float
+        :param expected: How many files it is expected to have (from a previous run, say), if known.
+        :type expected: int or None
+        """
+        self.name = name
+        self.started = started
+        self.pages = 0
+        self.file_count = 0
+        self.cumulative_size = 0
+        self.expected = expected
+
+    def rate(self, now: float):
+        """
+        :param now: The current time.
+        :type now: float
+        :return: Files listed a second so far (None if too soon to tell).
+        :rtype: float or None
+        """
+        elapsed = now - self.started
+        return self.file_count / elapsed if elapsed > 0 else None
+
+    def eta(self, now: float):
+        """
+        :param now: The current time.
+        :type now: float
+        :return: Seconds until the bucket is expected to be done, or None if there is
+        no telling (nothing to go on, or already past what was expected).
+        :rtype: float or None
+        """
+        rate = self.rate(now)
+        if (self.expected is None) or (self.expected <= self.file_count) or not rate:
+            return None
+        return (self.expected - self.file_count) / rate
+
+    def as_dict(self, now: float):
+        """
+        :param now: The current time.
+        :type now: float
+        :return: Progress as plain values, ready for JSON.
+        :rtype: dict
+        """
+        rate = self.rate(now)
+        eta = self.eta(now)
+        return dict(bucket=self.name, pages=self.pages, file_count=self.file_count,
+                    cumulative_size=self.cumulative_size, expected_file_count=self.expected,
+                    files_per_second=None if rate is None else round(rate, 1),
+                    eta_seconds=None if eta is None else round(eta))
+
+
+def display_duration(seconds: float):
+    """
+    :param seconds: A length of time.
+    :type seconds: float
+    :return: A string that is human readable: "1:02:03" for example
+    :rtype: str
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+
+class ProgressReporter:
+    """
+    Shows how far each bucket's listing has got while it is still going,
+    rather than only once it is done: the running count and size, files a
+    second, and, when it is known roughly how many files there are, how
+    long is left.
+
+    Pages are counted from the client's own responses (by way of botocore
+    events, as with IndexWriter), so the listing loop is left as it is, and
+    any way of listing a bucket with the client is followed, shards and
+    versions included. A page costs a lock and a sum of its sizes; progress
+    is only written out every 'every_pages' pages of a bucket.
+
+    On a terminal, progress is a single status line, written over in place
+    (and only when it has changed), that is cleared before each result is
+    shown. Anywhere else, each update is a line of JSON, for logs and other
+    programs to follow.
+    """
+    def __init__(self, stream=None, every_pages: int = DEFAULT_PROGRESS_PAGES, expected=None,
+                 size_format: SizeFormat = SizeFormat.MB, clock=time.monotonic):
+        """
+        :param stream: Where to write progress. Default: standard error.
+        :type stream: file
+        :param every_pages: Pages of a bucket between updates.
+        :type every_pages: int
+        :param expected: Files each bucket is expected to have, by name, for working out how long is left.
+        :type expected: dict or None
+        :param size_format: Unit to show sizes in on a terminal.
+        :type size_format: SizeFormat
+        :param clock: Source of time in seconds, for tests.
+        :type clock: function
+        """
+        self._stream = stream or sys.stderr
+        self._tty = self._stream.isatty()
+        self._every_pages = every_pages
+        self._expected = expected or dict()
+        self._size_format = size_format
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Bucket name -> BucketProgress, for buckets being listed
+        self._buckets = dict()
+        # What the status line on the terminal says now
+        self._status = ''
+
+    def attach(self, s3_client):
+        """
+        Counts every listing page the client receives from now on.
+
+        :param s3_client: The client used to explore buckets.
+        :type s3_client: boto3.s3.client
+        """
+        def note_bucket(params, context, **kwargs):
+            context['s3explore_progress_bucket'] = params['Bucket']
+            self.start(params['Bucket'])
+
+        def on_page(http_response, parsed, model, context, **kwargs):
+            if (http_response.status_code == 200) and ('s3explore_progress_bucket' in context):
+                self.add_page(context['s3explore_progress_bucket'], parsed, LISTINGS[model.name])
+
+        events = s3_client.meta.events
+        for operation in LISTINGS:
+            events.register('provide-client-params.s3.{}'.format(operation), note_bucket,
+                            unique_id='s3explore-progress-bucket-{}'.format(operation))
+            events.register('after-call.s3.{}'.format(operation), on_page,
+                            unique_id='s3explore-progress-page-{}'.format(operation))
+
+    def start(self, bucket_name: str):
+        """
+        Starts following a bucket, from now, unless it is already being followed.
+
+        :param bucket_name: Bucket whose first page is being asked for.
+        :type bucket_name: str
+        """
+        with self._lock:
+            self._bucket(bucket_name)
+
+    def add_page(self, bucket_name: str, resp: dict, field: str = CONTENTS):
+        """
+        :param bucket_name: Bucket the page is of.
+        :type bucket_name: str
+        :param resp: A listing response page.
+        :type resp: dict
+        :param field: Where the objects are on the page.
+        :type field: str
+        """
+        if FAST_PAGE in resp:
+            file_count, size = resp[FAST_PAGE].file_count, resp[FAST_PAGE].cumulative_size
+        else:
+            files = resp.get(field, ())
+            file_count, size = len(files), sum(map(_get_size, files))
+        with self._lock:
+            bucket = self._bucket(bucket_name)
+            bucket.pages += 1
+            bucket.file_count += file_count
+            bucket.cumulative_size += size
+            if bucket.pages % self._every_pages == 0:
+                self._show(bucket)
+
+    def wrap_report(self, report):
+        """
+        :param report: Called with each completed BucketInfo (ResultHandler.update_results, say).
+        :type report: function
+        :return: The same function, that first stops following the bucket, and clears
+        any status line out of the way of what it shows.
+        :rtype: function
+        """
+        def reporting(bucket_info, *args, **kwargs):
+            self._forget(bucket_info.name)
+            # Reporting can take a while (writing logs, say), so pages keep being counted meanwhile
+            report(bucket_info, *args, **kwargs)
+        return reporting
+
+    def wrap_explore(self, explore):
+        """
+        :param explore: Function exploring a single bucket, for example explore_bucket.
+        :type explore: function
+        :return: The same function, that stops following the bucket if exploring it fails,
+        as it will then never be reported.
+        :rtype: function
+        """
+        def exploring(my_info, s3_client):
+            try:
+                return explore(my_info, s3_client)
+            except BaseException:
+                self._forget(my_info.name)
+                raise
+        return exploring
+
+    def _forget(self, bucket_name):
+        with self._lock:
+            self._buckets.pop(bucket_name, None)
+            self._write_status('')
+
+    def _bucket(self, bucket_name):
+        bucket = self._buckets.get(bucket_name)
+        if bucket is None:
+            bucket = self._buckets[bucket_name] = BucketProgress(bucket_name, self._clock(),
+                                                                 self._expected.get(bucket_name))
+        return bucket
+
+    def _show(self, bucket):
+        now = self._clock()
+        if not self._tty:
+            self._stream.write('{}\n'.format(json.dumps(dict(progress=bucket.as_dict(now)))))
+            self._stream.flush()
+            return
+        rate = bucket.rate(now)
+        eta = bucket.eta(now)
+        status = '{}: {} files, {}{}{}'.format(
+            bucket.name, bucket.file_count, display_file_size(bucket.cumulative_size, self._size_format),
+            '' if rate is None else ', {:.0f} files/s'.format(rate),
+            '' if eta is None else ', about {} left'.format(display_duration(eta)))
+        if len(self._buckets) > 1:
+            status = '[{} buckets] {}'.format(len(self._buckets), status)
+        # Wider than the terminal, the line would wrap, and could no longer be written over
+        self._write_status(status[:shutil.get_terminal_size().columns - 1])
+
+    def _write_status(self, status):
+        if (not self._tty) or (status == self._status):
+            return
+        self._stream.write('\r{}{}'.format(status, _CLEAR_TO_END))
+        self._stream.flush()
+        self._status = status
@@ -0,0 +1,194 @@
+import argparse
+from datetime import datetime, timedelta, timezone
+from history import HistoryStore
+from results import SizeFormat, display_file_size
+
+DEFAULT_PROFILE_NAME = 'default'
+DEFAULT_SIZE_FORMAT = 'mb'
+DEFAULT_DAYS = 90.0
+DEFAULT_LIMIT = 10
+QUESTIONS = ('growth', 'rate', 'top')
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class Trend:
+    """
+    How a bucket changed over a period, from its first and last results
+    in it, and the rate of change fitted over all of them.
+    """
+    __slots__ = ('name', 'first_time', 'last_time', 'first_size', 'last_size',
+                 'first_count', 'last_count', 'observations', 'size_rate', 'count_rate')
+
+    def __init__(self, name: str):
+        """
+        :param name: The bucket's name.
+        :type name: str
+        """
+        self.name = name
+        self.first_time = self.last_time = None
+        self.first_size = self.last_size = 0
+        self.first_count = self.last_count = 0
+        self.observations = 0
+        # Bytes and files a day, by least squares (None with less than two points in time)
+        self.size_rate = None
+        self.count_rate = None
+
+    @property
+    def size_change(self):
+        return self.last_size - self.first_size
+
+    @property
+    def count_change(self):
+        return self.last_count - self.first_count
+
+    @property
+    def days(self):
+        return (self.last_time - self.first_time) / SECONDS_PER_DAY
+
+
+def _slope(n, sum_x, sum_y, sum_xy, sum_xx):
+    denominator = n * sum_xx - sum_x * sum_x
+    if denominator <= 0:
+        return None
+    return (n * sum_xy - sum_x * sum_y) / denominator
+
+
+def bucket_trends(store, since=None, until=None, buckets=None):
+    """
+    Works out how each bucket changed over a period, in a single pass over
+    the history, reading only the columns and partitions needed.
+
+    :param store: History to look through.
+    :type store: HistoryStore
+    :param since: Start of the period, if not from the very first result.
+    :type since: datetime or None
+    :param until: End of the period, if not up to now.
+    :type until: datetime or None
+    :param buckets: Names of the buckets to look at, if not all of them.
+    :type buckets: list of str or None
+    :return: A Trend for each bucket with results in the period, by name.
+    :rtype: list of Trend
+    """
+    names = store.bucket_names()
+    wanted = None
+    if buckets is not None:
+        wanted = {n for n, x in enumerate(names) if x in set(buckets)}
+        if not wanted:
+            return []
+    columns = store.read(['bucket', 'file_count', 'cumulative_size'], since=since, until=until)
+    if not columns['time']:
+        return []
+    origin = columns['time'][0]
+    # Bucket id -> [Trend, n, sum t, sum t^2, sum size, sum t * size, sum count, sum t * count]
+    sums = dict()
+    for time, bucket_id, file_count, size in zip(columns['time'], columns['bucket'],
+                                                 columns['file_count'], columns['cumulative_size']):
+        if (wanted is not None) and (bucket_id not in wanted):
+            continue
+        entry = sums.get(bucket_id)
+        if entry is None:
+            trend = Trend(names[bucket_id])
+            trend.first_time, trend.first_size, trend.first_count = time, size, file_count
+            entry = sums[bucket_id] = [trend, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        trend = entry[0]
+        trend.last_time, trend.last_size, trend.last_count = time, size, file_count
+        days = (time - origin) / SECONDS_PER_DAY
+        entry[1] += 1
+        entry[2] += days
+        entry[3] += days * days
+        entry[4] += size
+        entry[5] += days * size
+        entry[6] += file_count
+        entry[7] += days * file_count
+
+    trends = []
+    for trend, n, sum_t, sum_tt, sum_size, sum_t_size, sum_count, sum_t_count in sums.values():
+        trend.observations = n
+        trend.size_rate = _slope(n, sum_t, sum_size, sum_t_size, sum_tt)
+        trend.count_rate = _slope(n, sum_t, sum_count, sum_t_count, sum_tt)
+        trends.append(trend)
+    return sorted(trends, key=lambda x: x.name)
+
+
+def _signed_size(size, size_format):
+    return '{}{}'.format('-' if size < 0 else '+', display_file_size(abs(size), size_format))
+
+
+def display_trend(trend, question, size_format):
+    """
+    :param trend: How a bucket changed.
+    :type trend: Trend
+    :param question: What was asked, one of QUESTIONS.
+    :type question: str
+    :param size_format: Unit to show sizes in.
+    :type size_format: SizeFormat
+    :return: A line saying how the bucket changed, for example
+    "bucket-one: 1.0 MB to 3.0 MB (+2.0 MB, +200%), 5 to 9 files (+4) over 30.0 days, 31 results"
+    :rtype: str
+    """
+    if question == 'rate':
+        if trend.size_rate is None:
+            return '{}: not enough results to tell ({})'.format(trend.name, trend.observations)
+        return '{}: {} per day, {:+.1f} files per day, over {:.1f} days, {} results'.format(
+            trend.name, _signed_size(round(trend.size_rate), size_format), trend.count_rate,
+            trend.days, trend.observations)
+    percent = ''
+    if trend.first_size:
+        percent = ', {:+.0%}'.format(trend.size_change / trend.first_size)
+    return '{}: {} to {} ({}{}), {} to {} files ({:+d}) over {:.1f} days, {} results'.format(
+        trend.name, display_file_size(trend.first_size, size_format), display_file_size(trend.last_size, size_format),
+        _signed_size(trend.size_change, size_format), percent, trend.first_count, trend.last_count,
+        trend.count_change, trend.days, trend.observations)
+
+
+def build_parser():
+    """
+    :return: Parser defining the arguments of "s3explore.py query".
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(
+        prog='s3explore.py query',
+        description='Answer questions about how buckets changed over time, from the history kept with --history.')
+    parser.add_argument('question', type=str, choices=QUESTIONS,
+                        help='"growth" for how much each bucket grew, "rate" for how fast, '
+                             'and "top" for the buckets that grew the most.')
+    parser.add_argument('-p', '--profile', type=str, default=DEFAULT_PROFILE_NAME,
+                        help='Profile whose history to look through (default "{}").'.format(DEFAULT_PROFILE_NAME))
+    parser.add_argument('--days', type=float, default=DEFAULT_DAYS,
+                        help='Look at the last so many days (default {:g}), 0 for all of the history.'.format(
+                            DEFAULT_DAYS))
+    parser.add_argument('-b', '--bucket', type=str, action='append', default=None,
+                        help='Only look at this bucket; may be given more than once.')
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT,
+                        help='With "top", how many buckets to list (default {}).'.format(DEFAULT_LIMIT))
+    parser.add_argument('-s', '--size_format', type=str, default=DEFAULT_SIZE_FORMAT,
+                        choices=[x.name.lower() for x in SizeFormat],
+                        help='Display file sizes in bytes, kilobytes, etc. (default "{}").'.format(DEFAULT_SIZE_FORMAT))
+    return parser
+
+
+def main(argv=None):
+    """
+    Answers a question about the history of a profile's buckets, printing a line per bucket.
+
+    :param argv: Command line arguments following "query".
+    :type argv: list of str or None
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.days < 0:
+        parser.error('--days cannot be negative.')
+    if args.limit < 1:
+        parser.error('--limit must be at least 1.')
+
+    since = None
+    if args.days > 0:
+        since = datetime.now(timezone.utc) - timedelta(days=args.days)
+    trends = bucket_trends(HistoryStore(args.profile), since=since, buckets=args.bucket)
+    if args.question == 'top':
+        trends = sorted(trends, key=lambda x: x.size_change, reverse=True)[:args.limit]
+    if not trends:
+        print('No results for profile "{}" in that period.'.format(args.profile))
+    size_format = SizeFormat[args.size_format.upper()]
+    for trend in trends:
+        print(display_trend(trend, args.question, size_format))
@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+import time
+from defaults import DEFAULT_REGION_CACHE_DAYS
+
+APP_HOME = os.environ['S3X_PATH']
+
+# GetBucketLocation leaves the region out for us-east-1, and names
+# Ireland by its original name
+LEGACY_LOCATIONS = {None: 'us-east-1', '': 'us-east-1', 'EU': 'eu-west-1'}
+LOCATION_CONSTRAINT = 'LocationConstraint'
+
+
+class RegionCache:
+    """
+    Remembers which region each bucket is in, from one run to the next,
+    under "data/regions/<profile>.json". Buckets practically never move,
+    but may be deleted and created again elsewhere, so entries expire
+    after a while and are then looked up again.
+    """
+    REGIONS_LOCATION = 'data/regions'
+
+    def __init__(self, profile_name: str, max_age: float = DEFAULT_REGION_CACHE_DAYS * 24 * 60 * 60,
+                 clock=time.time, location: str = REGIONS_LOCATION):
+        """
+        :param profile_name: Each profile (account) gets a cache of its own.
+        :type profile_name: str
+        :param max_age: Seconds after which a bucket's region is looked up again.
+        :type max_age: float
+        :param clock: Source of the current time, for tests.
+        :type clock: function
+        :param location: Directory for the caches, relative to the app directory.
+        :type location: str
+        """
+        self._path = os.path.join(APP_HOME, location, '{}.json'.format(profile_name))
+        self._max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._changed = False
+        # Bucket name -> [region, when it was looked up]
+        self._regions = dict()
+        if os.path.exists(self._path):
+            with open(self._path, 'r') as fp:
+                self._regions = json.load(fp)
+
+    def get(self, bucket_name: str):
+        """
+        :param bucket_name: The bucket to look up.
+        :type bucket_name: str
+        :return: The bucket's region, or None if not known (or too old to trust).
+        :rtype: str or None
+        """
+        with self._lock:
+            entry = self._regions.get(bucket_name)
+        if (entry is None) or (self._clock() - entry[1] > self._max_age):
+            return None
+        return entry[0]
+
+    def put(self, bucket_name: str, region: str):
+        """
+        :param bucket_name: The bucket just looked up.
+        :type bucket_name: str
+        :param region: The region it is in.
+        :type region: str
+        """
+        with self._lock:
+            self._regions[bucket_name] = [region, self._clock()]
+            self._changed = True
+
+    def save(self):
+        """
+        Writes the cache out, if anything was added. The file is written
+        alongside and renamed over the old one, so it is never left half written.
+        """
+        with self._lock:
+            if not self._changed:
+                return
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            temp_path = '{}.tmp'.format(self._path)
+            with open(temp_path, 'w') as fp:
+                json.dump(self._regions, fp)
+            os.replace(temp_path, self._path)
+            self._changed = False
+
+
+class RegionalClients:
+    """
+    Hands out an S3 client in each bucket's own region, so listing a bucket
+    outside the default region does not cost a redirect (or a failure) on
+    every page. Regions are found with GetBucketLocation, once per bucket
+    (and then remembered in a RegionCache), and there is a single client
+    per region, shared by all its buckets (and their connection pool).
+    """
+    def __init__(self, default_client, new_client, cache, prepare=None):
+        """
+        :param default_client: Client in the default region, used for looking up regions,
+        for the buckets in that region, and for any whose region cannot be found.
+        :type default_client: boto3.s3.client
+        :param new_client: Makes a client for a given region.
+        :type new_client: function
+        :param cache: Where regions found are remembered.
+        :type cache: RegionCache
+        :param prepare: Called with each new regional client, before it is first used
+        (to instrument it the same way as the default client, say).
+        :type prepare: function or None
+        """
+        self._default_client = default_client
+        self._new_client = new_client
+        self._cache = cache
+        self._prepare = prepare
+        self._clients = {default_client.meta.region_name: default_client}
+        self._lock = threading.Lock()
+
+    def region_of(self, bucket_name: str):
+        """
+        :param bucket_name: Bucket to find the region of.
+        :type bucket_name: str
+        :return: The bucket's region, or None if it cannot be found (no permission, say).
+        :rtype: str or None
+        """
+        region = self._cache.get(bucket_name)
+        if region is not None:
+            return region
+        from botocore.exceptions import ClientError
+        try:
+            location = self._default_client.get_bucket_location(Bucket=bucket_name).get(LOCATION_CONSTRAINT)
+        except ClientError:
+            return None
+        region = LEGACY_LOCATIONS.get(location, location)
+        self._cache.put(bucket_name, region)
+        return region
+
+    def client_for(self, bucket_name: str):
+        """
+        :param bucket_name: Bucket about to be listed.
+        :type bucket_name: str
+        :return: A client in the bucket's region.
+        :rtype: boto3.s3.client
+        """
+        region = self.region_of(bucket_name)
+        if region is None:
+            return self._default_client
+        with self._lock:
+            client = self._clients.get(region)
+            if client is None:
+                client = self._clients[region] = self._new_client(region)
+                if self._prepare is not None:
+                    self._prepare(client)
+        return client
+
+    def regional_explore(self, explore):
+        """
+        :param explore: Function exploring a single bucket, for example explore_bucket.
+        :type explore: function
+        :return: The same function, exploring each bucket with a client in its own region.
+        :rtype: function
+        """
+        def regional(my_info, s3_client):
+            return explore(my_info, self.client_for(my_info.name))
+        return regional
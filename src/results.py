@@ -1,7 +1,9 @@
 import os
-import pandas as pd
+import threading
+import time
 from datetime import datetime
 from enum import Enum
+from writers import FsyncPolicy, RESULT_WRITERS
 
 APP_HOME = os.environ['S3X_PATH']
 
@@ -21,7 +23,13 @@ class BucketInfo:
     """
     Because we'll want to gather and read information about the bucket in different places,
     having a unified data structure that can be passed around seemed useful.
+
+    There can be one of these per shard of a bucket, so attributes are kept
+    in slots rather than a per instance dict.
     """
+    __slots__ = ('name', 'created', 'file_count', 'cumulative_size', 'most_recent_mod',
+                 'throttle', 'changes', 'estimate', 'breakdown', 'top_objects', 'versions')
+
     def __init__(
             self,
             name: str,
@@ -44,6 +52,19 @@ class BucketInfo:
         self.cumulative_size = 0
         self.most_recent_mod = None
 
+        # Request rate control for the bucket, if the engine used one (see throttle.py)
+        self.throttle = None
+        # Changes since the previous run, if the bucket is indexed (see index.py)
+        self.changes = None
+        # Set when the numbers are an estimate rather than a count (see estimate.py)
+        self.estimate = None
+        # Totals by prefix, storage class and size, if asked for (see breakdown.py)
+        self.breakdown = None
+        # Largest and least recently modified files, if asked for (see topobjects.py)
+        self.top_objects = None
+        # Noncurrent versions, delete markers and incomplete uploads, if asked for (see versions.py)
+        self.versions = None
+
     def add_file(self, size:int , last_modified: datetime):
         """
         As the bucket is explored, we will use this object as a
@@ -60,6 +81,102 @@ class BucketInfo:
                 (self.most_recent_mod < last_modified):
             self.most_recent_mod = last_modified
 
+    def add_totals(self, file_count: int, cumulative_size: int,
+                   most_recent_mod: [None or datetime]):
+        """
+        Folds in the totals for a whole batch of files at once, for example
+        a page of listing results, rather than updating file by file.
+
+        :param file_count: Number of files in the batch.
+        :type file_count: int
+        :param cumulative_size: Total size of the files in the batch.
+        :type cumulative_size: int
+        :param most_recent_mod: Most recent modification in the batch (None if empty).
+        :type most_recent_mod: datetime or None
+        """
+        self.file_count += file_count
+        self.cumulative_size += cumulative_size
+        if (most_recent_mod is not None) and \
+                ((self.most_recent_mod is None) or
+                 (self.most_recent_mod < most_recent_mod)):
+            self.most_recent_mod = most_recent_mod
+
+    def merge(self, other):
+        """
+        Folds in the totals gathered by another BucketInfo, for example
+        one that explored a single prefix of the same bucket.
+
+        :param other: Partial results to fold into this one.
+        :type other: BucketInfo
+        """
+        self.add_totals(other.file_count, other.cumulative_size, other.most_recent_mod)
+        if (self.breakdown is not None) and (other.breakdown is not None):
+            self.breakdown.merge(other.breakdown)
+        if (self.top_objects is not None) and (other.top_objects is not None):
+            self.top_objects.merge(other.top_objects)
+        if (self.versions is not None) and (other.versions is not None):
+            self.versions.merge(other.versions)
+
+    def empty_copy(self):
+        """
+        :return: A BucketInfo for the same bucket with nothing counted yet, gathering
+        the same extra details as this one, for partial results to be merged back in.
+        :rtype: BucketInfo
+        """
+        partial = BucketInfo(self.name, self.created)
+        if self.breakdown is not None:
+            partial.breakdown = self.breakdown.empty_copy()
+        if self.top_objects is not None:
+            partial.top_objects = self.top_objects.empty_copy()
+        if self.versions is not None:
+            partial.versions = self.versions.empty_copy()
+        return partial
+
+    def as_state(self):
+        """
+        :return: The bucket's totals and any extra details, as plain values ready
+        for JSON (as kept in checkpoints and work queues), to carry on with later.
+        :rtype: dict
+        """
+        state = dict(
+            bucket=self.name,
+            created=None if self.created is None else self.created.isoformat(),
+            file_count=self.file_count,
+            cumulative_size=self.cumulative_size,
+            most_recent_mod=None if self.most_recent_mod is None else self.most_recent_mod.isoformat(),
+        )
+        for name in ('breakdown', 'top_objects', 'versions'):
+            details = getattr(self, name)
+            if details is not None:
+                state[name] = details.as_state()
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        :param state: As returned by as_state.
+        :type state: dict
+        :return: The bucket as it was.
+        :rtype: BucketInfo
+        """
+        created = state.get('created')
+        my_info = cls(state['bucket'], None if created is None else datetime.fromisoformat(created))
+        my_info.file_count = state['file_count']
+        my_info.cumulative_size = state['cumulative_size']
+        if state['most_recent_mod'] is not None:
+            my_info.most_recent_mod = datetime.fromisoformat(state['most_recent_mod'])
+        # Only imported for buckets that gather them
+        if 'breakdown' in state:
+            from breakdown import Breakdown
+            my_info.breakdown = Breakdown.from_state(state['breakdown'])
+        if 'top_objects' in state:
+            from topobjects import TopObjects
+            my_info.top_objects = TopObjects.from_state(state['top_objects'])
+        if 'versions' in state:
+            from versions import VersionTotals
+            my_info.versions = VersionTotals.from_state(state['versions'])
+        return my_info
+
 
 def display_file_size(file_size: int, size_format: SizeFormat):
     """
@@ -76,6 +193,26 @@ def display_file_size(file_size: int, size_format: SizeFormat):
     return '{:.1f} {}'.format(file_size/size_format.value, size_format.name)
 
 
+def display_size_range(size_range: int):
+    """
+    :param size_range: A Breakdown size range, holding sizes under 2 ** size_range
+    and at least 2 ** (size_range - 1).
+    :type size_range: int
+    :return: A string that is human readable: "1 KB to 2 KB" for example
+    :rtype: str
+    """
+    def label(size):
+        size_format = SizeFormat.BYTES
+        for candidate in SizeFormat:
+            if size >= candidate.value:
+                size_format = candidate
+        return '{:g} {}'.format(size / size_format.value, size_format.name)
+
+    if size_range == 0:
+        return 'empty'
+    return '{} to {}'.format(label(2 ** (size_range - 1)), label(2 ** size_range))
+
+
 def display_last_mod(last_mod: [None or datetime], date_display_format: str):
     """
     This will handle converting the raw datetime into
@@ -100,18 +237,28 @@ def display_last_mod(last_mod: [None or datetime], date_display_format: str):
 class ResultHandler:
     """
     An object to hold together display configuration and information
-    as each bucket is explored. Main advantage of a collector like
-    this (as opposed to just writing out info as we discover it)
-    is a more organized way to create a log as everything is updated.
+    as each bucket is explored. Each completed bucket is displayed, and
+    (optionally) appended to a log file as a single record. Results of
+    other profiles than its own may be passed in too, and are then
+    logged to that profile's own log file.
     """
     LOG_FILE_LOCATION = 'data/result_logs'
     LOG_TIMESTAMP_FORMAT = '%Y_%m%d_%H%M'
+    DEFAULT_OUTPUT_FORMAT = 'csv'
+    # Most prefixes listed by name in a breakdown, the rest are added up as one
+    BREAKDOWN_DISPLAY_PREFIXES = 10
+    # Most of the largest / oldest files shown, all of them are logged
+    TOP_OBJECTS_DISPLAY = 10
 
     def __init__(self,
                  date_display_format: str,
                  size_display_format: str,
                  profile_name: str,
-                 write_results_to_disk: bool = True):
+                 write_results_to_disk: bool = True,
+                 output_format: str = DEFAULT_OUTPUT_FORMAT,
+                 fsync_policy: FsyncPolicy = FsyncPolicy.CLOSE,
+                 metrics=None,
+                 history: bool = False):
         """
         Establish how we will display results and information that
         will be used to structure the logging written out to the 'data' directory.
@@ -126,15 +273,32 @@ class ResultHandler:
         :type profile_name: str
         :param write_results_to_disk: Besides displaying, also write out to disk. Default: True.
         :type write_results_to_disk: bool
+        :param output_format: File format to write results in, 'csv' or 'jsonl'. Default: 'csv'.
+        :type output_format: str
+        :param fsync_policy: How hard to push written results to disk. Default: on close.
+        :type fsync_policy: FsyncPolicy
+        :param metrics: Records how long each result takes to display / log, if given.
+        :type metrics: ScanMetrics or None
+        :param history: Also append each result to the profile's history (see history.py). Default: False.
+        :type history: bool
         """
         self._profile = profile_name
         self._initated = datetime.now()
         self._date_display_format = date_display_format
         self._size_disaplay_format = size_display_format
         self._write = write_results_to_disk
+        self._writer_class = RESULT_WRITERS[output_format]
+        self._fsync_policy = fsync_policy
+        # Profile name -> ResultWriter, opened on its first result
+        self._writers = dict()
+        # Profile name -> HistoryStore, if keeping history
+        self._history = history
+        self._histories = dict()
+        self._metrics = metrics
         self._validate_location()
-        self._results = []
-        pass
+        # Buckets may be explored concurrently, so make sure only
+        # one result is printed / logged at a time.
+        self._lock = threading.Lock()
 
     def version_name(self):
         """
@@ -143,51 +307,97 @@ class ResultHandler:
         """
         return self._initated.strftime(self.LOG_TIMESTAMP_FORMAT)
 
-    def update_results(self, bucket_info: BucketInfo):
+    def update_results(self, bucket_info: BucketInfo, profile_name: str = None):
         """
         As each bucket is completed, pass the results here to keep track of them
         and take appropriate action with notification / logging.
 
         :param bucket_info: Completed bucket analysis.
         :type bucket_info: BucketInfo
+        :param profile_name: Profile the bucket belongs to, if there is more than one
+        (shown with the bucket, and logged to that profile's log file).
+        :type profile_name: str or None
         """
-        print(self._console_display(bucket_info))
-        if self._write:
-            self._results.append(bucket_info)
-            self._update_logfile()
+        with self._lock:
+            started = time.perf_counter()
+            print(self._console_display(bucket_info, profile_name))
+            if self._write:
+                self._update_logfile(bucket_info, profile_name or self._profile)
+            if self._history:
+                self._update_history(bucket_info, profile_name or self._profile)
+            if self._metrics is not None:
+                self._metrics.record_output(time.perf_counter() - started)
 
-    def _validate_location(self):
+    def close(self):
+        """
+        Finishes off the log file(s), once all buckets are done.
+        """
+        with self._lock:
+            for writer in self._writers.values():
+                writer.close()
+            self._writers.clear()
+            for store in self._histories.values():
+                store.close()
+            self._histories.clear()
+
+    def _validate_location(self, profile_name: str = None):
         """
         Handles making sure a place for writing out files exists.
+
+        :param profile_name: Profile to write out for, if not this handler's own.
+        :type profile_name: str or None
         """
         if self._write:
-            subdir, filename = os.path.split(self._logfile_location())
+            subdir, filename = os.path.split(self._logfile_location(profile_name))
             if not os.path.exists(subdir):
                 os.makedirs(subdir)
 
-    def _update_logfile(self):
+    def _update_logfile(self, bucket_info: BucketInfo, profile_name: str):
+        """
+        Appends the bucket to the log file as a single record, so the cost of
+        logging stays flat however many buckets have already been written.
+
+        :param bucket_info: Completed bucket analysis.
+        :type bucket_info: BucketInfo
+        :param profile_name: Profile whose log file to append to.
+        :type profile_name: str
+        """
+        writer = self._writers.get(profile_name)
+        if writer is None:
+            self._validate_location(profile_name)
+            writer = self._writers[profile_name] = self._writer_class(self._logfile_location(profile_name),
+                                                                      self._fsync_policy)
+        writer.write(bucket_info)
+
+    def _update_history(self, bucket_info: BucketInfo, profile_name: str):
         """
-        Writes a table as the results are updated. Could write out line by line,
-        but this sacrifices a minor amount of processing and memory
-        to keep code cleaner and less error prone.
+        :param bucket_info: Completed bucket analysis.
+        :type bucket_info: BucketInfo
+        :param profile_name: Profile whose history to append to.
+        :type profile_name: str
         """
-        res_dict = [x.__dict__ for x in self._results]
-        pd.DataFrame(res_dict).set_index('name').to_csv(self._logfile_location())
+        store = self._histories.get(profile_name)
+        if store is None:
+            from history import HistoryStore
+            store = self._histories[profile_name] = HistoryStore(profile_name)
+        store.append(bucket_info)
 
-    def _logfile_location(self):
+    def _logfile_location(self, profile_name: str = None):
         """
         A consistent way to point back to the logfile.
 
+        :param profile_name: Profile to point to the log file of, if not this handler's own.
+        :type profile_name: str or None
         :return: Filepath to dedicated log file.
         :rtype: str
         """
         return os.path.join(
             APP_HOME,
             self.LOG_FILE_LOCATION,
-            self._profile, '{}.csv'.format(self.version_name())
+            profile_name or self._profile, '{}.{}'.format(self.version_name(), self._writer_class.EXTENSION)
         )
 
-    def _console_display(self, bucket_info: BucketInfo):
+    def _console_display(self, bucket_info: BucketInfo, profile_name: str = None):
         """
         Encapsulates a consistent method of printing out information. Handle
         string value here, but defer to calling function to either print out
@@ -195,12 +405,18 @@ class ResultHandler:
 
         :param bucket_info: Completed tally of a bucket's contents.
         :type bucket_info: BucketInfo
+        :param profile_name: Profile to show the bucket under, if any.
+        :type profile_name: str or None
         :return: A formatted string for display.
         :rtype: str
         """
-        return (
-            '\nBucket "{}", created {}\n Contains {} files\n Most recently updated {}\n Total size: {}'.format(
-                bucket_info.name,
+        if profile_name is None:
+            heading = 'Bucket "{}"'.format(bucket_info.name)
+        else:
+            heading = 'Bucket "{}" of profile "{}"'.format(bucket_info.name, profile_name)
+        display = (
+            '\n{}, created {}\n Contains {} files\n Most recently updated {}\n Total size: {}'.format(
+                heading,
                 bucket_info.created.strftime(self._date_display_format),
                 bucket_info.file_count,
                 display_last_mod(bucket_info.most_recent_mod,
@@ -209,17 +425,103 @@ class ResultHandler:
                                   self._size_disaplay_format)
             )
         )
+        if bucket_info.throttle is not None:
+            display = '{}\n Requests in flight: {}'.format(display, bucket_info.throttle)
+        estimate = bucket_info.estimate
+        if estimate is not None:
+            display = '{}\n Estimated {}'.format(display, estimate.describe(self._date_display_format))
+            if estimate.file_count_range is not None:
+                display = '{}\n {:.0%} confidence: {} to {} files, {} to {}'.format(
+                    display, estimate.confidence, estimate.file_count_range[0], estimate.file_count_range[1],
+                    display_file_size(estimate.size_range[0], self._size_disaplay_format),
+                    display_file_size(estimate.size_range[1], self._size_disaplay_format))
+        if bucket_info.versions is not None:
+            display = '{}{}'.format(display, self._versions_display(bucket_info))
+        if bucket_info.changes is not None:
+            display = '{}\n Since last run: {}'.format(display, bucket_info.changes)
+        if bucket_info.breakdown is not None:
+            display = '{}{}'.format(display, self._breakdown_display(bucket_info.breakdown))
+        if bucket_info.top_objects is not None:
+            display = '{}{}'.format(display, self._top_objects_display(bucket_info.top_objects))
+        return display
+
+    def _versions_display(self, bucket_info: BucketInfo):
+        """
+        :param bucket_info: A bucket explored with its versions and uploads.
+        :type bucket_info: BucketInfo
+        :return: Lines to add to a bucket's display, ending with everything the bucket holds.
+        :rtype: str
+        """
+        versions = bucket_info.versions
+        display = ('\n Noncurrent versions: {} ({})\n Delete markers: {}'
+                   '\n Incomplete multipart uploads: {} ({})').format(
+            versions.noncurrent_count, display_file_size(versions.noncurrent_size, self._size_disaplay_format),
+            versions.delete_markers,
+            versions.upload_count, display_file_size(versions.upload_size, self._size_disaplay_format))
+        if versions.oldest_upload is not None:
+            display = '{}, oldest started {}'.format(
+                display, display_last_mod(versions.oldest_upload, self._date_display_format))
+        return '{}\n Total stored: {}'.format(display, display_file_size(
+            bucket_info.cumulative_size + versions.noncurrent_size + versions.upload_size,
+            self._size_disaplay_format))
+
+    def _breakdown_display(self, breakdown):
+        """
+        :param breakdown: Totals by prefix, storage class and size range.
+        :type breakdown: Breakdown
+        :return: Lines to add to a bucket's display, top level prefixes biggest first.
+        :rtype: str
+        """
+        lines = []
+        sections = (
+            ('By prefix', breakdown.top_prefixes(self.BREAKDOWN_DISPLAY_PREFIXES)),
+            ('By storage class', [(x, y[0], y[1]) for x, y in sorted(breakdown.storage_classes.items())]),
+            ('By file size', [(display_size_range(x), y[0], y[1]) for x, y in sorted(breakdown.sizes.items())]),
+        )
+        for title, rows in sections:
+            if not rows:
+                continue
+            lines.append('\n {}:'.format(title))
+            for name, file_count, cumulative_size in rows:
+                lines.append('\n  {}: {} files, {}'.format(
+                    name, file_count, display_file_size(cumulative_size, self._size_disaplay_format)))
+        return ''.join(lines)
+
+    def _top_objects_display(self, top_objects):
+        """
+        :param top_objects: The largest and least recently modified files.
+        :type top_objects: TopObjects
+        :return: Lines to add to a bucket's display.
+        :rtype: str
+        """
+        lines = []
+        for title, files in (('Largest files', top_objects.largest()),
+                             ('Least recently modified files', top_objects.oldest())):
+            if not files:
+                continue
+            lines.append('\n {}:'.format(title))
+            for key, size, last_modified in files[:self.TOP_OBJECTS_DISPLAY]:
+                lines.append('\n  {} ({}, {})'.format(
+                    key, display_file_size(size, self._size_disaplay_format),
+                    display_last_mod(last_modified, self._date_display_format)))
+        return ''.join(lines)
 
 
 def initiate_bucket_info(input_bucket):
     """
     Helper function for extracting preliminary information from a bucket.
 
-    :param input_bucket: An S3 bucket object passed back from resource handler.
-    :type input_bucket: S3 bucket
+    :param input_bucket: An entry of the 'Buckets' list returned by the client's
+    list_buckets, or an S3 bucket object passed back from resource handler.
+    :type input_bucket: dict or S3 bucket
     :return: Data structure ready to start collecting file inforation
     :rtype: BucketInfo
     """
+    if isinstance(input_bucket, dict):
+        return BucketInfo(
+            name=input_bucket['Name'],
+            created=input_bucket['CreationDate']
+        )
     return BucketInfo(
         name=input_bucket.name,
         created=input_bucket.creation_date
@@ -1,26 +1,52 @@
 import argparse
-from access import AccessHandler, explore_bucket
-from datetime import datetime
+import sys
+from breakdown import Breakdown, DEFAULT_BREAKDOWN_DEPTH, DEFAULT_MAX_PREFIXES
+from datetime import datetime, timedelta, timezone
+from defaults import DEFAULT_CHECKPOINT_INTERVAL, DEFAULT_INVENTORY_WORKERS, DEFAULT_REGION_CACHE_DAYS, \
+    DEFAULT_PROFILE_WORKERS, DEFAULT_MAX_IN_FLIGHT, DEFAULT_PER_BUCKET_IN_FLIGHT, \
+    DEFAULT_SAMPLE_ERROR, DEFAULT_SAMPLE_SECONDS, DEFAULT_WATCH_HOST, DEFAULT_WATCH_PORT, \
+    DEFAULT_WATCH_MIN_INTERVAL, DEFAULT_WATCH_MAX_INTERVAL, DEFAULT_PROGRESS_PAGES, DEFAULT_LEASE_SECONDS
+from functools import partial
 from results import ResultHandler, SizeFormat, initiate_bucket_info
+from topobjects import TopObjects, DEFAULT_TOP_OBJECTS
+from writers import FsyncPolicy, RESULT_WRITERS
+
+# Only light weight modules are imported up here, so that --help (and argument
+# errors) come back straight away. Anything pulling in boto3 is imported in
+# main(), once we know we will actually be talking to AWS.
 
 DEFAULT_PROFILE_NAME = 'default'
+ALL_PROFILES = 'all'
 DEFAULT_DATE_FORMAT = 'month_first'
 DEFAULT_SIZE_FORMAT = 'mb'
+DEFAULT_WORKERS = 1
+DEFAULT_SHARD_WORKERS = 1
+DEFAULT_ENGINE = 'threads'
+ENGINES = ('threads', 'async')
+SOURCES = ('list', 'inventory', 'sample')
+DEFAULT_SOURCE = 'list'
+# How far back to look in the history for how many files each bucket had last time
+PROGRESS_HISTORY_DAYS = 90
 
-if __name__ == '__main__':
-    # TODO complete README
-
-    # This dict sets certain date display options; the underlying
-    # object, ResultHandler, can take any string written in python's
-    # date formatting mini language,
-    # (https://docs.python.org/3/library/datetime.html#strftime-and-strptime-format-codes),
-    # but for out users, we want to keep this easy to use, so we narrow
-    # down to some often used formats
-    date_display_mapping = dict(
-        month_first='%m/%d/%Y',
-        year_first='%Y_%m_%d',
-        day_first='%d/%m/%Y',
-    )
+# This dict sets certain date display options; the underlying
+# object, ResultHandler, can take any string written in python's
+# date formatting mini language,
+# (https://docs.python.org/3/library/datetime.html#strftime-and-strptime-format-codes),
+# but for out users, we want to keep this easy to use, so we narrow
+# down to some often used formats
+DATE_DISPLAY_MAPPING = dict(
+    month_first='%m/%d/%Y',
+    year_first='%Y_%m_%d',
+    day_first='%d/%m/%Y',
+)
+
+
+def build_parser():
+    """
+    :return: Parser defining the various possible arguments for this script.
+    :rtype: argparse.ArgumentParser
+    """
+    date_display_mapping = DATE_DISPLAY_MAPPING
 
     # This is an extra bit of clarity for th user regarding date formats;
     # It creates a list of today's dte in each of the formats above,
@@ -32,10 +58,18 @@ if __name__ == '__main__':
     date_format_example = ', '.join(date_format_example_list)
 
     # Define and manage the various possible arguments for this script
-    parser = argparse.ArgumentParser(description=__doc__)
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     epilog='See "s3explore.py query --help" for looking through the '
+                                            'history kept with --history.')
     parser.add_argument('-p', '--profile', type=str, default=DEFAULT_PROFILE_NAME,
                         help="Provide profile name (will use {} if not supplied).".format(
                             DEFAULT_PROFILE_NAME))
+    parser.add_argument('--profiles', type=str, default=None,
+                        help='Explore several profiles (comma separated, or "{}" for every profile) in '
+                             'parallel worker processes, instead of just --profile.'.format(ALL_PROFILES))
+    parser.add_argument('--profile_workers', type=int, default=DEFAULT_PROFILE_WORKERS,
+                        help='With --profiles, number of profiles to explore at the same time (default {}).'.format(
+                            DEFAULT_PROFILE_WORKERS))
     parser.add_argument('-s', '--size_format', type=str, default=DEFAULT_SIZE_FORMAT,
                         choices=[x.name.lower() for x in SizeFormat],
                         help='Choose unit to display total bucket size.')
@@ -50,31 +84,598 @@ if __name__ == '__main__':
                         help='Include the time of day for last modified file; for example "... 13:01:20".')
     parser.add_argument('-w', '--write_results_to_disk', default=False, action='store_true',
                         help='After displaying in command line; also write to a log file in "data" directory.')
-    args = parser.parse_args()
+    parser.add_argument('--output_format', type=str, default=ResultHandler.DEFAULT_OUTPUT_FORMAT,
+                        choices=list(RESULT_WRITERS.keys()),
+                        help='File format for results written to disk.')
+    parser.add_argument('--fsync', type=str, default=FsyncPolicy.CLOSE.value,
+                        choices=[x.value for x in FsyncPolicy],
+                        help='When to force results written to disk out of the OS cache: '
+                             'never, after every record, or once on close.')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='Number of buckets to explore at the same time (default {}).'.format(
+                            DEFAULT_WORKERS))
+    parser.add_argument('--sorted_output', default=False, action='store_true',
+                        help='Report buckets sorted by name instead of in the order they finish.')
+    parser.add_argument('--shard_workers', type=int, default=DEFAULT_SHARD_WORKERS,
+                        help='Number of prefixes to list at the same time within each bucket (default {}).'.format(
+                            DEFAULT_SHARD_WORKERS))
+    parser.add_argument('--fast_parse', default=False, action='store_true',
+                        help='Read only the fields needed from each listing response, skipping the full botocore parse.')
+    parser.add_argument('--engine', type=str, default=DEFAULT_ENGINE, choices=ENGINES,
+                        help='Explore with a pool of threads, or with asyncio on a single event loop '
+                             '(async ignores --workers and --shard_workers).')
+    parser.add_argument('--max_in_flight', type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help='With --engine async, most listing requests in flight at once (default {}).'.format(
+                            DEFAULT_MAX_IN_FLIGHT))
+    parser.add_argument('--per_bucket_in_flight', type=int, default=DEFAULT_PER_BUCKET_IN_FLIGHT,
+                        help='With --engine async, ceiling for the adaptive limit on listing requests '
+                             'in flight for any one bucket (default {}).'.format(DEFAULT_PER_BUCKET_IN_FLIGHT))
+    parser.add_argument('--source', type=str, default=DEFAULT_SOURCE, choices=SOURCES,
+                        help='Where bucket contents come from: listing every object, S3 Inventory reports '
+                             '(buckets without a report are listed), or listing a random sample of each '
+                             'bucket and estimating.')
+    parser.add_argument('--inventory_location', type=str, default=None,
+                        help='With --source inventory, where reports are delivered: "s3://bucket/prefix", '
+                             'a local copy of that, or a single manifest.json.')
+    parser.add_argument('--inventory_workers', type=int, default=DEFAULT_INVENTORY_WORKERS,
+                        help='Inventory data files to read at the same time, per bucket (default {}).'.format(
+                            DEFAULT_INVENTORY_WORKERS))
+    parser.add_argument('--sample_error', type=float, default=DEFAULT_SAMPLE_ERROR,
+                        help='With --source sample, stop sampling a bucket once its file count and size are '
+                             'known to within this fraction, at 95%% confidence (default {}).'.format(
+                                 DEFAULT_SAMPLE_ERROR))
+    parser.add_argument('--sample_seconds', type=float, default=DEFAULT_SAMPLE_SECONDS,
+                        help='With --source sample, stop sampling a bucket after this many seconds, '
+                             'whatever the error (default {:g}).'.format(DEFAULT_SAMPLE_SECONDS))
+    parser.add_argument('--fast_estimate', default=False, action='store_true',
+                        help='Take sizes and object counts from the daily CloudWatch storage metrics, '
+                             'listing only buckets that have none. Numbers are marked as estimates.')
+    parser.add_argument('--index', default=False, action='store_true',
+                        help='Keep an index of every object under "data/index", and report what changed '
+                             'since the last indexed run.')
+    parser.add_argument('--include_buckets', type=str, action='append', default=None, metavar='PATTERN',
+                        help='Only explore buckets whose name matches this pattern ("logs-*", say); '
+                             'may be given more than once.')
+    parser.add_argument('--exclude_buckets', type=str, action='append', default=None, metavar='PATTERN',
+                        help='Do not explore buckets whose name matches this pattern; may be given more than once.')
+    parser.add_argument('--include_prefixes', type=str, action='append', default=None, metavar='PREFIX',
+                        help='Only list and count keys starting with this prefix ("logs/2026/", say); '
+                             'may be given more than once.')
+    parser.add_argument('--exclude_keys', type=str, action='append', default=None, metavar='PATTERN',
+                        help='Do not count keys matching this pattern ("*.tmp", or "logs/debug/*", which '
+                             'is also skipped over while listing); may be given more than once.')
+    parser.add_argument('--breakdown', default=False, action='store_true',
+                        help='Also total up each bucket by prefix, storage class and file size, '
+                             'in the same pass as listing it.')
+    parser.add_argument('--breakdown_depth', type=int, default=DEFAULT_BREAKDOWN_DEPTH,
+                        help='With --breakdown, how many levels of "/" delimited prefixes to total up '
+                             '(default {}).'.format(DEFAULT_BREAKDOWN_DEPTH))
+    parser.add_argument('--breakdown_prefixes', type=int, default=DEFAULT_MAX_PREFIXES,
+                        help='With --breakdown, most prefixes to keep totals for per bucket; files under '
+                             'any more are added up as "(other)" (default {}).'.format(DEFAULT_MAX_PREFIXES))
+    parser.add_argument('--top_objects', type=int, nargs='?', const=DEFAULT_TOP_OBJECTS, default=None, metavar='N',
+                        help='Also keep the N largest and N least recently modified files of each bucket, '
+                             'in the same pass as listing it (N is {} if not given).'.format(DEFAULT_TOP_OBJECTS))
+    parser.add_argument('--versions', default=False, action='store_true',
+                        help='List every version of every object, and any incomplete multipart uploads, '
+                             'to also report noncurrent versions, delete markers and upload parts.')
+    parser.add_argument('--progress', default=False, action='store_true',
+                        help='Show how far each bucket has got while it is being listed: as a status line '
+                             'on a terminal, otherwise as lines of JSON (on standard error).')
+    parser.add_argument('--progress_pages', type=int, default=DEFAULT_PROGRESS_PAGES,
+                        help='With --progress, pages of a bucket between updates (default {}).'.format(
+                            DEFAULT_PROGRESS_PAGES))
+    parser.add_argument('--metrics_json', type=str, default=None,
+                        help='Write a JSON summary of request counts, latencies and timings to this file.')
+    parser.add_argument('--metrics_textfile', type=str, default=None,
+                        help='Write the same metrics in Prometheus text format to this file '
+                             '(for the node exporter\'s textfile collector).')
+    parser.add_argument('--region_cache_days', type=float, default=DEFAULT_REGION_CACHE_DAYS,
+                        help='Days to remember the region each bucket is in, under "data/regions", '
+                             'before looking it up again (default {}).'.format(DEFAULT_REGION_CACHE_DAYS))
+    parser.add_argument('--checkpoint_interval', type=float, default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help='Seconds between saving progress through each bucket, 0 to turn off (default {}).'.format(
+                            DEFAULT_CHECKPOINT_INTERVAL))
+    parser.add_argument('--resume', default=False, action='store_true',
+                        help='Pick up from where an interrupted run left off.')
+    parser.add_argument('--history', default=False, action='store_true',
+                        help='Also append each result to the profile\'s history under "data/history", '
+                             'for "s3explore.py query" to answer questions about.')
+    parser.add_argument('--watch', default=False, action='store_true',
+                        help='Keep running, refreshing each bucket now and again (more often the more it '
+                             'changes), and serve the latest results as JSON over HTTP.')
+    parser.add_argument('--watch_host', type=str, default=DEFAULT_WATCH_HOST,
+                        help='Address to serve results on with --watch (default {}).'.format(DEFAULT_WATCH_HOST))
+    parser.add_argument('--watch_port', type=int, default=DEFAULT_WATCH_PORT,
+                        help='Port to serve results on with --watch (default {}).'.format(DEFAULT_WATCH_PORT))
+    parser.add_argument('--watch_min_interval', type=float, default=DEFAULT_WATCH_MIN_INTERVAL,
+                        help='Shortest time between refreshes of a bucket with --watch, in seconds '
+                             '(default {}).'.format(DEFAULT_WATCH_MIN_INTERVAL))
+    parser.add_argument('--watch_max_interval', type=float, default=DEFAULT_WATCH_MAX_INTERVAL,
+                        help='Longest time between refreshes of a bucket with --watch, in seconds '
+                             '(default {}).'.format(DEFAULT_WATCH_MAX_INTERVAL))
+    parser.add_argument('--coordinate', type=str, default=None, metavar='QUEUE',
+                        help='Put the buckets in a work queue (a SQLite file on storage shared with the '
+                             'workers) and report each one as the workers finish it, rather than explore them here.')
+    parser.add_argument('--work', type=str, default=None, metavar='QUEUE',
+                        help='Explore pieces of buckets from a work queue, --workers at a time, until there '
+                             'are none left, for a coordinator to report on.')
+    parser.add_argument('--lease_seconds', type=float, default=DEFAULT_LEASE_SECONDS,
+                        help='With --work, how long a worker can go without being heard from before its pieces '
+                             'are handed to another worker (default {}).'.format(DEFAULT_LEASE_SECONDS))
+    return parser
+
+
+def main(argv=None):
+    """
+    Explores every bucket available to the chosen profile(s) and reports on them.
+
+    :param argv: Command line arguments, defaults to those the script was run with.
+    :type argv: list of str or None
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    # "s3explore.py query ..." looks through the history instead
+    if argv and (argv[0] == 'query'):
+        from query import main as query_main
+        query_main(argv[1:])
+        return
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('--workers must be at least 1.')
+    if args.shard_workers < 1:
+        parser.error('--shard_workers must be at least 1.')
+    if (args.max_in_flight < 1) or (args.per_bucket_in_flight < 1):
+        parser.error('--max_in_flight and --per_bucket_in_flight must be at least 1.')
+    if args.resume and ((args.shard_workers > 1) or (args.checkpoint_interval <= 0) or (args.engine == 'async')):
+        parser.error('--resume needs checkpoints, which are only kept by the threads engine without --shard_workers.')
+    use_async = args.engine == 'async'
+    use_inventory = args.source == 'inventory'
+    if use_inventory and (args.inventory_location is None):
+        parser.error('--source inventory needs an --inventory_location.')
+    if use_inventory and (use_async or args.index):
+        parser.error('--source inventory cannot be used with --engine async or --index.')
+    if args.inventory_workers < 1:
+        parser.error('--inventory_workers must be at least 1.')
+    use_sampling = args.source == 'sample'
+    if use_sampling and (use_async or args.index or args.fast_parse):
+        parser.error('--source sample cannot be used with --engine async, --index or --fast_parse.')
+    if (args.sample_error <= 0) or (args.sample_seconds <= 0):
+        parser.error('--sample_error and --sample_seconds must be more than 0.')
+    if (args.breakdown or (args.top_objects is not None)) and \
+            (args.fast_parse or use_async or use_sampling or args.resume):
+        parser.error('--breakdown and --top_objects need every object listed in full, so cannot be used with '
+                     '--fast_parse, --engine async, --source sample or --resume.')
+    if (args.top_objects is not None) and (args.top_objects < 1):
+        parser.error('--top_objects must be at least 1.')
+    if (args.breakdown_depth < 1) or (args.breakdown_prefixes < 1):
+        parser.error('--breakdown_depth and --breakdown_prefixes must be at least 1.')
+    if args.index and (args.fast_parse or use_async or args.resume):
+        parser.error('--index needs every object listed in full, so cannot be used with '
+                     '--fast_parse, --engine async or --resume.')
+    if args.versions and (use_async or (args.shard_workers > 1) or (args.source != 'list') or
+                          args.fast_parse or args.index or args.resume):
+        parser.error('--versions lists object versions rather than objects, so cannot be used with --engine async, '
+                     '--shard_workers, --source inventory or sample, --fast_parse, --index or --resume.')
+
+    if (args.include_prefixes or args.exclude_keys) and \
+            (use_async or (args.shard_workers > 1) or (args.source != 'list') or args.versions or
+             args.index or args.resume):
+        parser.error('--include_prefixes and --exclude_keys cannot be used with --engine async, --shard_workers, '
+                     '--source inventory or sample, --versions, --index or --resume.')
+    if args.exclude_keys and args.fast_parse:
+        parser.error('--exclude_keys needs every key listed, so cannot be used with --fast_parse.')
+    if args.progress and (use_async or (args.profiles is not None)):
+        parser.error('--progress cannot be used with --engine async or --profiles.')
+    if args.progress_pages < 1:
+        parser.error('--progress_pages must be at least 1.')
+
+    if (args.profiles is not None) and (args.metrics_json or args.metrics_textfile):
+        parser.error('--metrics_json and --metrics_textfile cannot be used with --profiles.')
+    if args.profile_workers < 1:
+        parser.error('--profile_workers must be at least 1.')
+    if args.region_cache_days < 0:
+        parser.error('--region_cache_days cannot be negative.')
+    if args.watch and (use_async or (args.profiles is not None) or args.resume or args.fast_estimate):
+        parser.error('--watch cannot be used with --engine async, --profiles, --resume or --fast_estimate.')
+    if (args.watch_min_interval <= 0) or (args.watch_max_interval < args.watch_min_interval):
+        parser.error('--watch_min_interval must be more than 0, and no more than --watch_max_interval.')
+    if (args.coordinate is not None) and (args.work is not None):
+        parser.error('--coordinate and --work are run as separate processes.')
+    if ((args.coordinate is not None) or (args.work is not None)) and \
+            (use_async or (args.shard_workers > 1) or (args.source != 'list') or (args.profiles is not None) or
+             args.watch or args.resume or args.versions or args.include_prefixes or args.exclude_keys or
+             args.index or args.progress or args.fast_estimate):
+        parser.error('--coordinate and --work cannot be used with --engine async, --shard_workers, --source '
+                     'inventory or sample, --profiles, --watch, --resume, --versions, --include_prefixes, '
+                     '--exclude_keys, --index, --progress or --fast_estimate.')
+    if args.lease_seconds <= 0:
+        parser.error('--lease_seconds must be more than 0.')
+
+    metrics = None
+    if args.metrics_json or args.metrics_textfile:
+        from metrics import ScanMetrics
+        metrics = ScanMetrics()
+
+    profiles = None
+    if args.profiles is not None:
+        from access import AccessHandler
+        if args.profiles == ALL_PROFILES:
+            profiles = AccessHandler.list_profiles(use_aws_cli_profiles=args.use_aws_cli_creds)
+        else:
+            profiles = [x.strip() for x in args.profiles.split(',') if x.strip()]
+        if not profiles:
+            parser.error('--profiles found no profiles to explore.')
 
     # Resolve actual date format codes, and append time code
     # if user has opted for that level of detail
-    use_date_format = date_display_mapping[args.date_format]
+    use_date_format = DATE_DISPLAY_MAPPING[args.date_format]
     if args.show_time_modified:
         use_date_format = '{} %H:%M:%S'.format(use_date_format)
 
-    # Initiate the main handler objects that will be our workers
-    access_handler = AccessHandler(profile_name=args.profile,
-                                   use_aws_cli_profiles=args.use_aws_cli_creds)
+    # Results of every profile come back here, to be displayed and logged
+    # (each profile to its own log file) in one place
     result_handler = ResultHandler(date_display_format=use_date_format,
                                    size_display_format=SizeFormat[args.size_format.upper()],
-                                   profile_name=args.profile,
-                                   write_results_to_disk=args.write_results_to_disk)
+                                   profile_name=args.profile if profiles is None else profiles[0],
+                                   write_results_to_disk=args.write_results_to_disk,
+                                   output_format=args.output_format,
+                                   fsync_policy=FsyncPolicy(args.fsync),
+                                   metrics=metrics,
+                                   history=args.history)
+
+    try:
+        if args.watch:
+            watch_profile(args, args.profile, result_handler.update_results, metrics)
+        elif args.coordinate is not None:
+            coordinate_profile(args, args.profile, result_handler.update_results, metrics)
+        elif args.work is not None:
+            work_profile(args, args.profile, metrics)
+        elif profiles is None:
+            scan_profile(args, args.profile, result_handler.update_results, metrics)
+        else:
+            from fanout import explore_profiles
+            for profile_name, bucket_info in explore_profiles(profiles, partial(scan_profile, args),
+                                                              workers=args.profile_workers):
+                result_handler.update_results(bucket_info, profile_name=profile_name)
+    finally:
+        result_handler.close()
+
+    if metrics is not None:
+        metrics.finish()
+        if args.metrics_json:
+            metrics.write_json(args.metrics_json)
+        if args.metrics_textfile:
+            metrics.write_textfile(args.metrics_textfile)
+
+
+class ProfileExplorer:
+    """
+    Everything set up to explore one profile's buckets the way the command
+    line asks: its clients, the function each bucket is explored with, and
+    the index, region cache and checkpoints that go with them.
+    """
+    def __init__(self, args, profile_name, metrics=None, checkpoints=True):
+        """
+        :param args: Parsed (and checked) command line arguments.
+        :type args: argparse.Namespace
+        :param profile_name: Profile whose buckets to explore.
+        :type profile_name: str
+        :param metrics: Records requests and timings, if given.
+        :type metrics: ScanMetrics or None
+        :param checkpoints: Keep checkpoints, if the arguments call for them.
+        Buckets explored more than once in a run (by --watch) must not be.
+        :type checkpoints: bool
+        """
+        # Each feature's module is only imported when it is asked for
+        from access import AccessHandler, explore_bucket
+        from scope import BucketFilter
+
+        self._args = args
+        self.use_async = args.engine == 'async'
+        self._bucket_filter = BucketFilter(args.include_buckets, args.exclude_buckets)
+
+        # Large buckets can be split up by prefix and listed in parallel,
+        # otherwise we keep checkpoints as we page through each bucket
+        self.checkpointer = None
+        if self.use_async:
+            explore = None
+        elif args.versions:
+            from versions import explore_bucket_versions
+            explore = explore_bucket_versions
+        elif args.shard_workers > 1:
+            from shards import explore_bucket_sharded
+            explore = partial(explore_bucket_sharded, workers=args.shard_workers)
+        elif args.include_prefixes or args.exclude_keys:
+            from scope import KeyScope
+            explore = partial(explore_bucket, scope=KeyScope(args.include_prefixes, args.exclude_keys))
+        elif checkpoints and (args.checkpoint_interval > 0):
+            from checkpoint import Checkpointer
+            self.checkpointer = Checkpointer(profile_name=profile_name,
+                                             resume=args.resume,
+                                             interval=args.checkpoint_interval)
+            explore = partial(explore_bucket, checkpointer=self.checkpointer)
+        else:
+            explore = explore_bucket
+        # Buckets with inventory reports are read from them, the rest are listed as above
+        if args.source == 'inventory':
+            from inventory import InventoryLocation, explore_bucket_inventory
+            explore = partial(explore_bucket_inventory,
+                              location=InventoryLocation(args.inventory_location),
+                              workers=args.inventory_workers,
+                              fallback=explore)
+        # Or only a sample of each bucket is listed, to estimate from
+        if args.source == 'sample':
+            from sampling import explore_bucket_sampled
+            explore = partial(explore_bucket_sampled, error=args.sample_error, seconds=args.sample_seconds)
+
+        # Initiate the main handler objects that will be our workers
+        self.access_handler = AccessHandler(profile_name=profile_name,
+                                            use_aws_cli_profiles=args.use_aws_cli_creds,
+                                            max_pool_connections=args.workers * args.shard_workers)
+        self.index_writer = None
+        if args.index:
+            from index import IndexWriter
+            self.index_writer = IndexWriter(profile_name=profile_name)
+        self.progress = None
+        if args.progress:
+            from history import HistoryStore
+            from progress import ProgressReporter
+            # How long is left is worked out from how many files the last run found
+            # (versions are not counted in the history, so there is no telling then)
+            expected = None
+            if not args.versions:
+                expected = HistoryStore(profile_name).latest(
+                    'file_count', since=datetime.now(timezone.utc) - timedelta(days=PROGRESS_HISTORY_DAYS))
+            self.progress = ProgressReporter(every_pages=args.progress_pages, expected=expected,
+                                             size_format=SizeFormat[args.size_format.upper()])
+
+        def prepare(s3_client):
+            if args.fast_parse:
+                from fastparse import enable_fast_parse
+                enable_fast_parse(s3_client)
+            if metrics is not None:
+                metrics.instrument_client(s3_client)
+            if self.index_writer is not None:
+                self.index_writer.attach(s3_client)
+            if self.progress is not None:
+                self.progress.attach(s3_client)
+        prepare(self.access_handler.s3_client)
+
+        # Each bucket is listed through a client in its own region (the async
+        # engine finds its own way there, from S3's redirects), and its
+        # CloudWatch metrics are looked for there too
+        self.region_cache = None
+        self.regional_clients = None
+        if (explore is not None) or args.fast_estimate:
+            from regions import RegionCache, RegionalClients
+            self.region_cache = RegionCache(profile_name, max_age=args.region_cache_days * 24 * 60 * 60)
+            self.regional_clients = RegionalClients(self.access_handler.s3_client,
+                                                    self.access_handler.regional_s3_client,
+                                                    self.region_cache, prepare=prepare)
+        if explore is not None:
+            explore = self.regional_clients.regional_explore(explore)
+        if (metrics is not None) and (explore is not None):
+            explore = metrics.timed_explore(explore)
+        if (self.progress is not None) and (explore is not None):
+            explore = self.progress.wrap_explore(explore)
+        # None with the async engine, which explores buckets its own way
+        self.explore = explore
+
+    def bucket_infos(self):
+        """
+        :return: A BucketInfo for each of the profile's buckets, nothing counted yet.
+        :rtype: list of BucketInfo
+        """
+        # Grab the top level info for each bucket and fill in "top of form"
+        # for the BucketInfo objects...
+        # ...leaving out any filtered out, so they are never listed
+        bucket_infos = [initiate_bucket_info(bucket)
+                        for bucket in self.access_handler.list_buckets()]
+        return [x for x in bucket_infos if self._bucket_filter.matches(x.name)]
+
+    def set_up_details(self, bucket_info):
+        """
+        Gets a BucketInfo ready to gather any extra details asked for, before it is explored.
+
+        :param bucket_info: A bucket about to be explored.
+        :type bucket_info: BucketInfo
+        :return: The same BucketInfo.
+        :rtype: BucketInfo
+        """
+        args = self._args
+        if args.breakdown:
+            bucket_info.breakdown = Breakdown(depth=args.breakdown_depth, max_prefixes=args.breakdown_prefixes)
+        if args.top_objects is not None:
+            bucket_info.top_objects = TopObjects(limit=args.top_objects)
+        if args.versions:
+            from versions import VersionTotals
+            bucket_info.versions = VersionTotals()
+        return bucket_info
+
+    def finish_bucket(self, bucket_info):
+        """
+        :param bucket_info: A bucket just explored.
+        :type bucket_info: BucketInfo
+        """
+        if self.index_writer is not None:
+            bucket_info.changes = self.index_writer.finish(bucket_info)
+
+    def close(self):
+        """
+        Finishes off the index and region cache, once all buckets are done.
+        """
+        if self.index_writer is not None:
+            self.index_writer.close()
+        if self.region_cache is not None:
+            self.region_cache.save()
 
-    # Cycle through the buckets...
-    for bucket in access_handler.s3_resource.buckets.all():
-        # Grab the top level bucket info and fill in "top of form"
-        # for the BucketInfo object...
-        bucket_info = initiate_bucket_info(bucket)
 
-        # Now send the BucketInfo object to get populated with
-        # detailed information about the files within
-        bucket_info = explore_bucket(bucket_info, access_handler.s3_client)
+def scan_profile(args, profile_name, report, metrics=None):
+    """
+    Explores every bucket available to one profile, handing each
+    one on as it is done. This is all of the work for a profile, so
+    with --profiles it is what each worker process runs.
 
-        # Once completed, hand off to ResultHandler for display and/or logging to disk
-        result_handler.update_results(bucket_info)
+    :param args: Parsed (and checked) command line arguments.
+    :type args: argparse.Namespace
+    :param profile_name: Profile whose buckets to explore.
+    :type profile_name: str
+    :param report: Called with each completed BucketInfo.
+    :type report: function
+    :param metrics: Records requests and timings, if given.
+    :type metrics: ScanMetrics or None
+    """
+    from access import explore_buckets
+
+    explorer = ProfileExplorer(args, profile_name, metrics)
+    if explorer.progress is not None:
+        report = explorer.progress.wrap_report(report)
+    bucket_infos = explorer.bucket_infos()
+
+    # Buckets CloudWatch has numbers for are done straight away,
+    # leaving only the rest to be explored
+    if args.fast_estimate:
+        from estimate import estimate_buckets_by_region
+        remaining = estimate_buckets_by_region(bucket_infos, explorer.regional_clients.region_of,
+                                               partial(explorer.access_handler.client, 'cloudwatch'))
+        estimated = [x for x in bucket_infos if x.estimate is not None]
+        if args.sorted_output:
+            estimated.sort(key=lambda x: x.name)
+        for bucket_info in estimated:
+            report(bucket_info)
+        bucket_infos = remaining
+
+    # Estimated buckets were never listed, so have nothing to break down
+    for bucket_info in bucket_infos:
+        explorer.set_up_details(bucket_info)
+
+    # Now send the BucketInfo objects to get populated with
+    # detailed information about the files within
+    if explorer.use_async:
+        from asyncscan import AsyncScanner, explore_buckets_async
+        scanner = AsyncScanner.from_access_handler(explorer.access_handler,
+                                                   max_in_flight=args.max_in_flight,
+                                                   per_bucket_in_flight=args.per_bucket_in_flight,
+                                                   metrics=metrics)
+        explored = explore_buckets_async(bucket_infos, scanner, sorted_output=args.sorted_output)
+    else:
+        explored = explore_buckets(bucket_infos, explorer.access_handler.s3_client,
+                                   workers=args.workers,
+                                   sorted_output=args.sorted_output,
+                                   explore=explorer.explore)
+    for bucket_info in explored:
+        explorer.finish_bucket(bucket_info)
+        # Once completed, hand off for display and/or logging to disk
+        report(bucket_info)
+    explorer.close()
+
+    # Everything made it, so there is nothing left to resume
+    if explorer.checkpointer is not None:
+        explorer.checkpointer.clear()
+
+
+def watch_profile(args, profile_name, report, metrics=None):
+    """
+    Keeps exploring one profile's buckets until interrupted, each one as
+    often as it changes (within --watch_min_interval and --watch_max_interval),
+    and serves the latest results over HTTP in the meantime.
+
+    :param args: Parsed (and checked) command line arguments.
+    :type args: argparse.Namespace
+    :param profile_name: Profile whose buckets to watch.
+    :type profile_name: str
+    :param report: Called with each BucketInfo as it is refreshed.
+    :type report: function
+    :param metrics: Records requests and timings, if given.
+    :type metrics: ScanMetrics or None
+    """
+    import threading
+    from watch import RefreshScheduler, Watcher, serve_results
+
+    # Every bucket is explored again and again, so there is nothing to checkpoint
+    explorer = ProfileExplorer(args, profile_name, metrics, checkpoints=False)
+    if explorer.progress is not None:
+        report = explorer.progress.wrap_report(report)
+
+    def explore(bucket_info, s3_client):
+        bucket_info = explorer.explore(bucket_info, s3_client)
+        explorer.finish_bucket(bucket_info)
+        return bucket_info
+
+    def on_result(bucket_info):
+        report(bucket_info)
+        # Kept up to date as we go, as there is no telling when we will be stopped
+        explorer.region_cache.save()
+
+    watcher = Watcher(explorer.bucket_infos, explore, explorer.access_handler.s3_client,
+                      RefreshScheduler(args.watch_min_interval, args.watch_max_interval),
+                      workers=args.workers, set_up=explorer.set_up_details, on_result=on_result)
+    server = serve_results(watcher, host=args.watch_host, port=args.watch_port)
+    print('Serving results on http://{}:{}/buckets'.format(*server.server_address[:2]))
+    try:
+        watcher.run(threading.Event())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        explorer.close()
+
+
+def coordinate_profile(args, profile_name, report, metrics=None):
+    """
+    Puts one profile's buckets in the --coordinate work queue, and hands
+    each one on once the workers have explored all of it.
+
+    :param args: Parsed (and checked) command line arguments.
+    :type args: argparse.Namespace
+    :param profile_name: Profile whose buckets to explore.
+    :type profile_name: str
+    :param report: Called with each completed BucketInfo.
+    :type report: function
+    :param metrics: Records requests and timings, if given.
+    :type metrics: ScanMetrics or None
+    """
+    from workqueue import WorkQueue, coordinate
+
+    explorer = ProfileExplorer(args, profile_name, metrics, checkpoints=False)
+    bucket_infos = [explorer.set_up_details(x) for x in explorer.bucket_infos()]
+    coordinate(WorkQueue(args.coordinate, lease_seconds=args.lease_seconds), bucket_infos, report)
+    explorer.close()
+
+
+def work_profile(args, profile_name, metrics=None):
+    """
+    Explores pieces of buckets from the --work queue until there are none
+    left. The profile's credentials are used, so it has to have access
+    to every bucket the coordinator put in the queue.
+
+    :param args: Parsed (and checked) command line arguments.
+    :type args: argparse.Namespace
+    :param profile_name: Profile to explore with.
+    :type profile_name: str
+    :param metrics: Records requests and timings, if given.
+    :type metrics: ScanMetrics or None
+    """
+    from shards import explore_shard
+    from workqueue import WorkQueue, work
+
+    # A piece of a bucket is all that is ever explored here, so there is nothing to checkpoint
+    explorer = ProfileExplorer(args, profile_name, metrics, checkpoints=False)
+
+    def explore(bucket_info, shard):
+        # What details to gather is up to the coordinator, so it is only now we can tell
+        if args.fast_parse and ((bucket_info.breakdown is not None) or (bucket_info.top_objects is not None)):
+            raise ValueError('--breakdown and --top_objects need every object listed in full, '
+                             'so this worker (with --fast_parse) cannot explore the bucket.')
+        return explore_shard(bucket_info, explorer.regional_clients.client_for(bucket_info.name), shard)
+
+    try:
+        explored = work(WorkQueue(args.work, lease_seconds=args.lease_seconds), explore, threads=args.workers)
+    finally:
+        explorer.close()
+    print('Explored {} pieces of buckets'.format(explored))
+
+
+if __name__ == '__main__':
+    main()
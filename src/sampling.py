@@ -0,0 +1,551 @@
+import math
+import random
+import time
+from bisect import bisect_left, bisect_right
+from access import iter_pages, add_page, CONTENTS, KEY, SIZE, LAST_MODIFIED, IS_TRUNCATED
+from defaults import DEFAULT_SAMPLE_ERROR, DEFAULT_SAMPLE_SECONDS
+from estimate import Estimate
+from results import BucketInfo
+
+COMMON_PREFIXES = 'CommonPrefixes'
+PREFIX = 'Prefix'
+DELIMITER = '/'
+SAMPLING = 'sampling'
+
+# Pages listed from the start of each prefix before resorting to sampling;
+# prefixes that fit are counted exactly
+DEFAULT_EXACT_PAGES = 5
+# Keys each sample window should hold, on average
+DEFAULT_WINDOW_KEYS = 200
+# A window taking more than this many pages to list makes the windows after it narrower
+MAX_WINDOW_PAGES = 5
+# Windows every sampled stratum gets before the error bound can stop sampling
+MIN_WINDOWS = 10
+CONFIDENCE = 0.95
+Z_SCORE = 1.96
+
+# Resolution of the key space: keys alike for longer than this share a place in it
+POSITION_BITS = 128
+KEY_SPACE = 2 ** POSITION_BITS
+# How much more room a character gets, at a given place in a key, for having
+# been seen there in the sample than one that was not
+SEEN_WEIGHT = 2 ** 16
+# Random listings made to sample the keys of a prefix, to model its key space on
+MODEL_PROBES = 8
+# Sorts after any realistic key under a prefix
+LAST_CHAR = '\U0010ffff'
+END = ''
+
+
+class _Level:
+    """
+    How one character of a key, at a given place in the key, divides up the
+    room it is given: among the end of the key, the characters seen in the
+    sample, and the gaps between them (for characters never seen), in that order.
+    """
+    __slots__ = ('alphabet', 'bounds', 'total')
+
+    def __init__(self, alphabet: str, seen, end_seen: bool):
+        """
+        :param alphabet: Every character seen in the sample, in order.
+        :type alphabet: str
+        :param seen: Characters seen at this place, which get SEEN_WEIGHT rather than 1.
+        :type seen: set of str
+        :param end_seen: Whether keys in the sample ended here.
+        :type end_seen: bool
+        """
+        self.alphabet = alphabet
+        weights = [SEEN_WEIGHT if end_seen else 1, 1]
+        for char in alphabet:
+            weights.extend((SEEN_WEIGHT if char in seen else 1, 1))
+        self.bounds = [0]
+        for weight in weights:
+            self.bounds.append(self.bounds[-1] + weight)
+        self.total = self.bounds[-1]
+
+    def symbol(self, char: str):
+        """
+        :return: 0 for the end of the key, 2n + 2 for the n-th character of
+        the alphabet, and the odd number in between for a character not in it.
+        :rtype: int
+        """
+        if char == END:
+            return 0
+        n = bisect_left(self.alphabet, char)
+        if (n < len(self.alphabet)) and (self.alphabet[n] == char):
+            return 2 * n + 2
+        return 2 * n + 1
+
+
+class KeySpace:
+    """
+    Lays the keys under a prefix out along a line of numbers, in the order S3
+    lists them, so that stretches of the line can be picked at random.
+
+    Each character after the prefix narrows the key down to a share of the
+    stretch the characters before it left, as in arithmetic coding. The
+    shares are modelled on a sample of the keys: characters seen at a place
+    in the sample get far more room there than any other. So, for example,
+    the fixed parts of date partitioned keys take up next to no room, and
+    hexadecimal names fill the line evenly rather than a sixteenth of it,
+    which keeps the keys spread out about evenly along the line. Without
+    the sample's places (weighted=False), every character of the sample
+    gets the same room everywhere.
+    """
+    __slots__ = ('prefix', 'size', '_levels', '_default')
+
+    def __init__(self, prefix: str, sample, weighted: bool = True):
+        """
+        :param prefix: Every key in the space starts with this.
+        :type prefix: str
+        :param sample: Keys from the space, to model it on.
+        :type sample: list of str
+        :param weighted: Model which characters appear where, not only which appear.
+        :type weighted: bool
+        """
+        self.prefix = prefix
+        self.size = KEY_SPACE
+        suffixes = [x[len(prefix):] for x in sample]
+        alphabet = ''.join(sorted(set(char for suffix in suffixes for char in suffix)))
+        self._levels = []
+        if weighted:
+            depth = max((len(x) for x in suffixes), default=0) + 1
+            seen = [set() for _ in range(depth)]
+            ends = set()
+            for suffix in suffixes:
+                for n, char in enumerate(suffix):
+                    seen[n].add(char)
+                ends.add(len(suffix))
+            self._levels = [_Level(alphabet, seen[n], n in ends) for n in range(depth)]
+        self._default = _Level(alphabet, set(alphabet), True)
+
+    def _level(self, n):
+        return self._levels[n] if n < len(self._levels) else self._default
+
+    def position(self, key: str):
+        """
+        :param key: A key starting with the prefix.
+        :type key: str
+        :return: The key's place in the space, from 0 up to size.
+        :rtype: int
+        """
+        low, width = 0, self.size
+        suffix = key[len(self.prefix):]
+        for n in range(len(suffix) + 1):
+            level = self._level(n)
+            if width < level.total:
+                break
+            symbol = level.symbol(suffix[n] if n < len(suffix) else END)
+            start = width * level.bounds[symbol] // level.total
+            low, width = low + start, width * level.bounds[symbol + 1] // level.total - start
+            # The end of the key, or a character not in the sample, is as far as it goes
+            if symbol % 2 == 0 and symbol > 0:
+                continue
+            break
+        return low
+
+    def key_at(self, position: int):
+        """
+        :param position: A place in the space.
+        :type position: int
+        :return: A key at or before the place, as close to it as can be
+        told, to start listing after.
+        :rtype: str
+        """
+        low, width = 0, self.size
+        chars = []
+        for n in range(self.size.bit_length()):
+            level = self._level(n)
+            if width < level.total:
+                break
+            starts = [low + width * x // level.total for x in level.bounds]
+            symbol = bisect_right(starts, position) - 1
+            if symbol == 0:
+                break
+            if symbol % 2 == 1:
+                # Between two characters of the sample: just after everything starting with the lower one
+                if symbol > 1:
+                    chars.append(level.alphabet[symbol // 2 - 1] + LAST_CHAR)
+                break
+            chars.append(level.alphabet[symbol // 2 - 1])
+            low, width = starts[symbol], starts[symbol + 1] - starts[symbol]
+        return self.prefix + ''.join(chars)
+
+
+class Stratum:
+    """
+    A piece of a bucket's key space that is sampled on its own: the keys in
+    'space' sorting after 'start_after', with positions from 'low' up to
+    (not including) 'high'.
+
+    Each sample is a window of fixed width placed at random, whose keys are
+    counted and scaled up to the whole stratum. Every window is an unbiased
+    estimate on its own, so the stratum's estimate is simply their mean.
+    """
+    __slots__ = ('space', 'start_after', 'low', 'high', 'window',
+                 'windows', 'count_sum', 'count_squares', 'size_sum', 'size_squares')
+
+    def __init__(self, space: KeySpace, start_after: str, low: int, high: int):
+        """
+        :param space: The key space the stratum is part of.
+        :type space: KeySpace
+        :param start_after: Only keys sorting after this belong to the stratum.
+        :type start_after: str or None
+        :param low: First position in the stratum.
+        :type low: int
+        :param high: First position after the stratum.
+        :type high: int
+        """
+        self.space = space
+        self.start_after = start_after
+        self.low = low
+        self.high = high
+        # Width of the sample windows, adapted as the key density becomes known
+        self.window = high - low
+        self.windows = 0
+        self.count_sum = 0.0
+        self.count_squares = 0.0
+        self.size_sum = 0.0
+        self.size_squares = 0.0
+
+    @property
+    def width(self):
+        return self.high - self.low
+
+    def add_window(self, file_count: float, cumulative_size: float):
+        """
+        :param file_count: The stratum's file count, as estimated from one window.
+        :type file_count: float
+        :param cumulative_size: The stratum's total size, as estimated from one window.
+        :type cumulative_size: float
+        """
+        self.windows += 1
+        self.count_sum += file_count
+        self.count_squares += file_count ** 2
+        self.size_sum += cumulative_size
+        self.size_squares += cumulative_size ** 2
+
+    def estimate(self):
+        """
+        :return: Estimated file count and total size, with the variance of each estimate.
+        :rtype: tuple(float, float, float, float)
+        """
+        n = self.windows
+        if n == 0:
+            return 0.0, 0.0, math.inf, math.inf
+        count, size = self.count_sum / n, self.size_sum / n
+        if n == 1:
+            return count, size, math.inf, math.inf
+        count_variance = max(0.0, self.count_squares - n * count ** 2) / (n - 1) / n
+        size_variance = max(0.0, self.size_squares - n * size ** 2) / (n - 1) / n
+        return count, size, count_variance, size_variance
+
+    def adapt(self, window_keys: int):
+        """
+        Sets the window width so that a window holds about window_keys keys.
+
+        :param window_keys: Keys wanted in each window.
+        :type window_keys: int
+        """
+        count = self.count_sum / self.windows if self.windows else 0
+        if count < 1:
+            self.window = min(self.width, self.window * 2)
+        else:
+            self.window = max(1, min(self.width, self.width * window_keys // int(count)))
+
+
+def _search_params(bucket_name, prefix, start_after, page_size):
+    search_params = dict(Bucket=bucket_name, Prefix=prefix)
+    if start_after is not None:
+        search_params.update(dict(StartAfter=start_after))
+    if page_size is not None:
+        search_params.update(dict(MaxKeys=page_size))
+    return search_params
+
+
+def _list_range(s3_client, search_params, space, low, high, tally):
+    """
+    Lists the keys with positions from low up to high, adding the files to tally.
+
+    :return: How many pages it took.
+    :rtype: int
+    """
+    pages = 0
+    for resp in iter_pages(s3_client, **search_params):
+        pages += 1
+        for obj in resp.get(CONTENTS, ()):
+            position = space.position(obj[KEY])
+            if position < low:
+                continue
+            if position >= high:
+                return pages
+            if not obj[KEY].endswith('/'):
+                tally.add_file(obj[SIZE], obj[LAST_MODIFIED])
+    return pages
+
+
+def _find_end(my_info, s3_client, stratum, sample, out_of_time):
+    """
+    Narrows the stratum down to end just after its last key, so that sample
+    windows are not wasted on the empty stretch beyond. This is a binary
+    search, listing a single key at each step; where a step cannot tell for
+    sure, it errs towards a longer stratum, never a shorter one. Out of
+    time, the search stops where it is, which leaves the stratum longer
+    than it needs to be but still right.
+
+    :param sample: Keys found along the way are added to this.
+    :type sample: list of str
+    :param out_of_time: Tells whether the time budget is spent.
+    :type out_of_time: function
+    :return: False if the stratum turns out to hold no keys at all.
+    :rtype: bool
+    """
+    space = stratum.space
+
+    def first_after(start_after):
+        search_params = _search_params(my_info.name, space.prefix, start_after, 1)
+        found = s3_client.list_objects_v2(**search_params).get(CONTENTS)
+        if not found:
+            return None
+        sample.append(found[0][KEY])
+        return space.position(found[0][KEY])
+
+    if out_of_time():
+        return True
+    position = first_after(stratum.start_after)
+    if position is None:
+        return False
+    # There is a key before low, and none from high on
+    low, high = position + 1, stratum.high
+    for _ in range(POSITION_BITS):
+        # Close enough: within a small part of the stretch known to hold keys
+        if (high - low <= max(1, (low - stratum.low) // 64)) or out_of_time():
+            break
+        middle = (low + high) // 2
+        position = first_after(max(stratum.start_after, space.key_at(middle)))
+        if position is None:
+            high = middle + 1
+        elif position >= middle:
+            low = position + 1
+        else:
+            low = middle
+    stratum.high = high
+    return True
+
+
+def _pilot(my_info, s3_client, prefix, start_after, exact_pages, window_keys, page_size, rng, out_of_time):
+    """
+    Lists the start of the keys under a prefix (sorting after start_after),
+    adding what it finds to my_info. If there is more, the rest becomes a
+    stratum to be sampled, in a KeySpace modelled on the keys listed here
+    and on a few more listed from random places further on. Running out of
+    time cuts this short, leaving a stratum in the plainer space modelled
+    on what was listed so far: the windows sampled in it are just as
+    unbiased, if less evenly filled.
+
+    :return: The stratum still to be sampled, or None if everything was listed.
+    :rtype: Stratum or None
+    """
+    search_params = _search_params(my_info.name, prefix, start_after, page_size)
+    keys = []
+    pages = 0
+    for resp in iter_pages(s3_client, **search_params):
+        pages += 1
+        add_page(my_info, resp)
+        keys.extend(x[KEY] for x in resp.get(CONTENTS, ()))
+        if ((pages >= exact_pages) or out_of_time()) and resp.get(IS_TRUNCATED):
+            break
+    else:
+        return None
+    first, last = keys[0], keys[-1]
+
+    # The keys listed so far all come from the very start, so first look
+    # further on, in a plainer space modelled only on which characters keys use
+    sample = list(keys)
+    space = KeySpace(prefix, keys, weighted=False)
+    stratum = Stratum(space, last, space.position(last) + 1, space.size)
+    if not _find_end(my_info, s3_client, stratum, sample, out_of_time):
+        return None
+    for _ in range(MODEL_PROBES):
+        if out_of_time():
+            break
+        probe_after = max(last, space.key_at(rng.randrange(stratum.low, stratum.high)))
+        probe = s3_client.list_objects_v2(**_search_params(my_info.name, prefix, probe_after, page_size))
+        sample.extend(x[KEY] for x in probe.get(CONTENTS, ()))
+    else:
+        space = KeySpace(prefix, sample)
+        stratum = Stratum(space, last, space.position(last) + 1, space.size)
+        if not _find_end(my_info, s3_client, stratum, sample, out_of_time):
+            return None
+    # Start with windows about as dense as the keys listed so far
+    stratum.window = max(1, min(stratum.width, window_keys * (stratum.low - space.position(first)) // len(keys)))
+    return stratum
+
+
+def _sample_window(my_info, s3_client, stratum, rng, window_keys, page_size, seen):
+    """
+    Counts the keys in one randomly placed window, and adds the estimate it
+    gives to the stratum.
+
+    Windows are placed so that they may hang over either end of the stratum,
+    which gives every key the same chance of falling in one. That chance
+    depends on the window's width, so a window is always listed to its end,
+    however dense it turns out to be; one that takes more than
+    MAX_WINDOW_PAGES pages only makes the windows after it narrower.
+    """
+    space = stratum.space
+    width = stratum.window
+    start = rng.randrange(stratum.low - width, stratum.high)
+    start_after = stratum.start_after
+    if start > stratum.low:
+        start_after = max(start_after, space.key_at(start))
+    search_params = _search_params(my_info.name, space.prefix, start_after, page_size)
+    tally = BucketInfo(my_info.name, my_info.created)
+    pages = _list_range(s3_client, search_params, space, max(start, stratum.low), min(start + width, stratum.high),
+                        tally)
+    coverage = (stratum.width + width) / width
+    stratum.add_window(tally.file_count * coverage, tally.cumulative_size * coverage)
+    seen.merge(tally)
+    stratum.adapt(window_keys)
+    if pages > MAX_WINDOW_PAGES:
+        stratum.window = min(stratum.window, max(1, width // 2))
+
+
+def _discover(my_info, s3_client, exact_pages, page_size, out_of_time):
+    """
+    Lists the top level of the bucket with a delimiter, counting the files
+    found there, to find its prefixes. A top level too big to list within
+    exact_pages pages (or the time budget) leaves everything after where
+    listing stopped as one more piece.
+
+    :return: (prefix, start_after) for each piece of the bucket still to be explored.
+    :rtype: list of tuple(str, str or None)
+    """
+    pieces = []
+    search_params = _search_params(my_info.name, '', None, page_size)
+    search_params.update(dict(Delimiter=DELIMITER))
+    pages = 0
+    for resp in iter_pages(s3_client, **search_params):
+        pages += 1
+        add_page(my_info, resp)
+        pieces.extend((x[PREFIX], None) for x in resp.get(COMMON_PREFIXES, ()))
+        if ((pages >= exact_pages) or out_of_time()) and resp.get(IS_TRUNCATED):
+            keys = [x[KEY] for x in resp.get(CONTENTS, ())] + [x[0] + LAST_CHAR for x in pieces[-1:]]
+            pieces.append(('', max(keys)))
+            break
+    return pieces
+
+
+def explore_bucket_sampled(my_info, s3_client,
+                           error: float = DEFAULT_SAMPLE_ERROR,
+                           seconds: float = DEFAULT_SAMPLE_SECONDS,
+                           exact_pages: int = DEFAULT_EXACT_PAGES,
+                           window_keys: int = DEFAULT_WINDOW_KEYS,
+                           page_size: int = None,
+                           rng=None,
+                           clock=time.monotonic):
+    """
+    A drop in replacement for explore_bucket for buckets too big to list in
+    time, which lists only a sample of the bucket and extrapolates.
+
+    The key space is split up (stratified) by top level prefix. The start of
+    each prefix is listed, so small prefixes are counted exactly; the rest of
+    each bigger one is sampled with randomly placed windows, listed from a
+    StartAfter at the window's start. Each new window goes to whichever
+    prefix contributes most to the uncertainty. Sampling stops once the
+    file count and total size are both known to within the error bound
+    (at 95% confidence), or once the time is up.
+
+    The time budget is checked before every request that is not needed to
+    finish one already under way (a sample window is always listed to its
+    end), so the listing goes on for at most a window past the deadline.
+
+    The bucket's file count and total size are then the estimates, with
+    their confidence intervals in an Estimate; the most recent modification
+    is the latest seen. Without at least two windows in every piece of the
+    bucket (the time ran out first), there is no telling how far off the
+    estimates are, and the Estimate gives no intervals. A bucket small
+    enough to be listed in full is, and gets no Estimate.
+
+    :param my_info: An initiated BucketInfo object not yet containing detailed file info.
+    :type my_info: BucketInfo
+    :param s3_client: The client that will be used to gain access to AWS.
+    :type s3_client: boto3.s3.client
+    :param error: Relative error (half the confidence interval) to stop at, for example 0.02.
+    :type error: float
+    :param seconds: Time budget for the bucket, None for no limit.
+    :type seconds: float or None
+    :param exact_pages: Pages to list from the start of each prefix before sampling it.
+    :type exact_pages: int
+    :param window_keys: Keys wanted in each sample window.
+    :type window_keys: int
+    :param page_size: Keys per listing page (S3's own default if None).
+    :type page_size: int or None
+    :param rng: Random number generator, for tests.
+    :type rng: random.Random or None
+    :param clock: Source of time in seconds, for tests.
+    :type clock: function
+    :return: Returns the BucketInfo data structure now filled in with results
+    :rtype: BucketInfo
+    """
+    started = clock()
+
+    def out_of_time():
+        return (seconds is not None) and (clock() - started >= seconds)
+
+    rng = rng or random.Random()
+    strata = []
+    # Whether every piece of the bucket was piloted, and so is either counted or sampled
+    covered = True
+    for prefix, start_after in _discover(my_info, s3_client, exact_pages, page_size, out_of_time):
+        if out_of_time():
+            covered = False
+            break
+        stratum = _pilot(my_info, s3_client, prefix, start_after, exact_pages, window_keys, page_size, rng,
+                         out_of_time)
+        if stratum is not None:
+            strata.append(stratum)
+    if covered and not strata:
+        return my_info
+
+    # Files listed while sampling (some more than once); only their latest modification counts
+    seen = BucketInfo(my_info.name, my_info.created)
+
+    def totals():
+        estimates = [x.estimate() for x in strata]
+        return (my_info.file_count + sum(x[0] for x in estimates),
+                my_info.cumulative_size + sum(x[1] for x in estimates),
+                sum(x[2] for x in estimates), sum(x[3] for x in estimates))
+
+    while strata and not out_of_time():
+        pending = [x for x in strata if x.windows < MIN_WINDOWS]
+        if pending:
+            stratum = min(pending, key=lambda x: x.windows)
+        else:
+            file_count, cumulative_size, count_variance, size_variance = totals()
+            if ((Z_SCORE * math.sqrt(count_variance) <= error * file_count) and
+                    (Z_SCORE * math.sqrt(size_variance) <= error * cumulative_size)):
+                break
+
+            def uncertainty(x):
+                _, _, x_count_variance, x_size_variance = x.estimate()
+                return x_count_variance / max(file_count, 1) ** 2 + x_size_variance / max(cumulative_size, 1) ** 2
+            stratum = max(strata, key=uncertainty)
+        _sample_window(my_info, s3_client, stratum, rng, window_keys, page_size, seen)
+
+    file_count, cumulative_size, count_variance, size_variance = totals()
+    estimate = Estimate(SAMPLING, samples=sum(x.windows for x in strata))
+    if covered and all(x.windows >= 2 for x in strata):
+        count_margin = Z_SCORE * math.sqrt(count_variance)
+        size_margin = Z_SCORE * math.sqrt(size_variance)
+        # Files counted exactly are the least there can be
+        estimate.confidence = CONFIDENCE
+        estimate.file_count_range = (max(my_info.file_count, round(file_count - count_margin)),
+                                     round(file_count + count_margin))
+        estimate.size_range = (max(my_info.cumulative_size, round(cumulative_size - size_margin)),
+                               round(cumulative_size + size_margin))
+    my_info.add_totals(0, 0, seen.most_recent_mod)
+    my_info.file_count = max(my_info.file_count, round(file_count))
+    my_info.cumulative_size = max(my_info.cumulative_size, round(cumulative_size))
+    my_info.estimate = estimate
+    return my_info
@@ -0,0 +1,147 @@
+import re
+from access import CONTENTS, IS_TRUNCATED, KEY, iter_pages, page_last_key
+from fnmatch import translate
+
+GLOB_CHARACTERS = '*?['
+# Sorts after every other character, so "<prefix><this>" comes after all keys starting with the prefix
+LAST_CHARACTER = '\U0010ffff'
+
+
+def compile_globs(patterns):
+    """
+    :param patterns: Shell style patterns, for example "logs-*". A "*" matches "/" too.
+    :type patterns: list of str
+    :return: A single regular expression matching anything any of the patterns
+    match, or None if there are no patterns.
+    :rtype: re.Pattern or None
+    """
+    if not patterns:
+        return None
+    return re.compile('|'.join(translate(x) for x in patterns))
+
+
+def literal_prefix(pattern: str):
+    """
+    :param pattern: A shell style pattern.
+    :type pattern: str
+    :return: What the pattern's matches start with, if it matches everything that
+    does ("logs/tmp/" for "logs/tmp/*"), otherwise None.
+    :rtype: str or None
+    """
+    if pattern.endswith('*') and not any(x in pattern[:-1] for x in GLOB_CHARACTERS):
+        return pattern[:-1]
+    return None
+
+
+class BucketFilter:
+    """
+    Picks out the buckets to explore by name, before any of them is listed.
+    """
+    def __init__(self, include=None, exclude=None):
+        """
+        :param include: Only buckets matching one of these patterns, if given.
+        :type include: list of str or None
+        :param exclude: No buckets matching any of these patterns.
+        :type exclude: list of str or None
+        """
+        self._include = compile_globs(include)
+        self._exclude = compile_globs(exclude)
+
+    def matches(self, bucket_name: str):
+        """
+        :param bucket_name: A bucket's name.
+        :type bucket_name: str
+        :return: Whether the bucket is to be explored.
+        :rtype: bool
+        """
+        if (self._include is not None) and not self._include.match(bucket_name):
+            return False
+        return (self._exclude is None) or not self._exclude.match(bucket_name)
+
+
+class KeyScope:
+    """
+    Limits the listing of each bucket to some of its keys, doing as much of
+    it as possible on S3's side, so the work done is in proportion to the
+    keys in scope rather than to the whole bucket.
+
+    Each prefix to include is listed on its own, with S3 doing the
+    filtering (the Prefix parameter). Exclusions are applied to each page,
+    patterns that are just a prefix followed by "*" with a single
+    str.startswith, and the rest with one regular expression compiled up
+    front. Listing also skips past excluded prefixes: once a page ends
+    inside one, the listing picks up again after it (the StartAfter
+    parameter), so a big excluded "directory" costs a page, not its size.
+    """
+    def __init__(self, prefixes=None, exclude=None):
+        """
+        :param prefixes: Only keys starting with one of these, if given.
+        :type prefixes: list of str or None
+        :param exclude: No keys matching any of these patterns.
+        :type exclude: list of str or None
+        """
+        # A prefix inside another one is already listed with it
+        self.prefixes = []
+        for prefix in sorted(set(prefixes or ['']), key=lambda x: x.encode('utf-8')):
+            if not any(prefix.startswith(x) for x in self.prefixes):
+                self.prefixes.append(prefix)
+        exclude = exclude or []
+        self._excluded_prefixes = tuple(x for x in map(literal_prefix, exclude) if x is not None)
+        self._exclude = compile_globs([x for x in exclude if literal_prefix(x) is None])
+
+    def iter_pages(self, s3_client, bucket_name: str):
+        """
+        :param s3_client: The client that will be used to gain access to AWS.
+        :type s3_client: boto3.s3.client
+        :param bucket_name: The bucket to list.
+        :type bucket_name: str
+        :return: Yields each list_objects_v2 page of the keys in scope (and of
+        some that are not, which filter_page then leaves out).
+        :rtype: generator of dict
+        """
+        for prefix in self.prefixes:
+            if prefix.startswith(self._excluded_prefixes):
+                continue
+            search_params = dict(Bucket=bucket_name)
+            if prefix:
+                search_params['Prefix'] = prefix
+            while True:
+                start_after = None
+                for resp in iter_pages(s3_client, **search_params):
+                    yield resp
+                    start_after = self._skip_to(page_last_key(resp)) if resp.get(IS_TRUNCATED) else None
+                    if start_after is not None:
+                        break
+                if start_after is None:
+                    break
+                search_params['StartAfter'] = start_after
+
+    def filter_page(self, resp: dict):
+        """
+        :param resp: A list_objects_v2 response page.
+        :type resp: dict
+        :return: The same page, leaving out any keys excluded.
+        :rtype: dict
+        """
+        files = resp.get(CONTENTS)
+        if not files or ((self._exclude is None) and not self._excluded_prefixes):
+            return resp
+        excluded_prefixes, exclude = self._excluded_prefixes, self._exclude
+        kept = [x for x in files if not (x[KEY].startswith(excluded_prefixes) or
+                                         ((exclude is not None) and exclude.match(x[KEY])))]
+        if len(kept) == len(files):
+            return resp
+        return dict(resp, **{CONTENTS: kept})
+
+    def _skip_to(self, last_key):
+        """
+        :return: Key to carry on listing after, if last_key is inside an excluded prefix.
+        :rtype: str or None
+        """
+        if (last_key is None) or not last_key.startswith(self._excluded_prefixes):
+            return None
+        # The shortest excluded prefix it is in skips the furthest
+        prefix = min(x for x in self._excluded_prefixes if last_key.startswith(x))
+        start_after = prefix + LAST_CHARACTER
+        # Only ever forwards, so a listing can never go round in circles
+        return start_after if start_after > last_key else None
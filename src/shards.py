@@ -0,0 +1,192 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from access import iter_pages, add_page, page_last_key
+from throttle import AimdController, ThreadGate, gated_pages
+
+COMMON_PREFIXES = 'CommonPrefixes'
+PREFIX = 'Prefix'
+DELIMITER = '/'
+
+DEFAULT_SHARD_WORKERS = 8
+DEFAULT_MAX_DEPTH = 4
+DEFAULT_SPLIT_AFTER_PAGES = 20
+
+
+class Shard:
+    """
+    One piece of a bucket's key space: every key under 'prefix' that sorts
+    after 'start_after' (or all of them, if start_after is None).
+
+    A shard is either "discovered" (listed one level deep with a delimiter,
+    so that the sub-prefixes below it become shards of their own), or listed
+    flat, in which case it may hand back whatever it did not get to as a
+    new shard to be discovered, should it turn out to hold most of the keys.
+    """
+    def __init__(self, prefix='', start_after=None, depth=0, discover=True):
+        """
+        :param prefix: Only keys starting with this belong to the shard.
+        :type prefix: str
+        :param start_after: Only keys sorting after this belong to the shard.
+        :type start_after: str or None
+        :param depth: How many times the key space was split to arrive here.
+        :type depth: int
+        :param discover: List with a delimiter to find sub-prefixes,
+        rather than listing every key under the prefix.
+        :type discover: bool
+        """
+        self.prefix = prefix
+        self.start_after = start_after
+        self.depth = depth
+        self.discover = discover
+
+    def search_params(self, bucket_name):
+        """
+        :param bucket_name: Bucket the shard belongs to.
+        :type bucket_name: str
+        :return: list_objects_v2 parameters limiting the listing to this shard.
+        :rtype: dict
+        """
+        search_params = dict(Bucket=bucket_name, Prefix=self.prefix)
+        if self.start_after is not None:
+            search_params.update(dict(StartAfter=self.start_after))
+        if self.discover:
+            search_params.update(dict(Delimiter=DELIMITER))
+        return search_params
+
+    def __repr__(self):
+        return 'Shard({!r}, start_after={!r}, depth={}, discover={})'.format(
+            self.prefix, self.start_after, self.depth, self.discover)
+
+
+def next_shards(shard, resp, pages, max_depth=DEFAULT_MAX_DEPTH,
+                split_after_pages=DEFAULT_SPLIT_AFTER_PAGES):
+    """
+    Works out which new shards a page of a shard's listing gives rise to.
+
+    Discovering a shard returns each sub-prefix on the page as a new (flat)
+    shard. Listing a flat shard returns nothing, unless it has run past
+    split_after_pages, in which case the listing should stop, and the rest
+    of its key space (everything after the last key counted) is returned
+    as a shard to be discovered one level deeper, plus the remainder of
+    the sub-prefix it stopped in, if any. Between them, the shards returned
+    over a listing cover exactly the keys it did not count itself.
+
+    :param shard: The shard being listed.
+    :type shard: Shard
+    :param resp: The page just counted.
+    :type resp: dict
+    :param pages: Number of pages listed so far, including this one.
+    :type pages: int
+    :param max_depth: Shards this deep are never split further.
+    :type max_depth: int
+    :param split_after_pages: Pages a flat shard lists before splitting off the rest.
+    :type split_after_pages: int
+    :return: New shards to explore, and whether to stop listing this one.
+    :rtype: tuple(list of Shard, bool)
+    """
+    children = []
+    if shard.discover:
+        for common_prefix in resp.get(COMMON_PREFIXES, []):
+            sub_prefix = common_prefix[PREFIX]
+            # The sub-prefix we were split part way through was
+            # already handed out as a shard of its own.
+            if (shard.start_after is not None) and shard.start_after.startswith(sub_prefix):
+                continue
+            children.append(Shard(sub_prefix, None, shard.depth + 1, discover=False))
+        return children, False
+
+    last_key = page_last_key(resp)
+    if (shard.depth < max_depth) and (pages >= split_after_pages) and (last_key is not None):
+        children.append(Shard(shard.prefix, last_key, shard.depth + 1, discover=True))
+        # If we stopped inside a sub-prefix, finish that one off separately,
+        # as S3 will not (reliably) report a common prefix we are already
+        # part way through.
+        rest = last_key[len(shard.prefix):]
+        if DELIMITER in rest:
+            sub_prefix = shard.prefix + rest[:rest.index(DELIMITER) + 1]
+            children.append(Shard(sub_prefix, last_key, shard.depth + 1, discover=False))
+        return children, True
+    return children, False
+
+
+def explore_shard(my_info, s3_client, shard, max_depth=DEFAULT_MAX_DEPTH,
+                  split_after_pages=DEFAULT_SPLIT_AFTER_PAGES, gate=None):
+    """
+    Lists a single shard, tallying its files into a fresh BucketInfo,
+    and collecting any new shards it gives rise to (see next_shards).
+
+    :param my_info: BucketInfo of the bucket being explored (only used for its name, and
+    to start the shard's totals off gathering the same details).
+    :type my_info: BucketInfo
+    :param s3_client: The client that will be used to gain access to AWS.
+    :type s3_client: boto3.s3.client
+    :param shard: The piece of key space to list.
+    :type shard: Shard
+    :param max_depth: Shards this deep are never split further.
+    :type max_depth: int
+    :param split_after_pages: Pages a flat shard lists before splitting off the rest.
+    :type split_after_pages: int
+    :param gate: If given, each page is fetched through it (see gated_pages).
+    :type gate: ThreadGate or None
+    :return: Partial totals for the shard, and any shards still to be explored.
+    :rtype: tuple(BucketInfo, list of Shard)
+    """
+    partial = my_info.empty_copy()
+    children = []
+
+    pages = 0
+    listing = iter_pages(s3_client, **shard.search_params(my_info.name))
+    if gate is not None:
+        listing = gated_pages(listing, gate)
+    for resp in listing:
+        add_page(partial, resp)
+        pages += 1
+        new_shards, stop = next_shards(shard, resp, pages, max_depth, split_after_pages)
+        children.extend(new_shards)
+        if stop:
+            break
+    return partial, children
+
+
+def explore_bucket_sharded(my_info, s3_client, workers=DEFAULT_SHARD_WORKERS,
+                           max_depth=DEFAULT_MAX_DEPTH,
+                           split_after_pages=DEFAULT_SPLIT_AFTER_PAGES):
+    """
+    A drop in replacement for explore_bucket, which splits the bucket's
+    key space by prefix and lists the pieces in parallel. Prefixes turning
+    out to hold a lot of keys are split further as the scan goes, so one
+    busy prefix does not leave the remaining workers idle. Partial totals
+    are merged as each shard finishes, giving exactly the serial result.
+    How many pages are fetched at once follows an AimdController, which
+    backs off when the bucket starts throttling and is left on the
+    BucketInfo for the report.
+
+    Note that splitting relies on keys being organized with '/' delimiters;
+    a bucket of flat keys is listed one page at a time, as it would be serially.
+
+    :param my_info: An initiated BucketInfo object not yet containing detailed file info.
+    :type my_info: BucketInfo
+    :param s3_client: The client that will be used to gain access to AWS.
+    :type s3_client: boto3.s3.client
+    :param workers: How many shards to list at the same time.
+    :type workers: int
+    :param max_depth: How many prefix levels deep to split the key space.
+    :type max_depth: int
+    :param split_after_pages: Pages a shard lists before the rest of it is split up.
+    :type split_after_pages: int
+    :return: Returns the BucketInfo data structure now filled in with results
+    :rtype: BucketInfo
+    """
+    my_info.throttle = AimdController(max_limit=workers)
+    gate = ThreadGate(my_info.throttle)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(explore_shard, my_info, s3_client, Shard(),
+                                   max_depth, split_after_pages, gate)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                partial, children = future.result()
+                my_info.merge(partial)
+                for shard in children:
+                    pending.add(executor.submit(explore_shard, my_info, s3_client, shard,
+                                                max_depth, split_after_pages, gate))
+    return my_info
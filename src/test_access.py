@@ -1,7 +1,9 @@
 import os
 import tempfile
-from access import explore_bucket
+from access import AccessHandler, add_page, explore_bucket, explore_buckets
+from datetime import datetime
 from moto import mock_s3
+from results import BucketInfo
 
 
 @mock_s3
@@ -37,6 +39,59 @@ def test_explore_bucket(mock_bucket_info, s3_client, bucket_name):
     assert test_info.cumulative_size == 6*1024
 
 
+@mock_s3
+def test_explore_buckets_concurrently(s3_client, created_date):
+    """
+    Several buckets explored through a thread pool should come back
+    with the same totals as exploring them one at a time, and in name
+    order when sorted output is requested.
+
+    :param s3_client: boto3 s3 client object to use in test.
+    :param created_date: Any creation date for the BucketInfo objects.
+    """
+    names = ['bucket-c', 'bucket-a', 'bucket-b']
+    for n, name in enumerate(names, start=1):
+        s3_client.create_bucket(Bucket=name)
+        for i in range(n):
+            s3_client.put_object(Bucket=name, Key='file_{}'.format(i), Body=b'x' * 100)
+
+    results = list(explore_buckets(
+        [BucketInfo(name, created_date) for name in names],
+        s3_client, workers=3, sorted_output=True
+    ))
+    assert [x.name for x in results] == sorted(names)
+    assert [x.file_count for x in results] == [2, 3, 1]
+    assert [x.cumulative_size for x in results] == [200, 300, 100]
+
+    unordered = list(explore_buckets(
+        [BucketInfo(name, created_date) for name in names],
+        s3_client, workers=3
+    ))
+    assert sorted(x.name for x in unordered) == sorted(names)
+    assert sum(x.file_count for x in unordered) == 6
+
+
+def test_add_page(mock_bucket_info):
+    """
+    A whole page folds into the same totals as adding its files one at a time,
+    skipping directory placeholders.
+
+    :param mock_bucket_info: BucketInfo object before Bucket exploration.
+    """
+    contents = [
+        dict(Key='dir/', Size=0, LastModified=datetime(2021, 1, 1)),
+        dict(Key='dir/a', Size=10, LastModified=datetime(2020, 1, 1)),
+        dict(Key='dir/b', Size=20, LastModified=datetime(2020, 6, 1)),
+        dict(Key='c', Size=30, LastModified=datetime(2020, 3, 1)),
+    ]
+    add_page(mock_bucket_info, dict(Contents=contents))
+    add_page(mock_bucket_info, dict(Contents=[contents[0]]))
+    add_page(mock_bucket_info, dict())
+    assert mock_bucket_info.file_count == 3
+    assert mock_bucket_info.cumulative_size == 60
+    assert mock_bucket_info.most_recent_mod == datetime(2020, 6, 1)
+
+
 def test_asset_handler_types(access_handler):
     """
     Basic test that asset_handler is passing
@@ -56,6 +111,33 @@ def test_asset_handler_types(access_handler):
     )) == "<class 'boto3.resources.factory.s3.ServiceResource'>"
 
 
+@mock_s3
+def test_asset_handler_list_buckets(access_handler):
+    """
+    Buckets are enumerated through the plain client, without building a resource.
+
+    :param access_handler: AccessHandler object to be tested.
+    """
+    access_handler.s3_client.create_bucket(Bucket='bucket-b')
+    access_handler.s3_client.create_bucket(Bucket='bucket-a')
+    buckets = access_handler.list_buckets()
+    assert sorted(x['Name'] for x in buckets) == ['bucket-a', 'bucket-b']
+    assert access_handler._s3_resource is None
+
+
+def test_asset_handler_pool_size(profile_name, example_creds_path):
+    """
+    The connection pool should grow to cover however many workers will share the client.
+
+    :param profile_name: Specific set of credentials to be extracted.
+    :param example_creds_path: Path for cred file to be tested.
+    """
+    handler = AccessHandler(profile_name=profile_name,
+                            cred_path=example_creds_path,
+                            max_pool_connections=32)
+    assert handler.s3_client.meta.config.max_pool_connections == 32
+
+
 def test_asset_handler_creds(
         access_handler,
         mock_s3_credentials,
@@ -74,3 +156,7 @@ def test_asset_handler_creds(
     assert access_handler._fetch_creds(
         profile_name, example_creds_path
     ) == mock_s3_credentials
+
+
+def test_list_profiles(example_creds_path):
+    assert AccessHandler.list_profiles(cred_path=example_creds_path) == ['default']
@@ -0,0 +1,151 @@
+import pytest
+import socket
+from botocore.credentials import Credentials
+from botocore.exceptions import ClientError, ConnectionClosedError
+from access import explore_bucket
+from asyncscan import AsyncScanner, AsyncScanError, explore_buckets_async
+from metrics import ScanMetrics
+from results import BucketInfo
+
+
+def _scanner(moto_server_url, mock_s3_credentials, **kwargs):
+    credentials = Credentials(mock_s3_credentials['aws_access_key_id'],
+                              mock_s3_credentials['aws_secret_access_key'])
+    return AsyncScanner(credentials, 'us-east-1', moto_server_url, **kwargs)
+
+
+@pytest.fixture
+def filled_buckets(server_s3_client):
+    """
+    A handful of buckets on the moto server, one of them big enough to be split up.
+    """
+    names = ['async-{}'.format(n) for n in range(5)]
+    for n, name in enumerate(names):
+        server_s3_client.create_bucket(Bucket=name)
+        for i in range(3 * n):
+            server_s3_client.put_object(Bucket=name, Key='d{}/f {}&'.format(i % 2, i), Body=b'x' * i)
+    server_s3_client.put_object(Bucket=names[0], Key='dir/', Body=b'')
+    yield names
+    for name in names:
+        for obj in server_s3_client.list_objects_v2(Bucket=name).get('Contents', []):
+            server_s3_client.delete_object(Bucket=name, Key=obj['Key'])
+        server_s3_client.delete_bucket(Bucket=name)
+
+
+@pytest.mark.parametrize("max_in_flight, per_bucket_in_flight", ((1, 1), (16, 2)))
+def test_async_matches_serial(filled_buckets, server_s3_client, moto_server_url,
+                              mock_s3_credentials, created_date,
+                              max_in_flight, per_bucket_in_flight):
+    """
+    The async engine should give exactly the same totals as explore_bucket,
+    however tight the in flight limits (small pages make sure shards get split).
+    """
+    expected = {name: explore_bucket(BucketInfo(name, created_date), server_s3_client)
+                for name in filled_buckets}
+    scanner = _scanner(moto_server_url, mock_s3_credentials,
+                       max_in_flight=max_in_flight,
+                       per_bucket_in_flight=per_bucket_in_flight,
+                       split_after_pages=1,
+                       page_size=2)
+    results = list(explore_buckets_async([BucketInfo(name, created_date) for name in filled_buckets],
+                                         scanner, sorted_output=True))
+    assert [x.name for x in results] == filled_buckets
+    for result in results:
+        assert result.file_count == expected[result.name].file_count
+        assert result.cumulative_size == expected[result.name].cumulative_size
+        assert result.most_recent_mod == expected[result.name].most_recent_mod
+
+
+class ThrottledScanner(AsyncScanner):
+    """
+    Turns away every third request with a SlowDown, as S3 does when pushed too hard.
+    """
+    requests = 0
+
+    async def _send(self, search_params):
+        self.requests += 1
+        if self.requests % 3 == 0:
+            raise ClientError(dict(Error=dict(Code='SlowDown'), ResponseMetadata=dict(HTTPStatusCode=503)),
+                              'ListObjectsV2')
+        return await super()._send(search_params)
+
+
+def test_async_throttled(filled_buckets, server_s3_client, moto_server_url,
+                         mock_s3_credentials, created_date):
+    """
+    Throttled requests are retried, so totals still come out right,
+    and each bucket's controller reports what it went through.
+    """
+    credentials = Credentials(mock_s3_credentials['aws_access_key_id'],
+                              mock_s3_credentials['aws_secret_access_key'])
+    scanner = ThrottledScanner(credentials, 'us-east-1', moto_server_url,
+                               split_after_pages=1, page_size=2, max_retries=10,
+                               metrics=ScanMetrics())
+    name = filled_buckets[-1]
+    expected = explore_bucket(BucketInfo(name, created_date), server_s3_client)
+    result, = explore_buckets_async([BucketInfo(name, created_date)], scanner)
+    assert result.file_count == expected.file_count
+    assert result.cumulative_size == expected.cumulative_size
+    assert result.throttle.throttled > 0
+    assert scanner._metrics.summary()['by_bucket'][name]['retries'] == result.throttle.throttled
+    assert result.throttle.requests == scanner.requests
+    assert 1 <= result.throttle.limit <= result.throttle.max_limit
+
+
+class DroppingScanner(AsyncScanner):
+    """
+    Has its first request's connection dropped, as with a stale keep-alive connection.
+    """
+    requests = 0
+
+    async def _send(self, search_params):
+        self.requests += 1
+        if self.requests == 1:
+            raise ConnectionClosedError(endpoint_url='http://example.com')
+        return await super()._send(search_params)
+
+
+def test_async_dropped_connection(filled_buckets, server_s3_client, moto_server_url,
+                                  mock_s3_credentials, created_date):
+    """
+    A dropped connection is retried, but is no reason to slow the bucket down.
+    """
+    credentials = Credentials(mock_s3_credentials['aws_access_key_id'],
+                              mock_s3_credentials['aws_secret_access_key'])
+    scanner = DroppingScanner(credentials, 'us-east-1', moto_server_url, metrics=ScanMetrics())
+    name = filled_buckets[-1]
+    result, = explore_buckets_async([BucketInfo(name, created_date)], scanner)
+    assert result.file_count == explore_bucket(BucketInfo(name, created_date), server_s3_client).file_count
+    assert result.throttle.throttled == 0
+    assert scanner._metrics.summary()['retries'] == 1
+
+
+def test_async_missing_bucket(moto_server_url, mock_s3_credentials, created_date):
+    """
+    Errors S3 will not get over are raised back in the calling thread.
+    """
+    scanner = _scanner(moto_server_url, mock_s3_credentials)
+    with pytest.raises(AsyncScanError) as error_info:
+        list(explore_buckets_async([BucketInfo('no-such-bucket', created_date)], scanner))
+    assert error_info.value.code == 'NoSuchBucket'
+    assert error_info.value.status == 404
+
+
+def test_async_stalled_connection(mock_s3_credentials, created_date):
+    """
+    A server that takes connections but never answers is given up on after
+    the read timeout, and retried like a dropped connection, rather than
+    holding up the scan for good.
+    """
+    with socket.socket() as server:
+        # Connections are queued by the OS, but nothing ever reads from them
+        server.bind(('127.0.0.1', 0))
+        server.listen(8)
+        metrics = ScanMetrics()
+        scanner = _scanner('http://127.0.0.1:{}'.format(server.getsockname()[1]), mock_s3_credentials,
+                           read_timeout=0.1, max_retries=2, metrics=metrics)
+        with pytest.raises(AsyncScanError) as error_info:
+            list(explore_buckets_async([BucketInfo('stalled', created_date)], scanner))
+    assert error_info.value.status is None
+    summary = metrics.summary()
+    assert (summary['errors'], summary['retries']) == (1, 2)
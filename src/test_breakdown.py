@@ -0,0 +1,127 @@
+import json
+import pytest
+from moto import mock_s3
+from access import explore_bucket
+from breakdown import Breakdown, OTHER
+from results import BucketInfo
+from shards import explore_bucket_sharded
+from writers import JsonLinesResultWriter
+
+
+def _fill_bucket(s3_client, bucket_name):
+    s3_client.create_bucket(Bucket=bucket_name)
+    keys = ['top_{}.txt'.format(n) for n in range(3)]
+    keys += ['hot/sub_{}/file_{}'.format(n % 4, n) for n in range(60)]
+    keys += ['hot/loose_{}'.format(n) for n in range(5)]
+    keys += ['cold_{}/file'.format(n) for n in range(3)]
+    keys += ['empty_dir/']
+    for n, key in enumerate(keys):
+        s3_client.put_object(Bucket=bucket_name, Key=key, Body=b'x' * (n + 1))
+
+
+def test_add_file():
+    """
+    Files should be counted per prefix (down to the breakdown's depth),
+    per storage class, and per size range.
+    """
+    breakdown = Breakdown(depth=2)
+    breakdown.add_file('logs/2020/a.gz', 100, 'STANDARD')
+    breakdown.add_file('logs/2020/deeper/b.gz', 28, 'GLACIER')
+    breakdown.add_file('logs/c.gz', 0, None)
+    breakdown.add_file('top.txt', 1)
+
+    assert breakdown.prefixes == {'logs/': [3, 128], 'logs/2020/': [2, 128]}
+    assert breakdown.storage_classes == dict(STANDARD=[3, 101], GLACIER=[1, 28])
+    # Ranges by bit length: 0, 1, 16 to 31, 64 to 127
+    assert breakdown.sizes == {0: [1, 0], 1: [1, 1], 5: [1, 28], 7: [1, 100]}
+
+
+def test_prefix_cap():
+    """
+    Once max_prefixes are tracked, files under new top level prefixes
+    should go into OTHER, and deeper ones count only towards their parent.
+    """
+    breakdown = Breakdown(depth=2, max_prefixes=3)
+    for key in ('a/1/x', 'a/2/x', 'b/1/x', 'a/3/x', 'a/1/y'):
+        breakdown.add_file(key, 10)
+    # 'b/' and 'a/3/' did not fit: 'b/' went to OTHER, 'a/3/' only counts towards 'a/'
+    assert breakdown.prefixes == {'a/': [4, 40], 'a/1/': [2, 20], 'a/2/': [1, 10], OTHER: [1, 10]}
+    assert breakdown.top_prefixes(1) == [('a/', 4, 40), (OTHER, 1, 10)]
+    assert breakdown.top_prefixes(0) == [(OTHER, 5, 50)]
+
+
+@pytest.mark.parametrize("max_prefixes", (1000, 3))
+def test_merge(max_prefixes):
+    """
+    Merging breakdowns of parts of a bucket should match the breakdown of
+    the whole, without going over the cap on prefixes.
+    """
+    keys = ['{}/{}/file_{}'.format('abc'[n % 3], n % 5, n) for n in range(60)]
+    whole = Breakdown(max_prefixes=max_prefixes)
+    halves = [Breakdown(max_prefixes=max_prefixes) for _ in range(2)]
+    for n, key in enumerate(keys):
+        whole.add_file(key, n)
+        halves[n % 2].add_file(key, n)
+    merged = halves[0].empty_copy()
+    for half in halves:
+        merged.merge(half)
+
+    assert merged.storage_classes == whole.storage_classes
+    assert merged.sizes == whole.sizes
+    assert len(merged.prefixes) <= max_prefixes + 1
+    # Every file is still counted once at the top level
+    top_level = [y for x, y in merged.prefixes.items() if x.count('/') < 2]
+    assert sum(x[0] for x in top_level) == len(keys)
+    if max_prefixes == 1000:
+        assert merged.prefixes == whole.prefixes
+
+
+@mock_s3
+@pytest.mark.parametrize("shard_workers", (1, 4))
+def test_explore_with_breakdown(s3_client, bucket_name, created_date, shard_workers):
+    """
+    A breakdown gathered while exploring, serially or sharded, should
+    agree with the bucket's totals.
+    """
+    _fill_bucket(s3_client, bucket_name)
+    my_info = BucketInfo(bucket_name, created_date)
+    my_info.breakdown = Breakdown()
+    if shard_workers == 1:
+        explore_bucket(my_info, s3_client)
+    else:
+        explore_bucket_sharded(my_info, s3_client, workers=shard_workers, split_after_pages=1)
+
+    breakdown = my_info.breakdown
+    assert breakdown.storage_classes['STANDARD'] == [71, my_info.cumulative_size]
+    assert sum(x[0] for x in breakdown.sizes.values()) == 71
+    assert breakdown.prefixes['hot/'][0] == 65
+    assert breakdown.prefixes['hot/sub_0/'][0] == 15
+    # The placeholder is not a file
+    assert 'empty_dir/' not in breakdown.prefixes
+
+
+def test_breakdown_display(result_handler, mock_bucket_info):
+    """
+    The console should show the breakdown by prefix, storage class and size.
+    """
+    mock_bucket_info.breakdown = Breakdown()
+    mock_bucket_info.breakdown.add_file('logs/a', 3 * 1024 ** 2, 'STANDARD_IA')
+    mock_bucket_info.breakdown.add_file('img/b', 1024 ** 2)
+    display = result_handler._console_display(mock_bucket_info)
+    assert '\n By prefix:\n  logs/: 1 files, 3.0 MB\n  img/: 1 files, 1.0 MB' in display
+    assert '\n By storage class:\n  STANDARD: 1 files, 1.0 MB\n  STANDARD_IA: 1 files, 3.0 MB' in display
+    assert '\n  1 MB to 2 MB: 1 files, 1.0 MB\n  2 MB to 4 MB: 1 files, 3.0 MB' in display
+
+
+def test_breakdown_jsonl(mock_bucket_info, tmp_path):
+    """
+    JSON Lines records should carry the breakdown in full.
+    """
+    mock_bucket_info.breakdown = Breakdown()
+    mock_bucket_info.breakdown.add_file('logs/a', 1000)
+    writer = JsonLinesResultWriter(str(tmp_path / 'results.jsonl'))
+    record = json.loads(writer.format_record(mock_bucket_info))
+    writer.close()
+    assert record['breakdown'] == dict(prefixes={'logs/': [1, 1000]},
+                                       storage_classes=dict(STANDARD=[1, 1000]),
+                                       sizes={'512': [1, 1000]})
@@ -0,0 +1,131 @@
+import pytest
+from moto import mock_s3
+from access import explore_bucket
+from checkpoint import BucketCheckpoint, Checkpointer
+from results import BucketInfo
+
+
+class FailingClient:
+    """
+    Wraps an s3 client, raising after a set number of listing calls,
+    like credentials expiring part way through a bucket.
+    """
+    def __init__(self, s3_client, fail_after):
+        self._s3_client = s3_client
+        self._fail_after = fail_after
+        self.calls = 0
+
+    def list_objects_v2(self, **kwargs):
+        if self.calls == self._fail_after:
+            raise RuntimeError('Credentials expired')
+        self.calls += 1
+        return self._s3_client.list_objects_v2(MaxKeys=5, **kwargs)
+
+
+def _fill_bucket(s3_client, bucket_name, n_files=23):
+    s3_client.create_bucket(Bucket=bucket_name)
+    for n in range(n_files):
+        s3_client.put_object(Bucket=bucket_name, Key='file_{:02d}'.format(n), Body=b'x' * n)
+
+
+@mock_s3
+def test_resume_after_failure(s3_client, bucket_name, created_date, profile_name, tmp_path):
+    """
+    A scan dying part way through should pick back up from the last
+    page it finished, and end up with exactly the uninterrupted totals.
+    """
+    _fill_bucket(s3_client, bucket_name)
+    expected = explore_bucket(BucketInfo(bucket_name, created_date), s3_client)
+
+    # An interval of 0 checkpoints every page
+    checkpointer = Checkpointer(profile_name, interval=0, location=str(tmp_path))
+    with pytest.raises(RuntimeError):
+        explore_bucket(BucketInfo(bucket_name, created_date),
+                       FailingClient(s3_client, fail_after=3), checkpointer)
+
+    resumed_client = FailingClient(s3_client, fail_after=-1)
+    checkpointer = Checkpointer(profile_name, resume=True, interval=0, location=str(tmp_path))
+    resumed = explore_bucket(BucketInfo(bucket_name, created_date), resumed_client, checkpointer)
+    assert resumed_client.calls == 2
+    assert resumed.file_count == expected.file_count == 23
+    assert resumed.cumulative_size == expected.cumulative_size
+    assert resumed.most_recent_mod == expected.most_recent_mod
+
+    # Now the bucket is done, resuming again should not list it at all
+    resumed_client = FailingClient(s3_client, fail_after=0)
+    checkpointer = Checkpointer(profile_name, resume=True, interval=0, location=str(tmp_path))
+    resumed = explore_bucket(BucketInfo(bucket_name, created_date), resumed_client, checkpointer)
+    assert resumed.file_count == 23
+
+    # Without resume, we start from scratch
+    fresh_client = FailingClient(s3_client, fail_after=-1)
+    checkpointer = Checkpointer(profile_name, interval=0, location=str(tmp_path))
+    fresh = explore_bucket(BucketInfo(bucket_name, created_date), fresh_client, checkpointer)
+    assert fresh_client.calls == 5
+    assert fresh.file_count == 23
+
+
+@mock_s3
+def test_interrupt_saves_progress(s3_client, bucket_name, created_date, profile_name, tmp_path):
+    """
+    Even when the interval has not come round yet, an interrupted scan
+    saves the progress it has made.
+    """
+    _fill_bucket(s3_client, bucket_name)
+    checkpointer = Checkpointer(profile_name, interval=3600, location=str(tmp_path))
+    with pytest.raises(RuntimeError):
+        explore_bucket(BucketInfo(bucket_name, created_date),
+                       FailingClient(s3_client, fail_after=2), checkpointer)
+
+    partial = BucketInfo(bucket_name, created_date)
+    checkpoint = Checkpointer(profile_name, resume=True, location=str(tmp_path)).start(partial)
+    assert not checkpoint.complete
+    assert checkpoint.cont_token is not None
+    assert partial.file_count == 10
+
+
+@mock_s3
+def test_failed_save_keeps_original_error(s3_client, bucket_name, created_date, profile_name, tmp_path,
+                                          monkeypatch, caplog):
+    """
+    If the checkpoint cannot be saved when a scan dies, that should be
+    logged, and the error that stopped the scan raised rather than hidden.
+    """
+    _fill_bucket(s3_client, bucket_name)
+
+    def disk_full(self):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(BucketCheckpoint, 'save', disk_full)
+    checkpointer = Checkpointer(profile_name, interval=3600, location=str(tmp_path))
+    with pytest.raises(RuntimeError, match='Credentials expired'):
+        explore_bucket(BucketInfo(bucket_name, created_date),
+                       FailingClient(s3_client, fail_after=2), checkpointer)
+    assert 'Saving the checkpoint of {} failed'.format(bucket_name) in caplog.text
+    assert 'No space left on device' in caplog.text
+
+
+@mock_s3
+def test_fresh_run_keeps_interrupted_progress(s3_client, bucket_name, created_date, profile_name, tmp_path,
+                                              caplog):
+    """
+    A run without resume should warn about interrupted buckets, and leave the
+    progress of any it does not list again in place for a later --resume.
+    """
+    _fill_bucket(s3_client, bucket_name)
+    checkpointer = Checkpointer(profile_name, interval=0, location=str(tmp_path))
+    with pytest.raises(RuntimeError):
+        explore_bucket(BucketInfo(bucket_name, created_date),
+                       FailingClient(s3_client, fail_after=2), checkpointer)
+
+    s3_client.create_bucket(Bucket='other')
+    checkpointer = Checkpointer(profile_name, interval=0, location=str(tmp_path))
+    assert bucket_name in caplog.text
+    explore_bucket(BucketInfo('other', created_date), s3_client, checkpointer)
+    checkpointer.clear()
+    assert checkpointer.interrupted() == [bucket_name]
+
+    resumed_client = FailingClient(s3_client, fail_after=-1)
+    resumed = explore_bucket(BucketInfo(bucket_name, created_date), resumed_client,
+                             Checkpointer(profile_name, resume=True, interval=0, location=str(tmp_path)))
+    assert (resumed_client.calls, resumed.file_count) == (3, 23)
@@ -0,0 +1,103 @@
+import json
+from datetime import datetime, timedelta, timezone
+from estimate import Estimate, estimate_buckets, estimate_buckets_by_region, NAMESPACE, SIZE_METRIC, COUNT_METRIC
+from results import BucketInfo
+from writers import JsonLinesResultWriter
+
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def put_bucket_metrics(cloudwatch_client, bucket_name, sizes, count, when=NOW - timedelta(days=1)):
+    data = [dict(MetricName=SIZE_METRIC, Value=size, Unit='Bytes', Timestamp=when,
+                 Dimensions=[dict(Name='BucketName', Value=bucket_name),
+                             dict(Name='StorageType', Value=storage_type)])
+            for storage_type, size in sizes.items()]
+    if count is not None:
+        data.append(dict(MetricName=COUNT_METRIC, Value=count, Unit='Count', Timestamp=when,
+                         Dimensions=[dict(Name='BucketName', Value=bucket_name),
+                                     dict(Name='StorageType', Value='AllStorageTypes')]))
+    cloudwatch_client.put_metric_data(Namespace=NAMESPACE, MetricData=data)
+
+
+def test_estimate_buckets(cloudwatch_client, created_date):
+    """
+    Buckets with both a size and an object count in CloudWatch should be
+    filled in from them, and the rest handed back to be explored.
+    """
+    put_bucket_metrics(cloudwatch_client, 'estimated',
+                       dict(StandardStorage=1000, StandardIAStorage=24), count=12)
+    put_bucket_metrics(cloudwatch_client, 'no-count', dict(StandardStorage=5), count=None)
+    bucket_infos = [BucketInfo(name, created_date) for name in ('estimated', 'no-count', 'unknown')]
+
+    remaining = estimate_buckets(bucket_infos, cloudwatch_client, now=NOW)
+
+    estimated = bucket_infos[0]
+    assert (estimated.file_count, estimated.cumulative_size) == (12, 1024)
+    assert estimated.most_recent_mod is None
+    assert estimated.estimate.method == 'cloudwatch'
+    assert estimated.estimate.as_of is not None
+    # Buckets without metrics are left to be explored
+    assert [x.name for x in remaining] == ['no-count', 'unknown']
+    assert all((x.estimate is None) and (x.file_count == 0) for x in remaining)
+
+
+def test_estimate_buckets_takes_latest_value(cloudwatch_client, created_date):
+    """
+    Of several days' metrics, the most recent should be the one used.
+    """
+    put_bucket_metrics(cloudwatch_client, 'growing', dict(StandardStorage=10), count=1,
+                       when=NOW - timedelta(days=2))
+    put_bucket_metrics(cloudwatch_client, 'growing', dict(StandardStorage=20), count=2,
+                       when=NOW - timedelta(hours=1))
+    bucket_info = BucketInfo('growing', created_date)
+
+    assert estimate_buckets([bucket_info], cloudwatch_client, now=NOW) == []
+    assert (bucket_info.file_count, bucket_info.cumulative_size) == (2, 20)
+
+
+def test_estimate_buckets_by_region(cloudwatch_client, mock_s3_credentials, created_date):
+    """
+    Each bucket's metrics should be looked for in its own region, where S3 publishes them.
+    """
+    import boto3
+    import botocore.session
+    session = boto3.Session(botocore_session=botocore.session.Session(), **mock_s3_credentials)
+    clients = {None: cloudwatch_client, 'eu-west-1': session.client('cloudwatch', region_name='eu-west-1')}
+    put_bucket_metrics(cloudwatch_client, 'home', dict(StandardStorage=10), count=1)
+    put_bucket_metrics(clients['eu-west-1'], 'abroad', dict(StandardStorage=20), count=2)
+    # Only in the wrong region, so not to be found
+    put_bucket_metrics(cloudwatch_client, 'misplaced', dict(StandardStorage=30), count=3)
+    regions = dict(abroad='eu-west-1', misplaced='eu-west-1')
+    bucket_infos = [BucketInfo(name, created_date) for name in ('misplaced', 'home', 'abroad', 'unknown')]
+
+    remaining = estimate_buckets_by_region(bucket_infos, regions.get, clients.get, now=NOW)
+    assert [x.name for x in remaining] == ['misplaced', 'unknown']
+    assert [(x.file_count, x.cumulative_size) for x in bucket_infos[1:3]] == [(1, 10), (2, 20)]
+
+
+def test_estimate_display(result_handler, mock_bucket_info):
+    """
+    The console should say how each kind of estimate was made, and how
+    sure it is, when sampled.
+    """
+    mock_bucket_info.estimate = Estimate('cloudwatch', as_of=datetime(2020, 9, 30))
+    assert 'Estimated from CloudWatch storage metrics as of 2020_09_30' in \
+        result_handler._console_display(mock_bucket_info)
+
+    mock_bucket_info.estimate = Estimate('sampling', confidence=0.95, samples=40,
+                                         file_count_range=(90, 110), size_range=(1024 ** 2, 2 * 1024 ** 2))
+    display = result_handler._console_display(mock_bucket_info)
+    assert 'Estimated by sampling from 40 samples' in display
+    assert '95% confidence: 90 to 110 files, 1.0 MB to 2.0 MB' in display
+
+
+def test_estimate_jsonl(mock_bucket_info, tmp_path):
+    """
+    JSON Lines records should carry the estimate in full.
+    """
+    mock_bucket_info.estimate = Estimate('cloudwatch', as_of=datetime(2020, 9, 30))
+    writer = JsonLinesResultWriter(str(tmp_path / 'results.jsonl'))
+    record = json.loads(writer.format_record(mock_bucket_info))
+    writer.close()
+    assert record['estimate'] == dict(method='cloudwatch', as_of='2020-09-30T00:00:00', confidence=None,
+                                      file_count_range=None, size_range=None, samples=None)
@@ -0,0 +1,33 @@
+import pytest
+from datetime import datetime
+from fanout import ProfileScanError, explore_profiles
+from results import BucketInfo
+
+
+def _scan(profile_name, report):
+    """
+    Stands in for s3explore.scan_profile, in the worker processes.
+    """
+    if profile_name == 'broken':
+        raise ValueError('Profile "broken" is not found.')
+    for n in range(3):
+        my_info = BucketInfo('{}-bucket-{}'.format(profile_name, n), datetime(2020, 9, 25))
+        my_info.add_totals(n, n * 10, None)
+        report(my_info)
+
+
+def test_explore_profiles():
+    found = list(explore_profiles(['one', 'two', 'three'], _scan, workers=2))
+    assert sorted((x, y.name, y.file_count) for x, y in found) == sorted(
+        (x, '{}-bucket-{}'.format(x, n), n) for x in ('one', 'two', 'three') for n in range(3))
+
+
+def test_failed_profile():
+    found = []
+    with pytest.raises(ProfileScanError) as error_info:
+        for profile_name, my_info in explore_profiles(['one', 'broken', 'two'], _scan, workers=2):
+            found.append(profile_name)
+    # The other profiles are explored in full regardless
+    assert sorted(found) == ['one'] * 3 + ['two'] * 3
+    assert list(error_info.value.failures) == ['broken']
+    assert isinstance(error_info.value.failures['broken'], ValueError)
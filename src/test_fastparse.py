@@ -0,0 +1,92 @@
+import pytest
+from moto import mock_s3
+from access import explore_bucket, iter_pages
+from fastparse import enable_fast_parse, parse_list_objects, FAST_PAGE
+from results import BucketInfo
+from shards import explore_bucket_sharded
+
+# Awkward keys: escaping, url encoding, unicode and "directories"
+KEYS = ['a b/1&2+3.txt', 'dir/', 'dir/file', 'ünï/x', 'q"uote\'s<>', 'plain', 'deep/er/still/']
+
+
+def _fill_bucket(s3_client, bucket_name):
+    s3_client.create_bucket(Bucket=bucket_name)
+    for n, key in enumerate(KEYS * 3):
+        s3_client.put_object(Bucket=bucket_name, Key='{}{}'.format(key, n // len(KEYS) or ''),
+                             Body=b'x' * (n * 7))
+
+
+def _small_pages(params, **kwargs):
+    params['MaxKeys'] = 4
+
+
+@mock_s3
+def test_fast_parse_matches_boto(s3_client, bucket_name, created_date):
+    """
+    Fast parsed totals (and paging) should be identical to botocore's.
+    """
+    _fill_bucket(s3_client, bucket_name)
+    s3_client.meta.events.register('provide-client-params.s3.ListObjectsV2', _small_pages)
+    expected = explore_bucket(BucketInfo(bucket_name, created_date), s3_client)
+    boto_last_keys = [resp['Contents'][-1]['Key'] for resp in iter_pages(s3_client, Bucket=bucket_name)]
+
+    enable_fast_parse(s3_client)
+    fast = explore_bucket(BucketInfo(bucket_name, created_date), s3_client)
+    assert fast.file_count == expected.file_count
+    assert fast.cumulative_size == expected.cumulative_size
+    assert fast.most_recent_mod == expected.most_recent_mod
+    assert fast.most_recent_mod.tzinfo is not None
+
+    pages = list(iter_pages(s3_client, Bucket=bucket_name))
+    assert all(FAST_PAGE in resp and 'Contents' not in resp for resp in pages)
+    assert [resp[FAST_PAGE].last_key for resp in pages] == boto_last_keys
+
+
+@mock_s3
+def test_fast_parse_sharded(s3_client, bucket_name, created_date):
+    """
+    Common prefixes come through decoded, so sharding works the same with fast parsing.
+    """
+    _fill_bucket(s3_client, bucket_name)
+    expected = explore_bucket(BucketInfo(bucket_name, created_date), s3_client)
+
+    enable_fast_parse(s3_client)
+    resp = s3_client.list_objects_v2(Bucket=bucket_name, Delimiter='/')
+    assert 'a b/' in [x['Prefix'] for x in resp['CommonPrefixes']]
+    assert 'ünï/' in [x['Prefix'] for x in resp['CommonPrefixes']]
+
+    s3_client.meta.events.register('provide-client-params.s3.ListObjectsV2', _small_pages)
+    sharded = explore_bucket_sharded(BucketInfo(bucket_name, created_date), s3_client,
+                                     workers=3, split_after_pages=1)
+    assert sharded.file_count == expected.file_count
+    assert sharded.cumulative_size == expected.cumulative_size
+    assert sharded.most_recent_mod == expected.most_recent_mod
+
+
+@mock_s3
+def test_fast_parse_errors_untouched(s3_client):
+    """
+    Error responses are left for botocore to parse as usual.
+    """
+    from botocore.exceptions import ClientError
+    enable_fast_parse(s3_client)
+    with pytest.raises(ClientError) as error_info:
+        s3_client.list_objects_v2(Bucket='no-such-bucket')
+    assert error_info.value.response['Error']['Code'] == 'NoSuchBucket'
+
+
+def test_parse_list_objects():
+    body = (b'<ListBucketResult><EncodingType>url</EncodingType><IsTruncated>true</IsTruncated>'
+            b'<NextContinuationToken>abc=</NextContinuationToken>'
+            b'<Contents><Key>x%2F</Key><LastModified>2020-01-02T00:00:00.000Z</LastModified><Size>5</Size></Contents>'
+            b'<Contents><Key>y</Key><LastModified>2020-01-01T00:00:00.000Z</LastModified><Size>7</Size></Contents>'
+            b'<Contents><Key>z</Key><LastModified>2020-01-01T12:00:00Z</LastModified><Size>9</Size></Contents>'
+            b'</ListBucketResult>')
+    page, fields = parse_list_objects(body)
+    assert page.file_count == 2
+    assert page.cumulative_size == 16
+    assert page.most_recent_mod.isoformat() == '2020-01-01T12:00:00+00:00'
+    assert page.last_key == 'z'
+    assert fields['IsTruncated'] is True
+    assert fields['NextContinuationToken'] == 'abc='
+    assert fields['KeyCount'] == 3
@@ -0,0 +1,190 @@
+import multiprocessing
+import os
+import pytest
+from datetime import datetime, timedelta, timezone
+from history import HistoryStore
+from query import bucket_trends, display_trend, main as query_main
+from results import BucketInfo, ResultHandler, SizeFormat
+
+HISTORY_PROFILE = 'test_history'
+START = datetime(2020, 1, 20, tzinfo=timezone.utc)
+
+
+def _store(fake_clock, **kwargs):
+    fake_clock.now = START
+    history = HistoryStore(HISTORY_PROFILE, clock=fake_clock, **kwargs)
+    history.clock = fake_clock
+    return history
+
+
+@pytest.fixture
+def store(tmp_path, fake_clock):
+    history = _store(fake_clock, location=str(tmp_path))
+    yield history
+    history.close()
+
+
+@pytest.fixture
+def app_store(tmp_path, monkeypatch, fake_clock):
+    """
+    A store in the default location, under a temporary app directory,
+    where the query command and ResultHandler look for it.
+    """
+    monkeypatch.setattr('history.APP_HOME', str(tmp_path))
+    history = _store(fake_clock)
+    yield history
+    history.close()
+
+
+def _result(name, file_count, size, estimated=False):
+    my_info = BucketInfo(name, START)
+    my_info.add_totals(file_count, size, START)
+    if estimated:
+        my_info.estimate = object()
+    return my_info
+
+
+def _record_days(store, days):
+    # A day's run a day: "growing" gains 10 files and 1 MB each day, "steady" stays put
+    for day in range(days):
+        store.clock.now = START + timedelta(days=day)
+        store.append(_result('growing', 100 + 10 * day, (10 + day) * 1024 ** 2))
+        store.append(_result('steady', 50, 1024 ** 2))
+
+
+def test_append_and_read(store, tmp_path):
+    """
+    Results should be partitioned by month, and read back a column at a
+    time, only from the partitions and rows a period needs.
+    """
+    _record_days(store, 30)
+    store.append(_result('estimated', 7, 70, estimated=True))
+    store.close()
+    # Results span two months, so two partitions
+    assert store.partitions() == ['2020-01', '2020-02']
+    assert store.bucket_names() == ['growing', 'steady', 'estimated']
+
+    reader = HistoryStore(HISTORY_PROFILE, location=str(tmp_path))
+    columns = reader.read(['bucket', 'cumulative_size', 'estimated'])
+    assert len(columns['time']) == 61
+    assert list(columns['bucket'][:4]) == [0, 1, 0, 1]
+    assert columns['cumulative_size'][2] == 11 * 1024 ** 2
+    assert list(columns['estimated'][-2:]) == [0, 1]
+    # Periods only reach into the partitions and rows needed
+    since = START + timedelta(days=25)
+    columns = reader.read(['file_count'], since=since, until=since + timedelta(days=2))
+    assert list(columns['file_count']) == [350, 50, 360, 50]
+    assert set(columns) == {'time', 'file_count'}
+
+
+def test_interrupted_append_is_dropped(store):
+    """
+    A result only partly written (by a run killed between columns)
+    should be ignored, and written over by the next one.
+    """
+    _record_days(store, 2)
+    store.close()
+    partition = os.path.join(store._path, '2020-01')
+    # As if killed between columns of a third result
+    with open(os.path.join(partition, 'time.col'), 'ab') as fp:
+        fp.write(b'\x01' * 8)
+    assert len(store.read(['file_count'])['time']) == 4
+
+    store.append(_result('steady', 51, 1024 ** 2))
+    columns = store.read(['bucket', 'file_count'])
+    assert list(columns['file_count']) == [100, 50, 110, 50, 51]
+
+
+def test_concurrent_writers(store, tmp_path):
+    """
+    Two stores appending to the same history in turn (a --watch daemon next
+    to a scheduled run, say) should see each other's buckets and results,
+    rather than overwriting them.
+    """
+    other = HistoryStore(HISTORY_PROFILE, clock=store.clock, location=str(tmp_path))
+    store.append(_result('alpha', 1, 10))
+    other.append(_result('beta', 2, 20))
+    store.append(_result('gamma', 3, 30))
+    other.append(_result('alpha', 4, 40))
+    columns = HistoryStore(HISTORY_PROFILE, location=str(tmp_path)).read(['bucket', 'file_count', 'cumulative_size'])
+    names = store.bucket_names()
+    assert names == ['alpha', 'beta', 'gamma']
+    assert [(names[x], y, z) for x, y, z in zip(columns['bucket'], columns['file_count'],
+                                                  columns['cumulative_size'])] == \
+        [('alpha', 1, 10), ('beta', 2, 20), ('gamma', 3, 30), ('alpha', 4, 40)]
+
+
+def _append_many(name, count, location):
+    history = HistoryStore(HISTORY_PROFILE, clock=lambda: START, location=location)
+    for n in range(count):
+        history.append(_result('{}-{}'.format(name, n % 3), n, n))
+
+
+def test_concurrent_processes(store, tmp_path):
+    """
+    Processes appending at the same time should never lose or mix up each other's results.
+    """
+    processes = [multiprocessing.Process(target=_append_many, args=(name, 100, str(tmp_path))) for name in ('one', 'two')]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    columns = store.read(['bucket', 'file_count'])
+    names = store.bucket_names()
+    assert sorted(names) == sorted('{}-{}'.format(x, n) for x in ('one', 'two') for n in range(3))
+    for name in ('one', 'two'):
+        counts = [y for x, y in zip(columns['bucket'], columns['file_count']) if names[x].startswith(name)]
+        assert counts == list(range(100))
+        assert all(names[x] == '{}-{}'.format(name, y % 3)
+                   for x, y in zip(columns['bucket'], columns['file_count']) if names[x].startswith(name))
+
+
+def test_bucket_trends(store):
+    """
+    Trends should cover each bucket's first to last result in the period,
+    and display as growth or as a daily rate.
+    """
+    _record_days(store, 30)
+    trends = bucket_trends(store)
+    assert [x.name for x in trends] == ['growing', 'steady']
+    growing, steady = trends
+    assert (growing.first_size, growing.last_size, growing.observations) == (10 * 1024 ** 2, 39 * 1024 ** 2, 30)
+    assert growing.size_change == 29 * 1024 ** 2
+    assert growing.size_rate == pytest.approx(1024 ** 2)
+    assert growing.count_rate == pytest.approx(10)
+    assert (steady.size_change, steady.size_rate) == (0, pytest.approx(0))
+
+    trends = bucket_trends(store, since=START + timedelta(days=20), buckets=['growing'])
+    assert [(x.name, x.first_count, x.days) for x in trends] == [('growing', 300, 9.0)]
+    assert bucket_trends(store, buckets=['missing']) == []
+
+    assert display_trend(growing, 'growth', SizeFormat.MB) == \
+        'growing: 10.0 MB to 39.0 MB (+29.0 MB, +290%), 100 to 390 files (+290) over 29.0 days, 30 results'
+    assert display_trend(growing, 'rate', SizeFormat.MB) == \
+        'growing: +1.0 MB per day, +10.0 files per day, over 29.0 days, 30 results'
+
+
+def test_query(app_store, capsys):
+    """
+    The query command should show the buckets growing fastest, or say
+    there is nothing to show.
+    """
+    _record_days(app_store, 3)
+    app_store.close()
+    query_main(['top', '-p', HISTORY_PROFILE, '--days', '0', '--limit', '1'])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines == ['growing: 10.0 MB to 12.0 MB (+2.0 MB, +20%), 100 to 120 files (+20) over 2.0 days, 3 results']
+    # Nothing that recent
+    query_main(['growth', '-p', HISTORY_PROFILE, '--days', '1'])
+    assert 'No results' in capsys.readouterr().out
+
+
+def test_result_handler_history(app_store):
+    """
+    Results should be recorded in the history when it is asked for.
+    """
+    handler = ResultHandler(date_display_format='%Y_%m_%d', size_display_format=SizeFormat.MB,
+                            profile_name=HISTORY_PROFILE, write_results_to_disk=False, history=True)
+    handler.update_results(_result('steady', 50, 1024 ** 2))
+    handler.close()
+    assert list(app_store.read(['file_count'])['file_count']) == [50]
@@ -0,0 +1,81 @@
+import pytest
+from access import explore_bucket
+from index import IndexWriter, ObjectIndex
+from moto import mock_s3
+from results import BucketInfo
+
+
+def _indexed_run(s3_client, writer, bucket_name, created_date):
+    my_info = explore_bucket(BucketInfo(bucket_name, created_date), s3_client)
+    return my_info, writer.finish(my_info)
+
+
+@mock_s3
+def test_index_diff(s3_client, created_date, tmp_path):
+    """
+    A second run reports exactly what was added, deleted and changed in
+    between, and only adds up the prefixes those changes were in.
+    """
+    s3_client.create_bucket(Bucket='index-bucket')
+    for prefix in ('a/', 'b/', 'c/'):
+        for n in range(4):
+            s3_client.put_object(Bucket='index-bucket', Key='{}file_{}'.format(prefix, n), Body=b'x' * 10)
+    s3_client.put_object(Bucket='index-bucket', Key='a/', Body=b'')
+    s3_client.meta.events.register('provide-client-params.s3.ListObjectsV2',
+                                   lambda params, **kwargs: params.update(MaxKeys=5))
+
+    writer = IndexWriter('default', location=str(tmp_path))
+    writer.attach(s3_client)
+    my_info, diff = _indexed_run(s3_client, writer, 'index-bucket', created_date)
+    assert diff.first_run
+    assert diff.added == my_info.file_count == 12
+
+    s3_client.put_object(Bucket='index-bucket', Key='a/new', Body=b'x' * 100)
+    s3_client.delete_object(Bucket='index-bucket', Key='b/file_0')
+    s3_client.put_object(Bucket='index-bucket', Key='b/file_1', Body=b'x' * 30)
+    my_info, diff = _indexed_run(s3_client, writer, 'index-bucket', created_date)
+    writer.close()
+
+    assert not diff.first_run
+    assert (diff.added, diff.added_bytes) == (1, 100)
+    assert (diff.deleted, diff.deleted_bytes) == (1, 10)
+    assert diff.changed == 1
+    assert diff.size_growth == 100 - 10 + 20
+    assert (diff.changed_prefixes, diff.reused_prefixes) == (2, 1)
+
+    index = ObjectIndex(writer.index_path('index-bucket'))
+    totals = index.prefix_totals()
+    index.close()
+    assert {prefix: x[:2] for prefix, x in totals.items()} == {'a/': (5, 140), 'b/': (3, 50), 'c/': (4, 40)}
+    assert sum(x[0] for x in totals.values()) == my_info.file_count
+    assert sum(x[1] for x in totals.values()) == my_info.cumulative_size
+
+
+def test_interrupted_run(tmp_path):
+    """
+    A run that never finished leaves the last completed index as it was.
+    """
+    path = str(tmp_path / 'bucket.sqlite')
+    index = ObjectIndex(path)
+    index.begin_run()
+    index.add_files([('a', 1, '2020-01-01T00:00:00+00:00'), ('b', 2, '2020-01-01T00:00:00+00:00')])
+    index.finish_run()
+    index.begin_run()
+    index.add_files([('a', 1, '2020-01-01T00:00:00+00:00')])
+    index.close()
+
+    index = ObjectIndex(path)
+    index.begin_run()
+    index.add_files([('a', 1, '2020-01-01T00:00:00+00:00'), ('b', 2, '2020-01-01T00:00:00+00:00')])
+    diff = index.finish_run()
+    index.close()
+    assert (diff.added, diff.deleted, diff.changed, diff.size_growth) == (0, 0, 0, 0)
+    assert str(diff) == '0 new (0 bytes), 0 deleted (0 bytes), 0 changed, size +0 bytes'
+
+
+def test_write_errors_reach_finish(tmp_path, created_date):
+    writer = IndexWriter('default', location=str(tmp_path))
+    writer._queue.put(('broken', [dict(Key='k', Size=1, LastModified=None)], None))
+    with pytest.raises(AttributeError):
+        writer.finish(BucketInfo('broken', created_date))
+    writer.close()
@@ -0,0 +1,121 @@
+import csv
+import gzip
+import io
+import json
+import os
+import pytest
+from access import explore_bucket
+from datetime import datetime, timezone
+from inventory import InventoryError, InventoryLocation, explore_bucket_inventory
+from moto import mock_s3
+from results import BucketInfo
+
+SCHEMA = 'Bucket, Key, VersionId, IsLatest, IsDeleteMarker, Size, LastModifiedDate, ETag, StorageClass'
+
+
+def _rows(bucket_name):
+    """
+    Inventory rows for a versioned bucket: 4 current files (one under a
+    URL encoded key), a placeholder, an old version and a delete marker.
+    """
+    return [
+        [bucket_name, 'a/file%201.txt', 'v1', 'true', 'false', '100', '2020-09-01T10:00:00.000Z', 'e', 'STANDARD'],
+        [bucket_name, 'a/file%201.txt', 'v0', 'false', 'false', '999', '2020-08-01T10:00:00.000Z', 'e', 'STANDARD'],
+        [bucket_name, 'a%2F', 'v1', 'true', 'false', '0', '2020-09-30T10:00:00.000Z', 'e', 'STANDARD'],
+        [bucket_name, 'b/file2', 'v1', 'true', 'false', '200', '2020-09-20T08:30:00.000Z', 'e', 'GLACIER'],
+        [bucket_name, 'b/gone', 'v2', 'true', 'true', '', '2020-09-25T08:30:00.000Z', '', ''],
+        [bucket_name, 'c', 'v1', 'true', 'false', '300', '2019-01-01T00:00:00.000Z', 'e', 'STANDARD'],
+        [bucket_name, 'd', 'v1', 'true', 'false', '400', '2020-01-01T00:00:00.000Z', 'e', 'STANDARD'],
+    ]
+
+
+def _gzipped_csv(rows):
+    text = io.StringIO()
+    csv.writer(text, quoting=csv.QUOTE_ALL, lineterminator='\n').writerows(rows)
+    return gzip.compress(text.getvalue().encode('utf-8'))
+
+
+def _write_report(root, bucket_name, timestamp, rows, files=2):
+    """
+    Lays out a report the way S3 delivers one, under a local directory.
+    """
+    config_dir = os.path.join(root, 'inventory', bucket_name, 'daily')
+    os.makedirs(os.path.join(config_dir, 'data'), exist_ok=True)
+    os.makedirs(os.path.join(config_dir, timestamp), exist_ok=True)
+    entries = []
+    for n in range(files):
+        key = 'inventory/{}/daily/data/{}-{}.csv.gz'.format(bucket_name, timestamp, n)
+        with open(os.path.join(root, key), 'wb') as fp:
+            fp.write(_gzipped_csv(rows[n::files]))
+        entries.append(dict(key=key, size=0, MD5checksum=''))
+    manifest = dict(sourceBucket=bucket_name, destinationBucket='arn:aws:s3:::inventory-bucket',
+                    version='2016-11-30', fileFormat='CSV', fileSchema=SCHEMA, files=entries)
+    path = os.path.join(config_dir, timestamp, 'manifest.json')
+    with open(path, 'w') as fp:
+        json.dump(manifest, fp)
+    return path
+
+
+def _check_totals(my_info):
+    assert my_info.file_count == 4
+    assert my_info.cumulative_size == 1000
+    assert my_info.most_recent_mod == datetime(2020, 9, 20, 8, 30, tzinfo=timezone.utc)
+
+
+def test_local_inventory(tmp_path, created_date):
+    """
+    The newest report is read, in parallel, from a local copy of the destination bucket.
+    """
+    root = str(tmp_path)
+    _write_report(root, 'inv-bucket', '2020-09-30T00-00Z', _rows('inv-bucket')[:2])
+    _write_report(root, 'inv-bucket', '2020-10-01T00-00Z', _rows('inv-bucket'), files=3)
+
+    location = InventoryLocation(os.path.join(root, 'inventory'))
+    my_info = explore_bucket_inventory(BucketInfo('inv-bucket', created_date), None, location, workers=2)
+    _check_totals(my_info)
+
+
+def test_single_manifest(tmp_path, created_date):
+    path = _write_report(str(tmp_path), 'inv-bucket', '2020-10-01T00-00Z', _rows('inv-bucket'))
+    location = InventoryLocation(path)
+    _check_totals(explore_bucket_inventory(BucketInfo('inv-bucket', created_date), None, location))
+
+    # A report for another bucket is no use to this one
+    with pytest.raises(InventoryError):
+        explore_bucket_inventory(BucketInfo('other-bucket', created_date), None, location)
+
+
+@mock_s3
+def test_s3_inventory_and_fallback(s3_client, created_date, tmp_path):
+    """
+    Reports kept in S3 are read from there; a bucket without one is listed instead.
+    """
+    s3_client.create_bucket(Bucket='inventory-bucket')
+    root = str(tmp_path)
+    _write_report(root, 'inv-bucket', '2020-10-01T00-00Z', _rows('inv-bucket'))
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as fp:
+                s3_client.put_object(Bucket='inventory-bucket', Key=os.path.relpath(path, root), Body=fp.read())
+
+    s3_client.create_bucket(Bucket='listed-bucket')
+    s3_client.put_object(Bucket='listed-bucket', Key='only_file', Body=b'x' * 10)
+
+    location = InventoryLocation('s3://inventory-bucket/inventory')
+    _check_totals(explore_bucket_inventory(BucketInfo('inv-bucket', created_date), s3_client, location,
+                                           fallback=explore_bucket))
+    listed = explore_bucket_inventory(BucketInfo('listed-bucket', created_date), s3_client, location,
+                                      fallback=explore_bucket)
+    assert (listed.file_count, listed.cumulative_size) == (1, 10)
+
+
+def test_unsupported_format(tmp_path, created_date):
+    path = _write_report(str(tmp_path), 'inv-bucket', '2020-10-01T00-00Z', _rows('inv-bucket'))
+    with open(path) as fp:
+        manifest = json.load(fp)
+    manifest['fileFormat'] = 'Parquet'
+    with open(path, 'w') as fp:
+        json.dump(manifest, fp)
+    with pytest.raises(InventoryError):
+        explore_bucket_inventory(BucketInfo('inv-bucket', created_date), None, InventoryLocation(path))
@@ -0,0 +1,100 @@
+import json
+import pytest
+from access import explore_bucket, explore_buckets
+from metrics import Histogram, ScanMetrics
+from moto import mock_s3
+from results import BucketInfo
+
+
+def test_histogram_percentiles():
+    histogram = Histogram(bounds=(1.0, 2.0, 4.0))
+    for value in (0.5, 1.5, 1.5, 3.0, 10.0):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1, 1]
+    assert histogram.count == 5
+    assert histogram.total == pytest.approx(16.5)
+    assert histogram.percentile(50) == pytest.approx(1.75)
+    assert histogram.percentile(100) == 4.0
+    assert Histogram().percentile(50) is None
+
+    other = Histogram(bounds=(1.0, 2.0, 4.0))
+    other.observe(0.1)
+    histogram.merge(other)
+    assert histogram.counts == [2, 2, 1, 1]
+
+
+@mock_s3
+def test_instrumented_explore(s3_client, created_date, fake_clock):
+    """
+    Every page listed is counted against its bucket, along with the
+    bucket's totals and how long it took.
+    """
+    s3_client.create_bucket(Bucket='metrics-bucket')
+    for n in range(5):
+        s3_client.put_object(Bucket='metrics-bucket', Key='file_{}'.format(n), Body=b'x' * n)
+    s3_client.meta.events.register('provide-client-params.s3.ListObjectsV2',
+                                   lambda params, **kwargs: params.update(MaxKeys=2))
+
+    fake_clock.tick = 0.01
+    metrics = ScanMetrics(clock=fake_clock)
+    metrics.instrument_client(s3_client)
+    explore = metrics.timed_explore(explore_bucket)
+    results = list(explore_buckets([BucketInfo('metrics-bucket', created_date)], s3_client, explore=explore))
+    metrics.finish()
+
+    summary = metrics.summary()
+    assert summary['objects'] == 5
+    assert summary['buckets'] == 1
+    bucket = summary['by_bucket']['metrics-bucket']
+    assert bucket['requests'] == 3
+    assert bucket['objects'] == results[0].file_count
+    assert bucket['bytes'] == 10
+    assert bucket['scan_seconds'] > 0
+    assert summary['request_latency']['ListObjectsV2']['count'] == 3
+    assert summary['request_latency']['ListObjectsV2']['p50'] is not None
+
+
+@mock_s3
+def test_instrumented_errors(s3_client):
+    metrics = ScanMetrics()
+    metrics.instrument_client(s3_client)
+    with pytest.raises(Exception):
+        s3_client.list_objects_v2(Bucket='no-such-bucket')
+    assert metrics.summary()['by_bucket']['no-such-bucket']['errors'] == 1
+
+
+def test_written_files(tmp_path, created_date):
+    metrics = ScanMetrics()
+    my_info = BucketInfo('bucket "quoted"', created_date)
+    my_info.add_file(100, created_date)
+    metrics.record_request('ListObjectsV2', my_info.name, 0.003, retries=1)
+    metrics.record_bucket(my_info, 0.5)
+    metrics.record_output(0.0001)
+    metrics.finish()
+
+    json_path = tmp_path / 'metrics.json'
+    metrics.write_json(str(json_path))
+    summary = json.loads(json_path.read_text())
+    assert summary['retries'] == 1
+    assert summary['output_latency']['count'] == 1
+
+    prom_path = tmp_path / 'collector' / 's3explore.prom'
+    metrics.write_textfile(str(prom_path))
+    lines = prom_path.read_text().splitlines()
+    assert '# TYPE s3explore_requests_total counter' in lines
+    assert 's3explore_requests_total{bucket="bucket \\"quoted\\""} 1' in lines
+    assert 's3explore_bucket_objects{bucket="bucket \\"quoted\\""} 1' in lines
+    assert 's3explore_request_duration_seconds_bucket{operation="ListObjectsV2",le="0.004"} 1' in lines
+    assert 's3explore_request_duration_seconds_bucket{operation="ListObjectsV2",le="+Inf"} 1' in lines
+    assert 's3explore_request_duration_seconds_count{operation="ListObjectsV2"} 1' in lines
+    assert not (tmp_path / 'collector' / 's3explore.prom.tmp').exists()
+
+
+def test_output_timed(mock_bucket_info, capsys):
+    from results import ResultHandler, SizeFormat
+    metrics = ScanMetrics()
+    handler = ResultHandler('%Y_%m_%d', SizeFormat.MB, 'default', write_results_to_disk=False, metrics=metrics)
+    handler.update_results(mock_bucket_info)
+    handler.update_results(mock_bucket_info)
+    assert metrics.summary()['output_latency']['count'] == 2
+    assert 'Contains 0 files' in capsys.readouterr().out
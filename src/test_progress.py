@@ -0,0 +1,118 @@
+import io
+import json
+import pytest
+from moto import mock_s3
+from access import explore_bucket
+from progress import ProgressReporter, display_duration
+from results import BucketInfo
+
+
+class FakeTerminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def _page(count, size=10):
+    return dict(Contents=[dict(Key='file_{}'.format(n), Size=size) for n in range(count)])
+
+
+def test_json_progress(fake_clock):
+    """
+    Away from a terminal, progress should be written as a line of JSON
+    every so many pages, with how long is left when it can be told.
+    """
+    stream = io.StringIO()
+    progress = ProgressReporter(stream, every_pages=2, expected=dict(big=1000), clock=fake_clock)
+    progress.start('big')
+    for _ in range(4):
+        fake_clock.now += 1
+        progress.add_page('big', _page(100))
+    lines = [json.loads(x)['progress'] for x in stream.getvalue().splitlines()]
+    # One update every other page; 400 of 1000 files in 4 seconds leaves 6 seconds
+    assert len(lines) == 2
+    assert lines[-1] == dict(bucket='big', pages=4, file_count=400, cumulative_size=4000, expected_file_count=1000,
+                             files_per_second=100.0, eta_seconds=6)
+
+
+def test_terminal_progress(mock_bucket_info, fake_clock):
+    """
+    On a terminal, progress should be a status line written over in place,
+    and cleared before each result is shown.
+    """
+    stream = FakeTerminal()
+    progress = ProgressReporter(stream, every_pages=1, clock=fake_clock)
+    reported = []
+    report = progress.wrap_report(lambda x: reported.append(stream.getvalue()))
+    progress.start(mock_bucket_info.name)
+
+    fake_clock.now += 2
+    progress.add_page(mock_bucket_info.name, _page(10, 1024 ** 2))
+    assert stream.getvalue() == '\rBUCKET1: 10 files, 10.0 MB, 5 files/s\x1b[K'
+    # An empty page changes nothing shown, so nothing is written
+    progress.add_page(mock_bucket_info.name, _page(0))
+    assert stream.getvalue().count('\r') == 1
+    # The status line is cleared before the result is shown
+    report(mock_bucket_info)
+    assert reported == [stream.getvalue()]
+    assert stream.getvalue().endswith('\r\x1b[K')
+
+
+def test_report_outside_lock(mock_bucket_info, fake_clock):
+    """
+    Pages of other buckets should still be counted while a result is being reported.
+    """
+    progress = ProgressReporter(FakeTerminal(), every_pages=1, clock=fake_clock)
+    counted = []
+
+    def report(bucket_info):
+        progress.add_page('other', _page(5))
+        counted.append(progress._buckets['other'].file_count)
+
+    progress.start(mock_bucket_info.name)
+    progress.wrap_report(report)(mock_bucket_info)
+    assert counted == [5]
+    assert list(progress._buckets) == ['other']
+
+
+def test_failed_bucket_forgotten(mock_bucket_info, fake_clock):
+    """
+    A bucket that could not be explored should no longer be counted
+    among those in progress.
+    """
+    stream = FakeTerminal()
+    progress = ProgressReporter(stream, every_pages=1, clock=fake_clock)
+
+    def explore(bucket_info, s3_client):
+        progress.add_page(bucket_info.name, _page(10))
+        raise RuntimeError('denied')
+
+    with pytest.raises(RuntimeError):
+        progress.wrap_explore(explore)(mock_bucket_info, None)
+    assert progress._buckets == dict()
+    assert stream.getvalue().endswith('\r\x1b[K')
+
+
+def test_display_duration():
+    """
+    Durations should be shown as hours, minutes and seconds.
+    """
+    assert display_duration(3723.4) == '1:02:03'
+    assert display_duration(59) == '0:00:59'
+
+
+@mock_s3
+def test_attach(s3_client, bucket_name, created_date):
+    """
+    Pages should be counted from the client's own responses, however the
+    bucket is listed.
+    """
+    s3_client.create_bucket(Bucket=bucket_name)
+    for n in range(25):
+        s3_client.put_object(Bucket=bucket_name, Key='file_{}'.format(n), Body=b'x' * n)
+    stream = io.StringIO()
+    progress = ProgressReporter(stream, every_pages=1)
+    progress.attach(s3_client)
+    s3_client.list_objects_v2(Bucket=bucket_name, MaxKeys=10)
+    explore_bucket(BucketInfo(bucket_name, created_date), s3_client)
+    updates = [json.loads(x)['progress'] for x in stream.getvalue().splitlines()]
+    assert (updates[-1]['pages'], updates[-1]['file_count'], updates[-1]['cumulative_size']) == (2, 35, 409)
@@ -0,0 +1,66 @@
+import boto3
+from moto import mock_s3
+from access import explore_bucket
+from metrics import ScanMetrics
+from regions import RegionCache, RegionalClients
+from results import BucketInfo
+
+CACHE_PROFILE = 'test_regions'
+
+
+def test_region_cache(tmp_path, fake_clock):
+    """
+    Regions saved by one run should be found by the next, until they are too old.
+    """
+    cache = RegionCache(CACHE_PROFILE, max_age=60, clock=fake_clock, location=str(tmp_path))
+    assert cache.get('bucket-one') is None
+    cache.put('bucket-one', 'eu-west-1')
+    cache.save()
+    # Picked up again by the next run, until it gets too old
+    cache = RegionCache(CACHE_PROFILE, max_age=60, clock=fake_clock, location=str(tmp_path))
+    assert cache.get('bucket-one') == 'eu-west-1'
+    fake_clock.now += 61
+    assert cache.get('bucket-one') is None
+
+
+@mock_s3
+def test_regional_clients(tmp_path, s3_client, mock_s3_credentials, created_date, fake_clock):
+    """
+    Each bucket should be explored through a client in its own region,
+    with one client per region, looked up once per bucket.
+    """
+    s3_client.create_bucket(Bucket='bucket-east')
+    s3_client.create_bucket(Bucket='bucket-west', CreateBucketConfiguration=dict(LocationConstraint='eu-west-1'))
+    s3_client.create_bucket(Bucket='bucket-west-2', CreateBucketConfiguration=dict(LocationConstraint='eu-west-1'))
+    session = boto3.Session(region_name='us-east-1', **mock_s3_credentials)
+    default_client = session.client('s3')
+    for n in range(3):
+        default_client.put_object(Bucket='bucket-west', Key='file_{}'.format(n), Body=b'x' * n)
+
+    metrics = ScanMetrics()
+    metrics.instrument_client(default_client)
+    prepared = []
+
+    def prepare(client):
+        prepared.append(client.meta.region_name)
+        metrics.instrument_client(client)
+
+    cache = RegionCache(CACHE_PROFILE, clock=fake_clock, location=str(tmp_path))
+    clients = RegionalClients(default_client, lambda region: session.client('s3', region_name=region),
+                              cache, prepare=prepare)
+    assert clients.client_for('bucket-east') is default_client
+    west = clients.client_for('bucket-west')
+    assert west.meta.region_name == 'eu-west-1'
+    # One client per region, looked up once per bucket
+    assert clients.client_for('bucket-west-2') is west
+    assert prepared == ['eu-west-1']
+    assert cache.get('bucket-west') == 'eu-west-1'
+    # Buckets whose region cannot be found are left to the default client
+    assert clients.client_for('no-such-bucket') is default_client
+
+    explore = clients.regional_explore(explore_bucket)
+    my_info = explore(BucketInfo('bucket-west', created_date), default_client)
+    assert (my_info.file_count, my_info.cumulative_size) == (3, 3)
+    by_region = metrics.summary()['request_latency_by_region']
+    assert by_region['eu-west-1']['count'] == 1
+    assert by_region['us-east-1']['count'] >= 3
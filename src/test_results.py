@@ -1,6 +1,7 @@
+import json
 import pytest
-from datetime import datetime
-from results import SizeFormat, display_file_size, display_last_mod
+from datetime import datetime, timedelta, timezone
+from results import BucketInfo, SizeFormat, display_file_size, display_last_mod, initiate_bucket_info
 
 
 @pytest.mark.parametrize("file_size, size_format, expected_output",
@@ -87,3 +88,88 @@ def test_result_handler(mock_bucket_info, result_handler):
     assert lines[2] == ' Contains 3 files'
     assert lines[3] == ' Most recently updated 2020_01_10'
     assert lines[4] == ' Total size: 6.0 MB'
+
+
+def test_result_handler_throttle(mock_bucket_info, result_handler):
+    """
+    The request rate limits are shown, when the engine kept any.
+    """
+    from throttle import AimdController
+    assert len(result_handler._console_display(mock_bucket_info).split('\n')) == 5
+    mock_bucket_info.throttle = AimdController(max_limit=8, initial_limit=4)
+    mock_bucket_info.throttle.on_success(0.1)
+    lines = result_handler._console_display(mock_bucket_info).split('\n')
+    assert lines[5] == ' Requests in flight: limit 5 of 8 (peak 5), 0 of 1 requests throttled'
+
+
+def test_initiate_bucket_info(bucket_name, created_date):
+    """
+    BucketInfo can be started from a list_buckets entry.
+    """
+    bucket_info = initiate_bucket_info(dict(Name=bucket_name, CreationDate=created_date))
+    assert bucket_info.name == bucket_name
+    assert bucket_info.created == created_date
+    assert bucket_info.file_count == 0
+
+
+def test_bucket_info_totals(mock_bucket_info):
+    """
+    Adding a batch of files at once should match adding them one by one,
+    and an empty batch should change nothing.
+    """
+    one_by_one = BucketInfo(mock_bucket_info.name, mock_bucket_info.created)
+    for size, last_modified in ((100, datetime(2020, 1, 1)),
+                                (200, datetime(2020, 3, 1)),
+                                (300, datetime(2020, 2, 1))):
+        one_by_one.add_file(size, last_modified)
+
+    mock_bucket_info.add_totals(0, 0, None)
+    mock_bucket_info.add_totals(2, 300, datetime(2020, 1, 1))
+    mock_bucket_info.add_totals(1, 300, datetime(2020, 3, 1))
+    assert mock_bucket_info.file_count == one_by_one.file_count == 3
+    assert mock_bucket_info.cumulative_size == one_by_one.cumulative_size == 600
+    assert mock_bucket_info.most_recent_mod == one_by_one.most_recent_mod == datetime(2020, 3, 1)
+
+    with pytest.raises(AttributeError):
+        mock_bucket_info.not_a_field = 1
+
+
+def test_bucket_info_state(mock_bucket_info):
+    """
+    A BucketInfo should come back from its JSON state with the same totals
+    and details, so that carrying on with it gives the same results.
+    """
+    from breakdown import Breakdown
+    from topobjects import TopObjects
+    from versions import VersionTotals
+
+    when = datetime(2020, 3, 1, tzinfo=timezone.utc)
+    mock_bucket_info.breakdown = Breakdown(max_prefixes=3)
+    mock_bucket_info.top_objects = TopObjects(limit=2)
+    mock_bucket_info.versions = VersionTotals()
+    for n, key in enumerate(('a/1', 'a/b/2', 'c/3', 'd/4', 'e')):
+        mock_bucket_info.add_file(n, when - timedelta(days=n))
+        mock_bucket_info.breakdown.add_file(key, n, 'GLACIER' if n % 2 else None)
+        mock_bucket_info.top_objects.add_file(key, n, when - timedelta(days=n))
+    mock_bucket_info.versions.add_upload(10, when)
+
+    restored = BucketInfo.from_state(json.loads(json.dumps(mock_bucket_info.as_state())))
+    assert (restored.name, restored.created) == (mock_bucket_info.name, mock_bucket_info.created)
+    assert (restored.file_count, restored.cumulative_size, restored.most_recent_mod) == (5, 10, when)
+    for name in ('breakdown', 'top_objects', 'versions'):
+        assert getattr(restored, name).as_dict() == getattr(mock_bucket_info, name).as_dict()
+    # Carrying on gives the same results either way
+    for my_info in (restored, mock_bucket_info):
+        my_info.breakdown.add_file('f/5', 5)
+        my_info.top_objects.add_file('f/5', 5, when - timedelta(days=9))
+    assert restored.breakdown.as_dict() == mock_bucket_info.breakdown.as_dict()
+    assert restored.top_objects.as_dict() == mock_bucket_info.top_objects.as_dict()
+    # Nothing gathered, nothing kept
+    assert set(BucketInfo('plain', None).as_state()) == {'bucket', 'created', 'file_count', 'cumulative_size',
+                                                          'most_recent_mod'}
+
+
+def test_console_display_profile(result_handler, mock_bucket_info):
+    assert '\nBucket "BUCKET1", created 2020_09_25\n' in result_handler._console_display(mock_bucket_info)
+    assert '\nBucket "BUCKET1" of profile "prod", created 2020_09_25\n' in \
+        result_handler._console_display(mock_bucket_info, 'prod')
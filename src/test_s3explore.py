@@ -0,0 +1,48 @@
+import os
+import pytest
+import subprocess
+import sys
+import s3explore
+
+SRC_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run_python(code, **env_vars):
+    env = dict(os.environ, PYTHONPATH=SRC_PATH, **env_vars)
+    return subprocess.run([sys.executable, '-c', code], env=env, cwd=SRC_PATH,
+                          stdout=subprocess.PIPE, check=True).stdout.decode().strip()
+
+
+def test_startup_is_lazy():
+    """
+    Importing the script (which is all --help needs) should not load boto3 or pandas.
+    """
+    loaded = _run_python(
+        'import sys, s3explore; s3explore.build_parser().format_help(); '
+        'print(",".join(x for x in ("boto3", "botocore", "pandas") if x in sys.modules))'
+    )
+    assert loaded == ''
+
+
+def test_features_are_lazy(tmp_path):
+    """
+    Setting up to explore a profile should only load the modules of the features asked for.
+    """
+    cred_path = os.path.join(os.path.dirname(SRC_PATH), 'installation_support', 'cred_EXAMPLE.json')
+    loaded = _run_python(
+        'import sys, access, s3explore; '
+        'init = access.AccessHandler.__init__; '
+        'access.AccessHandler.__init__ = lambda self, **kwargs: init(self, cred_path={!r}, **kwargs); '
+        's3explore.ProfileExplorer(s3explore.build_parser().parse_args([]), "default"); '
+        'print(",".join(x for x in ("inventory", "sampling", "index", "history", "progress", "versions", '
+        '"shards", "asyncscan", "watch", "workqueue") if x in sys.modules))'.format(cred_path),
+        S3X_PATH=str(tmp_path)
+    )
+    assert loaded == ''
+
+
+def test_help(capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        s3explore.main(['--help'])
+    assert exit_info.value.code == 0
+    assert '--workers' in capsys.readouterr().out
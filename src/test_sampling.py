@@ -0,0 +1,192 @@
+import pytest
+import random
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from moto import mock_s3
+from access import explore_bucket
+from results import BucketInfo
+from sampling import KeySpace, explore_bucket_sampled, MIN_WINDOWS
+
+BIG_FILES = 800
+SKEWED_FILES = 3000
+LAST_CHAR = '\U0010ffff'
+
+
+class SortedBucket:
+    """
+    Just enough of list_objects_v2, over keys kept in memory, to run the
+    sampler on the same bucket many times over in a reasonable time.
+    """
+    def __init__(self, sizes):
+        self._sizes = sizes
+        self._keys = sorted(sizes)
+
+    def list_objects_v2(self, Bucket, Prefix='', StartAfter=None, MaxKeys=1000, ContinuationToken=None,
+                        Delimiter=None):
+        keys = self._keys
+        after = ContinuationToken or StartAfter
+        n = max(bisect_left(keys, Prefix), bisect_right(keys, after) if after is not None else 0)
+        contents, prefixes, last = [], [], None
+        while (n < len(keys)) and keys[n].startswith(Prefix) and (len(contents) + len(prefixes) < MaxKeys):
+            key = keys[n]
+            if Delimiter and (Delimiter in key[len(Prefix):]):
+                last = key[:key.index(Delimiter, len(Prefix)) + 1]
+                prefixes.append(dict(Prefix=last))
+                n = bisect_left(keys, last + LAST_CHAR)
+            else:
+                contents.append(dict(Key=key, Size=self._sizes[key], LastModified=datetime(2020, 1, 1)))
+                last = key
+                n += 1
+        resp = dict(Contents=contents, CommonPrefixes=prefixes,
+                    IsTruncated=(n < len(keys)) and keys[n].startswith(Prefix))
+        if resp['IsTruncated']:
+            resp['NextContinuationToken'] = last
+        return resp
+
+
+def _fill_bucket(s3_client, bucket_name):
+    rng = random.Random(7)
+    s3_client.create_bucket(Bucket=bucket_name)
+    for n in range(BIG_FILES):
+        s3_client.put_object(Bucket=bucket_name, Key='big/{:012x}'.format(rng.getrandbits(48)),
+                             Body=b'x' * rng.randrange(200))
+    for n in range(30):
+        s3_client.put_object(Bucket=bucket_name, Key='small/file_{}'.format(n), Body=b'x' * n)
+    for n in range(3):
+        s3_client.put_object(Bucket=bucket_name, Key='top_{}'.format(n), Body=b'x' * 10)
+    s3_client.put_object(Bucket=bucket_name, Key='small/', Body=b'')
+
+
+def test_key_space():
+    """
+    Positions in the key space should keep keys in order, map back to the
+    sampled keys, and spread the sample's keys over nearly all the room.
+    """
+    sample = ['logs/2020-01-0{}/{:x}'.format(n % 10, n) for n in range(100)]
+    keys = sorted(sample[::7] + ['logs/', 'logs/1', 'logs/2020-01-01', 'logs/2020-01-01/', 'logs/2020-01-1',
+                                 'logs/2020-12-31/z', 'logs/2021', 'logs/é', 'logs/' + 'x' * 300])
+    for space in (KeySpace('logs/', sample), KeySpace('logs/', sample, weighted=False)):
+        positions = [space.position(x) for x in keys]
+        assert positions == sorted(positions)
+        assert all(0 <= x < space.size for x in positions)
+        for key in sample[::7]:
+            assert space.key_at(space.position(key)) == key
+        # Part way between two keys, listing starts no later than the position
+        for low, high in zip(keys, keys[1:]):
+            middle = (space.position(low) + space.position(high)) // 2
+            start_after = space.key_at(middle)
+            assert start_after <= high
+            assert space.position(start_after) <= middle
+
+    # Where the sample's keys all agree, they take up next to no room
+    space = KeySpace('logs/', sample)
+    first, last = space.position('logs/2020-01-00/0'), space.position('logs/2020-01-09/ff')
+    assert last - first > space.size * 0.9
+
+
+@mock_s3
+def test_small_bucket_is_exact(s3_client, bucket_name, created_date):
+    """
+    A bucket small enough to list within the exact pages should give
+    exactly the serial totals, and no estimate.
+    """
+    _fill_bucket(s3_client, bucket_name)
+    expected = explore_bucket(BucketInfo(bucket_name, created_date), s3_client)
+
+    sampled = explore_bucket_sampled(BucketInfo(bucket_name, created_date), s3_client)
+    assert sampled.estimate is None
+    assert (sampled.file_count, sampled.cumulative_size, sampled.most_recent_mod) == \
+        (expected.file_count, expected.cumulative_size, expected.most_recent_mod)
+
+
+@mock_s3
+def test_sampled_estimate(s3_client, bucket_name, created_date):
+    """
+    Sampling a larger bucket should come close to the real totals, inside
+    its confidence interval, having sampled until the error bound was met.
+    """
+    _fill_bucket(s3_client, bucket_name)
+    expected = explore_bucket(BucketInfo(bucket_name, created_date), s3_client)
+
+    sampled = explore_bucket_sampled(BucketInfo(bucket_name, created_date), s3_client,
+                                     error=0.1, seconds=None, exact_pages=2, window_keys=40,
+                                     page_size=20, rng=random.Random(3))
+    estimate = sampled.estimate
+    assert estimate.method == 'sampling'
+    assert estimate.confidence == 0.95
+    assert estimate.samples >= 10
+    assert estimate.file_count_range[0] <= expected.file_count <= estimate.file_count_range[1]
+    assert estimate.size_range[0] <= expected.cumulative_size <= estimate.size_range[1]
+    assert abs(sampled.file_count - expected.file_count) < 0.15 * expected.file_count
+    # Sampling went on until the error bound was met
+    assert estimate.file_count_range[1] - sampled.file_count <= 0.1 * sampled.file_count + 1
+
+
+class TimedBucket(SortedBucket):
+    """
+    A SortedBucket where every request takes a second on the given clock,
+    and which counts the listings started once the deadline has passed
+    (pages after the first of a listing already under way do not count).
+    """
+    def __init__(self, sizes, clock, deadline):
+        super().__init__(sizes)
+        self.clock = clock
+        self.deadline = deadline
+        self.late_listings = 0
+
+    def list_objects_v2(self, **kwargs):
+        if (self.clock.now >= self.deadline) and ('ContinuationToken' not in kwargs):
+            self.late_listings += 1
+        self.clock.now += 1
+        return super().list_objects_v2(**kwargs)
+
+
+@pytest.mark.parametrize("seconds", (0, 5, 30, 100, 200))
+def test_time_budget(created_date, fake_clock, seconds):
+    """
+    Out of time, the sampler should start no more listings (bar the first,
+    which it cannot do without), however far it got, and only give intervals
+    if every prefix was sampled enough to have one.
+    """
+    rng = random.Random(5)
+    sizes = {'{}/{:012x}'.format(prefix, rng.getrandbits(48)): rng.randrange(100)
+             for prefix in ('a', 'b', 'c') for _ in range(500)}
+    s3_client = TimedBucket(sizes, fake_clock, fake_clock.now + seconds)
+    sampled = explore_bucket_sampled(BucketInfo('timed', created_date), s3_client,
+                                     error=0.0001, seconds=seconds, exact_pages=2, window_keys=40,
+                                     page_size=10, rng=random.Random(3), clock=fake_clock)
+    assert s3_client.late_listings == (1 if seconds == 0 else 0)
+    estimate = sampled.estimate
+    assert estimate.samples < 3 * MIN_WINDOWS
+    if estimate.file_count_range is None:
+        assert estimate.size_range is None
+    else:
+        assert estimate.file_count_range[0] <= len(sizes) <= estimate.file_count_range[1]
+    # Never less than was counted
+    assert sampled.file_count >= min(seconds, 2) * 10
+
+
+def test_estimate_is_unbiased(created_date):
+    """
+    Sampling a bucket whose keys are crowded into a narrow stretch of the
+    key space (so that many windows are denser than expected) should neither
+    over nor under estimate, on average over many runs. Any one run's interval
+    is wide enough to hide a bias, so only the mean over the runs is tested.
+    """
+    rng = random.Random(11)
+    sizes = dict()
+    for n in range(SKEWED_FILES):
+        # Four keys in five start with "0", the rest anywhere
+        sizes['big/{:x}{:011x}'.format(0 if n % 5 else rng.randrange(16), rng.getrandbits(44))] = rng.randrange(100)
+    s3_client = SortedBucket(sizes)
+    runs = 40
+    file_counts, sizes_total = 0, 0
+    for seed in range(runs):
+        sampled = explore_bucket_sampled(BucketInfo('skewed', created_date), s3_client,
+                                         error=0.2, seconds=None, exact_pages=2, window_keys=40,
+                                         page_size=10, rng=random.Random(seed))
+        assert sampled.estimate is not None
+        file_counts += sampled.file_count
+        sizes_total += sampled.cumulative_size
+    assert abs(file_counts / runs - SKEWED_FILES) < 0.04 * SKEWED_FILES
+    assert abs(sizes_total / runs - sum(sizes.values())) < 0.04 * sum(sizes.values())
@@ -0,0 +1,70 @@
+from moto import mock_s3
+from access import explore_bucket
+from results import BucketInfo
+from scope import BucketFilter, KeyScope, literal_prefix
+
+
+def test_bucket_filter():
+    """
+    Buckets should be picked out by include and exclude patterns.
+    """
+    bucket_filter = BucketFilter(include=['logs-*', 'data'], exclude=['*-old'])
+    assert [x for x in ('logs-a', 'logs-old', 'data', 'data-2', 'other') if bucket_filter.matches(x)] == \
+        ['logs-a', 'data']
+    assert BucketFilter().matches('anything')
+
+
+def test_key_scope_prefixes():
+    """
+    Prefixes to list should take in any given inside them, and patterns
+    that are a prefix and '*' should be told apart from the rest.
+    """
+    assert literal_prefix('logs/tmp/*') == 'logs/tmp/'
+    assert literal_prefix('*.tmp') is None
+    assert literal_prefix('logs/*/tmp') is None
+    # Prefixes inside others are listed with them
+    assert KeyScope(['logs/2026/', 'logs/', 'data/x', 'data/']).prefixes == ['data/', 'logs/']
+    assert KeyScope().prefixes == ['']
+
+
+def test_filter_page():
+    """
+    Excluded keys should be taken off a page, leaving other pages as they are.
+    """
+    scope = KeyScope(exclude=['logs/debug/*', '*.tmp'])
+    page = dict(Contents=[dict(Key=x, Size=1) for x in ('logs/a', 'logs/debug/b', 'c.tmp', 'd')])
+    assert [x['Key'] for x in scope.filter_page(page)['Contents']] == ['logs/a', 'd']
+    # Pages with nothing excluded are passed on as they are
+    page = dict(Contents=[dict(Key='logs/a', Size=1)])
+    assert scope.filter_page(page) is page
+
+
+@mock_s3
+def test_scoped_explore(s3_client, bucket_name, created_date):
+    """
+    Scoped exploration should only count keys in scope, listing each
+    prefix server side and skipping over excluded "directories".
+    """
+    s3_client.create_bucket(Bucket=bucket_name)
+    keys = ['logs/2025/{:02d}'.format(n) for n in range(5)] + \
+        ['logs/2026/{:02d}'.format(n) for n in range(5)] + \
+        ['logs/2026/debug/{:02d}'.format(n) for n in range(20)] + \
+        ['logs/2026/x.tmp', 'other/file']
+    for key in keys:
+        s3_client.put_object(Bucket=bucket_name, Key=key, Body=b'x')
+    requests = []
+    s3_client.meta.events.register('provide-client-params.s3.ListObjectsV2',
+                                   lambda params, **kwargs: requests.append(dict(params)))
+
+    scope = KeyScope(['logs/2026/', 'other/'], exclude=['logs/2026/debug/*', '*.tmp'])
+    original = s3_client.list_objects_v2
+
+    def list_small_pages(**params):
+        return original(MaxKeys=4, **params)
+
+    s3_client.list_objects_v2 = list_small_pages
+    my_info = explore_bucket(BucketInfo(bucket_name, created_date), s3_client, scope=scope)
+    assert (my_info.file_count, my_info.cumulative_size) == (6, 6)
+    # Each prefix listed server side, and the excluded "directory" skipped over after its first page
+    assert [x.get('Prefix') for x in requests] == ['logs/2026/', 'logs/2026/', 'logs/2026/', 'other/']
+    assert requests[2]['StartAfter'] == 'logs/2026/debug/\U0010ffff'
@@ -0,0 +1,95 @@
+import pytest
+from datetime import datetime
+from moto import mock_s3
+from access import explore_bucket
+from results import BucketInfo
+from shards import Shard, explore_shard, explore_bucket_sharded
+
+
+def _fill_bucket(s3_client, bucket_name):
+    """
+    One "hot" prefix holding most of the keys, a few small ones,
+    some files at the top level, and a directory placeholder.
+    """
+    s3_client.create_bucket(Bucket=bucket_name)
+    keys = ['top_{}.txt'.format(n) for n in range(3)]
+    keys += ['hot/sub_{}/file_{}'.format(n % 4, n) for n in range(60)]
+    keys += ['hot/loose_{}'.format(n) for n in range(5)]
+    keys += ['cold_{}/file'.format(n) for n in range(3)]
+    keys += ['empty_dir/']
+    for n, key in enumerate(keys):
+        s3_client.put_object(Bucket=bucket_name, Key=key, Body=b'x' * (n + 1))
+
+
+@mock_s3
+@pytest.mark.parametrize("workers, split_after_pages", ((1, 1), (4, 1), (4, 100)))
+def test_sharded_matches_serial(s3_client, bucket_name, created_date,
+                                workers, split_after_pages):
+    """
+    Sharded exploration should give exactly the serial totals,
+    however eagerly the key space gets split.
+    """
+    _fill_bucket(s3_client, bucket_name)
+    serial = explore_bucket(BucketInfo(bucket_name, created_date), s3_client)
+
+    # Small pages force the hot prefix to be split mid listing
+    def small_pages(params, **kwargs):
+        params['MaxKeys'] = 7
+    s3_client.meta.events.register('provide-client-params.s3.ListObjectsV2', small_pages)
+
+    sharded = explore_bucket_sharded(BucketInfo(bucket_name, created_date), s3_client,
+                                     workers=workers, split_after_pages=split_after_pages)
+    assert sharded.file_count == serial.file_count == 71
+    assert sharded.cumulative_size == serial.cumulative_size
+    assert sharded.most_recent_mod == serial.most_recent_mod
+    # Every page went through the bucket's request rate control
+    assert sharded.throttle.requests >= 71 // 7
+    assert sharded.throttle.max_limit == workers
+
+
+@mock_s3
+def test_explore_shard_split(s3_client, bucket_name, created_date):
+    """
+    A flat shard running past its page budget should hand back the
+    rest of its key space, starting after the last key it counted.
+    """
+    _fill_bucket(s3_client, bucket_name)
+
+    def small_pages(params, **kwargs):
+        params['MaxKeys'] = 10
+    s3_client.meta.events.register('provide-client-params.s3.ListObjectsV2', small_pages)
+
+    partial, children = explore_shard(BucketInfo(bucket_name, created_date), s3_client,
+                                      Shard('hot/', discover=False, depth=1),
+                                      split_after_pages=2)
+    # Keys sort as hot/loose_*, then hot/sub_0/... so we stop inside hot/sub_0/
+    assert partial.file_count == 20
+    assert len(children) == 2
+    rest_of_prefix, rest_of_sub_prefix = children
+    assert rest_of_prefix.discover
+    assert rest_of_prefix.prefix == 'hot/'
+    assert not rest_of_sub_prefix.discover
+    assert rest_of_sub_prefix.prefix == 'hot/sub_0/'
+    assert rest_of_sub_prefix.start_after == rest_of_prefix.start_after
+
+    rest, sub_shards = explore_shard(BucketInfo(bucket_name, created_date), s3_client,
+                                     rest_of_prefix)
+    assert rest.file_count == 0
+    assert [x.prefix for x in sub_shards] == ['hot/sub_{}/'.format(n) for n in range(1, 4)]
+
+
+def test_bucket_info_merge(bucket_name, created_date):
+    """
+    Merging partial results should add counts and sizes and keep the newest date.
+    """
+    first = BucketInfo(bucket_name, created_date)
+    first.add_file(100, datetime(2020, 1, 1))
+    second = BucketInfo(bucket_name, created_date)
+    second.add_file(200, datetime(2020, 2, 1))
+    empty = BucketInfo(bucket_name, created_date)
+
+    first.merge(empty)
+    first.merge(second)
+    assert first.file_count == 2
+    assert first.cumulative_size == 300
+    assert first.most_recent_mod == datetime(2020, 2, 1)
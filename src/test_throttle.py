@@ -0,0 +1,148 @@
+import asyncio
+import threading
+import time
+from throttle import AimdController, AdaptiveGate, ThreadGate, gated_pages
+
+
+def test_slow_start_up_to_max():
+    controller = AimdController(max_limit=8, initial_limit=1)
+    for limit in (2, 3, 4):
+        controller.on_success(0.01)
+        assert controller.limit == limit
+    for _ in range(20):
+        controller.on_success(0.01)
+    assert controller.limit == 8
+    assert controller.peak_limit == 8
+
+
+def test_throttle_cuts_once_per_round_trip(fake_clock):
+    controller = AimdController(max_limit=16, initial_limit=16, clock=fake_clock)
+    controller.on_success(0.5)
+
+    # A burst of throttles from requests in flight together is one signal
+    for _ in range(5):
+        controller.on_throttle()
+    assert controller.limit == 8
+    assert controller.throttled == 5
+
+    fake_clock.now += 1.0
+    controller.on_throttle()
+    assert controller.limit == 4
+
+    # Out of slow start, the limit now grows by about one per round of requests
+    for _ in range(5):
+        controller.on_success(0.5)
+    assert controller.limit == 5
+
+
+def test_min_limit(fake_clock):
+    controller = AimdController(max_limit=4, clock=fake_clock)
+    for _ in range(10):
+        fake_clock.now += 1
+        controller.on_throttle()
+    assert controller.limit == 1
+
+
+def test_slow_responses_hold_the_limit():
+    controller = AimdController(max_limit=32, initial_limit=4)
+    controller.on_success(0.01)
+    limit = controller.limit
+    for _ in range(10):
+        controller.on_success(1.0)
+    assert controller.limit <= limit + 1
+
+
+def test_gate_follows_limit():
+    controller = AimdController(max_limit=3, initial_limit=3)
+    in_flight = []
+    peak = []
+
+    async def request(gate):
+        async with gate:
+            in_flight.append(1)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.001)
+            in_flight.pop()
+
+    async def run():
+        gate = AdaptiveGate(controller)
+        await asyncio.gather(*(request(gate) for _ in range(12)))
+        controller.on_throttle()
+        controller.on_throttle()
+        peak.clear()
+        await asyncio.gather(*(request(gate) for _ in range(12)))
+
+    asyncio.run(run())
+    assert max(peak) == 1
+
+
+def test_gate_wakes_when_limit_rises():
+    controller = AimdController(max_limit=4, initial_limit=1)
+    entered = []
+
+    async def request(gate, name, release):
+        async with gate:
+            entered.append(name)
+            await release.wait()
+
+    async def run():
+        gate = AdaptiveGate(controller)
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(request(gate, name, release)) for name in 'ab']
+        await asyncio.sleep(0)
+        assert entered == ['a']
+        # The first request is still in flight, but the limit now has room for the second
+        await gate.on_success(0.01)
+        await asyncio.sleep(0)
+        assert entered == ['a', 'b']
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+
+def test_thread_gate_follows_limit():
+    controller = AimdController(max_limit=3, initial_limit=3)
+    gate = ThreadGate(controller)
+    lock = threading.Lock()
+    in_flight = []
+    peak = []
+
+    def request():
+        with gate:
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            time.sleep(0.001)
+            with lock:
+                in_flight.pop()
+
+    def run():
+        threads = [threading.Thread(target=request) for _ in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    run()
+    assert max(peak) <= 3
+    gate.on_throttle()
+    assert controller.limit == 1
+    peak.clear()
+    run()
+    assert max(peak) == 1
+
+
+def test_gated_pages_reports_each_page(fake_clock):
+    controller = AimdController(max_limit=8, initial_limit=2, clock=fake_clock)
+
+    def pages():
+        for retries in (0, 2, 0):
+            fake_clock.now += 0.1
+            yield {'ResponseMetadata': {'RetryAttempts': retries}}
+
+    listing = gated_pages(pages(), ThreadGate(controller), clock=fake_clock)
+    assert len(list(listing)) == 3
+    # Pages botocore had to retry count as throttled
+    assert (controller.requests, controller.throttled) == (3, 1)
+    assert controller.latency is not None
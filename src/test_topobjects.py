@@ -0,0 +1,106 @@
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from moto import mock_s3
+from access import explore_bucket
+from results import BucketInfo
+from shards import explore_bucket_sharded
+from topobjects import TopObjects
+from writers import JsonLinesResultWriter
+
+START = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def _files(count, seed=1):
+    rng = random.Random(seed)
+    return [dict(Key='file_{}'.format(n), Size=rng.randrange(50),
+                 LastModified=START + timedelta(days=rng.randrange(30)))
+            for n in range(count)]
+
+
+def _expected(files, limit):
+    largest = sorted(files, key=lambda x: (x['Size'], x['Key']), reverse=True)[:limit]
+    oldest = sorted(files, key=lambda x: (-x['LastModified'].timestamp(), x['Key']), reverse=True)[:limit]
+    return ([(x['Key'], x['Size'], x['LastModified']) for x in largest],
+            [(x['Key'], x['Size'], x['LastModified']) for x in oldest])
+
+
+def test_top_objects():
+    """
+    The largest and least recently modified files should be kept, whether
+    added a page or a file at a time.
+    """
+    files = _files(500)
+    top_objects = TopObjects(limit=7)
+    for n in range(0, len(files), 100):
+        top_objects.add_files(files[n:n + 100])
+
+    assert (top_objects.largest(), top_objects.oldest()) == _expected(files, 7)
+    assert top_objects.oldest()[0][2] == START
+    # Same again, one file at a time
+    one_by_one = TopObjects(limit=7)
+    for obj in files:
+        one_by_one.add_file(obj['Key'], obj['Size'], obj['LastModified'])
+    assert (one_by_one.largest(), one_by_one.oldest()) == _expected(files, 7)
+
+
+def test_merge():
+    """
+    Merging the top files of parts of a bucket should match those of the whole.
+    """
+    files = _files(500)
+    parts = [TopObjects(limit=5) for _ in range(3)]
+    for n, obj in enumerate(files):
+        parts[n % 3].add_files([obj])
+    merged = parts[0].empty_copy()
+    for part in parts:
+        merged.merge(part)
+    assert (merged.largest(), merged.oldest()) == _expected(files, 5)
+
+
+@mock_s3
+def test_explore_with_top_objects(s3_client, bucket_name, created_date):
+    """
+    Serial and sharded exploration should find the same top files.
+    """
+    s3_client.create_bucket(Bucket=bucket_name)
+    for n in range(40):
+        s3_client.put_object(Bucket=bucket_name, Key='dir_{}/file_{}'.format(n % 4, n), Body=b'x' * n)
+    s3_client.put_object(Bucket=bucket_name, Key='dir_0/', Body=b'')
+
+    results = []
+    for explore in (explore_bucket, explore_bucket_sharded):
+        my_info = BucketInfo(bucket_name, created_date)
+        my_info.top_objects = TopObjects(limit=3)
+        explore(my_info, s3_client)
+        results.append((my_info.top_objects.largest(), my_info.top_objects.oldest()))
+
+    assert results[0] == results[1]
+    largest, oldest = results[0]
+    assert [(x[0], x[1]) for x in largest] == [('dir_3/file_39', 39), ('dir_2/file_38', 38), ('dir_1/file_37', 37)]
+    assert len(oldest) == 3
+
+
+def test_top_objects_display(result_handler, mock_bucket_info):
+    """
+    The console should list the largest and least recently modified files.
+    """
+    mock_bucket_info.top_objects = TopObjects(limit=3)
+    mock_bucket_info.top_objects.add_file('new/big', 2 * 1024 ** 2, START + timedelta(days=1))
+    mock_bucket_info.top_objects.add_file('old/small', 1024 ** 2, START)
+    display = result_handler._console_display(mock_bucket_info)
+    assert '\n Largest files:\n  new/big (2.0 MB, 2020_01_02)\n  old/small (1.0 MB, 2020_01_01)' in display
+    assert '\n Least recently modified files:\n  old/small (1.0 MB, 2020_01_01)' in display
+
+
+def test_top_objects_jsonl(mock_bucket_info, tmp_path):
+    """
+    JSON Lines records should carry the top files in full.
+    """
+    mock_bucket_info.top_objects = TopObjects(limit=3)
+    mock_bucket_info.top_objects.add_file('a', 10, START)
+    writer = JsonLinesResultWriter(str(tmp_path / 'results.jsonl'))
+    record = json.loads(writer.format_record(mock_bucket_info))
+    writer.close()
+    entry = dict(key='a', size=10, last_modified='2020-01-01T00:00:00+00:00')
+    assert record['top_objects'] == dict(largest=[entry], oldest=[entry])
@@ -0,0 +1,97 @@
+import json
+from datetime import datetime, timezone
+from moto import mock_s3
+from access import explore_bucket, iter_marked_pages
+from results import BucketInfo
+from topobjects import TopObjects
+from versions import VERSION_MARKERS, VersionTotals, explore_bucket_versions
+from writers import JsonLinesResultWriter
+
+
+def _fill_versioned_bucket(s3_client, bucket_name):
+    s3_client.create_bucket(Bucket=bucket_name)
+    s3_client.put_bucket_versioning(Bucket=bucket_name, VersioningConfiguration=dict(Status='Enabled'))
+    # Three versions of "a", the current one 30 bytes
+    for n in range(1, 4):
+        s3_client.put_object(Bucket=bucket_name, Key='a', Body=b'x' * 10 * n)
+    s3_client.put_object(Bucket=bucket_name, Key='dir/', Body=b'')
+    # "b" deleted, leaving its only version noncurrent behind a delete marker
+    s3_client.put_object(Bucket=bucket_name, Key='b', Body=b'x' * 5)
+    s3_client.delete_object(Bucket=bucket_name, Key='b')
+    # An upload with two parts that was never completed
+    upload = s3_client.create_multipart_upload(Bucket=bucket_name, Key='big')
+    for part in (1, 2):
+        s3_client.upload_part(Bucket=bucket_name, Key='big', UploadId=upload['UploadId'],
+                              PartNumber=part, Body=b'x' * 5 * 1024 ** 2)
+
+
+@mock_s3
+def test_explore_bucket_versions(s3_client, bucket_name, created_date):
+    """
+    Current objects should be counted as explore_bucket counts them, with
+    noncurrent versions, delete markers and incomplete uploads kept apart.
+    """
+    _fill_versioned_bucket(s3_client, bucket_name)
+    my_info = BucketInfo(bucket_name, created_date)
+    my_info.top_objects = TopObjects(limit=2)
+    explore_bucket_versions(my_info, s3_client)
+
+    # Current objects are counted as explore_bucket counts them
+    current = explore_bucket(BucketInfo(bucket_name, created_date), s3_client)
+    assert (my_info.file_count, my_info.cumulative_size) == (current.file_count, current.cumulative_size) == (1, 30)
+    assert [x[0] for x in my_info.top_objects.largest()] == ['a']
+    versions = my_info.versions
+    assert (versions.noncurrent_count, versions.noncurrent_size) == (3, 35)
+    assert versions.delete_markers == 1
+    upload = s3_client.list_multipart_uploads(Bucket=bucket_name)['Uploads'][0]
+    parts = s3_client.list_parts(Bucket=bucket_name, Key='big', UploadId=upload['UploadId'])['Parts']
+    assert (versions.upload_count, versions.upload_size) == (1, sum(x['Size'] for x in parts))
+    assert versions.upload_size >= 10 * 1024 ** 2
+    assert versions.oldest_upload is not None
+
+
+@mock_s3
+def test_version_paging(s3_client, bucket_name, created_date):
+    """
+    Listing versions should follow the key and version id markers to the end.
+    """
+    _fill_versioned_bucket(s3_client, bucket_name)
+    pages = list(iter_marked_pages(s3_client.list_object_versions, VERSION_MARKERS, Bucket=bucket_name, MaxKeys=1))
+    assert len(pages) > 1
+    assert sum(len(x.get('Versions', ())) + len(x.get('DeleteMarkers', ())) for x in pages) == 6
+
+
+def test_merge_and_record(mock_bucket_info, tmp_path):
+    """
+    Merged version totals should add up, keep the oldest upload, and be
+    carried in full by JSON Lines records.
+    """
+    early, late = datetime(2020, 1, 1, tzinfo=timezone.utc), datetime(2020, 6, 1, tzinfo=timezone.utc)
+    totals = VersionTotals()
+    totals.add_upload(10, late)
+    other = totals.empty_copy()
+    other.noncurrent_count, other.noncurrent_size, other.delete_markers = 2, 20, 1
+    other.add_upload(5, early)
+    totals.merge(other)
+    assert (totals.upload_count, totals.upload_size, totals.oldest_upload) == (2, 15, early)
+
+    mock_bucket_info.versions = totals
+    writer = JsonLinesResultWriter(str(tmp_path / 'results.jsonl'))
+    record = json.loads(writer.format_record(mock_bucket_info))
+    writer.close()
+    assert record['versions'] == dict(noncurrent_count=2, noncurrent_size=20, delete_markers=1, upload_count=2,
+                                      upload_size=15, oldest_upload='2020-01-01T00:00:00+00:00')
+
+
+def test_versions_display(result_handler, mock_bucket_info):
+    """
+    The console should show what versions and uploads add to the bucket's size.
+    """
+    mock_bucket_info.add_totals(1, 1024 ** 2, datetime(2020, 9, 26))
+    mock_bucket_info.versions = VersionTotals()
+    mock_bucket_info.versions.noncurrent_count, mock_bucket_info.versions.noncurrent_size = 3, 2 * 1024 ** 2
+    mock_bucket_info.versions.add_upload(1024 ** 2, datetime(2020, 9, 27))
+    display = result_handler._console_display(mock_bucket_info)
+    assert ('\n Noncurrent versions: 3 (2.0 MB)\n Delete markers: 0'
+            '\n Incomplete multipart uploads: 1 (1.0 MB), oldest started 2020_09_27'
+            '\n Total stored: 4.0 MB') in display
@@ -0,0 +1,182 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from moto import mock_s3
+from access import explore_bucket
+from results import BucketInfo
+from topobjects import TopObjects
+from watch import RefreshScheduler, Watcher, serve_results
+
+
+def test_refresh_scheduler(fake_clock):
+    """
+    Unchanged buckets should be refreshed less and less often, changed
+    ones more often, and removed ones not at all.
+    """
+    scheduler = RefreshScheduler(min_interval=10, max_interval=80, clock=fake_clock)
+    scheduler.add('busy')
+    scheduler.add('quiet')
+    # New buckets are due straight away, and out of the schedule until done
+    assert scheduler.take_due() == ['busy', 'quiet']
+    assert scheduler.take_due() == []
+    assert scheduler.seconds_until_due() is None
+
+    # Unchanged buckets back off up to the longest interval, changed ones come back down
+    scheduler.done('busy', changed=False)
+    scheduler.done('quiet', changed=False)
+    assert scheduler.seconds_until_due() == 20
+    for _ in range(5):
+        fake_clock.now += scheduler.seconds_until_due()
+        for name in scheduler.take_due():
+            scheduler.done(name, changed=False)
+    assert scheduler.interval('quiet') == 80
+    fake_clock.now += scheduler.seconds_until_due()
+    for name in scheduler.take_due():
+        scheduler.done(name, changed=(name == 'busy'))
+    assert (scheduler.interval('busy'), scheduler.interval('quiet')) == (40, 80)
+    fake_clock.now += 40
+    assert scheduler.take_due() == ['busy']
+    scheduler.done('busy', changed=True)
+    assert scheduler.interval('busy') == 20
+
+    # Removed buckets are never handed out again
+    scheduler.remove('quiet')
+    fake_clock.now += 1000
+    assert scheduler.take_due() == ['busy']
+    assert scheduler.names() == {'busy'}
+
+
+@mock_s3
+def test_watcher(s3_client, created_date, fake_clock):
+    """
+    The watcher should refresh buckets as they come due, sooner when they
+    have changed, and drop deleted buckets at the next check of the list.
+    """
+    for name in ('bucket-one', 'bucket-two'):
+        s3_client.create_bucket(Bucket=name)
+        s3_client.put_object(Bucket=name, Key='file', Body=b'x' * 10)
+    buckets = ['bucket-one', 'bucket-two']
+    reported = []
+
+    def set_up(my_info):
+        my_info.top_objects = TopObjects(limit=2)
+
+    watcher = Watcher(lambda: [BucketInfo(x, created_date) for x in buckets], explore_bucket, s3_client,
+                      RefreshScheduler(min_interval=10, max_interval=100, clock=fake_clock), workers=2,
+                      set_up=set_up, on_result=lambda x: reported.append(x.name),
+                      bucket_list_interval=50, clock=fake_clock)
+    for future in watcher.step():
+        future.result()
+    assert sorted(reported) == buckets
+    assert watcher.results['bucket-one'].file_count == 1
+
+    # Only the bucket that changed is refreshed sooner
+    s3_client.put_object(Bucket='bucket-one', Key='new_file', Body=b'x' * 5)
+    fake_clock.now += 20
+    for future in watcher.step():
+        future.result()
+    assert watcher.results['bucket-one'].cumulative_size == 15
+    assert watcher._scheduler.interval('bucket-one') == 10
+    assert watcher._scheduler.interval('bucket-two') == 40
+
+    # Deleted buckets are dropped when the bucket list is next checked
+    buckets.remove('bucket-two')
+    fake_clock.now += 50
+    for future in watcher.step():
+        future.result()
+    records = watcher.snapshot()
+    assert [x['name'] for x in records] == ['bucket-one']
+    assert records[0]['watch']['refreshes'] == 3
+    assert records[0]['top_objects']['largest'][0]['key'] == 'file'
+    watcher.run(_set_event())
+
+
+@mock_s3
+def test_watcher_keeps_last_result_on_error(s3_client, created_date, fake_clock):
+    """
+    A bucket that can no longer be explored should keep its last result,
+    with the error alongside it.
+    """
+    s3_client.create_bucket(Bucket='bucket-one')
+    fail = [False]
+
+    def explore(my_info, client):
+        if fail[0]:
+            raise RuntimeError('Access Denied')
+        return explore_bucket(my_info, client)
+
+    watcher = Watcher(lambda: [BucketInfo('bucket-one', created_date)], explore, s3_client,
+                      RefreshScheduler(min_interval=10, max_interval=100, clock=fake_clock), clock=fake_clock)
+    watcher.step()[0].result()
+    fail[0] = True
+    fake_clock.now += 20
+    watcher.step()[0].result()
+    record = watcher.snapshot()[0]
+    assert record['file_count'] == 0
+    assert (record['watch']['error'], record['watch']['interval']) == ('Access Denied', 40)
+    watcher.run(_set_event())
+
+
+@mock_s3
+def test_watcher_survives_bucket_list_error(s3_client, created_date, caplog, fake_clock):
+    """
+    A failed check of the bucket list should be logged, and the buckets
+    already known carried on with, rather than the daemon stopping.
+    """
+    s3_client.create_bucket(Bucket='bucket-one')
+    calls = []
+
+    def list_buckets():
+        calls.append(fake_clock.now)
+        if len(calls) == 2:
+            raise ConnectionError('Network is unreachable')
+        return [BucketInfo('bucket-one', created_date)]
+
+    watcher = Watcher(list_buckets, explore_bucket, s3_client,
+                      RefreshScheduler(min_interval=10, max_interval=100, clock=fake_clock),
+                      bucket_list_interval=50, clock=fake_clock)
+    watcher.step()[0].result()
+    fake_clock.now += 50
+    for future in watcher.step():
+        future.result()
+    assert 'Network is unreachable' in caplog.text
+    assert [x['name'] for x in watcher.snapshot()] == ['bucket-one']
+    # Not checked again until the next interval, when it works again
+    fake_clock.now += 20
+    watcher.step()
+    assert len(calls) == 2
+    fake_clock.now += 30
+    watcher.step()
+    assert len(calls) == 3
+    watcher.run(_set_event())
+
+
+def _set_event():
+    event = threading.Event()
+    event.set()
+    return event
+
+
+def test_serve_results(mock_bucket_info):
+    """
+    The latest results should be served as JSON, all together or by bucket.
+    """
+    class FakeWatcher:
+        def snapshot(self):
+            return [dict(name=mock_bucket_info.name, file_count=3)]
+
+    server = serve_results(FakeWatcher(), port=0)
+    try:
+        url = 'http://{}:{}'.format(*server.server_address[:2])
+        with urllib.request.urlopen(url + '/buckets') as response:
+            assert json.load(response) == dict(buckets=[dict(name='BUCKET1', file_count=3)])
+        with urllib.request.urlopen(url + '/buckets/BUCKET1') as response:
+            assert json.load(response)['file_count'] == 3
+        try:
+            urllib.request.urlopen(url + '/buckets/missing')
+            assert False, 'Expected a 404'
+        except urllib.error.HTTPError as error:
+            assert error.code == 404
+    finally:
+        server.shutdown()
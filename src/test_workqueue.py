@@ -0,0 +1,131 @@
+import pytest
+import threading
+from moto import mock_s3
+from access import explore_bucket
+from breakdown import Breakdown
+from results import BucketInfo
+from shards import Shard, explore_shard
+from topobjects import TopObjects
+from workqueue import ShardScanError, WorkQueue, coordinate, work
+
+
+def _with_details(bucket_info):
+    bucket_info.breakdown = Breakdown(depth=2)
+    bucket_info.top_objects = TopObjects(limit=3)
+    return bucket_info
+
+
+@mock_s3
+def test_workers_merge_exactly(s3_client, bucket_name, created_date, tmp_path):
+    """
+    Shards explored by workers through the queue should merge into
+    exactly the serial totals and details.
+    """
+    s3_client.create_bucket(Bucket=bucket_name)
+    for n in range(30):
+        s3_client.put_object(Bucket=bucket_name, Key='{}/{}/{:02d}'.format('abc'[n % 3], n % 4, n), Body=b'x' * n)
+    s3_client.put_object(Bucket=bucket_name, Key='top', Body=b'y')
+    original = s3_client.list_objects_v2
+
+    def list_small_pages(**params):
+        return original(MaxKeys=2, **params)
+
+    s3_client.list_objects_v2 = list_small_pages
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    scan_id = queue.start_scan([_with_details(BucketInfo(bucket_name, created_date))])
+
+    # Splitting after every page, so the bucket is spread over many shards
+    explored = work(queue, lambda x, y: explore_shard(x, s3_client, y, split_after_pages=1), threads=3,
+                    poll_interval=0.01)
+    assert explored > 4
+    (name, merged, error), = queue.finished_buckets(scan_id, {bucket_name})
+    assert (name, error) == (bucket_name, None)
+    expected = explore_bucket(_with_details(BucketInfo(bucket_name, created_date)), s3_client)
+    assert (merged.file_count, merged.cumulative_size) == (31, sum(range(30)) + 1)
+    assert (merged.file_count, merged.cumulative_size, merged.most_recent_mod) == \
+        (expected.file_count, expected.cumulative_size, expected.most_recent_mod)
+    assert merged.breakdown.as_dict() == expected.breakdown.as_dict()
+    assert merged.top_objects.as_dict() == expected.top_objects.as_dict()
+
+
+def test_expired_lease_reissued(mock_bucket_info, tmp_path, fake_clock):
+    """
+    A shard whose lease ran out should go to the next worker, and only
+    that worker's results be taken.
+    """
+    queue = WorkQueue(str(tmp_path / 'queue.db'), lease_seconds=30, clock=fake_clock)
+    scan_id = queue.start_scan([mock_bucket_info])
+    task = queue.claim('crashed')
+    assert (task.bucket_info.name, task.shard.prefix, task.shard.discover) == (mock_bucket_info.name, '', True)
+    assert queue.claim('other') is None
+
+    # Renewing keeps the lease going...
+    fake_clock.now += 20
+    queue.renew('crashed')
+    fake_clock.now += 20
+    assert queue.claim('other') is None
+    # ...and once it runs out, the shard goes to the next worker to ask
+    fake_clock.now += 11
+    retry = queue.claim('other')
+    assert retry.task_id == task.task_id
+
+    partial = mock_bucket_info.empty_copy()
+    partial.file_count, partial.cumulative_size = 5, 50
+    # The first worker lost its lease, so its results (and shards) are not taken...
+    assert not queue.complete(task, 'crashed', partial, [Shard('lost/', discover=False)])
+    assert queue.unfinished() == 1
+    # ...and the shard is only counted once
+    assert queue.complete(retry, 'other', partial, [Shard('more/', discover=False)])
+    assert queue.finished_buckets(scan_id, {mock_bucket_info.name}) == []
+    child = queue.claim('other')
+    assert (child.shard.prefix, child.shard.discover) == ('more/', False)
+    assert queue.complete(child, 'other', partial, [])
+
+    (_, merged, _), = queue.finished_buckets(scan_id, {mock_bucket_info.name})
+    assert (merged.file_count, merged.cumulative_size) == (10, 100)
+
+
+def test_lease_runs_out_too_often(mock_bucket_info, tmp_path, fake_clock):
+    """
+    A shard whose lease runs out max_attempts times should be given up
+    on, and its bucket reported as failed.
+    """
+    queue = WorkQueue(str(tmp_path / 'queue.db'), lease_seconds=30, max_attempts=2, clock=fake_clock)
+    scan_id = queue.start_scan([mock_bucket_info])
+    assert queue.claim('crashed') is not None
+    fake_clock.now += 31
+    assert queue.claim('crashed again') is not None
+    # A shard that takes its workers down every time is given up on, not handed out for good
+    fake_clock.now += 31
+    assert queue.claim('other') is None
+    assert queue.unfinished() == 0
+    (name, merged, error), = queue.finished_buckets(scan_id, {mock_bucket_info.name})
+    assert (name, merged, error) == (mock_bucket_info.name, None, 'Lease ran out 2 times')
+
+
+def test_failing_shard(mock_bucket_info, tmp_path):
+    """
+    A bucket with a shard that keeps failing should be left out of the
+    results, and reported in ShardScanError.
+    """
+    queue = WorkQueue(str(tmp_path / 'queue.db'), max_attempts=2)
+    other = BucketInfo('BUCKET2', mock_bucket_info.created)
+
+    def explore(bucket_info, shard):
+        if bucket_info.name == mock_bucket_info.name:
+            raise RuntimeError('denied')
+        partial = bucket_info.empty_copy()
+        partial.file_count = 1
+        return partial, []
+
+    # The worker waits for the coordinator to queue the buckets
+    worker = threading.Thread(target=work, args=(queue, explore), kwargs=dict(poll_interval=0.01))
+    worker.start()
+    reported = []
+    with pytest.raises(ShardScanError) as error:
+        coordinate(queue, [mock_bucket_info, other], reported.append, poll_interval=0.01)
+    worker.join()
+    # The bucket that could not be explored is left out, rather than reported short
+    assert [(x.name, x.file_count) for x in reported] == [('BUCKET2', 1)]
+    assert error.value.failures == {mock_bucket_info.name: 'RuntimeError: denied'}
+    assert queue.unfinished() == 0
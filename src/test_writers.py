@@ -0,0 +1,168 @@
+import csv
+import json
+import os
+import pytest
+from datetime import datetime, timezone
+from results import BucketInfo, ResultHandler, SizeFormat
+from writers import CsvResultWriter, JsonLinesResultWriter, FsyncPolicy
+
+
+@pytest.fixture
+def filled_bucket_info(mock_bucket_info):
+    mock_bucket_info.add_file(1024, datetime(2020, 9, 26, 13, 1, 20, tzinfo=timezone.utc))
+    return mock_bucket_info
+
+
+@pytest.mark.parametrize("fsync_policy", list(FsyncPolicy))
+def test_csv_writer(filled_bucket_info, mock_bucket_info, tmp_path, fsync_policy):
+    """
+    Records are appended under a single header, in the same layout the pandas
+    written logs used, and reopening the file carries on where it left off.
+    """
+    path = str(tmp_path / 'results.csv')
+    writer = CsvResultWriter(path, fsync_policy)
+    writer.write(filled_bucket_info)
+    writer.close()
+
+    writer = CsvResultWriter(path, fsync_policy)
+    writer.write(filled_bucket_info)
+    writer.close()
+
+    with open(path) as fp:
+        lines = fp.read().splitlines()
+    assert lines[0] == 'name,created,file_count,cumulative_size,most_recent_mod,estimate'
+    assert lines[1] == 'BUCKET1,2020-09-25 00:00:00,1,1024,2020-09-26 13:01:20+00:00,'
+    assert lines[2] == lines[1]
+    assert len(lines) == 3
+
+
+def test_csv_writer_empty_bucket(bucket_name, created_date, tmp_path):
+    """
+    A bucket without files has no last modified date, which is written as an empty value.
+    """
+    path = str(tmp_path / 'results.csv')
+    writer = CsvResultWriter(path)
+    writer.write(BucketInfo('with,comma', created_date))
+    writer.close()
+
+    with open(path) as fp:
+        rows = list(csv.reader(fp))
+    assert rows[1] == ['with,comma', '2020-09-25 00:00:00', '0', '0', '', '']
+
+
+def test_csv_writer_estimate(filled_bucket_info, tmp_path):
+    """
+    Estimated buckets name the method their numbers came from, so they can be told apart from counts.
+    """
+    from estimate import Estimate
+    filled_bucket_info.estimate = Estimate('sampling', confidence=0.95, samples=10)
+    path = str(tmp_path / 'results.csv')
+    writer = CsvResultWriter(path)
+    writer.write(filled_bucket_info)
+    writer.close()
+
+    with open(path) as fp:
+        rows = list(csv.reader(fp))
+    assert rows[1][-1] == 'sampling'
+
+
+def test_jsonl_writer(filled_bucket_info, tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    writer = JsonLinesResultWriter(path)
+    writer.write(filled_bucket_info)
+    writer.close()
+
+    with open(path) as fp:
+        records = [json.loads(x) for x in fp]
+    assert records == [dict(name='BUCKET1',
+                            created='2020-09-25T00:00:00',
+                            file_count=1,
+                            cumulative_size=1024,
+                            most_recent_mod='2020-09-26T13:01:20+00:00')]
+
+
+def test_jsonl_writer_changes(filled_bucket_info, tmp_path):
+    """
+    Indexed buckets carry their changes since the last run along with them.
+    """
+    from index import IndexDiff
+    filled_bucket_info.changes = IndexDiff()
+    filled_bucket_info.changes.added = 3
+    path = str(tmp_path / 'results.jsonl')
+    writer = JsonLinesResultWriter(path)
+    writer.write(filled_bucket_info)
+    writer.close()
+
+    with open(path) as fp:
+        record = json.loads(fp.readline())
+    assert record['changes']['added'] == 3
+    assert record['changes']['first_run'] is False
+
+
+def test_partial_line_is_dropped(filled_bucket_info, tmp_path):
+    """
+    A crash part way through a record should not leave a half written row
+    in front of the records written after it.
+    """
+    path = str(tmp_path / 'results.jsonl')
+    writer = JsonLinesResultWriter(path)
+    writer.write(filled_bucket_info)
+    writer.close()
+    with open(path, 'a') as fp:
+        fp.write('{"name": "BUCK')
+
+    writer = JsonLinesResultWriter(path)
+    writer.write(filled_bucket_info)
+    writer.close()
+    with open(path) as fp:
+        records = [json.loads(x) for x in fp]
+    assert len(records) == 2
+
+    # Nothing but a partial line at all
+    with open(path, 'w') as fp:
+        fp.write('name,crea')
+    writer = CsvResultWriter(path)
+    writer.close()
+    with open(path) as fp:
+        assert fp.read() == 'name,created,file_count,cumulative_size,most_recent_mod,estimate\n'
+
+
+def test_result_handler_writes_log(filled_bucket_info, profile_name):
+    """
+    ResultHandler should stream each result into a log file in the chosen format.
+    """
+    handler = ResultHandler(date_display_format='%Y_%m_%d',
+                            size_display_format=SizeFormat.MB,
+                            profile_name=profile_name,
+                            output_format='jsonl')
+    handler.update_results(filled_bucket_info)
+    handler.update_results(filled_bucket_info)
+    handler.close()
+
+    path = handler._logfile_location()
+    assert path.endswith('.jsonl')
+    with open(path) as fp:
+        assert len(fp.readlines()) == 2
+    os.remove(path)
+
+
+def test_result_handler_logs_by_profile(filled_bucket_info, profile_name):
+    """
+    Results of other profiles should go to log files of their own.
+    """
+    handler = ResultHandler(date_display_format='%Y_%m_%d',
+                            size_display_format=SizeFormat.MB,
+                            profile_name=profile_name,
+                            output_format='jsonl')
+    handler.update_results(filled_bucket_info, profile_name='other_profile')
+    handler.update_results(filled_bucket_info, profile_name='other_profile')
+    handler.update_results(filled_bucket_info)
+    handler.close()
+
+    for name, expected in ((profile_name, 1), ('other_profile', 2)):
+        path = handler._logfile_location(name)
+        assert os.path.basename(os.path.dirname(path)) == name
+        with open(path) as fp:
+            assert len(fp.readlines()) == expected
+        os.remove(path)
+    os.rmdir(os.path.dirname(handler._logfile_location('other_profile')))
@@ -0,0 +1,235 @@
+import asyncio
+import threading
+import time
+
+DEFAULT_INITIAL_LIMIT = 2
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_DECREASE_FACTOR = 0.5
+DEFAULT_LATENCY_TOLERANCE = 2.0
+
+# Weight of each new latency sample in the running average
+LATENCY_SMOOTHING = 0.2
+# How far the best latency seen may creep up per request, so that one
+# unusually quick response does not hold the limit down for good
+BASELINE_DRIFT = 1.01
+
+
+class AimdController:
+    """
+    Works out how many requests to keep in flight against one bucket, in
+    the same way TCP works out a congestion window: additive increase,
+    multiplicative decrease.
+
+    Every successful request raises the limit a little (by one per round
+    of 'limit' requests), provided latency is holding up; throttling cuts
+    it by a fixed factor. Until the first throttle the limit grows twice as
+    fast ("slow start"), so a healthy bucket reaches full speed quickly.
+    Throttles from requests that were all in flight together are one signal,
+    so the limit is only cut once per round trip.
+    """
+    def __init__(self,
+                 max_limit: int,
+                 min_limit: int = DEFAULT_MIN_LIMIT,
+                 initial_limit: int = DEFAULT_INITIAL_LIMIT,
+                 decrease_factor: float = DEFAULT_DECREASE_FACTOR,
+                 latency_tolerance: float = DEFAULT_LATENCY_TOLERANCE,
+                 clock=time.monotonic):
+        """
+        :param max_limit: The limit never goes above this.
+        :type max_limit: int
+        :param min_limit: The limit never goes below this.
+        :type min_limit: int
+        :param initial_limit: Where the limit starts.
+        :type initial_limit: int
+        :param decrease_factor: What the limit is multiplied by on throttling.
+        :type decrease_factor: float
+        :param latency_tolerance: Stop raising the limit once the average latency
+        is this many times the best seen.
+        :type latency_tolerance: float
+        :param clock: Source of time in seconds, for tests.
+        :type clock: function
+        """
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self._limit = float(max(self.min_limit, min(initial_limit, max_limit)))
+        self._decrease_factor = decrease_factor
+        self._latency_tolerance = latency_tolerance
+        self._clock = clock
+
+        self.peak_limit = self.limit
+        self.requests = 0
+        self.throttled = 0
+        self._slow_start = True
+        self._latency = None
+        self._baseline = None
+        self._last_decrease = None
+
+    @property
+    def limit(self):
+        """
+        :return: Requests that may currently be in flight.
+        :rtype: int
+        """
+        return int(self._limit)
+
+    @property
+    def latency(self):
+        """
+        :return: Smoothed request latency in seconds (None before the first request).
+        :rtype: float or None
+        """
+        return self._latency
+
+    def on_success(self, latency: float):
+        """
+        :param latency: How long the request took, in seconds.
+        :type latency: float
+        """
+        self.requests += 1
+        if self._latency is None:
+            self._latency = self._baseline = latency
+        else:
+            self._latency += LATENCY_SMOOTHING * (latency - self._latency)
+            self._baseline = min(self._baseline * BASELINE_DRIFT, latency)
+
+        if self._latency > self._baseline * self._latency_tolerance:
+            return
+        step = 1.0 if self._slow_start else 1.0 / self._limit
+        self._limit = min(float(self.max_limit), self._limit + step)
+        self.peak_limit = max(self.peak_limit, self.limit)
+
+    def on_throttle(self):
+        """
+        Called when a request was turned away with SlowDown, a 503,
+        or any other sign the bucket is being pushed too hard.
+        """
+        self.requests += 1
+        self.throttled += 1
+        self._slow_start = False
+        now = self._clock()
+        if (self._last_decrease is not None) and (now - self._last_decrease < (self._latency or 0)):
+            return
+        self._limit = max(float(self.min_limit), self._limit * self._decrease_factor)
+        self._last_decrease = now
+
+    def __str__(self):
+        return 'limit {} of {} (peak {}), {} of {} requests throttled'.format(
+            self.limit, self.max_limit, self.peak_limit, self.throttled, self.requests)
+
+
+class AdaptiveGate:
+    """
+    An asyncio semaphore whose size follows an AimdController. Requests
+    already in flight are never cut short when the limit drops; new ones
+    simply wait until enough of them have finished.
+    """
+    def __init__(self, controller: AimdController):
+        """
+        :param controller: Decides how many requests may pass at once.
+        :type controller: AimdController
+        """
+        self.controller = controller
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.controller.limit)
+            self._in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self._in_flight -= 1
+            # The limit may have moved either way, so let everyone re-check
+            self._condition.notify_all()
+
+    async def on_success(self, latency: float):
+        """
+        Passes a successful request on to the controller, letting in
+        anyone the raised limit now makes room for.
+
+        :param latency: How long the request took, in seconds.
+        :type latency: float
+        """
+        async with self._condition:
+            self.controller.on_success(latency)
+            self._condition.notify_all()
+
+    async def on_throttle(self):
+        """
+        Passes a throttled request on to the controller.
+        """
+        async with self._condition:
+            self.controller.on_throttle()
+
+
+class ThreadGate:
+    """
+    The threaded counterpart of AdaptiveGate, for requests made from
+    a pool of worker threads rather than an event loop.
+    """
+    def __init__(self, controller: AimdController):
+        """
+        :param controller: Decides how many requests may pass at once.
+        :type controller: AimdController
+        """
+        self.controller = controller
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self._in_flight < self.controller.limit)
+            self._in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self, latency: float):
+        """
+        :param latency: How long the request took, in seconds.
+        :type latency: float
+        """
+        with self._condition:
+            self.controller.on_success(latency)
+            self._condition.notify_all()
+
+    def on_throttle(self):
+        """
+        Passes a throttled request on to the controller.
+        """
+        with self._condition:
+            self.controller.on_throttle()
+
+
+def gated_pages(pages, gate: ThreadGate, clock=time.monotonic):
+    """
+    Fetches each page of a listing through a ThreadGate, telling its
+    controller how the request went. Botocore retries throttled requests
+    itself, so a page that needed any retries counts as throttled.
+
+    :param pages: Pages of a listing, fetched as they are asked for (see iter_pages).
+    :type pages: generator of dict
+    :param gate: Limits how many pages are being fetched at once.
+    :type gate: ThreadGate
+    :param clock: Source of time in seconds, for tests.
+    :type clock: function
+    :return: Yields each response page.
+    :rtype: generator of dict
+    """
+    while True:
+        with gate:
+            started = clock()
+            resp = next(pages, None)
+            latency = clock() - started
+        if resp is None:
+            return
+        if resp.get('ResponseMetadata', {}).get('RetryAttempts', 0):
+            gate.on_throttle()
+        else:
+            gate.on_success(latency)
+        yield resp
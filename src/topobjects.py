@@ -0,0 +1,137 @@
+import heapq
+from datetime import datetime
+
+KEY = 'Key'
+SIZE = 'Size'
+LAST_MODIFIED = 'LastModified'
+
+DEFAULT_TOP_OBJECTS = 100
+
+
+class TopObjects:
+    """
+    Keeps the largest, and the least recently modified, files of a bucket
+    as it is listed: two heaps of at most 'limit' entries each, so adding a
+    file costs O(log limit) at worst and memory stays O(limit) however big
+    the bucket. Most files are turned away by a single comparison with
+    the smallest entry kept.
+
+    Ties are broken by key, so the files kept are the same whatever order
+    they are added in, and TopObjects of different parts of a bucket merge
+    into exactly what a single pass would have kept.
+    """
+    __slots__ = ('limit', '_largest', '_oldest')
+
+    def __init__(self, limit: int = DEFAULT_TOP_OBJECTS):
+        """
+        :param limit: How many files to keep of each kind.
+        :type limit: int
+        """
+        self.limit = limit
+        # Min heaps, so the entry to drop next is always on top:
+        # (size, key, last modified) for the largest files, and
+        # (-timestamp, key, last modified, size) for the oldest.
+        self._largest = []
+        self._oldest = []
+
+    def empty_copy(self):
+        """
+        :return: A TopObjects keeping as many files, with nothing in it yet.
+        :rtype: TopObjects
+        """
+        return TopObjects(self.limit)
+
+    def add_file(self, key: str, size: int, last_modified):
+        """
+        :param key: The file's key.
+        :type key: str
+        :param size: The file's size.
+        :type size: int
+        :param last_modified: When the file was last modified.
+        :type last_modified: datetime
+        """
+        self._push(self._largest, (size, key, last_modified))
+        self._push(self._oldest, (-last_modified.timestamp(), key, last_modified, size))
+
+    def add_files(self, files):
+        """
+        :param files: 'Contents' entries of a list_objects_v2 page, placeholders already left out.
+        :type files: list of dict
+        """
+        largest, oldest, push = self._largest, self._oldest, self._push
+        for obj in files:
+            size, last_modified = obj[SIZE], obj[LAST_MODIFIED]
+            # Checked here first, as nearly every file falls short of both
+            if (len(largest) < self.limit) or (size >= largest[0][0]):
+                push(largest, (size, obj[KEY], last_modified))
+            stamp = -last_modified.timestamp()
+            if (len(oldest) < self.limit) or (stamp >= oldest[0][0]):
+                push(oldest, (stamp, obj[KEY], last_modified, size))
+
+    def merge(self, other):
+        """
+        Folds in the files kept by another TopObjects, for example
+        of a single shard of the same bucket.
+
+        :param other: Partial results to fold into these.
+        :type other: TopObjects
+        """
+        for entry in other._largest:
+            self._push(self._largest, entry)
+        for entry in other._oldest:
+            self._push(self._oldest, entry)
+
+    def largest(self):
+        """
+        :return: The largest files, biggest first.
+        :rtype: list of tuple(str, int, datetime)
+        """
+        return [(key, size, last_modified)
+                for size, key, last_modified in sorted(self._largest, reverse=True)]
+
+    def oldest(self):
+        """
+        :return: The least recently modified files, oldest first.
+        :rtype: list of tuple(str, int, datetime)
+        """
+        return [(key, size, last_modified)
+                for _, key, last_modified, size in sorted(self._oldest, reverse=True)]
+
+    def as_dict(self):
+        """
+        :return: Both lists as plain values, for logging.
+        :rtype: dict
+        """
+        return {name: [dict(key=key, size=size, last_modified=last_modified.isoformat())
+                       for key, size, last_modified in files]
+                for name, files in (('largest', self.largest()), ('oldest', self.oldest()))}
+
+    def as_state(self):
+        """
+        :return: Everything needed to carry on with the lists, as plain values ready for JSON.
+        :rtype: dict
+        """
+        # A file can be in both lists, but is only kept once
+        files = {key: (size, last_modified) for key, size, last_modified in self.largest() + self.oldest()}
+        return dict(limit=self.limit,
+                    files=[[key, size, last_modified.isoformat()] for key, (size, last_modified) in files.items()])
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        :param state: As returned by as_state.
+        :type state: dict
+        :return: The lists as they were.
+        :rtype: TopObjects
+        """
+        top_objects = cls(state['limit'])
+        # Both lists' files go into both heaps: each keeps its own best 'limit' of them, as before
+        for key, size, last_modified in state['files']:
+            top_objects.add_file(key, size, datetime.fromisoformat(last_modified))
+        return top_objects
+
+    def _push(self, heap, entry):
+        if len(heap) < self.limit:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
@@ -0,0 +1,167 @@
+from access import CONTENTS, SIZE, add_page, iter_marked_pages
+from datetime import datetime
+from operator import itemgetter
+
+VERSIONS = 'Versions'
+DELETE_MARKERS = 'DeleteMarkers'
+IS_LATEST = 'IsLatest'
+UPLOADS = 'Uploads'
+PARTS = 'Parts'
+INITIATED = 'Initiated'
+VERSION_MARKERS = (('NextKeyMarker', 'KeyMarker'), ('NextVersionIdMarker', 'VersionIdMarker'))
+UPLOAD_MARKERS = (('NextKeyMarker', 'KeyMarker'), ('NextUploadIdMarker', 'UploadIdMarker'))
+PART_MARKERS = (('NextPartNumberMarker', 'PartNumberMarker'),)
+
+_get_size = itemgetter(SIZE)
+_get_is_latest = itemgetter(IS_LATEST)
+
+
+class VersionTotals:
+    """
+    What a bucket holds besides its current objects, and is billed for all
+    the same: noncurrent versions, delete markers and the parts of multipart
+    uploads that were never completed (nor aborted). Only running totals are
+    kept, so memory stays the same however long a bucket's history.
+    """
+    __slots__ = ('noncurrent_count', 'noncurrent_size', 'delete_markers',
+                 'upload_count', 'upload_size', 'oldest_upload')
+
+    def __init__(self):
+        self.noncurrent_count = 0
+        self.noncurrent_size = 0
+        self.delete_markers = 0
+        self.upload_count = 0
+        self.upload_size = 0
+        # When the longest outstanding upload was started
+        self.oldest_upload = None
+
+    def empty_copy(self):
+        """
+        :return: A VersionTotals with nothing counted yet.
+        :rtype: VersionTotals
+        """
+        return VersionTotals()
+
+    def add_upload(self, size: int, initiated):
+        """
+        :param size: Total size of the parts uploaded so far.
+        :type size: int
+        :param initiated: When the upload was started.
+        :type initiated: datetime
+        """
+        self.upload_count += 1
+        self.upload_size += size
+        if (self.oldest_upload is None) or (initiated < self.oldest_upload):
+            self.oldest_upload = initiated
+
+    def merge(self, other):
+        """
+        :param other: Totals for another part of the same bucket.
+        :type other: VersionTotals
+        """
+        self.noncurrent_count += other.noncurrent_count
+        self.noncurrent_size += other.noncurrent_size
+        self.delete_markers += other.delete_markers
+        self.upload_count += other.upload_count
+        self.upload_size += other.upload_size
+        if (other.oldest_upload is not None) and \
+                ((self.oldest_upload is None) or (other.oldest_upload < self.oldest_upload)):
+            self.oldest_upload = other.oldest_upload
+
+    def as_dict(self):
+        """
+        :return: The totals as plain values, ready for JSON.
+        :rtype: dict
+        """
+        return dict(noncurrent_count=self.noncurrent_count,
+                    noncurrent_size=self.noncurrent_size,
+                    delete_markers=self.delete_markers,
+                    upload_count=self.upload_count,
+                    upload_size=self.upload_size,
+                    oldest_upload=None if self.oldest_upload is None else self.oldest_upload.isoformat())
+
+    def as_state(self):
+        """
+        :return: The totals as plain values ready for JSON, to carry on with later.
+        :rtype: dict
+        """
+        return self.as_dict()
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        :param state: As returned by as_state.
+        :type state: dict
+        :return: The totals as they were.
+        :rtype: VersionTotals
+        """
+        totals = cls()
+        for name in cls.__slots__:
+            setattr(totals, name, state[name])
+        if totals.oldest_upload is not None:
+            totals.oldest_upload = datetime.fromisoformat(totals.oldest_upload)
+        return totals
+
+
+def add_versions_page(my_info, resp):
+    """
+    Tallies a single list_object_versions response page. Current versions
+    go through add_page, exactly as if they had come from list_objects_v2;
+    everything else into the bucket's VersionTotals.
+
+    :param my_info: BucketInfo collecting the running totals, with its versions set.
+    :type my_info: BucketInfo
+    :param resp: A list_object_versions response page.
+    :type resp: dict
+    """
+    versions = resp.get(VERSIONS)
+    if versions:
+        current = list(filter(_get_is_latest, versions))
+        add_page(my_info, {CONTENTS: current})
+        if len(current) < len(versions):
+            my_info.versions.noncurrent_count += len(versions) - len(current)
+            my_info.versions.noncurrent_size += sum(map(_get_size, versions)) - sum(map(_get_size, current))
+    if resp.get(DELETE_MARKERS):
+        my_info.versions.delete_markers += len(resp[DELETE_MARKERS])
+
+
+def add_uploads(my_info, s3_client):
+    """
+    Finds the bucket's incomplete multipart uploads, and adds up the parts
+    each has uploaded so far.
+
+    :param my_info: BucketInfo collecting the running totals, with its versions set.
+    :type my_info: BucketInfo
+    :param s3_client: The client that will be used to gain access to AWS.
+    :type s3_client: boto3.s3.client
+    """
+    for resp in iter_marked_pages(s3_client.list_multipart_uploads, UPLOAD_MARKERS, Bucket=my_info.name):
+        for upload in resp.get(UPLOADS, ()):
+            size = 0
+            for parts in iter_marked_pages(s3_client.list_parts, PART_MARKERS, Bucket=my_info.name,
+                                           Key=upload['Key'], UploadId=upload['UploadId']):
+                size += sum(map(_get_size, parts.get(PARTS, ())))
+            my_info.versions.add_upload(size, upload[INITIATED])
+
+
+def explore_bucket_versions(my_info, s3_client):
+    """
+    Explores a bucket the same way as explore_bucket, but through
+    list_object_versions, so that noncurrent versions and delete markers
+    are counted too, and then looks for incomplete multipart uploads.
+    Current objects are counted exactly as explore_bucket would (on a
+    bucket that was never versioned, every version is current).
+
+    :param my_info: An initiated BucketInfo object not yet containing detailed file info.
+    :type my_info: BucketInfo
+    :param s3_client: The client that will be used to gain access to AWS.
+    :type s3_client: boto3.s3.client
+    :return: Returns the BucketInfo data structure now filled in with results
+    :rtype: BucketInfo
+    """
+    if my_info.versions is None:
+        my_info.versions = VersionTotals()
+    for resp in iter_marked_pages(s3_client.list_object_versions, VERSION_MARKERS, Bucket=my_info.name):
+        add_versions_page(my_info, resp)
+    add_uploads(my_info, s3_client)
+    return my_info
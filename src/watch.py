@@ -0,0 +1,358 @@
+import heapq
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from defaults import DEFAULT_WATCH_HOST, DEFAULT_WATCH_PORT, DEFAULT_WATCH_MIN_INTERVAL, DEFAULT_WATCH_MAX_INTERVAL
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+from writers import bucket_record
+
+DEFAULT_BUCKET_LIST_INTERVAL = 60 * 60
+# Longest the watch loop sleeps before looking for work again
+POLL_INTERVAL = 1.0
+
+_logger = logging.getLogger(__name__)
+
+
+class RefreshScheduler:
+    """
+    Decides when each bucket is next refreshed. Every bucket has its own
+    refresh interval, between min_interval and max_interval: a refresh that
+    finds the bucket changed halves it, one that finds nothing new doubles
+    it. Busy buckets are so kept fresh, while cold ones are left alone for
+    longer and longer, and between them the work stays proportional to how
+    much is actually changing.
+
+    Buckets due are handed out soonest due first. A bucket is out of the
+    schedule while it is being refreshed, and back in once it is done.
+    All methods may be called from any thread.
+    """
+    def __init__(self, min_interval: float = DEFAULT_WATCH_MIN_INTERVAL,
+                 max_interval: float = DEFAULT_WATCH_MAX_INTERVAL, clock=time.monotonic):
+        """
+        :param min_interval: Shortest time between refreshes of a bucket, in seconds.
+        :type min_interval: float
+        :param max_interval: Longest time between refreshes of a bucket, in seconds.
+        :type max_interval: float
+        :param clock: Source of time in seconds, for tests.
+        :type clock: function
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (due, name); entries of removed or rescheduled buckets are skipped when they come up
+        self._heap = []
+        # Name -> [interval, due (None while being refreshed)]
+        self._buckets = dict()
+
+    def add(self, name: str):
+        """
+        Schedules a new bucket, due straight away. Buckets already known are left as they are.
+
+        :param name: The bucket's name.
+        :type name: str
+        """
+        with self._lock:
+            if name in self._buckets:
+                return
+            now = self._clock()
+            self._buckets[name] = [self.min_interval, now]
+            heapq.heappush(self._heap, (now, name))
+
+    def remove(self, name: str):
+        """
+        :param name: A bucket that no longer needs refreshing (it was deleted, say).
+        :type name: str
+        """
+        with self._lock:
+            self._buckets.pop(name, None)
+
+    def names(self):
+        """
+        :return: Every bucket scheduled, or being refreshed.
+        :rtype: set of str
+        """
+        with self._lock:
+            return set(self._buckets)
+
+    def take_due(self):
+        """
+        :return: The buckets due for a refresh now, soonest due first. They are out
+        of the schedule until done() is called for them.
+        :rtype: list of str
+        """
+        due = []
+        with self._lock:
+            now = self._clock()
+            while self._heap and (self._heap[0][0] <= now):
+                when, name = heapq.heappop(self._heap)
+                state = self._buckets.get(name)
+                if (state is None) or (state[1] != when):
+                    continue
+                state[1] = None
+                due.append(name)
+        return due
+
+    def done(self, name: str, changed: bool):
+        """
+        Puts a refreshed bucket back in the schedule.
+
+        :param name: The bucket just refreshed.
+        :type name: str
+        :param changed: Whether the refresh found it changed.
+        :type changed: bool
+        """
+        with self._lock:
+            state = self._buckets.get(name)
+            if state is None:
+                return
+            if changed:
+                state[0] = max(self.min_interval, state[0] / 2)
+            else:
+                state[0] = min(self.max_interval, state[0] * 2)
+            state[1] = self._clock() + state[0]
+            heapq.heappush(self._heap, (state[1], name))
+
+    def interval(self, name: str):
+        """
+        :param name: A scheduled bucket.
+        :type name: str
+        :return: Seconds between the bucket's refreshes, as things stand.
+        :rtype: float or None
+        """
+        with self._lock:
+            state = self._buckets.get(name)
+            return None if state is None else state[0]
+
+    def seconds_until_due(self):
+        """
+        :return: Seconds until the next bucket is due (0 if one already is),
+        or None if nothing is scheduled.
+        :rtype: float or None
+        """
+        with self._lock:
+            while self._heap:
+                when, name = self._heap[0]
+                state = self._buckets.get(name)
+                if (state is not None) and (state[1] == when):
+                    return max(0.0, when - self._clock())
+                heapq.heappop(self._heap)
+            return None
+
+
+class Watcher:
+    """
+    Keeps the latest results for every bucket of a profile in memory, and
+    refreshes them as the RefreshScheduler says, on a pool of worker threads.
+    The list of buckets itself is checked every so often, so new buckets are
+    picked up and deleted ones dropped; if that fails, the buckets already
+    known are carried on with until the next check.
+    """
+    def __init__(self, list_buckets, explore, s3_client, scheduler, workers=1, set_up=None,
+                 on_result=None, bucket_list_interval=DEFAULT_BUCKET_LIST_INTERVAL, clock=time.monotonic):
+        """
+        :param list_buckets: Returns a fresh BucketInfo for each of the profile's buckets.
+        :type list_buckets: function
+        :param explore: Explores a single bucket, called the same way as explore_bucket.
+        :type explore: function
+        :param s3_client: Client to explore buckets with.
+        :type s3_client: boto3.s3.client
+        :param scheduler: Decides when each bucket is refreshed.
+        :type scheduler: RefreshScheduler
+        :param workers: How many buckets to refresh at the same time.
+        :type workers: int
+        :param set_up: Called with each BucketInfo before it is explored (to gather extra details, say).
+        :type set_up: function or None
+        :param on_result: Called with each refreshed BucketInfo (to display and log it, say),
+        one at a time.
+        :type on_result: function or None
+        :param bucket_list_interval: Seconds between checks of the list of buckets.
+        :type bucket_list_interval: float
+        :param clock: Source of time in seconds, for tests.
+        :type clock: function
+        """
+        self._list_buckets = list_buckets
+        self._explore = explore
+        self._s3_client = s3_client
+        self._scheduler = scheduler
+        self._set_up = set_up
+        self._on_result = on_result
+        self._bucket_list_interval = bucket_list_interval
+        self._clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._report_lock = threading.Lock()
+        self._buckets_listed = None
+        # Name -> BucketInfo as first listed, to start each refresh from
+        self._templates = dict()
+        # Name -> latest BucketInfo
+        self.results = dict()
+        # Name -> dict(refreshed=datetime, refreshes=int, error=str or None)
+        self._status = dict()
+
+    def update_buckets(self):
+        """
+        Checks the list of buckets, scheduling new ones and dropping deleted ones.
+        """
+        # Whether or not it works, the list is next checked an interval from now
+        self._buckets_listed = self._clock()
+        try:
+            bucket_infos = {x.name: x for x in self._list_buckets()}
+        except Exception as error:
+            _logger.warning('Listing buckets failed, carrying on with the %d already known: %s',
+                            len(self._templates), error)
+            return
+        with self._lock:
+            self._templates = bucket_infos
+            for name in set(self.results) - set(bucket_infos):
+                self.results.pop(name)
+                self._status.pop(name, None)
+        for name in self._scheduler.names() - set(bucket_infos):
+            self._scheduler.remove(name)
+        for name in bucket_infos:
+            self._scheduler.add(name)
+
+    def step(self):
+        """
+        Checks the list of buckets if it is time to, and starts refreshing
+        every bucket that is due. Does not wait for the refreshes to finish.
+
+        :return: The refreshes started.
+        :rtype: list of concurrent.futures.Future
+        """
+        if (self._buckets_listed is None) or (self._clock() - self._buckets_listed >= self._bucket_list_interval):
+            self.update_buckets()
+        return [self._executor.submit(self.refresh, name) for name in self._scheduler.take_due()]
+
+    def refresh(self, name: str):
+        """
+        Explores a bucket afresh, and reschedules it according to whether it changed.
+        A bucket that cannot be explored keeps its last result, and is backed off.
+
+        :param name: The bucket to refresh.
+        :type name: str
+        """
+        with self._lock:
+            template = self._templates.get(name)
+            previous = self.results.get(name)
+        if template is None:
+            return
+        my_info = template.empty_copy()
+        if self._set_up is not None:
+            self._set_up(my_info)
+        try:
+            my_info = self._explore(my_info, self._s3_client)
+        except Exception as error:
+            with self._lock:
+                self._status.setdefault(name, dict(refreshed=None, refreshes=0))['error'] = str(error)
+            self._scheduler.done(name, changed=False)
+            return
+
+        changed = (previous is None) or \
+            ((previous.file_count, previous.cumulative_size, previous.most_recent_mod) !=
+             (my_info.file_count, my_info.cumulative_size, my_info.most_recent_mod))
+        with self._lock:
+            if name not in self._templates:
+                return
+            self.results[name] = my_info
+            status = self._status.setdefault(name, dict(refreshed=None, refreshes=0))
+            status.update(refreshed=datetime.now(timezone.utc), error=None)
+            status['refreshes'] += 1
+        # A first result is not a change; only later ones are worth refreshing sooner for
+        self._scheduler.done(name, changed=changed and (previous is not None))
+        if self._on_result is not None:
+            with self._report_lock:
+                self._on_result(my_info)
+
+    def run(self, stop_event):
+        """
+        Refreshes buckets as they fall due, until stop_event is set.
+
+        :param stop_event: Set to stop watching.
+        :type stop_event: threading.Event
+        """
+        try:
+            while not stop_event.is_set():
+                self.step()
+                wait = self._scheduler.seconds_until_due()
+                stop_event.wait(POLL_INTERVAL if wait is None else min(max(wait, 0.01), POLL_INTERVAL))
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def snapshot(self):
+        """
+        :return: The latest result for each bucket, with when it was refreshed
+        and when it will be again, as plain values ready for JSON.
+        :rtype: list of dict
+        """
+        with self._lock:
+            results = sorted(self.results.items())
+            status = {x: dict(y) for x, y in self._status.items()}
+        records = []
+        for name, my_info in results:
+            record = bucket_record(my_info)
+            state = status.get(name, dict())
+            refreshed = state.get('refreshed')
+            record['watch'] = dict(refreshed=None if refreshed is None else refreshed.isoformat(),
+                                   refreshes=state.get('refreshes', 0),
+                                   interval=self._scheduler.interval(name),
+                                   error=state.get('error'))
+            records.append(record)
+        return records
+
+
+class _ResultsRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /buckets for every bucket's latest result, /buckets/<name> for a single one.
+    """
+    watcher = None
+
+    def do_GET(self):
+        path = self.path.split('?')[0].rstrip('/')
+        records = self.watcher.snapshot()
+        if path in ('', '/buckets'):
+            self._send(200, dict(buckets=records))
+            return
+        if path.startswith('/buckets/'):
+            name = unquote(path[len('/buckets/'):])
+            for record in records:
+                if record['name'] == name:
+                    self._send(200, record)
+                    return
+        self._send(404, dict(error='Not found: {}'.format(self.path)))
+
+    def log_message(self, format, *args):
+        # Dashboards poll often; keep the console for results
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve_results(watcher, host=DEFAULT_WATCH_HOST, port=DEFAULT_WATCH_PORT):
+    """
+    Serves the watcher's results as JSON over HTTP, on a thread of its own.
+
+    :param watcher: Holds the results to serve.
+    :type watcher: Watcher
+    :param host: Address to listen on.
+    :type host: str
+    :param port: Port to listen on (0 for any free one).
+    :type port: int
+    :return: The running server; its server_address says where it is, and shutdown() stops it.
+    :rtype: http.server.ThreadingHTTPServer
+    """
+    handler = type('ResultsRequestHandler', (_ResultsRequestHandler,), dict(watcher=watcher))
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
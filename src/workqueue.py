@@ -0,0 +1,393 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from defaults import DEFAULT_LEASE_SECONDS
+from results import BucketInfo
+from shards import Shard
+
+DEFAULT_MAX_ATTEMPTS = 3
+# Seconds between looking for work, or for finished buckets
+POLL_INTERVAL = 1.0
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    scan_id INTEGER PRIMARY KEY, started REAL NOT NULL, finished REAL
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    scan_id INTEGER NOT NULL, name TEXT NOT NULL, info TEXT NOT NULL, PRIMARY KEY (scan_id, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id INTEGER PRIMARY KEY, scan_id INTEGER NOT NULL, bucket TEXT NOT NULL,
+    prefix TEXT NOT NULL, start_after TEXT, depth INTEGER NOT NULL, discover INTEGER NOT NULL,
+    state TEXT NOT NULL, owner TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT, error TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_by_state ON tasks (state, task_id);
+CREATE INDEX IF NOT EXISTS tasks_by_bucket ON tasks (scan_id, bucket);
+"""
+
+
+class ShardScanError(Exception):
+    """
+    One or more buckets had shards that kept failing, so their totals
+    would have been incomplete. Every other bucket was still reported.
+    """
+    def __init__(self, failures):
+        """
+        :param failures: The last error of a failed shard, by bucket name.
+        :type failures: dict
+        """
+        self.failures = failures
+        super().__init__('Exploring failed for bucket(s) {}'.format(
+            ', '.join('"{}" ({})'.format(x, y) for x, y in failures.items())))
+
+
+class Task:
+    """
+    A shard of a bucket, claimed from the queue by a worker.
+    """
+    __slots__ = ('task_id', 'bucket_info', 'shard')
+
+    def __init__(self, task_id: int, bucket_info, shard):
+        """
+        :param task_id: The task's id in the queue.
+        :type task_id: int
+        :param bucket_info: The bucket, nothing counted yet, gathering whatever extra details the coordinator set up.
+        :type bucket_info: BucketInfo
+        :param shard: The piece of the bucket to list.
+        :type shard: Shard
+        """
+        self.task_id = task_id
+        self.bucket_info = bucket_info
+        self.shard = shard
+
+
+def _dumps(bucket_info):
+    return json.dumps(bucket_info.as_state())
+
+
+def _loads(text):
+    return BucketInfo.from_state(json.loads(text))
+
+
+def default_owner():
+    """
+    :return: A name for this worker process, unique across hosts: "<host>:<process id>".
+    :rtype: str
+    """
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+class WorkQueue:
+    """
+    Shards of buckets waiting to be explored, in a SQLite database that
+    a coordinator and any number of workers, on any number of hosts, share
+    (on shared storage; SQLite's locking has to work there, as it does on
+    most NFS setups, but WAL mode would not, so it is not used).
+
+    A worker claims a shard with a lease, and has to finish it before the
+    lease runs out, or renew it; a shard whose lease ran out (its worker
+    crashed, say) goes to the next worker to ask. Finishing a shard
+    stores its partial totals and queues any shards it split off (see
+    shards.next_shards), in one transaction, and only while the worker
+    still holds the lease, so every shard is counted exactly once however
+    many times it was handed out.
+
+    Buckets and partial totals are stored as JSON, in the same form as
+    checkpoints (see BucketInfo.as_state), so reading the queue never runs
+    anything written to it. All hosts should still run the same version
+    of the code.
+    """
+    def __init__(self, path: str, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, clock=time.time):
+        """
+        :param path: The queue's database file (created if need be).
+        :type path: str
+        :param lease_seconds: How long a worker has to finish (or renew) a shard it claimed.
+        Hosts' clocks have to agree to well within this.
+        :type lease_seconds: float
+        :param max_attempts: Times a shard is handed out before it is given up on.
+        :type max_attempts: int
+        :param clock: Source of the current time in seconds, for tests.
+        :type clock: function
+        """
+        self._path = path
+        self.lease_seconds = lease_seconds
+        self._max_attempts = max_attempts
+        self._clock = clock
+        with self._connection() as db:
+            db.executescript(_SCHEMA)
+
+    def start_scan(self, bucket_infos):
+        """
+        Queues the buckets to explore, a single shard (the whole key space) each.
+
+        :param bucket_infos: The buckets, nothing counted yet, with any extra details to gather set up.
+        :type bucket_infos: list of BucketInfo
+        :return: The scan's id, for finished_buckets.
+        :rtype: int
+        """
+        with self._transaction() as db:
+            scan_id = db.execute('INSERT INTO scans (started) VALUES (?)', (self._clock(),)).lastrowid
+            for bucket_info in bucket_infos:
+                db.execute('INSERT INTO buckets VALUES (?, ?, ?)',
+                           (scan_id, bucket_info.name, _dumps(bucket_info.empty_copy())))
+            self._add_shards(db, scan_id, [(x.name, Shard()) for x in bucket_infos])
+        return scan_id
+
+    def finished_buckets(self, scan_id: int, names):
+        """
+        :param scan_id: The scan, as returned by start_scan.
+        :type scan_id: int
+        :param names: Buckets to look at.
+        :type names: set of str
+        :return: Each of the buckets every shard is finished for, as a (name, BucketInfo,
+        error) triple; the BucketInfo merges every shard's totals, unless a shard failed,
+        in which case it is None and the error says why.
+        :rtype: list of tuple(str, BucketInfo or None, str or None)
+        """
+        finished = []
+        with self._connection() as db:
+            rows = db.execute("""
+                SELECT bucket, sum(state IN (?, ?)), max(CASE WHEN state = ? THEN error END)
+                FROM tasks WHERE scan_id = ? GROUP BY bucket""", (PENDING, LEASED, FAILED, scan_id)).fetchall()
+            for name, unfinished, error in rows:
+                if unfinished or (name not in names):
+                    continue
+                if error is not None:
+                    finished.append((name, None, error))
+                    continue
+                info, = db.execute('SELECT info FROM buckets WHERE scan_id = ? AND name = ?',
+                                   (scan_id, name)).fetchone()
+                bucket_info = _loads(info)
+                for result, in db.execute('SELECT result FROM tasks WHERE scan_id = ? AND bucket = ? AND state = ?',
+                                          (scan_id, name, DONE)):
+                    bucket_info.merge(_loads(result))
+                finished.append((name, bucket_info, None))
+        return finished
+
+    def finish_scan(self, scan_id: int):
+        """
+        :param scan_id: A scan all of whose buckets were reported.
+        :type scan_id: int
+        """
+        with self._transaction() as db:
+            db.execute('UPDATE scans SET finished = ? WHERE scan_id = ?', (self._clock(), scan_id))
+
+    def claim(self, owner: str):
+        """
+        :param owner: The worker claiming a shard.
+        :type owner: str
+        :return: The next shard to explore, leased to the owner, or None if there is none right now.
+        :rtype: Task or None
+        """
+        now = self._clock()
+        with self._transaction() as db:
+            # A shard whose every worker died (or hung) on it is given up on, as if it had failed
+            db.execute('UPDATE tasks SET state = ?, error = ?, owner = NULL, lease_expires = NULL '
+                       'WHERE state = ? AND lease_expires < ? AND attempts >= ?',
+                       (FAILED, 'Lease ran out {} times'.format(self._max_attempts), LEASED, now,
+                        self._max_attempts))
+            row = db.execute("""
+                SELECT task_id, scan_id, bucket, prefix, start_after, depth, discover FROM tasks
+                WHERE state = ? OR (state = ? AND lease_expires < ? AND attempts < ?) ORDER BY task_id LIMIT 1""",
+                             (PENDING, LEASED, now, self._max_attempts)).fetchone()
+            if row is None:
+                return None
+            task_id, scan_id, bucket, prefix, start_after, depth, discover = row
+            db.execute('UPDATE tasks SET state = ?, owner = ?, lease_expires = ?, attempts = attempts + 1 '
+                       'WHERE task_id = ?', (LEASED, owner, now + self.lease_seconds, task_id))
+            info, = db.execute('SELECT info FROM buckets WHERE scan_id = ? AND name = ?',
+                               (scan_id, bucket)).fetchone()
+        return Task(task_id, _loads(info), Shard(prefix, start_after, depth, bool(discover)))
+
+    def complete(self, task, owner: str, partial, children):
+        """
+        :param task: A shard the owner explored.
+        :type task: Task
+        :param owner: The worker that explored it.
+        :type owner: str
+        :param partial: The shard's totals.
+        :type partial: BucketInfo
+        :param children: Shards it split off, still to be explored.
+        :type children: list of Shard
+        :return: Whether the results were taken; if the lease was lost (it ran out and
+        another worker claimed the shard), they are not, and the other worker's count.
+        :rtype: bool
+        """
+        with self._transaction() as db:
+            updated = db.execute('UPDATE tasks SET state = ?, result = ?, lease_expires = NULL '
+                                 'WHERE task_id = ? AND owner = ? AND state = ?',
+                                 (DONE, _dumps(partial), task.task_id, owner, LEASED)).rowcount
+            if not updated:
+                return False
+            scan_id, = db.execute('SELECT scan_id FROM tasks WHERE task_id = ?', (task.task_id,)).fetchone()
+            self._add_shards(db, scan_id, [(task.bucket_info.name, x) for x in children])
+        return True
+
+    def fail(self, task, owner: str, error: str):
+        """
+        Hands a shard back after an error, to be tried again (up to max_attempts times in all).
+
+        :param task: A shard the owner could not explore.
+        :type task: Task
+        :param owner: The worker that tried.
+        :type owner: str
+        :param error: What went wrong.
+        :type error: str
+        """
+        with self._transaction() as db:
+            db.execute('UPDATE tasks SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?, '
+                       'owner = NULL, lease_expires = NULL WHERE task_id = ? AND owner = ? AND state = ?',
+                       (self._max_attempts, FAILED, PENDING, error, task.task_id, owner, LEASED))
+
+    def renew(self, owner: str):
+        """
+        Extends the lease of every shard the owner holds, from now.
+
+        :param owner: A worker still busy with its shards.
+        :type owner: str
+        """
+        with self._transaction() as db:
+            db.execute('UPDATE tasks SET lease_expires = ? WHERE owner = ? AND state = ?',
+                       (self._clock() + self.lease_seconds, owner, LEASED))
+
+    def unfinished(self):
+        """
+        :return: Number of shards not yet done (nor given up on), in every scan.
+        :rtype: int
+        """
+        with self._connection() as db:
+            return db.execute('SELECT count(*) FROM tasks WHERE state IN (?, ?)', (PENDING, LEASED)).fetchone()[0]
+
+    def _add_shards(self, db, scan_id, shards):
+        db.executemany('INSERT INTO tasks (scan_id, bucket, prefix, start_after, depth, discover, state) '
+                       'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                       [(scan_id, name, x.prefix, x.start_after, x.depth, int(x.discover), PENDING)
+                        for name, x in shards])
+
+    @contextmanager
+    def _connection(self):
+        # A connection per use, so any thread (or process, or host) may use the queue
+        db = sqlite3.connect(self._path, timeout=60, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connection() as db:
+            # Take the write lock up front, so two workers never read the same shard as free
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                yield db
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+
+
+def coordinate(queue, bucket_infos, report, poll_interval: float = POLL_INTERVAL):
+    """
+    Queues the buckets for workers to explore, and hands each one on, its
+    shards' totals merged, once they have all been done.
+
+    :param queue: Where workers pick up shards.
+    :type queue: WorkQueue
+    :param bucket_infos: The buckets, nothing counted yet, with any extra details to gather set up.
+    :type bucket_infos: list of BucketInfo
+    :param report: Called with each completed BucketInfo.
+    :type report: function
+    :param poll_interval: Seconds between checks for finished buckets.
+    :type poll_interval: float
+    """
+    scan_id = queue.start_scan(bucket_infos)
+    remaining = {x.name for x in bucket_infos}
+    failures = dict()
+    while remaining:
+        for name, bucket_info, error in queue.finished_buckets(scan_id, remaining):
+            remaining.discard(name)
+            if error is None:
+                report(bucket_info)
+            else:
+                failures[name] = error
+        if remaining:
+            time.sleep(poll_interval)
+    queue.finish_scan(scan_id)
+    if failures:
+        raise ShardScanError(failures)
+
+
+def work(queue, explore, owner: str = None, threads: int = 1, poll_interval: float = POLL_INTERVAL):
+    """
+    Claims and explores shards from the queue, on 'threads' threads, until
+    every shard queued is done. Waits for work if there is none yet. Leases
+    are renewed in the background for as long as the shards take.
+
+    :param queue: Where to pick up shards.
+    :type queue: WorkQueue
+    :param explore: Explores a shard, called as explore(bucket_info, shard) and
+    returning the shard's totals and any shards it split off, like shards.explore_shard.
+    :type explore: function
+    :param owner: Name to claim shards under. Default: host name and process id.
+    :type owner: str or None
+    :param threads: How many shards to explore at the same time.
+    :type threads: int
+    :param poll_interval: Seconds between looks for new work, when there is none.
+    :type poll_interval: float
+    :return: How many shards this worker explored.
+    :rtype: int
+    """
+    owner = owner or default_owner()
+    stop = threading.Event()
+    lock = threading.Lock()
+    state = dict(explored=0, seen_work=False)
+
+    def renew_leases():
+        while not stop.wait(queue.lease_seconds / 3):
+            queue.renew(owner)
+
+    def run():
+        while True:
+            task = queue.claim(owner)
+            if task is None:
+                unfinished = queue.unfinished()
+                with lock:
+                    if unfinished:
+                        state['seen_work'] = True
+                    elif state['seen_work']:
+                        return
+                time.sleep(poll_interval)
+                continue
+            with lock:
+                state['seen_work'] = True
+            try:
+                partial, children = explore(task.bucket_info, task.shard)
+            except Exception as error:
+                queue.fail(task, owner, '{}: {}'.format(type(error).__name__, error))
+                continue
+            if queue.complete(task, owner, partial, children):
+                with lock:
+                    state['explored'] += 1
+
+    renewer = threading.Thread(target=renew_leases, name='lease-renewer', daemon=True)
+    renewer.start()
+    workers = [threading.Thread(target=run, name='shard-worker-{}'.format(n)) for n in range(threads)]
+    try:
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    finally:
+        stop.set()
+    return state['explored']
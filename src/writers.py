@@ -0,0 +1,177 @@
+import csv
+import io
+import json
+import os
+from enum import Enum
+
+# Columns written out for each bucket, in order
+RESULT_FIELDS = ('name', 'created', 'file_count', 'cumulative_size', 'most_recent_mod')
+# The CSV log also says how each bucket's numbers were estimated, left empty for exact counts
+ESTIMATE_FIELD = 'estimate'
+CSV_FIELDS = RESULT_FIELDS + (ESTIMATE_FIELD,)
+
+
+class FsyncPolicy(Enum):
+    """
+    How hard to push each record to disk. Every record is always handed to the
+    OS in a single write, so even NEVER cannot leave a half written row behind
+    if the program dies; the policy only matters if the machine itself goes down.
+    """
+    NEVER = 'never'
+    RECORD = 'record'
+    CLOSE = 'close'
+
+
+class ResultWriter:
+    """
+    Appends one record per bucket to a log file, rather than rewriting
+    the whole file each time, so the cost of writing a result stays the
+    same however many buckets came before it.
+
+    Subclasses decide the file format, by way of a header (if any)
+    and how a single bucket is formatted into a line.
+    """
+    EXTENSION = None
+
+    def __init__(self, path: str, fsync_policy: FsyncPolicy = FsyncPolicy.CLOSE):
+        """
+        Opens (or creates) the file for appending. If a previous writer died
+        part way through a line, that partial line is cut off first.
+
+        :param path: File to append to.
+        :type path: str
+        :param fsync_policy: When to force written records to disk.
+        :type fsync_policy: FsyncPolicy
+        """
+        self._fsync_policy = fsync_policy
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._truncate_partial_line()
+        if os.fstat(self._fd).st_size == 0:
+            self._write_line(self.header())
+
+    def header(self):
+        """
+        :return: First line of a new file, or None for formats without one.
+        :rtype: str or None
+        """
+        return None
+
+    def format_record(self, bucket_info):
+        """
+        :param bucket_info: Completed bucket analysis.
+        :type bucket_info: BucketInfo
+        :return: A single line (including the newline) representing the bucket.
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def write(self, bucket_info):
+        """
+        :param bucket_info: Completed bucket analysis to append to the file.
+        :type bucket_info: BucketInfo
+        """
+        self._write_line(self.format_record(bucket_info))
+        if self._fsync_policy == FsyncPolicy.RECORD:
+            os.fsync(self._fd)
+
+    def close(self):
+        if self._fd is None:
+            return
+        if self._fsync_policy != FsyncPolicy.NEVER:
+            os.fsync(self._fd)
+        os.close(self._fd)
+        self._fd = None
+
+    def _write_line(self, line):
+        if line is None:
+            return
+        data = line.encode('utf-8')
+        # With O_APPEND each write lands at the end of the file in one go;
+        # the loop only guards against the OS accepting part of it.
+        while data:
+            written = os.write(self._fd, data)
+            data = data[written:]
+
+    def _truncate_partial_line(self):
+        size = os.fstat(self._fd).st_size
+        if size == 0:
+            return
+        # Walk back from the end of the file to the last complete line
+        chunk_size = 4096
+        end = size
+        while end > 0:
+            start = max(0, end - chunk_size)
+            chunk = os.pread(self._fd, end - start, start)
+            if (end == size) and chunk.endswith(b'\n'):
+                return
+            newline = chunk.rfind(b'\n')
+            if newline >= 0:
+                os.ftruncate(self._fd, start + newline + 1)
+                return
+            end = start
+        os.ftruncate(self._fd, 0)
+
+
+class CsvResultWriter(ResultWriter):
+    """
+    Same layout as the original pandas written log: a header row and
+    one row per bucket, with dates in python's default str() format. A
+    last column names the method a bucket's numbers were estimated by
+    ("cloudwatch" or "sampling"), and is empty where they were counted.
+    """
+    EXTENSION = 'csv'
+
+    def header(self):
+        return self._format_row(CSV_FIELDS)
+
+    def format_record(self, bucket_info):
+        values = [getattr(bucket_info, field) for field in RESULT_FIELDS]
+        values.append(None if bucket_info.estimate is None else bucket_info.estimate.method)
+        return self._format_row('' if value is None else str(value) for value in values)
+
+    @staticmethod
+    def _format_row(values):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerow(values)
+        return buffer.getvalue()
+
+
+class JsonLinesResultWriter(ResultWriter):
+    """
+    One JSON object per line, with dates in ISO 8601 format. Estimated
+    buckets say how they were estimated, indexed buckets get their
+    changes since the last run, and breakdowns and top objects are
+    written in full.
+    """
+    EXTENSION = 'jsonl'
+
+    def format_record(self, bucket_info):
+        return '{}\n'.format(json.dumps(bucket_record(bucket_info)))
+
+
+def bucket_record(bucket_info):
+    """
+    :param bucket_info: Completed bucket analysis.
+    :type bucket_info: BucketInfo
+    :return: The bucket as plain values, ready for JSON, with dates in ISO 8601 format.
+    :rtype: dict
+    """
+    record = dict()
+    for field in RESULT_FIELDS:
+        value = getattr(bucket_info, field)
+        record[field] = value.isoformat() if hasattr(value, 'isoformat') else value
+    if bucket_info.estimate is not None:
+        record['estimate'] = bucket_info.estimate.as_dict()
+    if bucket_info.changes is not None:
+        record['changes'] = bucket_info.changes.as_dict()
+    if bucket_info.breakdown is not None:
+        record['breakdown'] = bucket_info.breakdown.as_dict()
+    if bucket_info.top_objects is not None:
+        record['top_objects'] = bucket_info.top_objects.as_dict()
+    if bucket_info.versions is not None:
+        record['versions'] = bucket_info.versions.as_dict()
+    return record
+
+
+# Lookup of writer class by output format name
+RESULT_WRITERS = {x.EXTENSION: x for x in (CsvResultWriter, JsonLinesResultWriter)}